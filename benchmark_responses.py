@@ -0,0 +1,136 @@
+"""
+响应路径微基准
+
+比较两种构造工具返回值的方式（不连接数据库）：
+- pydantic: 每项构造pydantic模型并model_dump，MongoResponse再model_dump一次，由FastMCP转换字典
+- fast: 每项直接构造TypedDict，MongoResponse为slots数据类，由orjson一次编码为工具结果
+
+用法: python benchmark_responses.py [--items 10000] [--repeat 20]
+"""
+
+import argparse
+import asyncio
+import datetime
+import gc
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+from fastmcp import FastMCP
+from pydantic import BaseModel, Field
+
+from mongo_atlas_mcp.models import CollectionInfo, MongoResponse
+from mongo_atlas_mcp.server import _tool_result
+
+
+class PydanticCollectionInfo(BaseModel):
+    """改动前的集合信息模型"""
+    name: str = Field(..., description="集合名称")
+    count: Optional[int] = Field(None, description="文档数量")
+    size: Optional[int] = Field(None, description="集合大小（字节）")
+    avg_obj_size: Optional[int] = Field(None, description="平均对象大小")
+
+
+class PydanticResponse(BaseModel):
+    """改动前的响应模型"""
+    success: bool = Field(..., description="操作是否成功")
+    data: Optional[Any] = Field(None, description="响应数据")
+    error: Optional[str] = Field(None, description="错误信息")
+    count: Optional[int] = Field(None, description="影响文档数量")
+    cursor_id: Optional[str] = Field(None, description="游标ID")
+
+
+def make_documents(count: int) -> List[Dict[str, Any]]:
+    """生成与find_documents结果形状相近的文档"""
+    created = datetime.datetime(2024, 1, 1)
+    return [
+        {
+            "_id": f"{i:024x}",
+            "name": f"user{i}",
+            "age": i % 90,
+            "score": i * 0.5,
+            "created_at": created + datetime.timedelta(minutes=i),
+            "tags": ["a", "b", "c"],
+            "address": {"city": "Shanghai", "zip": "200000"},
+        }
+        for i in range(count)
+    ]
+
+
+def listing_pydantic(names: List[str]) -> Dict[str, Any]:
+    collections = [
+        PydanticCollectionInfo(name=name, count=0, size=0, avg_obj_size=0).model_dump()
+        for name in names
+    ]
+    return PydanticResponse(success=True, data=collections, count=len(collections)).model_dump()
+
+
+def listing_fast(names: List[str]) -> Dict[str, Any]:
+    collections = [
+        CollectionInfo(name=name, count=0, size=0, avg_obj_size=0) for name in names
+    ]
+    return MongoResponse(success=True, data=collections, count=len(collections)).model_dump()
+
+
+def documents_pydantic(documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return PydanticResponse(success=True, data=documents, count=len(documents)).model_dump()
+
+
+def documents_fast(documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return MongoResponse(success=True, data=documents, count=len(documents)).model_dump()
+
+
+def measure(fn, repeat: int) -> List[float]:
+    """多次运行并返回每次的耗时（毫秒）"""
+    fn()
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def get_tool(mcp: FastMCP, name: str):
+    return await mcp.get_tool(name)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="响应路径微基准")
+    parser.add_argument("--items", type=int, default=10000, help="每次响应包含的条目数量")
+    parser.add_argument("--repeat", type=int, default=20, help="每种方式的运行次数")
+    args = parser.parse_args()
+
+    # 用一个返回字典的工具取得FastMCP默认的结果转换
+    mcp = FastMCP("benchmark")
+
+    @mcp.tool
+    def echo() -> Dict[str, Any]:
+        return {}
+
+    tool = asyncio.run(get_tool(mcp, "echo"))
+
+    names = [f"collection_{i}" for i in range(args.items)]
+    documents = make_documents(args.items)
+    cases = {
+        "list_collections": (
+            lambda: tool.convert_result(listing_pydantic(names)),
+            lambda: _tool_result(listing_fast(names)),
+        ),
+        "find_documents": (
+            lambda: tool.convert_result(documents_pydantic(documents)),
+            lambda: _tool_result(documents_fast(documents)),
+        ),
+    }
+
+    print(f"条目数量: {args.items}，运行次数: {args.repeat}")
+    print(f"{'场景':<18}{'pydantic中位数(ms)':>20}{'fast中位数(ms)':>18}{'加速':>8}")
+    for name, (legacy, fast) in cases.items():
+        legacy_ms = statistics.median(measure(legacy, args.repeat))
+        fast_ms = statistics.median(measure(fast, args.repeat))
+        print(f"{name:<18}{legacy_ms:>20.2f}{fast_ms:>18.2f}{legacy_ms / fast_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
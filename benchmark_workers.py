@@ -0,0 +1,156 @@
+"""
+多进程工作模式吞吐量基准
+
+以不同的工作进程数量启动HTTP服务器（1表示单进程），用固定数量的并发会话持续调用
+find_documents读取较大的结果，比较每秒完成的调用数和文档数（需要可用的MONGODB_URI）。
+结果的BSON解码和JSON编码是CPU密集的，吞吐量应随工作进程数增长，直到用满CPU核心数
+
+用法: python benchmark_workers.py --database bench --collection docs [--seed 20000]
+      [--workers 1,2,4] [--sessions 16] [--limit 1000] [--duration 15]
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+from fastmcp import Client
+from fastmcp.client.transports import StreamableHttpTransport
+from pymongo import MongoClient
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def seed(database: str, collection: str, count: int) -> None:
+    """集合中的文档少于count时补充合成文档"""
+    client = MongoClient(os.getenv("MONGODB_URI"))
+    try:
+        target = client[database][collection]
+        existing = target.estimated_document_count()
+        created = datetime.datetime(2024, 1, 1)
+        batch = []
+        for i in range(existing, count):
+            batch.append({
+                "name": f"user{i}",
+                "age": i % 90,
+                "score": i * 0.5,
+                "created_at": created + datetime.timedelta(minutes=i),
+                "tags": ["a", "b", "c"],
+                "address": {"city": "Shanghai", "zip": "200000", "lines": ["x" * 40, "y" * 40]},
+            })
+            if len(batch) == 1000:
+                target.insert_many(batch)
+                batch = []
+        if batch:
+            target.insert_many(batch)
+    finally:
+        client.close()
+
+
+async def wait_until_ready(url: str, timeout: float) -> None:
+    """等待HTTP服务器开始接受请求"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with Client(StreamableHttpTransport(url)) as client:
+                await client.list_tools()
+                return
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.3)
+
+
+async def drive(url: str, arguments: Dict[str, Any], deadline: float,
+                latencies: List[float]) -> int:
+    """一个会话持续调用直到截止时间，返回读取的文档数"""
+    documents = 0
+    # 使用建立会话的握手，每个客户端由服务器签发自己的Mcp-Session-Id，主进程按会话分配工作进程
+    async with Client(StreamableHttpTransport(url), mode="legacy") as client:
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            result = await client.call_tool("find_documents", arguments)
+            latencies.append((time.perf_counter() - started) * 1000)
+            documents += result.structured_content.get("count") or 0
+    return documents
+
+
+async def run(workers: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """以workers个工作进程运行一轮"""
+    url = f"http://127.0.0.1:{args.port}/mcp"
+    env = dict(os.environ, MCP_MAX_CONCURRENT=str(args.sessions * 2),
+               MCP_MAX_CONCURRENT_PER_NAMESPACE=str(args.sessions * 2),
+               MCP_MAX_CHEAP_CONCURRENT=str(args.sessions * 2),
+               MCP_RATE_LIMIT_PER_SECOND="0")
+    server = subprocess.Popen(
+        [sys.executable, "run_server.py", "--transport", "http",
+         "--port", str(args.port), "--workers", str(workers)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        await wait_until_ready(url, timeout=60)
+        arguments = {"database": args.database, "collection": args.collection, "limit": args.limit}
+        # 预热：每个会话先调用一次，建立连接
+        await asyncio.gather(*(
+            drive(url, arguments, 0, []) for _ in range(args.sessions)
+        ))
+        latencies: List[float] = []
+        started = time.monotonic()
+        documents = await asyncio.gather(*(
+            drive(url, arguments, started + args.duration, latencies)
+            for _ in range(args.sessions)
+        ))
+        elapsed = time.monotonic() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    ordered = sorted(latencies)
+    return {
+        "workers": workers,
+        "calls_per_s": len(latencies) / elapsed,
+        "docs_per_s": sum(documents) / elapsed,
+        "p50_ms": statistics.median(ordered) if ordered else 0.0,
+        "p95_ms": ordered[int(len(ordered) * 0.95)] if ordered else 0.0,
+    }
+
+
+def main() -> None:
+    cpus = os.cpu_count() or 1
+    default_workers = ",".join(str(n) for n in (1, 2, 4, 8, 16) if n <= cpus) or "1"
+    parser = argparse.ArgumentParser(description="多进程工作模式吞吐量基准")
+    parser.add_argument("--database", required=True, help="读取的数据库")
+    parser.add_argument("--collection", required=True, help="读取的集合")
+    parser.add_argument("--seed", type=int, default=0, help="集合中文档少于该数量时补充合成文档")
+    parser.add_argument("--workers", default=default_workers, help="测试的工作进程数量，逗号分隔")
+    parser.add_argument("--sessions", type=int, default=16, help="并发会话数量")
+    parser.add_argument("--limit", type=int, default=1000, help="每次调用读取的文档数量")
+    parser.add_argument("--duration", type=float, default=15, help="每轮持续时间（秒）")
+    parser.add_argument("--port", type=int, default=8766, help="HTTP服务器端口")
+    args = parser.parse_args()
+
+    load_dotenv()
+    if not os.getenv("MONGODB_URI"):
+        print("错误: 未设置MONGODB_URI环境变量")
+        return
+    if args.seed:
+        seed(args.database, args.collection, args.seed)
+
+    print(f"CPU核心数: {cpus}，并发会话: {args.sessions}，每次读取: {args.limit} 个文档")
+    print(f"{'工作进程':<10}{'调用/秒':>10}{'文档/秒':>12}{'p50(ms)':>10}{'p95(ms)':>10}{'加速':>8}")
+    baseline = None
+    for workers in (int(n) for n in args.workers.split(",")):
+        result = asyncio.run(run(workers, args))
+        baseline = baseline or result["calls_per_s"]
+        print(f"{result['workers']:<10}{result['calls_per_s']:>10.1f}{result['docs_per_s']:>12.0f}"
+              f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+              f"{result['calls_per_s'] / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
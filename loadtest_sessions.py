@@ -0,0 +1,170 @@
+"""
+多会话负载测试
+
+比较两种部署方式下N个客户端会话的MongoDB连接数和调用延迟（需要可用的MONGODB_URI）：
+- stdio: 每个会话启动一个独立的服务器进程，各自建立连接池
+- http: 一个服务器进程（streamable HTTP）服务全部会话，共享一个连接池
+
+连接数取自各服务器get_metrics中的 mongo_connections_open，启动耗时包括进程启动、
+MCP握手和第一次调用（其中包含建立MongoDB连接）
+
+用法: python loadtest_sessions.py [--sessions 16] [--calls 50] --database test --collection users
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+from dotenv import load_dotenv
+from fastmcp import Client
+from fastmcp.client.transports import StdioTransport, StreamableHttpTransport
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """样本的分位数"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def open_connections(client: Client) -> float:
+    """读取服务器当前打开的MongoDB连接数"""
+    result = await client.call_tool("get_metrics", {})
+    return result.structured_content["data"]["gauges"].get("mongo_connections_open", 0)
+
+
+async def run_session(client: Client, tool: str, arguments: Dict[str, Any],
+                      calls: int) -> Tuple[float, List[float]]:
+    """
+    在一个会话中依次调用工具
+
+    Returns:
+        (启动耗时, 其余调用的延迟列表)，单位毫秒
+    """
+    started = time.perf_counter()
+    await client.__aenter__()
+    await client.call_tool(tool, arguments)
+    startup_ms = (time.perf_counter() - started) * 1000
+    latencies = []
+    for _ in range(calls - 1):
+        started = time.perf_counter()
+        await client.call_tool(tool, arguments)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return startup_ms, latencies
+
+
+async def run_stdio(args: argparse.Namespace, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """每个会话一个stdio服务器进程"""
+    clients = [
+        Client(StdioTransport(
+            command=sys.executable,
+            args=["-m", "mongo_atlas_mcp.server"],
+            env=dict(os.environ),
+            cwd=ROOT
+        ))
+        for _ in range(args.sessions)
+    ]
+    try:
+        results = await asyncio.gather(*(
+            run_session(client, args.tool, arguments, args.calls) for client in clients
+        ))
+        connections = sum(await asyncio.gather(*(open_connections(c) for c in clients)))
+    finally:
+        for client in clients:
+            await client.__aexit__(None, None, None)
+    return summarize("stdio", results, connections)
+
+
+async def wait_until_ready(url: str, timeout: float) -> None:
+    """等待HTTP服务器开始接受请求"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with Client(StreamableHttpTransport(url)) as client:
+                await client.list_tools()
+                return
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def run_http(args: argparse.Namespace, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """一个HTTP服务器进程服务全部会话"""
+    url = f"http://127.0.0.1:{args.port}/mcp"
+    server = subprocess.Popen(
+        [sys.executable, "run_server.py", "--transport", "http", "--port", str(args.port)],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        await wait_until_ready(url, timeout=30)
+        # 使用建立会话的握手，每个客户端都有服务器签发的会话，分别计算每会话限制
+        clients = [
+            Client(StreamableHttpTransport(url), mode="legacy") for _ in range(args.sessions)
+        ]
+        try:
+            results = await asyncio.gather(*(
+                run_session(client, args.tool, arguments, args.calls) for client in clients
+            ))
+            connections = await open_connections(clients[0])
+        finally:
+            for client in clients:
+                await client.__aexit__(None, None, None)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return summarize("http", results, connections)
+
+
+def summarize(mode: str, results: List[Tuple[float, List[float]]],
+              connections: float) -> Dict[str, Any]:
+    """汇总各会话的结果"""
+    startups = [startup for startup, _ in results]
+    latencies = [latency for _, samples in results for latency in samples]
+    return {
+        "mode": mode,
+        "connections": int(connections),
+        "startup_ms": statistics.median(startups),
+        "p50_ms": percentile(latencies, 0.5) if latencies else 0.0,
+        "p95_ms": percentile(latencies, 0.95) if latencies else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="多会话负载测试")
+    parser.add_argument("--sessions", type=int, default=16, help="并发会话数量")
+    parser.add_argument("--calls", type=int, default=50, help="每个会话的调用次数")
+    parser.add_argument("--database", required=True, help="查询的数据库")
+    parser.add_argument("--collection", required=True, help="查询的集合")
+    parser.add_argument("--tool", default="find_documents", help="调用的工具")
+    parser.add_argument("--limit", type=int, default=10, help="find_documents的limit")
+    parser.add_argument("--port", type=int, default=8765, help="HTTP服务器端口")
+    parser.add_argument("--modes", default="stdio,http", help="测试的部署方式，逗号分隔")
+    args = parser.parse_args()
+
+    load_dotenv()
+    if not os.getenv("MONGODB_URI"):
+        print("错误: 未设置MONGODB_URI环境变量")
+        return
+
+    arguments: Dict[str, Any] = {"database": args.database, "collection": args.collection}
+    if args.tool == "find_documents":
+        arguments["limit"] = args.limit
+
+    runners = {"stdio": run_stdio, "http": run_http}
+    print(f"会话数量: {args.sessions}，每个会话调用: {args.calls} 次 {args.tool}")
+    print(f"{'方式':<8}{'MongoDB连接数':>14}{'启动中位数(ms)':>16}{'p50(ms)':>10}{'p95(ms)':>10}")
+    for mode in args.modes.split(","):
+        result = asyncio.run(runners[mode](args, arguments))
+        print(f"{result['mode']:<8}{result['connections']:>14}{result['startup_ms']:>16.1f}"
+              f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
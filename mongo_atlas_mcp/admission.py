@@ -0,0 +1,194 @@
+"""
+MongoDB Atlas MCP 准入控制
+
+在工具调用到达MongoAtlasManager之前限制并发：全局并发上限、按命名空间的并发上限，
+以及轻量/重量操作两条独立通道。等待队列有长度和时间上限，超出时快速拒绝
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from .metrics import metrics
+
+# 始终按重量操作处理的工具
+EXPENSIVE_TOOLS = {
+    "aggregate", "create_index", "distinct", "infer_schema", "approximate_stats",
+    "vector_search", "create_materialized_view", "refresh_materialized_view",
+    "index_report", "gridfs_put", "gridfs_get"
+}
+
+# multi=True 时按重量操作处理的工具
+MULTI_EXPENSIVE_TOOLS = {"update_document", "delete_document"}
+
+
+class Overloaded(Exception):
+    """服务器过载，请求被准入控制拒绝"""
+
+
+def is_expensive(tool_name: str, arguments: Dict[str, Any]) -> bool:
+    """
+    判断一次工具调用是否属于重量操作
+
+    Args:
+        tool_name: 工具名称
+        arguments: 调用参数
+
+    Returns:
+        是否为重量操作
+    """
+    if tool_name in EXPENSIVE_TOOLS:
+        return True
+    if tool_name in MULTI_EXPENSIVE_TOOLS:
+        # 分批模式只启动后台任务，调用本身很轻
+        return bool(arguments.get("multi")) and not arguments.get("chunked")
+    if tool_name == "create_indexes":
+        # 不等待时只在后台发起构建
+        return bool(arguments.get("wait"))
+    if tool_name == "find_documents":
+        return not arguments.get("limit")
+    return False
+
+
+def namespace_of(arguments: Dict[str, Any]) -> Optional[str]:
+    """
+    从调用参数中取出命名空间
+
+    Args:
+        arguments: 调用参数
+
+    Returns:
+        "数据库.集合" 或 "数据库"，参数中没有数据库时返回None
+    """
+    database = arguments.get("database")
+    if not database:
+        return None
+    collection = arguments.get("collection")
+    return f"{database}.{collection}" if collection else database
+
+
+class AdmissionController:
+    """
+    准入控制器
+
+    一次调用需要依次获得所在通道、所在命名空间和全局的并发名额
+    """
+
+    def __init__(self, max_concurrent: int = 32, max_per_namespace: int = 8,
+                 max_cheap: int = 32, max_expensive: int = 4,
+                 max_queue: int = 64, queue_timeout: float = 5.0):
+        """
+        初始化准入控制器
+
+        Args:
+            max_concurrent: 全局并发上限
+            max_per_namespace: 每个命名空间的并发上限
+            max_cheap: 轻量操作通道的并发上限
+            max_expensive: 重量操作通道的并发上限
+            max_queue: 同时排队等待的调用数量上限
+            queue_timeout: 排队等待的最长时间（秒）
+        """
+        self.max_per_namespace = max_per_namespace
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._global = asyncio.Semaphore(max_concurrent)
+        self._lanes = {
+            "cheap": asyncio.Semaphore(max_cheap),
+            "expensive": asyncio.Semaphore(max_expensive),
+        }
+        # 命名空间的信号量和正在使用（执行或排队）它的调用数，没有调用时移除
+        self._namespaces: Dict[str, asyncio.Semaphore] = {}
+        self._namespace_users: Dict[str, int] = {}
+        self._queued = 0
+        self._running = 0
+
+    def _checkout_namespace(self, namespace: str) -> asyncio.Semaphore:
+        """获取命名空间对应的信号量，不存在时创建，并登记一个使用者"""
+        semaphore = self._namespaces.get(namespace)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_per_namespace)
+            self._namespaces[namespace] = semaphore
+        self._namespace_users[namespace] = self._namespace_users.get(namespace, 0) + 1
+        return semaphore
+
+    def _checkin_namespace(self, namespace: str) -> None:
+        """注销一个使用者，命名空间没有使用者时移除其信号量"""
+        users = self._namespace_users[namespace] - 1
+        if users:
+            self._namespace_users[namespace] = users
+        else:
+            del self._namespace_users[namespace]
+            del self._namespaces[namespace]
+
+    @asynccontextmanager
+    async def admit(self, namespace: Optional[str], expensive: bool) -> AsyncIterator[None]:
+        """
+        获取执行名额
+
+        Args:
+            namespace: 调用所在的命名空间
+            expensive: 是否为重量操作
+
+        Raises:
+            Overloaded: 等待队列已满或排队超时
+        """
+        lane = "expensive" if expensive else "cheap"
+        semaphores: List[asyncio.Semaphore] = [self._lanes[lane]]
+        if namespace:
+            semaphores.append(self._checkout_namespace(namespace))
+        semaphores.append(self._global)
+
+        try:
+            acquired = await self._acquire(semaphores, lane)
+            self._running += 1
+            metrics.set_gauge("admission_running", self._running)
+            try:
+                yield
+            finally:
+                self._running -= 1
+                metrics.set_gauge("admission_running", self._running)
+                for semaphore in acquired:
+                    semaphore.release()
+        finally:
+            if namespace:
+                self._checkin_namespace(namespace)
+
+    async def _acquire(self, semaphores: List[asyncio.Semaphore],
+                       lane: str) -> List[asyncio.Semaphore]:
+        """按顺序获取所有信号量，需要等待时进入有界队列，失败时释放已获取的部分"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        acquired: List[asyncio.Semaphore] = []
+        queued = False
+        try:
+            for semaphore in semaphores:
+                if not semaphore.locked():
+                    # 有空闲名额时acquire不会挂起
+                    await semaphore.acquire()
+                else:
+                    if not queued:
+                        if self._queued >= self.max_queue:
+                            metrics.incr("admission_rejections", reason="queue_full", lane=lane)
+                            raise Overloaded(f"等待队列已满（{self.max_queue}）")
+                        queued = True
+                        self._queued += 1
+                        metrics.set_gauge("admission_queued", self._queued)
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError
+                    await asyncio.wait_for(semaphore.acquire(), remaining)
+                acquired.append(semaphore)
+            return acquired
+        except asyncio.TimeoutError:
+            for semaphore in acquired:
+                semaphore.release()
+            metrics.incr("admission_rejections", reason="queue_timeout", lane=lane)
+            raise Overloaded(f"排队超过 {self.queue_timeout} 秒")
+        except BaseException:
+            for semaphore in acquired:
+                semaphore.release()
+            raise
+        finally:
+            if queued:
+                self._queued -= 1
+                metrics.set_gauge("admission_queued", self._queued)
@@ -0,0 +1,196 @@
+"""
+GridFS 文件传输
+
+在本地文件和GridFS存储桶之间流式传输：上传按块读取本地文件，下载按块范围并行读取
+chunks集合并按顺序写出。同时在途的块数有上限，内存占用与文件大小无关
+"""
+
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Deque, Dict, Iterator, List, Tuple
+
+from pymongo.collection import Collection
+
+
+class BlobError(ValueError):
+    """GridFS文件不存在、已损坏或本地路径不可用"""
+
+
+def resolve_local_path(base_directory: str, path: str) -> str:
+    """
+    解析本地文件路径，只允许访问base_directory下的文件
+
+    Args:
+        base_directory: 允许读写的目录
+        path: 相对于该目录的路径，或该目录下的绝对路径
+
+    Returns:
+        规范化后的绝对路径
+    """
+    base = os.path.realpath(base_directory)
+    resolved = os.path.realpath(os.path.join(base, path))
+    if os.path.commonpath([base, resolved]) != base:
+        raise BlobError(f"本地路径必须位于 {base} 下: {path}")
+    return resolved
+
+
+def read_file_blocks(path: str, block_size: int, digest: Any) -> Iterator[bytes]:
+    """逐块读取本地文件并更新摘要"""
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+            yield block
+
+
+def chunk_span(file_document: Dict[str, Any], offset: int, length: int) -> Tuple[int, int, int]:
+    """
+    计算字节范围覆盖的块
+
+    Args:
+        file_document: files集合中的文件文档
+        offset: 起始字节
+        length: 字节数
+
+    Returns:
+        (第一个块序号, 最后一个块序号之后的序号, 第一个块内需要跳过的字节数)
+    """
+    chunk_size = file_document["chunkSize"]
+    first = offset // chunk_size
+    end = (offset + length + chunk_size - 1) // chunk_size if length else first
+    return first, end, offset - first * chunk_size
+
+
+class RangeReader:
+    """
+    按块范围并行读取GridFS文件
+
+    每个任务读取连续的batch_chunks个块，最多parallelism个任务同时在途，
+    结果按块序号顺序交给输出函数，内存中最多保留 parallelism × batch_chunks 个块
+    """
+
+    def __init__(self, chunks: Collection, parallelism: int = 4, batch_chunks: int = 16,
+                 execute: Callable[[Callable[[], Any]], Any] = None):
+        """
+        初始化读取器
+
+        Args:
+            chunks: 存储桶的chunks集合
+            parallelism: 同时执行的读取任务数量
+            batch_chunks: 每个任务读取的块数量
+            execute: 执行一次块查询的函数（例如带重试的执行器），默认直接执行
+        """
+        self.chunks = chunks
+        self.parallelism = max(1, parallelism)
+        self.batch_chunks = max(1, batch_chunks)
+        self.execute = execute or (lambda fn: fn())
+
+    def _fetch(self, file_id: Any, first: int, end: int) -> List[bytes]:
+        """读取序号在 [first, end) 的块，缺少块时报错"""
+        chunks = self.execute(lambda: list(self.chunks.find(
+            {"files_id": file_id, "n": {"$gte": first, "$lt": end}},
+            projection={"_id": 0, "n": 1, "data": 1},
+            sort=[("n", 1)]
+        )))
+        blocks = []
+        expected = first
+        for chunk in chunks:
+            if chunk["n"] != expected:
+                raise BlobError(f"文件 {file_id} 缺少块 {expected}")
+            blocks.append(bytes(chunk["data"]))
+            expected += 1
+        if expected != end:
+            raise BlobError(f"文件 {file_id} 缺少块 {expected}")
+        return blocks
+
+    def read(self, file_document: Dict[str, Any], offset: int, length: int,
+             sink: Callable[[bytes], None]) -> int:
+        """
+        读取字节范围并按顺序交给sink
+
+        Args:
+            file_document: files集合中的文件文档
+            offset: 起始字节
+            length: 字节数（调用方已限制在文件长度内）
+            sink: 接收数据的函数
+
+        Returns:
+            输出的字节数
+        """
+        first, end, skip = chunk_span(file_document, offset, length)
+        remaining = length
+        pending: Deque[Future] = deque()
+        with ThreadPoolExecutor(max_workers=self.parallelism) as executor:
+            try:
+                for start in range(first, end, self.batch_chunks):
+                    pending.append(executor.submit(
+                        self._fetch, file_document["_id"], start, min(start + self.batch_chunks, end)
+                    ))
+                    if len(pending) < self.parallelism:
+                        continue
+                    remaining, skip = self._drain(pending.popleft(), remaining, skip, sink)
+                while pending:
+                    remaining, skip = self._drain(pending.popleft(), remaining, skip, sink)
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+        return length - remaining
+
+    @staticmethod
+    def _drain(future: Future, remaining: int, skip: int,
+               sink: Callable[[bytes], None]) -> Tuple[int, int]:
+        """输出一个任务读取的块，去掉范围之外的字节"""
+        for block in future.result():
+            if skip:
+                block = block[skip:]
+                skip = 0
+            if len(block) > remaining:
+                block = block[:remaining]
+            if block:
+                sink(block)
+                remaining -= len(block)
+        return remaining, skip
+
+
+def describe_file(file_document: Dict[str, Any]) -> Dict[str, Any]:
+    """生成可直接序列化的文件描述"""
+    upload_date = file_document.get("uploadDate")
+    return {
+        "file_id": str(file_document["_id"]),
+        "filename": file_document.get("filename"),
+        "length": file_document.get("length", 0),
+        "chunk_size": file_document.get("chunkSize"),
+        "upload_date": upload_date.isoformat() if upload_date else None,
+        "metadata": file_document.get("metadata"),
+    }
+
+
+def write_atomically(path: str, overwrite: bool, writer: Callable[[BinaryIO], Any]) -> Any:
+    """
+    先写入临时文件，完成后再替换目标文件
+
+    Args:
+        path: 目标路径
+        overwrite: 目标已存在时是否覆盖
+        writer: 接收已打开文件的写入函数
+
+    Returns:
+        writer的返回值
+    """
+    if os.path.exists(path) and not overwrite:
+        raise BlobError(f"本地文件已存在: {path}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f"{path}.part"
+    try:
+        with open(partial, "wb") as f:
+            result = writer(f)
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return result
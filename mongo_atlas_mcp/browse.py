@@ -0,0 +1,68 @@
+"""
+集合浏览资源
+
+集合内容按 _id 升序以键集分页方式读取：页码令牌编码上一页最后一个文档的 _id，
+下一页从该 _id 之后继续，不使用skip，任意一页的读取代价都与第一页相同
+"""
+
+import base64
+from typing import Any, Dict, Optional
+from urllib.parse import quote
+
+from bson import json_util
+
+# 资源URI的协议前缀
+SCHEME = "mongodb://"
+
+
+def encode_page_token(last_id: Any) -> str:
+    """
+    生成下一页的令牌
+
+    Args:
+        last_id: 本页最后一个文档的 _id
+
+    Returns:
+        URL安全的令牌，以Canonical Extended JSON保留 _id 的类型
+    """
+    payload = json_util.dumps({"_id": last_id}, json_options=json_util.CANONICAL_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_page_token(token: str) -> Any:
+    """
+    解析页码令牌
+
+    Args:
+        token: encode_page_token生成的令牌
+
+    Returns:
+        上一页最后一个文档的 _id
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        return json_util.loads(base64.urlsafe_b64decode(padded.encode()).decode())["_id"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"无效的页码令牌: {token}") from e
+
+
+def collection_uri(database_name: str, collection_name: str, page: Optional[str] = None,
+                   page_size: Optional[int] = None) -> str:
+    """集合浏览资源的URI"""
+    uri = f"{SCHEME}{quote(database_name, safe='')}/{quote(collection_name, safe='')}"
+    query = []
+    if page:
+        query.append(f"page={page}")
+    if page_size:
+        query.append(f"page_size={page_size}")
+    return f"{uri}?{'&'.join(query)}" if query else uri
+
+
+def metadata_uri(database_name: str, collection_name: str) -> str:
+    """集合元数据资源的URI"""
+    return f"{collection_uri(database_name, collection_name)}/metadata"
+
+
+def render(value: Dict[str, Any]) -> str:
+    """将资源内容编码为Relaxed Extended JSON文本"""
+    return json_util.dumps(value, json_options=json_util.RELAXED_JSON_OPTIONS)
@@ -0,0 +1,332 @@
+"""
+分批批量写入任务
+
+按_id顺序分批找出匹配的文档，逐批删除或更新，根据每批耗时和复制延迟自适应调整批大小。
+任务进度保存在元数据集合中，中断后可以从最后处理的_id继续
+"""
+
+import datetime
+import logging
+import os
+import socket
+import threading
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from bson import json_util
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+INTERRUPTED = "interrupted"
+
+
+class BatchSizer:
+    """
+    自适应批大小
+
+    加性增、乘性减：耗时超过目标或复制延迟超限时减半，否则增加四分之一
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, target_ms: float):
+        """
+        初始化批大小控制
+
+        Args:
+            initial: 初始批大小
+            minimum: 最小批大小
+            maximum: 最大批大小
+            target_ms: 每批的目标耗时（毫秒）
+        """
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.target_ms = target_ms
+        self.size = min(max(initial, self.minimum), self.maximum)
+
+    def update(self, elapsed_ms: float, lagging: bool = False) -> int:
+        """
+        根据上一批的表现调整批大小
+
+        Args:
+            elapsed_ms: 上一批的耗时（毫秒）
+            lagging: 复制延迟是否超过上限
+
+        Returns:
+            下一批的大小
+        """
+        if lagging or elapsed_ms > self.target_ms:
+            self.size = max(self.minimum, self.size // 2)
+        elif elapsed_ms < self.target_ms / 2:
+            self.size = min(self.maximum, self.size + max(1, self.size // 4))
+        return self.size
+
+
+class BulkJob:
+    """
+    分批删除或更新任务的定义和进度
+
+    过滤器和更新以Extended JSON字符串保存，避免以$开头的键写入元数据集合
+    """
+
+    def __init__(self, operation: str, database: str, collection: str,
+                 filter_dict: Dict[str, Any], update: Optional[Any] = None,
+                 batch_size: int = 1000, job_id: Optional[str] = None):
+        """
+        初始化任务
+
+        Args:
+            operation: delete 或 update
+            database: 数据库名称
+            collection: 集合名称
+            filter_dict: 过滤器
+            update: 更新操作（update任务）
+            batch_size: 初始批大小
+            job_id: 任务ID，为空时自动生成
+        """
+        self.job_id = job_id or uuid.uuid4().hex
+        self.operation = operation
+        self.database = database
+        self.collection = collection
+        self.filter = filter_dict
+        self.update = update
+        self.batch_size = batch_size
+        self.status = RUNNING
+        self.last_id: Any = None
+        self.batches = 0
+        self.matched = 0
+        self.modified = 0
+        self.deleted = 0
+        self.error: Optional[str] = None
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+        self.updated_at = self.started_at
+        # 运行任务的进程标识
+        self.owner: Optional[str] = None
+        self.cancel_requested = threading.Event()
+
+    @property
+    def processed(self) -> int:
+        """已处理的文档数量"""
+        return self.deleted if self.operation == "delete" else self.matched
+
+    def record_batch(self, last_id: Any, result: Any, batch_size: int) -> None:
+        """记录一批的处理结果"""
+        self.last_id = last_id
+        self.batches += 1
+        self.batch_size = batch_size
+        if self.operation == "delete":
+            self.deleted += result.deleted_count
+        else:
+            self.matched += result.matched_count
+            self.modified += result.modified_count
+        self.updated_at = datetime.datetime.now(datetime.timezone.utc)
+
+    def finish(self, status: str, error: Optional[str] = None) -> None:
+        """记录任务结束"""
+        self.status = status
+        self.error = error
+        self.updated_at = datetime.datetime.now(datetime.timezone.utc)
+
+    def to_document(self) -> Dict[str, Any]:
+        """转换为元数据集合中的文档"""
+        return {
+            "_id": self.job_id,
+            "operation": self.operation,
+            "database": self.database,
+            "collection": self.collection,
+            "filter": json_util.dumps(self.filter),
+            "update": json_util.dumps(self.update),
+            "batch_size": self.batch_size,
+            "status": self.status,
+            "last_id": self.last_id,
+            "batches": self.batches,
+            "matched": self.matched,
+            "modified": self.modified,
+            "deleted": self.deleted,
+            "error": self.error,
+            "started_at": self.started_at,
+            "updated_at": self.updated_at,
+            "owner": self.owner,
+        }
+
+    @classmethod
+    def from_document(cls, document: Dict[str, Any]) -> "BulkJob":
+        """从元数据集合中的文档恢复"""
+        job = cls(
+            operation=document["operation"],
+            database=document["database"],
+            collection=document["collection"],
+            filter_dict=json_util.loads(document["filter"]),
+            update=json_util.loads(document["update"]),
+            batch_size=document["batch_size"],
+            job_id=document["_id"],
+        )
+        job.status = document["status"]
+        job.last_id = document.get("last_id")
+        job.batches = document.get("batches", 0)
+        job.matched = document.get("matched", 0)
+        job.modified = document.get("modified", 0)
+        job.deleted = document.get("deleted", 0)
+        job.error = document.get("error")
+        job.started_at = document.get("started_at", job.started_at)
+        job.updated_at = document.get("updated_at", job.updated_at)
+        job.owner = document.get("owner")
+        return job
+
+    def describe(self) -> Dict[str, Any]:
+        """生成可直接序列化的任务描述"""
+        return {
+            "job_id": self.job_id,
+            "operation": self.operation,
+            "namespace": f"{self.database}.{self.collection}",
+            "status": self.status,
+            "batches": self.batches,
+            "batch_size": self.batch_size,
+            "processed": self.processed,
+            "matched": self.matched,
+            "modified": self.modified,
+            "deleted": self.deleted,
+            "last_id": None if self.last_id is None else str(self.last_id),
+            "error": self.error,
+            "started_at": self.started_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+        }
+
+
+class JobStore:
+    """
+    批量任务存储
+
+    本进程中正在运行的任务以内存中的对象为准，其他任务每次都从元数据集合读取，
+    因此多个进程（多进程工作模式的各工作进程、多个stdio进程）看到一致的进度。
+    元数据中仍为运行状态的任务，如果属于其他进程且在 stale_after 秒内保存过进度，
+    视为仍在那个进程中运行，否则视为已中断
+    """
+
+    def __init__(self, collection_factory: Callable[[], Collection], stale_after: float = 300.0):
+        """
+        初始化任务存储
+
+        Args:
+            collection_factory: 返回元数据集合的函数，延迟到首次访问时调用
+            stale_after: 其他进程的运行中任务超过这么久（秒）没有保存进度时视为已中断
+        """
+        self._collection_factory = collection_factory
+        self.stale_after = stale_after
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._jobs: Dict[str, BulkJob] = {}
+        self._threads: Dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()
+
+    def _restore(self, document: Dict[str, Any]) -> BulkJob:
+        """从元数据文档恢复不在本进程中运行的任务"""
+        job = BulkJob.from_document(document)
+        if job.status == RUNNING:
+            updated_at = job.updated_at
+            if updated_at.tzinfo is None:
+                updated_at = updated_at.replace(tzinfo=datetime.timezone.utc)
+            idle = (datetime.datetime.now(datetime.timezone.utc) - updated_at).total_seconds()
+            if job.owner == self.owner or idle > self.stale_after:
+                job.status = INTERRUPTED
+        return job
+
+    def get(self, job_id: str) -> Optional[BulkJob]:
+        """按ID获取任务"""
+        if self.is_active(job_id):
+            with self._lock:
+                return self._jobs[job_id]
+        document = self._collection_factory().find_one({"_id": job_id})
+        return None if document is None else self._restore(document)
+
+    def list(self, limit: int = 50) -> List[BulkJob]:
+        """按开始时间倒序列出最近的任务"""
+        documents = self._collection_factory().find({}, sort=[("started_at", -1)], limit=limit)
+        jobs = []
+        for document in documents:
+            if self.is_active(document["_id"]):
+                with self._lock:
+                    jobs.append(self._jobs[document["_id"]])
+            else:
+                jobs.append(self._restore(document))
+        return jobs
+
+    def save(self, job: BulkJob) -> None:
+        """
+        保存任务进度
+
+        只覆盖属于本进程的任务文档；文档已被其他进程恢复时停止本进程中的执行。
+        其他进程请求的取消在这里被发现
+        """
+        job.owner = self.owner
+        try:
+            before = self._collection_factory().find_one_and_replace(
+                {"_id": job.job_id, "owner": {"$in": [self.owner, None]}},
+                job.to_document(), upsert=True
+            )
+        except DuplicateKeyError:
+            logger.warning(f"分批任务 {job.job_id} 已由其他进程恢复，停止本进程中的执行")
+            job.cancel_requested.set()
+            return
+        if before is not None and before.get("cancel_requested"):
+            job.cancel_requested.set()
+
+    def claim(self, job: BulkJob) -> bool:
+        """
+        恢复任务前把任务文档改为属于本进程
+
+        以读取时的owner和updated_at为条件，两个进程同时恢复同一任务时只有一个成功
+
+        Returns:
+            是否成功
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        document = self._collection_factory().find_one_and_update(
+            {"_id": job.job_id, "owner": job.owner, "updated_at": job.updated_at},
+            {"$set": {"owner": self.owner, "status": RUNNING, "updated_at": now},
+             "$unset": {"cancel_requested": ""}},
+            projection={"_id": 1}
+        )
+        if document is None:
+            return False
+        job.owner = self.owner
+        job.updated_at = now
+        return True
+
+    def request_cancel(self, job: BulkJob) -> None:
+        """取消任务：本进程中运行的任务直接通知，其他进程中的任务在下次保存进度时停止"""
+        if self.is_active(job.job_id):
+            job.cancel_requested.set()
+            return
+        self._collection_factory().update_one(
+            {"_id": job.job_id, "status": RUNNING}, {"$set": {"cancel_requested": True}}
+        )
+
+    def is_active(self, job_id: str) -> bool:
+        """任务是否正在本进程中运行"""
+        with self._lock:
+            thread = self._threads.get(job_id)
+            return thread is not None and thread.is_alive()
+
+    def start(self, job: BulkJob, target: Callable[[BulkJob], None]) -> None:
+        """
+        在后台线程中运行任务
+
+        Args:
+            job: 任务
+            target: 执行任务的函数
+        """
+        with self._lock:
+            thread = self._threads.get(job.job_id)
+            if thread is not None and thread.is_alive():
+                raise ValueError(f"任务 {job.job_id} 正在运行")
+            thread = threading.Thread(
+                target=target, args=(job,), name=f"bulk-{job.job_id}", daemon=True
+            )
+            self._jobs[job.job_id] = job
+            self._threads[job.job_id] = thread
+        thread.start()
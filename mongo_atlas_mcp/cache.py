@@ -0,0 +1,114 @@
+"""
+MongoDB Atlas MCP 结果缓存
+
+线程安全的TTL + LRU缓存，键的第一个元素约定为命名空间，便于写入后按命名空间失效
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+from bson import json_util
+
+# 缓存未命中的标记
+MISSING = object()
+
+
+def cache_key(namespace: str, *parts: Any) -> Tuple[Hashable, ...]:
+    """
+    生成缓存键
+
+    Args:
+        namespace: 命名空间（数据库.集合）
+        parts: 其余组成部分，字典和列表会序列化为Extended JSON字符串
+
+    Returns:
+        以命名空间开头的元组
+    """
+    return (namespace,) + tuple(
+        json_util.dumps(part) if isinstance(part, (dict, list)) else part
+        for part in parts
+    )
+
+
+class TTLCache:
+    """
+    TTL缓存
+
+    条目超过存活时间后失效，条目数超过上限时淘汰最久未使用的条目
+    """
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 1024):
+        """
+        初始化缓存
+
+        Args:
+            ttl: 默认存活时间（秒）
+            max_entries: 条目数量上限
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存值，未命中或已过期时返回MISSING
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+            ttl: 存活时间（秒），默认使用缓存的ttl
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_namespace(self, namespace: str) -> int:
+        """
+        使某个命名空间的所有条目失效
+
+        Args:
+            namespace: 命名空间（数据库.集合）
+
+        Returns:
+            失效的条目数量
+        """
+        with self._lock:
+            keys = [
+                key for key in self._entries
+                if isinstance(key, tuple) and key and key[0] == namespace
+            ]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,161 @@
+"""
+MongoDB 变更流
+
+后台线程持续读取变更流并放入有上限的缓冲区，watch_next按批次取出事件。
+缓冲区满时读取线程暂停，未读取的事件留在服务器的oplog中，内存占用保持有界
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from pymongo.errors import PyMongoError
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeStreamEntry:
+    """
+    已打开的变更流
+
+    与CursorEntry具有相同的 last_used/owner/close 接口，可以由CursorRegistry管理空闲超时和数量上限
+    """
+
+    def __init__(self, stream: Any, namespace: str, buffer_size: int = 1000):
+        """
+        初始化变更流并启动读取线程
+
+        Args:
+            stream: pymongo的ChangeStream
+            namespace: 监听范围（集群、数据库或集合）
+            buffer_size: 缓冲区最多保存的事件数量
+        """
+        self.stream = stream
+        self.namespace = namespace
+        self.buffer_size = buffer_size
+        self.owner: Optional[str] = None
+        self.last_used = time.monotonic()
+        self.delivered = 0
+        self.error: Optional[PyMongoError] = None
+        self.done = False
+        self.paused = False
+        self._buffer: Deque[Tuple[float, Dict[str, Any]]] = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        # 读取线程已消费到的位置，以及已交付给调用方的位置
+        self._stream_token = stream.resume_token
+        self._delivered_token = stream.resume_token
+        self._thread = threading.Thread(
+            target=self._run, name=f"watch-{namespace}", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        """读取线程：把事件放入缓冲区，缓冲区满时等待消费"""
+        try:
+            while True:
+                with self._condition:
+                    while len(self._buffer) >= self.buffer_size and not self._closed:
+                        if not self.paused:
+                            self.paused = True
+                            metrics.incr("watch_buffer_full")
+                        self._condition.wait()
+                    self.paused = False
+                    if self._closed:
+                        return
+                # try_next最多阻塞maxAwaitTimeMS，便于及时响应关闭
+                event = self.stream.try_next()
+                with self._condition:
+                    if event is not None:
+                        self._buffer.append((time.time(), event))
+                        metrics.incr("watch_events")
+                        self._condition.notify_all()
+                    self._stream_token = self.stream.resume_token
+        except PyMongoError as e:
+            if not self._closed:
+                logger.warning(f"变更流 {self.namespace} 中断: {str(e)}")
+                self.error = e
+        except Exception as e:
+            # 关闭时底层游标可能在try_next中途失效
+            if not self._closed:
+                logger.warning(f"变更流 {self.namespace} 读取失败: {str(e)}")
+                self.error = PyMongoError(str(e))
+        finally:
+            with self._condition:
+                self.done = True
+                self._condition.notify_all()
+
+    def read(self, max_events: int, max_wait: float) -> Tuple[List[Dict[str, Any]], Any]:
+        """
+        取出一批事件
+
+        Args:
+            max_events: 本批最多返回的事件数量
+            max_wait: 缓冲区为空时最多等待的秒数
+
+        Returns:
+            (事件列表, 恢复令牌)，恢复令牌指向本批最后一个事件之后的位置
+        """
+        self.last_used = time.monotonic()
+        deadline = time.monotonic() + max_wait
+        with self._condition:
+            while not self._buffer and not self.done:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            events = []
+            while self._buffer and len(events) < max_events:
+                events.append(self._buffer.popleft()[1])
+            if self._buffer:
+                self._delivered_token = events[-1]["_id"]
+            else:
+                # 缓冲区已清空，读取线程的位置就是已交付的位置（包含没有事件的批次推进的令牌）
+                self._delivered_token = self._stream_token
+            self.delivered += len(events)
+            self._condition.notify_all()
+            self.last_used = time.monotonic()
+            return events, self._delivered_token
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        缓冲与消费延迟统计
+
+        Returns:
+            包含buffered、lag_ms（最早未消费事件的集群时间到现在）、
+            oldest_buffered_ms（最早未消费事件在缓冲区中停留的时间）和paused的字典
+        """
+        with self._condition:
+            buffered = len(self._buffer)
+            oldest = self._buffer[0] if self._buffer else None
+        now = time.time()
+        lag_ms = 0.0
+        oldest_buffered_ms = 0.0
+        if oldest is not None:
+            received_at, event = oldest
+            oldest_buffered_ms = (now - received_at) * 1000
+            cluster_time = event.get("clusterTime")
+            if cluster_time is not None:
+                lag_ms = max(0.0, (now - cluster_time.time) * 1000)
+        return {
+            "buffered": buffered,
+            "lag_ms": round(lag_ms, 1),
+            "oldest_buffered_ms": round(oldest_buffered_ms, 1),
+            "paused": self.paused,
+            "delivered": self.delivered,
+        }
+
+    def close(self) -> None:
+        """停止读取线程并关闭变更流"""
+        with self._condition:
+            self._closed = True
+            self._buffer.clear()
+            self._condition.notify_all()
+        try:
+            self.stream.close()
+        except Exception as e:
+            logger.warning(f"关闭变更流失败: {str(e)}")
@@ -0,0 +1,18 @@
+"""
+MongoDB Atlas MCP 请求上下文
+
+保存当前工具调用的请求级信息，随asyncio任务和to_thread调用传递到数据库层
+"""
+
+from contextvars import ContextVar
+from typing import Optional
+
+# 当前工具调用的操作ID，作为comment附加到MongoDB命令上，用于取消时定位服务器操作
+current_operation_id: ContextVar[Optional[str]] = ContextVar(
+    "current_operation_id", default=None
+)
+
+# 当前工具调用所属的MCP会话ID，用于按会话限流和统计
+current_session_id: ContextVar[str] = ContextVar(
+    "current_session_id", default="default"
+)
@@ -0,0 +1,207 @@
+"""
+MongoDB 游标注册表
+
+保存分页读取中尚未读完的游标，供后续get_more调用继续读取
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import bson
+
+from .context import current_operation_id
+
+logger = logging.getLogger(__name__)
+
+
+class CursorEntry:
+    """
+    已注册的游标
+
+    除游标本身外，还保存因超出字节上限而留到下一页的文档，
+    以及创建游标的操作ID（comment）和当前正在读取它的操作ID
+    """
+
+    __slots__ = (
+        "cursor", "namespace", "comment", "owner",
+        "last_used", "pending", "done", "lock"
+    )
+
+    def __init__(self, cursor: Any, namespace: str, comment: Optional[str] = None):
+        self.cursor = cursor
+        self.namespace = namespace
+        self.comment = comment
+        self.owner: Optional[str] = None
+        self.last_used = time.monotonic()
+        self.pending: Optional[Dict[str, Any]] = None
+        self.done = False
+        self.lock = threading.Lock()
+
+    @property
+    def exhausted(self) -> bool:
+        """游标中是否已没有更多结果"""
+        return self.pending is None and (self.done or not self.cursor.alive)
+
+    def read_page(self, page_size: int, max_bytes: int) -> List[Dict[str, Any]]:
+        """
+        从游标读取一页结果
+
+        Args:
+            page_size: 本页最多返回的文档数量
+            max_bytes: 本页文档BSON大小之和的上限，至少返回一个文档
+
+        Returns:
+            本页文档列表
+        """
+        with self.lock:
+            self.owner = current_operation_id.get()
+            self.last_used = time.monotonic()
+            documents: List[Dict[str, Any]] = []
+            try:
+                self._fill(documents, page_size, max_bytes)
+            finally:
+                self.owner = None
+            return documents
+
+    def _fill(self, documents: List[Dict[str, Any]], page_size: int,
+              max_bytes: int) -> None:
+        """按数量和字节上限从游标读取文档到documents中（调用方需持有锁）"""
+        total_bytes = 0
+        while len(documents) < page_size:
+            if self.pending is not None:
+                document, self.pending = self.pending, None
+            else:
+                try:
+                    document = next(self.cursor)
+                except StopIteration:
+                    self.done = True
+                    break
+            size = len(bson.encode(document))
+            if documents and total_bytes + size > max_bytes:
+                self.pending = document
+                break
+            documents.append(document)
+            total_bytes += size
+
+    def close(self) -> None:
+        """关闭底层游标"""
+        try:
+            self.cursor.close()
+        except Exception as e:
+            logger.warning(f"关闭游标失败: {str(e)}")
+
+
+class CursorRegistry:
+    """
+    游标注册表
+
+    按ID保存未读完的游标，超过空闲时间或数量上限时关闭最久未使用的游标
+    """
+
+    def __init__(self, ttl_seconds: float = 600, max_cursors: int = 100):
+        """
+        初始化游标注册表
+
+        Args:
+            ttl_seconds: 游标空闲多久后被关闭
+            max_cursors: 同时保留的游标数量上限
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_cursors = max_cursors
+        self._entries: "OrderedDict[str, CursorEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, entry: CursorEntry) -> str:
+        """
+        注册游标
+
+        Args:
+            entry: 待注册的游标
+
+        Returns:
+            游标ID
+        """
+        cursor_id = uuid.uuid4().hex
+        evicted = []
+        with self._lock:
+            evicted.extend(self._pop_expired())
+            self._entries[cursor_id] = entry
+            while len(self._entries) > self.max_cursors:
+                evicted.append(self._entries.popitem(last=False)[1])
+        for old in evicted:
+            old.close()
+        return cursor_id
+
+    def get(self, cursor_id: str) -> Optional[CursorEntry]:
+        """
+        获取游标，同时将其标记为最近使用
+
+        Args:
+            cursor_id: 游标ID
+
+        Returns:
+            游标，不存在或已过期时返回None
+        """
+        with self._lock:
+            expired = self._pop_expired()
+            entry = self._entries.get(cursor_id)
+            if entry is not None:
+                self._entries.move_to_end(cursor_id)
+        for old in expired:
+            old.close()
+        return entry
+
+    def close(self, cursor_id: str) -> bool:
+        """
+        关闭并移除游标
+
+        Args:
+            cursor_id: 游标ID
+
+        Returns:
+            游标是否存在
+        """
+        with self._lock:
+            entry = self._entries.pop(cursor_id, None)
+        if entry is None:
+            return False
+        entry.close()
+        return True
+
+    def pop_owned_by(self, operation_id: str) -> List[CursorEntry]:
+        """
+        移除正在被指定操作读取的游标
+
+        Args:
+            operation_id: 操作ID
+
+        Returns:
+            被移除的游标，由调用方负责关闭
+        """
+        with self._lock:
+            owned_ids = [
+                cursor_id for cursor_id, entry in self._entries.items()
+                if entry.owner == operation_id
+            ]
+            return [self._entries.pop(cursor_id) for cursor_id in owned_ids]
+
+    def close_all(self) -> None:
+        """关闭所有游标"""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.close()
+
+    def _pop_expired(self) -> List[CursorEntry]:
+        """移除已过期的游标（调用方需持有锁）"""
+        deadline = time.monotonic() - self.ttl_seconds
+        expired_ids = [
+            cursor_id for cursor_id, entry in self._entries.items()
+            if entry.last_used < deadline
+        ]
+        return [self._entries.pop(cursor_id) for cursor_id in expired_ids]
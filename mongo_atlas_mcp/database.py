@@ -5,17 +5,58 @@ MongoDB Atlas 数据库连接和操作核心类
 """
 
 import os
+import math
+import time
+import re
+import json
 import logging
-from typing import List, Dict, Any, Optional
-from pymongo import MongoClient
+import datetime
+import threading
+import tempfile
+import base64
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import List, Dict, Any, Iterable, Optional, ContextManager, Union
+import numpy as np
+import bson
+import pymongo
+from bson import ObjectId, json_util
+from gridfs import GridFSBucket
+from pymongo import IndexModel, MongoClient
 from pymongo.database import Database
 from pymongo.collection import Collection
-from pymongo.errors import PyMongoError
+from pymongo.errors import OperationFailure, PyMongoError
+from pymongo.write_concern import WriteConcern
 from dotenv import load_dotenv
 
 from .models import (
     DatabaseInfo, CollectionInfo, IndexInfo, MongoResponse
 )
+from .cache import MISSING, TTLCache, cache_key
+from .cursors import CursorEntry, CursorRegistry
+from .changestreams import ChangeStreamEntry
+from .context import current_operation_id
+from .metrics import ConnectionPoolMetrics, metrics
+from .schema import SchemaAccumulator, example_value
+from .sketches import FieldSketch, extract_field
+from .vectors import LocalVectorEngine
+from .views import MaterializedView, ViewRegistry, aggregates_documents
+from .indexbuilds import IndexBuild, IndexBuildRegistry
+from .indexreport import analyze_collection, rank_candidates
+from .templates import QueryTemplate, TemplateRegistry, plan_signature
+from .readpolicy import ReadPolicies
+from .spill import SpillFile, SpillQuotaExceeded, SpillStore
+from .browse import collection_uri, decode_page_token, encode_page_token, metadata_uri, render
+from .blobs import (
+    BlobError, RangeReader, describe_file, read_file_blocks, resolve_local_path, write_atomically
+)
+from .bulkjobs import (
+    CANCELLED, COMPLETED, FAILED, RUNNING, BatchSizer, BulkJob, JobStore
+)
+from .resilience import (
+    READ, WRITE, MULTI_WRITE, CircuitBreaker, ResilientExecutor, RetryPolicy
+)
 
 # 加载环境变量
 load_dotenv()
@@ -24,6 +65,54 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 已经限定输出规模的聚合阶段，存在时不再自动追加$limit
+_BOUNDING_STAGES = ("$limit", "$count", "$out", "$merge")
+
+# distinct结果超过16MB时服务器返回的错误码
+_DISTINCT_TOO_BIG_CODES = (17217, 10334)
+
+# 部署不支持$vectorSearch（非Atlas或未启用Atlas Search）时返回的错误码
+_VECTOR_SEARCH_UNAVAILABLE_CODES = (40324, 6047401, 31082)
+
+
+def _plan_stages(plan: Any) -> List[str]:
+    """
+    收集执行计划中出现的所有阶段名称
+    
+    Args:
+        plan: explain返回的计划（或其中的一部分）
+        
+    Returns:
+        阶段名称列表，例如 ["PROJECTION_COVERED", "DISTINCT_SCAN"]
+    """
+    stages: List[str] = []
+    if isinstance(plan, dict):
+        if isinstance(plan.get("stage"), str):
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+def _filter_shape(value: Any) -> Any:
+    """
+    去掉过滤器中的具体取值，只保留字段和运算符结构，用作执行计划缓存键
+    
+    Args:
+        value: 过滤器或其中的一部分
+        
+    Returns:
+        与value结构相同、取值替换为None的对象
+    """
+    if isinstance(value, dict):
+        return {key: _filter_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_filter_shape(item) for item in value]
+    return None
+
 
 class MongoAtlasManager:
     """
@@ -35,7 +124,120 @@ class MongoAtlasManager:
     def __init__(self):
         """初始化MongoDB Atlas管理器"""
         self.client: Optional[MongoClient] = None
+        self.default_timeout_ms = int(os.getenv('MONGODB_DEFAULT_TIMEOUT_MS', '60000'))
+        self.page_size = int(os.getenv('MONGODB_PAGE_SIZE', '1000'))
+        self.max_response_bytes = int(os.getenv('MONGODB_MAX_RESPONSE_BYTES', str(4 * 1024 * 1024)))
+        self.aggregate_auto_limit = int(os.getenv('MONGODB_AGGREGATE_AUTO_LIMIT', '0'))
+        self.read_policies = ReadPolicies(json.loads(os.getenv('MONGODB_READ_POLICIES', '{}')))
+        self.count_cache = TTLCache(
+            ttl=float(os.getenv('MONGODB_COUNT_CACHE_TTL', '30')),
+            max_entries=int(os.getenv('MONGODB_COUNT_CACHE_SIZE', '1024'))
+        )
+        self.distinct_cache = TTLCache(
+            ttl=float(os.getenv('MONGODB_DISTINCT_CACHE_TTL', '300')),
+            max_entries=int(os.getenv('MONGODB_DISTINCT_CACHE_SIZE', '256'))
+        )
+        self.distinct_max_values = int(os.getenv('MONGODB_DISTINCT_MAX_VALUES', '10000'))
+        # distinct是否使用DISTINCT_SCAN只取决于字段和过滤器结构，按结构缓存，创建索引后失效
+        self.distinct_plan_cache = TTLCache(
+            ttl=float(os.getenv('MONGODB_DISTINCT_PLAN_CACHE_TTL', '600')),
+            max_entries=int(os.getenv('MONGODB_DISTINCT_PLAN_CACHE_SIZE', '1024'))
+        )
+        self.page_cache = TTLCache(
+            ttl=float(os.getenv('MONGODB_PAGE_CACHE_TTL', '30')),
+            max_entries=int(os.getenv('MONGODB_PAGE_CACHE_SIZE', '256'))
+        )
+        self.browse_page_size = int(os.getenv('MONGODB_BROWSE_PAGE_SIZE', '100'))
+        self.catalog_cache = TTLCache(
+            ttl=float(os.getenv('MONGODB_CATALOG_CACHE_TTL', '300')),
+            max_entries=int(os.getenv('MONGODB_CATALOG_CACHE_SIZE', '1024'))
+        )
+        self.schema_cache = TTLCache(
+            ttl=float(os.getenv('MONGODB_SCHEMA_CACHE_TTL', '3600')),
+            max_entries=int(os.getenv('MONGODB_SCHEMA_CACHE_SIZE', '128'))
+        )
+        self.schema_sample_size = int(os.getenv('MONGODB_SCHEMA_SAMPLE_SIZE', '1000'))
+        self.stats_sample_size = int(os.getenv('MONGODB_STATS_SAMPLE_SIZE', '10000'))
+        self.stats_max_documents = int(os.getenv('MONGODB_STATS_MAX_DOCUMENTS', '1000000'))
+        self.vector_engine = LocalVectorEngine(
+            cache_dir=os.getenv(
+                'MONGODB_VECTOR_CACHE_DIR',
+                os.path.join(tempfile.gettempdir(), 'mongo_atlas_mcp_vectors')
+            ),
+            refresh_interval=float(os.getenv('MONGODB_VECTOR_REFRESH_SECONDS', '60'))
+        )
+        self.vector_prefilter_limit = int(os.getenv('MONGODB_VECTOR_PREFILTER_LIMIT', '100000'))
+        self.spill_threshold_bytes = int(
+            os.getenv('MONGODB_SPILL_THRESHOLD_BYTES', str(self.max_response_bytes))
+        )
+        self.spill_max_read_lines = int(os.getenv('MONGODB_SPILL_MAX_READ_LINES', '1000'))
+        self.spills = SpillStore(
+            directory=os.getenv(
+                'MONGODB_SPILL_DIR',
+                os.path.join(tempfile.gettempdir(), 'mongo_atlas_mcp_spill')
+            ),
+            ttl=float(os.getenv('MONGODB_SPILL_TTL', '3600')),
+            quota_bytes=int(os.getenv('MONGODB_SPILL_QUOTA_BYTES', str(1024 ** 3)))
+        )
+        self.gridfs_dir = os.getenv(
+            'MONGODB_GRIDFS_DIR', os.path.join(tempfile.gettempdir(), 'mongo_atlas_mcp_gridfs')
+        )
+        self.gridfs_chunk_size = int(os.getenv('MONGODB_GRIDFS_CHUNK_SIZE', str(255 * 1024)))
+        self.gridfs_read_parallelism = int(os.getenv('MONGODB_GRIDFS_READ_PARALLELISM', '4'))
+        self.gridfs_read_batch_chunks = int(os.getenv('MONGODB_GRIDFS_READ_BATCH_CHUNKS', '16'))
+        self.gridfs_max_inline_bytes = int(os.getenv('MONGODB_GRIDFS_MAX_INLINE_BYTES', '65536'))
+        self.cursors = CursorRegistry(
+            ttl_seconds=float(os.getenv('MONGODB_CURSOR_TTL', '600')),
+            max_cursors=int(os.getenv('MONGODB_MAX_OPEN_CURSORS', '100'))
+        )
+        self.streams = CursorRegistry(
+            ttl_seconds=float(os.getenv('MONGODB_WATCH_TTL', '600')),
+            max_cursors=int(os.getenv('MONGODB_MAX_WATCH_STREAMS', '20'))
+        )
+        self.watch_buffer_size = int(os.getenv('MONGODB_WATCH_BUFFER_SIZE', '1000'))
+        # infer_schema细化结构使用的变更流，命名空间 -> 变更流ID
+        self.schema_streams: Dict[str, str] = {}
         self._connect()
+        views_db, _, views_coll = os.getenv(
+            'MONGODB_VIEWS_NAMESPACE', 'mcp_meta.materialized_views'
+        ).partition('.')
+        self.views = ViewRegistry(lambda: self.get_collection(views_db, views_coll))
+        jobs_db, _, jobs_coll = os.getenv(
+            'MONGODB_JOBS_NAMESPACE', 'mcp_meta.bulk_jobs'
+        ).partition('.')
+        self.jobs = JobStore(
+            lambda: self.get_collection(jobs_db, jobs_coll),
+            stale_after=float(os.getenv('MONGODB_BULK_STALE_SECONDS', '300'))
+        )
+        self.index_builds = IndexBuildRegistry()
+        self.index_report_concurrency = int(os.getenv('MONGODB_INDEX_REPORT_CONCURRENCY', '8'))
+        self.bulk_batch_size = int(os.getenv('MONGODB_BULK_BATCH_SIZE', '1000'))
+        self.bulk_min_batch_size = int(os.getenv('MONGODB_BULK_MIN_BATCH_SIZE', '10'))
+        self.bulk_max_batch_size = int(os.getenv('MONGODB_BULK_MAX_BATCH_SIZE', '10000'))
+        self.bulk_target_batch_ms = float(os.getenv('MONGODB_BULK_TARGET_BATCH_MS', '500'))
+        self.bulk_max_lag_ms = float(os.getenv('MONGODB_BULK_MAX_REPLICATION_LAG_MS', '5000'))
+        self._replication_lag_available = True
+        templates_db, _, templates_coll = os.getenv(
+            'MONGODB_TEMPLATES_NAMESPACE', 'mcp_meta.query_templates'
+        ).partition('.')
+        self.templates = TemplateRegistry(lambda: self.get_collection(templates_db, templates_coll))
+        self.template_explain_every = int(os.getenv('MONGODB_TEMPLATE_EXPLAIN_EVERY', '100'))
+        self.resilience = ResilientExecutor(
+            CircuitBreaker(
+                self.cluster_name,
+                failure_threshold=int(os.getenv('MONGODB_BREAKER_THRESHOLD', '5')),
+                window=float(os.getenv('MONGODB_BREAKER_WINDOW_MS', '10000')) / 1000,
+                reset_timeout=float(os.getenv('MONGODB_BREAKER_RESET_MS', '30000')) / 1000
+            ),
+            RetryPolicy(
+                max_attempts=int(os.getenv('MONGODB_RETRY_ATTEMPTS', '3')),
+                base_delay=float(os.getenv('MONGODB_RETRY_BASE_DELAY_MS', '100')) / 1000,
+                max_delay=float(os.getenv('MONGODB_RETRY_MAX_DELAY_MS', '2000')) / 1000
+            )
+        )
+        templates_file = os.getenv('MONGODB_QUERY_TEMPLATES_FILE')
+        if templates_file:
+            self.load_query_templates(templates_file)
     
     def _connect(self) -> None:
         """
@@ -48,7 +250,17 @@ class MongoAtlasManager:
             if not mongodb_uri:
                 raise ValueError("MONGODB_URI环境变量未设置")
             
-            self.client = MongoClient(mongodb_uri)
+            # 集群名称取连接字符串中的主机部分，用于熔断器和指标
+            self.cluster_name = (
+                mongodb_uri.split('://', 1)[-1].split('@')[-1].split('/')[0].split('?')[0]
+            )
+            # HTTP/SSE模式下所有会话共享这一个客户端及其连接池
+            self.client = MongoClient(
+                mongodb_uri,
+                maxPoolSize=int(os.getenv('MONGODB_MAX_POOL_SIZE', '100')),
+                minPoolSize=int(os.getenv('MONGODB_MIN_POOL_SIZE', '0')),
+                event_listeners=[ConnectionPoolMetrics()]
+            )
             # 测试连接
             self.client.admin.command('ping')
             logger.info("成功连接到MongoDB Atlas")
@@ -85,6 +297,97 @@ class MongoAtlasManager:
         database = self.get_database(database_name)
         return database[collection_name]
     
+    def _timeout_ms(self, max_time_ms: Optional[int]) -> Optional[int]:
+        """
+        计算本次调用生效的超时时间
+        
+        Args:
+            max_time_ms: 调用方指定的超时时间（毫秒），未指定时使用服务器默认值
+            
+        Returns:
+            超时时间（毫秒），None表示不限制
+        """
+        return max_time_ms or self.default_timeout_ms or None
+    
+    def _timeout(self, max_time_ms: Optional[int]) -> ContextManager:
+        """
+        为不支持maxTimeMS参数的操作设置客户端超时（timeoutMS）
+        
+        Args:
+            max_time_ms: 调用方指定的超时时间（毫秒）
+            
+        Returns:
+            超时上下文管理器
+        """
+        timeout_ms = self._timeout_ms(max_time_ms)
+        return pymongo.timeout(timeout_ms / 1000) if timeout_ms else nullcontext()
+    
+    @staticmethod
+    def _record_error(operation: str, error: Exception) -> None:
+        """
+        记录操作错误的指标
+        
+        Args:
+            operation: 操作名称
+            error: 捕获的异常
+        """
+        if isinstance(error, PyMongoError) and error.timeout:
+            metrics.incr("timeouts", operation=operation)
+    
+    def _invalidate(self, database_name: str, collection_name: str) -> None:
+        """
+        写入后使该集合的缓存结果失效
+        
+        Args:
+            database_name: 数据库名称
+            collection_name: 集合名称
+        """
+        namespace = f"{database_name}.{collection_name}"
+        self.count_cache.invalidate_namespace(namespace)
+        self.distinct_cache.invalidate_namespace(namespace)
+        self.page_cache.invalidate_namespace(namespace)
+        self.catalog_cache.invalidate_namespace(namespace)
+    
+    def cancel_operation(self, operation_id: str) -> int:
+        """
+        取消正在执行的操作
+        
+        关闭该操作正在读取的分页游标，并对服务器上带有该操作ID作为comment的命令执行killOp
+        
+        Args:
+            operation_id: 操作ID
+            
+        Returns:
+            被终止的服务器操作数量
+        """
+        comments = [operation_id]
+        for entry in self.cursors.pop_owned_by(operation_id):
+            if entry.comment:
+                comments.append(entry.comment)
+            entry.close()
+        
+        try:
+            admin = self.client.admin
+            operations = admin.aggregate([
+                {"$currentOp": {"ownOps": True}},
+                {"$match": {"$or": [
+                    {"command.comment": {"$in": comments}},
+                    {"cursor.originatingCommand.comment": {"$in": comments}}
+                ]}},
+                {"$project": {"opid": 1}}
+            ])
+            killed = 0
+            for operation in operations:
+                admin.command("killOp", op=operation["opid"])
+                killed += 1
+            if killed:
+                logger.info(f"已终止操作 {operation_id} 的 {killed} 个服务器命令")
+            return killed
+            
+        except PyMongoError as e:
+            logger.warning(f"终止操作 {operation_id} 失败: {str(e)}")
+            return 0
+    
     def list_databases(self) -> MongoResponse:
         """
         列出所有数据库
@@ -94,28 +397,28 @@ class MongoAtlasManager:
         """
         try:
             databases = []
-            for db_name in self.client.list_database_names():
+            database_names = self.resilience.execute(
+                "list_databases", self.client.list_database_names
+            )
+            for db_name in database_names:
                 # 只获取数据库名称，不执行需要管理员权限的命令
-                database_info = DatabaseInfo(
+                databases.append(DatabaseInfo(
                     name=db_name,
                     size_on_disk=0,  # 不获取大小信息，避免权限问题
                     empty=False
-                )
-                databases.append(database_info.model_dump())
+                ))
             
             return MongoResponse(
                 success=True,
                 data=databases,
-                count=len(databases),
-                message="成功列出数据库"
+                count=len(databases)
             )
             
         except Exception as e:
             logger.error(f"列出数据库失败: {str(e)}")
             return MongoResponse(
                 success=False,
-                error=str(e),
-                message="列出数据库失败"
+                error=str(e)
             )
     
     def list_collections(self, database_name: str) -> MongoResponse:
@@ -132,29 +435,29 @@ class MongoAtlasManager:
             database = self.get_database(database_name)
             collections = []
             
-            for collection_name in database.list_collection_names():
+            collection_names = self.resilience.execute(
+                "list_collections", database.list_collection_names
+            )
+            for collection_name in collection_names:
                 # 只获取集合名称，不执行需要管理员权限的命令
-                collection_info = CollectionInfo(
+                collections.append(CollectionInfo(
                     name=collection_name,
                     count=0,  # 不获取文档数量，避免权限问题
                     size=0,   # 不获取大小信息，避免权限问题
                     avg_obj_size=0
-                )
-                collections.append(collection_info.model_dump())
+                ))
             
             return MongoResponse(
                 success=True,
                 data=collections,
-                count=len(collections),
-                message="成功列出集合"
+                count=len(collections)
             )
             
         except Exception as e:
             logger.error(f"列出集合失败: {str(e)}")
             return MongoResponse(
                 success=False,
-                error=str(e),
-                message="列出集合失败"
+                error=str(e)
             )
     
     def find_documents(self, database_name: str, collection_name: str, 
@@ -162,40 +465,73 @@ class MongoAtlasManager:
                       projection: Dict[str, Any] = None,
                       sort: List[tuple] = None,
                       limit: int = None,
-                      skip: int = 0) -> MongoResponse:
+                      skip: int = 0,
+                      max_time_ms: int = None) -> MongoResponse:
         """
         查询文档
         
+        未指定投影时使用命名空间的读取策略：默认投影，以及在服务器端裁剪深层子文档、
+        长数组、长字符串和二进制数据，被裁剪的字段路径记录在文档的 _trimmed 中。
+        结果超过溢出阈值时写入本地NDJSON文件，data中返回资源URI、行数和结构摘要
+        
         Args:
             database_name: 数据库名称
             collection_name: 集合名称
             filter_dict: 查询过滤器
-            projection: 投影字段
+            projection: 投影字段，指定时不使用读取策略
             sort: 排序规则
             limit: 限制返回数量
             skip: 跳过文档数量
+            max_time_ms: 服务器端执行时间上限（毫秒）
             
         Returns:
             包含查询结果的响应对象
         """
         try:
             collection = self.get_collection(database_name, collection_name)
+            policy = None if projection else self.read_policies.get(database_name, collection_name)
+            if policy is not None:
+                projection = policy.projection
             
-            cursor = collection.find(
-                filter=filter_dict or {},
-                projection=projection
-            )
-            
-            if sort:
-                cursor = cursor.sort(sort)
-            
-            if skip:
-                cursor = cursor.skip(skip)
+            def run_trimmed_query() -> Union[List[Dict[str, Any]], SpillFile]:
+                options: Dict[str, Any] = {}
+                timeout_ms = self._timeout_ms(max_time_ms)
+                if timeout_ms:
+                    options["maxTimeMS"] = timeout_ms
+                comment = current_operation_id.get()
+                if comment:
+                    options["comment"] = comment
+                pipeline = policy.build_pipeline(filter_dict, sort, skip, limit)
+                return self._collect_or_spill(
+                    policy.unwrap(collection.aggregate(pipeline, **options)), namespace
+                )
             
-            if limit:
-                cursor = cursor.limit(limit)
+            def run_query() -> Union[List[Dict[str, Any]], SpillFile]:
+                cursor = collection.find(
+                    filter=filter_dict or {},
+                    projection=projection,
+                    max_time_ms=self._timeout_ms(max_time_ms),
+                    comment=current_operation_id.get()
+                )
+                
+                if sort:
+                    cursor = cursor.sort(sort)
+                
+                if skip:
+                    cursor = cursor.skip(skip)
+                
+                if limit:
+                    cursor = cursor.limit(limit)
+                
+                return self._collect_or_spill(cursor, namespace)
             
-            documents = list(cursor)
+            namespace = f"{database_name}.{collection_name}"
+            documents = self.resilience.execute(
+                "find_documents",
+                run_trimmed_query if policy is not None and policy.trims else run_query
+            )
+            if isinstance(documents, SpillFile):
+                return MongoResponse(success=True, data=documents.describe(), count=documents.rows)
             
             # 序列化文档，将 ObjectId 转换为字符串
             serialized_documents = []
@@ -215,240 +551,2623 @@ class MongoAtlasManager:
             )
             
         except PyMongoError as e:
+            self._record_error("find_documents", e)
+            logger.error(f"查询文档失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"查询文档失败: {str(e)}"
+            )
+        except SpillQuotaExceeded as e:
             logger.error(f"查询文档失败: {str(e)}")
             return MongoResponse(
                 success=False,
                 error=f"查询文档失败: {str(e)}"
             )
     
-    def insert_document(self, database_name: str, collection_name: str, 
-                       document: Dict[str, Any]) -> MongoResponse:
+    def count_documents(self, database_name: str, collection_name: str,
+                        filter_dict: Dict[str, Any] = None,
+                        exact: bool = False,
+                        use_cache: bool = False,
+                        max_time_ms: int = None) -> MongoResponse:
         """
-        插入文档
+        统计文档数量
+        
+        过滤器为空且未要求精确计数时使用estimated_document_count（只读取集合元数据），
+        否则使用count_documents。精确计数可以选择使用TTL缓存
         
         Args:
             database_name: 数据库名称
             collection_name: 集合名称
-            document: 要插入的文档
+            filter_dict: 查询过滤器
+            exact: 过滤器为空时是否仍然精确计数
+            use_cache: 是否使用缓存的精确计数
+            max_time_ms: 服务器端执行时间上限（毫秒）
             
         Returns:
-            包含插入结果的响应对象
+            data中包含count和mode（exact、estimated或cached）的响应对象
         """
         try:
             collection = self.get_collection(database_name, collection_name)
-            result = collection.insert_one(document)
+            filter_dict = filter_dict or {}
+            timeout_ms = self._timeout_ms(max_time_ms)
+            
+            if not filter_dict and not exact:
+                options = {"maxTimeMS": timeout_ms} if timeout_ms else {}
+                count = self.resilience.execute(
+                    "count_documents",
+                    lambda: collection.estimated_document_count(**options)
+                )
+                return MongoResponse(
+                    success=True,
+                    data={"count": count, "mode": "estimated"},
+                    count=count
+                )
+            
+            key = cache_key(f"{database_name}.{collection_name}", "count", filter_dict)
+            if use_cache:
+                cached = self.count_cache.get(key)
+                if cached is not MISSING:
+                    return MongoResponse(
+                        success=True,
+                        data={"count": cached, "mode": "cached"},
+                        count=cached
+                    )
+            
+            options = {"comment": current_operation_id.get()}
+            if timeout_ms:
+                options["maxTimeMS"] = timeout_ms
+            count = self.resilience.execute(
+                "count_documents",
+                lambda: collection.count_documents(filter_dict, **options)
+            )
+            if use_cache:
+                self.count_cache.set(key, count)
             
             return MongoResponse(
                 success=True,
-                data={"inserted_id": str(result.inserted_id)},
-                count=1
+                data={"count": count, "mode": "exact"},
+                count=count
             )
             
         except PyMongoError as e:
-            logger.error(f"插入文档失败: {str(e)}")
+            self._record_error("count_documents", e)
+            logger.error(f"统计文档数量失败: {str(e)}")
             return MongoResponse(
                 success=False,
-                error=f"插入文档失败: {str(e)}"
+                error=f"统计文档数量失败: {str(e)}"
             )
     
-    def update_document(self, database_name: str, collection_name: str,
-                       filter_dict: Dict[str, Any], update_dict: Dict[str, Any],
-                       upsert: bool = False, multi: bool = False) -> MongoResponse:
+    def distinct(self, database_name: str, collection_name: str, field: str,
+                 filter_dict: Dict[str, Any] = None,
+                 max_values: int = None,
+                 use_cache: bool = True,
+                 max_time_ms: int = None) -> MongoResponse:
         """
-        更新文档
+        获取字段的不同取值
+        
+        优先使用distinct命令；结果超过16MB时改用流式$group并按max_values截断。
+        通过queryPlanner检查是否使用了DISTINCT_SCAN索引扫描，检查结果按 字段/过滤器结构 缓存，
+        同一结构的后续调用不再额外执行explain。
+        结果按 命名空间/字段/过滤器 缓存，经本服务器写入该集合后失效
         
         Args:
             database_name: 数据库名称
             collection_name: 集合名称
-            filter_dict: 更新过滤器
-            update_dict: 更新操作
-            upsert: 是否插入不存在文档
-            multi: 是否更新多个文档
+            field: 字段路径
+            filter_dict: 查询过滤器
+            max_values: 最多返回的取值数量
+            use_cache: 是否使用缓存结果
+            max_time_ms: 服务器端执行时间上限（毫秒）
             
         Returns:
-            包含更新结果的响应对象
+            data中包含values、method、index_used、truncated和cached的响应对象
         """
         try:
-            collection = self.get_collection(database_name, collection_name)
+            database = self.get_database(database_name)
+            filter_dict = filter_dict or {}
+            max_values = max_values or self.distinct_max_values
+            timeout_ms = self._timeout_ms(max_time_ms)
+            comment = current_operation_id.get()
             
-            if multi:
-                result = collection.update_many(
-                    filter_dict, update_dict, upsert=upsert
+            key = cache_key(
+                f"{database_name}.{collection_name}", "distinct", field, filter_dict, max_values
+            )
+            if use_cache:
+                cached = self.distinct_cache.get(key)
+                if cached is not MISSING:
+                    data = dict(cached, cached=True)
+                    return MongoResponse(success=True, data=data, count=len(data["values"]))
+            
+            command: Dict[str, Any] = {
+                "distinct": collection_name, "key": field, "query": filter_dict
+            }
+            options: Dict[str, Any] = {}
+            if timeout_ms:
+                options["maxTimeMS"] = timeout_ms
+            if comment:
+                options["comment"] = comment
+            
+            plan_key = cache_key(
+                f"{database_name}.{collection_name}", field, _filter_shape(filter_dict)
+            )
+            index_used = self.distinct_plan_cache.get(plan_key)
+            if index_used is MISSING:
+                plan = self.resilience.execute(
+                    "distinct",
+                    lambda: database.command("explain", command, verbosity="queryPlanner")
                 )
-            else:
-                result = collection.update_one(
-                    filter_dict, update_dict, upsert=upsert
+                index_used = "DISTINCT_SCAN" in _plan_stages(plan.get("queryPlanner", plan))
+                self.distinct_plan_cache.set(plan_key, index_used)
+            
+            try:
+                values = self.resilience.execute(
+                    "distinct",
+                    lambda: database.command(dict(command, **options))["values"]
+                )
+                method = "distinct"
+            except OperationFailure as e:
+                if e.code not in _DISTINCT_TOO_BIG_CODES:
+                    raise
+                values = self.resilience.execute(
+                    "distinct",
+                    lambda: self._distinct_by_group(
+                        database[collection_name], field, filter_dict, max_values, options
+                    )
                 )
+                method = "group"
+            
+            truncated = len(values) > max_values
+            data = {
+                "values": values[:max_values],
+                "method": method,
+                "index_used": index_used,
+                "truncated": truncated
+            }
+            if use_cache:
+                self.distinct_cache.set(key, data)
             
             return MongoResponse(
                 success=True,
-                data={
-                    "matched_count": result.matched_count,
-                    "modified_count": result.modified_count,
-                    "upserted_id": str(result.upserted_id) if result.upserted_id else None
-                },
-                count=result.modified_count
+                data=dict(data, cached=False),
+                count=len(data["values"])
             )
             
         except PyMongoError as e:
-            logger.error(f"更新文档失败: {str(e)}")
+            self._record_error("distinct", e)
+            logger.error(f"获取不同取值失败: {str(e)}")
             return MongoResponse(
                 success=False,
-                error=f"更新文档失败: {str(e)}"
+                error=f"获取不同取值失败: {str(e)}"
             )
     
-    def delete_document(self, database_name: str, collection_name: str,
-                       filter_dict: Dict[str, Any], multi: bool = False) -> MongoResponse:
+    @staticmethod
+    def _distinct_by_group(collection: Collection, field: str,
+                           filter_dict: Dict[str, Any], max_values: int,
+                           options: Dict[str, Any]) -> List[Any]:
         """
-        删除文档
+        用流式$group获取不同取值，最多读取max_values + 1个，用于判断是否被截断
+        
+        与distinct命令一致，数组字段按元素展开
+        """
+        pipeline = [
+            {"$match": filter_dict},
+            {"$unwind": {"path": f"${field}", "preserveNullAndEmptyArrays": False}},
+            {"$group": {"_id": f"${field}"}},
+            {"$limit": max_values + 1}
+        ]
+        cursor = collection.aggregate(pipeline, allowDiskUse=True, **options)
+        with cursor:
+            return [document["_id"] for document in cursor]
+    
+    def infer_schema(self, database_name: str, collection_name: str,
+                     sample_size: int = None,
+                     refine: bool = False,
+                     refresh: bool = False,
+                     max_time_ms: int = None) -> MongoResponse:
+        """
+        推断集合结构
+        
+        用$sample抽取样本，在一次流式遍历中合并各文档的类型树。
+        结构按集合缓存：默认直接返回缓存；refine时合并新文档细化已有结构：
+        第一次refine抽取新样本并开始监听集合的变更流，之后的refine只合并变更流中
+        新插入和修改的文档（变更流不可用或已过期时改为重新抽样）。按 _id 去重，
+        已经合并过的文档不会重复计入。refresh时丢弃缓存重新推断
         
         Args:
             database_name: 数据库名称
             collection_name: 集合名称
-            filter_dict: 删除过滤器
-            multi: 是否删除多个文档
+            sample_size: 样本文档数量
+            refine: 是否用新样本细化已缓存的结构
+            refresh: 是否丢弃缓存重新推断
+            max_time_ms: 服务器端执行时间上限（毫秒）
             
         Returns:
-            包含删除结果的响应对象
+            data中包含字段统计和cached标记的响应对象
         """
         try:
             collection = self.get_collection(database_name, collection_name)
+            namespace = f"{database_name}.{collection_name}"
+            key = (namespace, "schema")
+            
+            if refresh:
+                self._close_schema_stream(namespace)
+            accumulator = None if refresh else self.schema_cache.get(key)
+            if accumulator is MISSING:
+                accumulator = None
+            if accumulator is not None and not refine:
+                report = accumulator.report()
+                report["cached"] = True
+                return MongoResponse(success=True, data=report, count=len(report["fields"]))
             
-            if multi:
-                result = collection.delete_many(filter_dict)
+            if accumulator is not None:
+                changes = self._schema_changes(namespace, sample_size or self.schema_sample_size)
+                if changes is not None:
+                    accumulator.add(changes)
+                    self.schema_cache.set(key, accumulator)
+                    report = accumulator.report()
+                    report.update(cached=False, refined_from="change_stream")
+                    return MongoResponse(success=True, data=report, count=len(report["fields"]))
             else:
-                result = collection.delete_one(filter_dict)
+                accumulator = SchemaAccumulator()
+            if refine:
+                # 先开始监听再抽样，抽样期间写入的文档会在下次refine时合并（重复的按 _id 跳过）
+                self._watch_schema(namespace, collection)
             
-            return MongoResponse(
-                success=True,
-                data={"deleted_count": result.deleted_count},
-                count=result.deleted_count
+            options: Dict[str, Any] = {"batchSize": self.page_size}
+            timeout_ms = self._timeout_ms(max_time_ms)
+            if timeout_ms:
+                options["maxTimeMS"] = timeout_ms
+            comment = current_operation_id.get()
+            if comment:
+                options["comment"] = comment
+            
+            # 只对建立游标重试，已经合并的文档不会重复计入
+            cursor = self.resilience.execute(
+                "infer_schema",
+                lambda: collection.aggregate(
+                    [{"$sample": {"size": sample_size or self.schema_sample_size}}], **options
+                )
             )
+            with cursor:
+                accumulator.add(cursor)
+            self.schema_cache.set(key, accumulator)
+            
+            report = accumulator.report()
+            report["cached"] = False
+            if refine:
+                report["refined_from"] = "sample"
+            return MongoResponse(success=True, data=report, count=len(report["fields"]))
             
         except PyMongoError as e:
-            logger.error(f"删除文档失败: {str(e)}")
+            self._record_error("infer_schema", e)
+            logger.error(f"推断集合结构失败: {str(e)}")
             return MongoResponse(
                 success=False,
-                error=f"删除文档失败: {str(e)}"
+                error=f"推断集合结构失败: {str(e)}"
             )
     
-    def aggregate(self, database_name: str, collection_name: str,
-                  pipeline: List[Dict[str, Any]]) -> MongoResponse:
+    def _watch_schema(self, namespace: str, collection: Collection) -> None:
         """
-        执行聚合管道
+        打开用于细化结构的变更流，替换该集合之前的变更流
+        
+        变更流与watch工具共用注册表，空闲超过MONGODB_WATCH_TTL后关闭
+        """
+        self._close_schema_stream(namespace)
+        try:
+            stream = collection.watch(
+                [{"$match": {"operationType": {"$in": ["insert", "replace", "update"]}}}],
+                full_document="updateLookup",
+                max_await_time_ms=1000
+            )
+        except PyMongoError as e:
+            # 单节点部署等不支持变更流，之后的refine改为重新抽样
+            logger.info(f"无法监听 {namespace} 的变更流，refine将重新抽样: {str(e)}")
+            return
+        self.schema_streams[namespace] = self.streams.register(
+            ChangeStreamEntry(stream, namespace, self.watch_buffer_size)
+        )
+    
+    def _schema_changes(self, namespace: str, max_documents: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        取出结构变更流中已缓冲的文档
+        
+        Args:
+            namespace: 命名空间
+            max_documents: 最多取出的事件数量
+            
+        Returns:
+            新插入或修改后的完整文档；没有可用的变更流时返回None
+        """
+        stream_id = self.schema_streams.get(namespace)
+        entry = self.streams.get(stream_id) if stream_id else None
+        if entry is None or entry.error is not None or entry.done:
+            return None
+        documents = []
+        remaining = max_documents
+        while remaining > 0:
+            events, _ = entry.read(remaining, 0)
+            if not events:
+                break
+            remaining -= len(events)
+            documents.extend(event["fullDocument"] for event in events if event.get("fullDocument"))
+        return documents
+    
+    def _close_schema_stream(self, namespace: str) -> None:
+        """关闭集合的结构变更流"""
+        stream_id = self.schema_streams.pop(namespace, None)
+        if stream_id:
+            self.streams.close(stream_id)
+    
+    def approximate_stats(self, database_name: str, collection_name: str, field: str,
+                          filter_dict: Dict[str, Any] = None,
+                          method: str = "sample",
+                          sample_size: int = None,
+                          max_documents: int = None,
+                          quantiles: List[float] = None,
+                          max_time_ms: int = None) -> MongoResponse:
+        """
+        计算字段的近似统计
+        
+        sample方式用$sample抽样，scan方式用只投影该字段的游标流式读取。
+        文档按批次送入HyperLogLog（不同值数量）、t-digest（分位数）和水塘抽样，
+        数值字段同时给出均值及其95%置信区间
         
         Args:
             database_name: 数据库名称
             collection_name: 集合名称
-            pipeline: 聚合管道
+            field: 字段路径
+            filter_dict: 查询过滤器
+            method: sample 或 scan
+            sample_size: sample方式的样本数量
+            max_documents: scan方式最多读取的文档数量
+            quantiles: 需要估计的分位点，默认 [0.5, 0.9, 0.99]
+            max_time_ms: 服务器端执行时间上限（毫秒）
             
         Returns:
-            包含聚合结果的响应对象
+            包含估计值和误差范围的响应对象
         """
         try:
+            if method not in ("sample", "scan"):
+                raise ValueError(f"不支持的统计方式: {method}")
             collection = self.get_collection(database_name, collection_name)
-            cursor = collection.aggregate(pipeline)
-            results = list(cursor)
+            filter_dict = filter_dict or {}
+            quantiles = quantiles or [0.5, 0.9, 0.99]
+            started = time.perf_counter()
             
-            return MongoResponse(
-                success=True,
-                data=results,
-                count=len(results)
-            )
+            options: Dict[str, Any] = {"batchSize": self.page_size}
+            timeout_ms = self._timeout_ms(max_time_ms)
+            if timeout_ms:
+                options["maxTimeMS"] = timeout_ms
+            comment = current_operation_id.get()
+            if comment:
+                options["comment"] = comment
+            projection = {"_id": 0, field: 1}
             
-        except PyMongoError as e:
-            logger.error(f"执行聚合管道失败: {str(e)}")
+            if method == "sample":
+                limit = sample_size or self.stats_sample_size
+                pipeline = ([{"$match": filter_dict}] if filter_dict else []) + [
+                    {"$sample": {"size": limit}}, {"$project": projection}
+                ]
+                open_cursor = lambda: collection.aggregate(pipeline, **options)
+            else:
+                limit = max_documents or self.stats_max_documents
+                open_cursor = lambda: collection.find(
+                    filter_dict, projection, limit=limit, batch_size=options["batchSize"],
+                    max_time_ms=options.get("maxTimeMS"), comment=comment
+                )
+            
+            sketch = FieldSketch()
+            documents_read = 0
+            
+            cursor = self.resilience.execute("approximate_stats", open_cursor)
+            with cursor:
+                batch: List[Dict[str, Any]] = []
+                for document in cursor:
+                    batch.append(document)
+                    if len(batch) >= self.page_size:
+                        documents_read += len(batch)
+                        sketch.add(extract_field(batch, field))
+                        batch = []
+                documents_read += len(batch)
+                sketch.add(extract_field(batch, field))
+            
+            # sample方式或scan达到上限时，结果只代表读取到的部分
+            exact_scope = method == "scan" and documents_read < limit
+            data: Dict[str, Any] = {
+                "method": method,
+                "documents_read": documents_read,
+                "values_read": sketch.values,
+                "complete_scan": exact_scope,
+                "distinct": self._distinct_summary(sketch, exact_scope),
+                "sample_values": [example_value(value) for value in sketch.reservoir.items]
+            }
+            
+            numeric_count = sketch.numeric_count
+            if numeric_count:
+                numeric_sum = sketch.numeric_sum
+                mean = numeric_sum / numeric_count
+                variance = max(0.0, sketch.numeric_sumsq / numeric_count - mean * mean)
+                if numeric_count > 1:
+                    variance *= numeric_count / (numeric_count - 1)
+                stddev = math.sqrt(variance)
+                margin = 0.0 if exact_scope else 1.96 * stddev / math.sqrt(numeric_count)
+                numeric: Dict[str, Any] = {
+                    "count": numeric_count,
+                    "mean": mean,
+                    "mean_ci95": [mean - margin, mean + margin],
+                    "stddev": stddev,
+                    "min": sketch.digest.min,
+                    "max": sketch.digest.max,
+                    "quantiles": {str(q): sketch.digest.quantile(q) for q in quantiles}
+                }
+                if exact_scope:
+                    numeric["sum"] = numeric_sum
+                elif not filter_dict:
+                    total = self.resilience.execute(
+                        "approximate_stats", collection.estimated_document_count
+                    )
+                    scale = total / documents_read if documents_read else 0.0
+                    numeric["sum_estimate"] = numeric_sum * scale
+                    numeric["sum_ci95"] = [
+                        (mean - margin) * numeric_count * scale,
+                        (mean + margin) * numeric_count * scale
+                    ]
+                data["numeric"] = numeric
+            
+            data["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            return MongoResponse(success=True, data=data, count=documents_read)
+            
+        except (PyMongoError, ValueError) as e:
+            self._record_error("approximate_stats", e)
+            logger.error(f"计算近似统计失败: {str(e)}")
             return MongoResponse(
                 success=False,
-                error=f"执行聚合管道失败: {str(e)}"
+                error=f"计算近似统计失败: {str(e)}"
             )
     
-    def create_index(self, database_name: str, collection_name: str,
-                     keys: List[tuple], name: str = None,
-                     unique: bool = False, sparse: bool = False,
-                     background: bool = True) -> MongoResponse:
+    @staticmethod
+    def _distinct_summary(sketch: FieldSketch, exact_scope: bool) -> Dict[str, Any]:
         """
-        创建索引
+        不同值数量的估计
+        
+        HyperLogLog的误差只描述读取到的文档中不同值的数量；样本中的不同值数量不能
+        外推到整个集合（不同值在样本中的比例取决于取值分布），因此样本结果使用sample_前缀
+        """
+        estimate = round(sketch.hll.estimate())
+        relative_error = round(sketch.hll.relative_error, 4)
+        if exact_scope:
+            return {"estimate": estimate, "relative_error": relative_error, "scope": "collection"}
+        return {
+            "sample_estimate": estimate,
+            "sample_relative_error": relative_error,
+            "scope": "sample"
+        }
+    
+    def vector_search(self, database_name: str, collection_name: str, field: str,
+                      query_vector: List[float], k: int = 10,
+                      metric: str = "cosine",
+                      filter_dict: Dict[str, Any] = None,
+                      index: str = None,
+                      engine: str = "auto",
+                      num_candidates: int = None,
+                      projection: Dict[str, Any] = None,
+                      refresh: bool = False,
+                      rebuild: bool = False,
+                      max_time_ms: int = None) -> MongoResponse:
+        """
+        向量相似度检索（kNN）
+        
+        指定了Atlas向量索引时使用$vectorSearch；部署不支持或未指定索引时，
+        使用本地引擎：嵌入字段加载为内存映射的float32矩阵，按_id高水位增量刷新，
+        在矩阵上分块计算余弦相似度或点积并取top-k
         
         Args:
             database_name: 数据库名称
             collection_name: 集合名称
-            keys: 索引键
-            name: 索引名称
-            unique: 是否唯一索引
-            sparse: 是否稀疏索引
-            background: 是否后台创建
+            field: 嵌入向量字段
+            query_vector: 查询向量
+            k: 返回的文档数量
+            metric: 本地引擎的相似度，cosine 或 dot（Atlas使用索引定义中的相似度）
+            filter_dict: 预过滤条件
+            index: Atlas向量索引名称
+            engine: auto、atlas 或 local
+            num_candidates: $vectorSearch的候选数量，默认 k 的10倍
+            projection: 返回文档的投影，默认排除嵌入字段
+            refresh: 是否忽略刷新间隔立即增量刷新本地索引
+            rebuild: 是否重建本地索引（用于捕获更新和删除）
+            max_time_ms: 服务器端执行时间上限（毫秒）
             
         Returns:
-            包含创建索引结果的响应对象
+            按相似度排序、带score字段的文档列表
         """
         try:
+            if engine not in ("auto", "atlas", "local"):
+                raise ValueError(f"不支持的检索引擎: {engine}")
+            if metric not in ("cosine", "dot"):
+                raise ValueError(f"不支持的相似度: {metric}")
+            if engine == "atlas" and not index:
+                raise ValueError("使用Atlas引擎时必须指定向量索引名称")
             collection = self.get_collection(database_name, collection_name)
+            filter_dict = filter_dict or {}
+            projection = projection or {field: 0}
+            timeout_ms = self._timeout_ms(max_time_ms)
+            comment = current_operation_id.get()
             
-            index_options = {
-                "unique": unique,
-                "sparse": sparse,
-                "background": background
-            }
+            if index and engine != "local":
+                try:
+                    documents = self._atlas_vector_search(
+                        collection, field, query_vector, k, filter_dict, index,
+                        num_candidates, projection, timeout_ms, comment
+                    )
+                    return MongoResponse(
+                        success=True,
+                        data={"engine": "atlas", "results": self._serialize_ids(documents)},
+                        count=len(documents)
+                    )
+                except OperationFailure as e:
+                    if engine == "atlas" or e.code not in _VECTOR_SEARCH_UNAVAILABLE_CODES:
+                        raise
+                    logger.info(f"$vectorSearch不可用，改用本地引擎: {str(e)}")
             
-            if name:
-                index_options["name"] = name
+            vector_index = self.resilience.execute(
+                "vector_search",
+                lambda: self.vector_engine.refresh(
+                    collection, field, force=refresh, rebuild=rebuild, comment=comment
+                )
+            )
             
-            result = collection.create_index(keys, **index_options)
+            rows = None
+            if filter_dict:
+                def run_prefilter() -> List[Any]:
+                    cursor = collection.find(
+                        filter_dict, {"_id": 1}, limit=self.vector_prefilter_limit + 1,
+                        batch_size=self.page_size, max_time_ms=timeout_ms, comment=comment
+                    )
+                    with cursor:
+                        return [document["_id"] for document in cursor]
+                
+                matched = self.resilience.execute("vector_search", run_prefilter)
+                if len(matched) > self.vector_prefilter_limit:
+                    raise ValueError(
+                        f"预过滤匹配的文档超过 {self.vector_prefilter_limit} 个，请缩小过滤条件"
+                    )
+                rows = vector_index.rows_for(matched)
+            
+            with vector_index.lock:
+                hits = vector_index.search(
+                    np.asarray(query_vector, dtype=np.float32), k, metric, rows
+                )
+            
+            def fetch_documents() -> List[Dict[str, Any]]:
+                cursor = collection.find(
+                    {"_id": {"$in": [doc_id for doc_id, _ in hits]}}, projection,
+                    max_time_ms=timeout_ms, comment=comment
+                )
+                with cursor:
+                    return list(cursor)
+            
+            by_id = {}
+            if hits:
+                by_id = {
+                    json_util.dumps(document["_id"]): document
+                    for document in self.resilience.execute("vector_search", fetch_documents)
+                }
+            documents = []
+            for doc_id, score in hits:
+                document = by_id.get(json_util.dumps(doc_id))
+                # 索引刷新后被删除的文档不再返回
+                if document is not None:
+                    document["score"] = score
+                    documents.append(document)
             
             return MongoResponse(
                 success=True,
-                data={"index_name": result},
-                count=1
+                data={
+                    "engine": "local",
+                    "metric": metric,
+                    "indexed_vectors": vector_index.count,
+                    "results": self._serialize_ids(documents)
+                },
+                count=len(documents)
             )
             
-        except PyMongoError as e:
-            logger.error(f"创建索引失败: {str(e)}")
+        except (PyMongoError, ValueError) as e:
+            self._record_error("vector_search", e)
+            logger.error(f"向量检索失败: {str(e)}")
             return MongoResponse(
                 success=False,
-                error=f"创建索引失败: {str(e)}"
+                error=f"向量检索失败: {str(e)}"
             )
     
-    def list_indexes(self, database_name: str, collection_name: str) -> MongoResponse:
+    @staticmethod
+    def _serialize_ids(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """将文档的 _id 转换为字符串"""
+        for document in documents:
+            if "_id" in document:
+                document["_id"] = str(document["_id"])
+        return documents
+    
+    def _atlas_vector_search(self, collection: Collection, field: str,
+                             query_vector: List[float], k: int,
+                             filter_dict: Dict[str, Any], index: str,
+                             num_candidates: Optional[int],
+                             projection: Dict[str, Any],
+                             timeout_ms: Optional[int],
+                             comment: Optional[str]) -> List[Dict[str, Any]]:
+        """使用Atlas $vectorSearch检索，得分写入score字段"""
+        stage: Dict[str, Any] = {
+            "index": index,
+            "path": field,
+            "queryVector": list(query_vector),
+            "numCandidates": num_candidates or k * 10,
+            "limit": k
+        }
+        if filter_dict:
+            stage["filter"] = filter_dict
+        pipeline = [
+            {"$vectorSearch": stage},
+            {"$project": projection},
+            {"$addFields": {"score": {"$meta": "vectorSearchScore"}}}
+        ]
+        options: Dict[str, Any] = {}
+        if timeout_ms:
+            options["maxTimeMS"] = timeout_ms
+        if comment:
+            options["comment"] = comment
+        
+        def run_pipeline() -> List[Dict[str, Any]]:
+            with collection.aggregate(pipeline, **options) as cursor:
+                return list(cursor)
+        
+        return self.resilience.execute("vector_search", run_pipeline)
+    
+    def insert_document(self, database_name: str, collection_name: str, 
+                       document: Dict[str, Any],
+                       max_time_ms: int = None) -> MongoResponse:
         """
-        列出集合的所有索引
+        插入文档
         
         Args:
             database_name: 数据库名称
             collection_name: 集合名称
+            document: 要插入的文档
+            max_time_ms: 超时时间（毫秒）
             
         Returns:
-            包含索引列表的响应对象
+            包含插入结果的响应对象
         """
         try:
             collection = self.get_collection(database_name, collection_name)
-            indexes = []
             
-            for index_info in collection.list_indexes():
-                index_data = IndexInfo(
-                    name=index_info["name"],
-                    key=list(index_info["key"]),
-                    unique=index_info.get("unique", False),
-                    sparse=index_info.get("sparse", False),
-                    background=index_info.get("background", True)
-                )
-                indexes.append(index_data.model_dump())
+            def run_insert():
+                with self._timeout(max_time_ms):
+                    return collection.insert_one(
+                        document, comment=current_operation_id.get()
+                    )
+            
+            result = self.resilience.execute("insert_document", run_insert, WRITE)
+            self._invalidate(database_name, collection_name)
             
             return MongoResponse(
                 success=True,
-                data=indexes,
-                count=len(indexes)
+                data={"inserted_id": str(result.inserted_id)},
+                count=1
             )
             
         except PyMongoError as e:
-            logger.error(f"列出索引失败: {str(e)}")
+            self._record_error("insert_document", e)
+            logger.error(f"插入文档失败: {str(e)}")
             return MongoResponse(
                 success=False,
-                error=f"列出索引失败: {str(e)}"
+                error=f"插入文档失败: {str(e)}"
+            )
+    
+    def update_document(self, database_name: str, collection_name: str,
+                       filter_dict: Dict[str, Any], update_dict: Dict[str, Any],
+                       upsert: bool = False, multi: bool = False,
+                       max_time_ms: int = None,
+                       chunked: bool = False,
+                       batch_size: int = None) -> MongoResponse:
+        """
+        更新文档
+        
+        Args:
+            database_name: 数据库名称
+            collection_name: 集合名称
+            filter_dict: 更新过滤器
+            update_dict: 更新操作
+            upsert: 是否插入不存在文档
+            multi: 是否更新多个文档
+            max_time_ms: 超时时间（毫秒）
+            chunked: multi为True时是否按_id分批在后台更新
+            batch_size: 分批更新的初始批大小
+            
+        Returns:
+            包含更新结果的响应对象，分批模式下返回任务信息
+        """
+        if multi and chunked:
+            if upsert:
+                return MongoResponse(success=False, error="分批更新不支持upsert")
+            return self._start_bulk_job(
+                "update", database_name, collection_name, filter_dict, update_dict, batch_size
+            )
+        try:
+            collection = self.get_collection(database_name, collection_name)
+            
+            comment = current_operation_id.get()
+            
+            def run_update():
+                with self._timeout(max_time_ms):
+                    if multi:
+                        return collection.update_many(
+                            filter_dict, update_dict, upsert=upsert, comment=comment
+                        )
+                    return collection.update_one(
+                        filter_dict, update_dict, upsert=upsert, comment=comment
+                    )
+            
+            result = self.resilience.execute(
+                "update_document", run_update, MULTI_WRITE if multi else WRITE
+            )
+            if result.modified_count or result.upserted_id is not None:
+                self._invalidate(database_name, collection_name)
+            
+            return MongoResponse(
+                success=True,
+                data={
+                    "matched_count": result.matched_count,
+                    "modified_count": result.modified_count,
+                    "upserted_id": str(result.upserted_id) if result.upserted_id else None
+                },
+                count=result.modified_count
+            )
+            
+        except PyMongoError as e:
+            self._record_error("update_document", e)
+            logger.error(f"更新文档失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"更新文档失败: {str(e)}"
+            )
+    
+    def delete_document(self, database_name: str, collection_name: str,
+                       filter_dict: Dict[str, Any], multi: bool = False,
+                       max_time_ms: int = None,
+                       chunked: bool = False,
+                       batch_size: int = None) -> MongoResponse:
+        """
+        删除文档
+        
+        Args:
+            database_name: 数据库名称
+            collection_name: 集合名称
+            filter_dict: 删除过滤器
+            multi: 是否删除多个文档
+            max_time_ms: 超时时间（毫秒）
+            chunked: multi为True时是否按_id分批在后台删除
+            batch_size: 分批删除的初始批大小
+            
+        Returns:
+            包含删除结果的响应对象，分批模式下返回任务信息
+        """
+        if multi and chunked:
+            return self._start_bulk_job(
+                "delete", database_name, collection_name, filter_dict, None, batch_size
+            )
+        try:
+            collection = self.get_collection(database_name, collection_name)
+            
+            comment = current_operation_id.get()
+            
+            def run_delete():
+                with self._timeout(max_time_ms):
+                    if multi:
+                        return collection.delete_many(filter_dict, comment=comment)
+                    return collection.delete_one(filter_dict, comment=comment)
+            
+            result = self.resilience.execute(
+                "delete_document", run_delete, MULTI_WRITE if multi else WRITE
+            )
+            if result.deleted_count:
+                self._invalidate(database_name, collection_name)
+            
+            return MongoResponse(
+                success=True,
+                data={"deleted_count": result.deleted_count},
+                count=result.deleted_count
+            )
+            
+        except PyMongoError as e:
+            self._record_error("delete_document", e)
+            logger.error(f"删除文档失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"删除文档失败: {str(e)}"
+            )
+    
+    def _start_bulk_job(self, operation: str, database_name: str, collection_name: str,
+                        filter_dict: Dict[str, Any], update: Any,
+                        batch_size: Optional[int]) -> MongoResponse:
+        """
+        创建并在后台启动分批删除或更新任务
+        
+        Args:
+            operation: delete 或 update
+            database_name: 数据库名称
+            collection_name: 集合名称
+            filter_dict: 过滤器
+            update: 更新操作（update任务）
+            batch_size: 初始批大小
+            
+        Returns:
+            包含任务信息的响应对象
+        """
+        try:
+            self.get_collection(database_name, collection_name)
+            job = BulkJob(
+                operation, database_name, collection_name, filter_dict or {}, update,
+                batch_size=batch_size or self.bulk_batch_size
+            )
+            self.resilience.execute("bulk_job", lambda: self.jobs.save(job), WRITE)
+            self.jobs.start(job, self._run_bulk_job)
+            return MongoResponse(success=True, data=job.describe(), count=0)
+        except (PyMongoError, ValueError) as e:
+            self._record_error("bulk_job", e)
+            logger.error(f"启动分批任务失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"启动分批任务失败: {str(e)}"
+            )
+    
+    def _run_bulk_job(self, job: BulkJob) -> None:
+        """
+        执行分批任务（在后台线程中运行）
+        
+        每批按_id顺序取出上次位置之后的匹配文档ID，用 {_id: {$in: ...}} 加原过滤器删除或更新，
+        写入使用majority写关注，使批次耗时包含复制时间。批大小根据耗时和复制延迟自适应调整，
+        每批之后保存进度
+        """
+        collection = self.get_collection(job.database, job.collection)
+        writer = collection.with_options(write_concern=WriteConcern("majority"))
+        sizer = BatchSizer(
+            job.batch_size, self.bulk_min_batch_size, self.bulk_max_batch_size,
+            self.bulk_target_batch_ms
+        )
+        comment = f"bulk_job:{job.job_id}"
+        try:
+            while not job.cancel_requested.is_set():
+                query = job.filter
+                if job.last_id is not None:
+                    query = {"$and": [job.filter, {"_id": {"$gt": job.last_id}}]}
+                started = time.perf_counter()
+                
+                def find_ids() -> List[Any]:
+                    cursor = collection.find(
+                        query, {"_id": 1}, sort=[("_id", pymongo.ASCENDING)],
+                        limit=sizer.size, comment=comment
+                    )
+                    with cursor:
+                        return [document["_id"] for document in cursor]
+                
+                ids = self.resilience.execute("bulk_job", find_ids)
+                if not ids:
+                    job.finish(COMPLETED)
+                    break
+                
+                # 再次带上原过滤器，跳过查出ID之后已不再匹配的文档
+                selector = {"$and": [{"_id": {"$in": ids}}, job.filter]}
+                if job.operation == "delete":
+                    # 按ID删除是幂等的，可以安全重试
+                    result = self.resilience.execute(
+                        "bulk_job", lambda: writer.delete_many(selector, comment=comment), WRITE
+                    )
+                else:
+                    result = self.resilience.execute(
+                        "bulk_job",
+                        lambda: writer.update_many(selector, job.update, comment=comment),
+                        MULTI_WRITE
+                    )
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self._invalidate(job.database, job.collection)
+                metrics.incr("bulk_documents", len(ids), operation=job.operation)
+                
+                lag_ms = self._replication_lag_ms()
+                lagging = lag_ms is not None and lag_ms > self.bulk_max_lag_ms
+                job.record_batch(ids[-1], result, sizer.size)
+                sizer.update(elapsed_ms, lagging)
+                self.resilience.execute("bulk_job", lambda: self.jobs.save(job), WRITE)
+                if lagging:
+                    # 给从节点追赶的时间
+                    metrics.incr("bulk_lag_pauses")
+                    time.sleep(min(lag_ms, self.bulk_max_lag_ms) / 1000)
+            else:
+                job.finish(CANCELLED)
+        except Exception as e:
+            logger.error(f"分批任务 {job.job_id} 失败: {str(e)}")
+            job.finish(FAILED, str(e))
+        
+        try:
+            self.resilience.execute("bulk_job", lambda: self.jobs.save(job), WRITE)
+        except PyMongoError as e:
+            logger.error(f"保存分批任务 {job.job_id} 进度失败: {str(e)}")
+    
+    def _replication_lag_ms(self) -> Optional[float]:
+        """
+        获取从节点相对主节点的最大复制延迟
+        
+        Returns:
+            延迟毫秒数；不是副本集或没有replSetGetStatus权限时返回None，之后不再尝试
+        """
+        if not self._replication_lag_available or not self.client:
+            return None
+        try:
+            status = self.client.admin.command("replSetGetStatus")
+        except OperationFailure as e:
+            logger.info(f"无法获取复制状态，分批任务仅按耗时调整批大小: {str(e)}")
+            self._replication_lag_available = False
+            return None
+        
+        members = status.get("members", [])
+        primary = next((m for m in members if m.get("stateStr") == "PRIMARY"), None)
+        secondaries = [m for m in members if m.get("stateStr") == "SECONDARY"]
+        if primary is None or not secondaries:
+            return 0.0
+        return max(
+            (primary["optimeDate"] - member["optimeDate"]).total_seconds() * 1000
+            for member in secondaries
+        )
+    
+    def bulk_job_status(self, job_id: str = None) -> MongoResponse:
+        """
+        查询分批任务进度
+        
+        Args:
+            job_id: 任务ID，为空时列出最近的任务
+            
+        Returns:
+            包含任务进度的响应对象
+        """
+        try:
+            if job_id is None:
+                jobs = [
+                    {**job.describe(), "active": job.status == RUNNING}
+                    for job in self.jobs.list()
+                ]
+                return MongoResponse(success=True, data=jobs, count=len(jobs))
+            
+            job = self.jobs.get(job_id)
+            if job is None:
+                raise ValueError(f"分批任务 {job_id} 不存在")
+            return MongoResponse(
+                success=True,
+                data={**job.describe(), "active": job.status == RUNNING},
+                count=1
+            )
+        except (PyMongoError, ValueError) as e:
+            logger.error(f"查询分批任务失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"查询分批任务失败: {str(e)}"
+            )
+    
+    def resume_bulk_job(self, job_id: str, batch_size: int = None) -> MongoResponse:
+        """
+        从最后处理的_id继续执行中断、失败或取消的分批任务
+        
+        Args:
+            job_id: 任务ID
+            batch_size: 新的初始批大小，默认沿用上次的批大小
+            
+        Returns:
+            包含任务信息的响应对象
+        """
+        try:
+            job = self.jobs.get(job_id)
+            if job is None:
+                raise ValueError(f"分批任务 {job_id} 不存在")
+            if job.status == COMPLETED:
+                raise ValueError(f"分批任务 {job_id} 已完成")
+            if job.status == RUNNING:
+                raise ValueError(f"分批任务 {job_id} 正在运行")
+            if not self.resilience.execute("bulk_job", lambda: self.jobs.claim(job), WRITE):
+                raise ValueError(f"分批任务 {job_id} 已由其他进程恢复")
+            if batch_size:
+                job.batch_size = batch_size
+            job.cancel_requested.clear()
+            job.status = RUNNING
+            job.error = None
+            self.jobs.start(job, self._run_bulk_job)
+            return MongoResponse(success=True, data=job.describe(), count=0)
+        except (PyMongoError, ValueError) as e:
+            logger.error(f"恢复分批任务失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"恢复分批任务失败: {str(e)}"
+            )
+    
+    def cancel_bulk_job(self, job_id: str) -> MongoResponse:
+        """
+        取消正在运行的分批任务，当前批次完成后停止
+        
+        任务在其他进程中运行时在元数据中记录取消请求，该进程保存下一批进度时停止
+        
+        Args:
+            job_id: 任务ID
+            
+        Returns:
+            取消结果的响应对象
+        """
+        try:
+            job = self.jobs.get(job_id)
+            if job is None or job.status != RUNNING:
+                return MongoResponse(
+                    success=False,
+                    error=f"分批任务 {job_id} 不存在或未在运行"
+                )
+            self.resilience.execute("bulk_job", lambda: self.jobs.request_cancel(job), WRITE)
+            return MongoResponse(success=True, data=job.describe(), count=0)
+        except PyMongoError as e:
+            logger.error(f"取消分批任务失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"取消分批任务失败: {str(e)}"
+            )
+    
+    def aggregate(self, database_name: str, collection_name: str,
+                  pipeline: List[Dict[str, Any]],
+                  allow_disk_use: bool = None,
+                  batch_size: int = None,
+                  max_time_ms: int = None,
+                  hint: Any = None,
+                  collation: Dict[str, Any] = None,
+                  let: Dict[str, Any] = None,
+                  page_size: int = None,
+                  max_bytes: int = None,
+                  auto_limit: int = None,
+                  spill: bool = False) -> MongoResponse:
+        """
+        执行聚合管道
+        
+        结果按页返回，未读完时响应中带有cursor_id，可通过get_more继续读取。
+        指定spill时一次读完全部结果，超过溢出阈值的结果写入本地NDJSON文件
+        
+        Args:
+            database_name: 数据库名称
+            collection_name: 集合名称
+            pipeline: 聚合管道
+            allow_disk_use: 是否允许使用磁盘临时文件
+            batch_size: 每批从服务器获取的文档数量，默认与页大小一致
+            max_time_ms: 服务器端执行时间上限（毫秒），未指定时使用服务器默认值
+            hint: 使用的索引
+            collation: 排序规则
+            let: 管道变量
+            page_size: 每页返回的文档数量
+            max_bytes: 每页返回的字节上限
+            auto_limit: 管道未限定输出规模时自动追加的$limit，0表示不追加
+            spill: 是否读完全部结果，超过溢出阈值时写入文件而不是分页返回
+            
+        Returns:
+            包含聚合结果的响应对象
+        """
+        try:
+            collection = self.get_collection(database_name, collection_name)
+            page_size = page_size or self.page_size
+            
+            limit = self.aggregate_auto_limit if auto_limit is None else auto_limit
+            if limit and not any(
+                key in stage for stage in pipeline for key in _BOUNDING_STAGES
+            ):
+                pipeline = list(pipeline) + [{"$limit": limit}]
+            
+            comment = current_operation_id.get()
+            options: Dict[str, Any] = {"batchSize": batch_size or page_size}
+            if allow_disk_use is not None:
+                options["allowDiskUse"] = allow_disk_use
+            if self._timeout_ms(max_time_ms):
+                options["maxTimeMS"] = self._timeout_ms(max_time_ms)
+            if comment:
+                options["comment"] = comment
+            if hint is not None:
+                options["hint"] = hint
+            if collation:
+                options["collation"] = collation
+            if let:
+                options["let"] = let
+            
+            namespace = f"{database_name}.{collection_name}"
+            # 写出结果的管道不是幂等操作，不重试
+            kind = MULTI_WRITE if any(
+                "$out" in stage or "$merge" in stage for stage in pipeline
+            ) else READ
+            if spill:
+                results = self.resilience.execute(
+                    "aggregate",
+                    lambda: self._collect_or_spill(collection.aggregate(pipeline, **options), namespace),
+                    kind
+                )
+                if isinstance(results, SpillFile):
+                    return MongoResponse(success=True, data=results.describe(), count=results.rows)
+                return MongoResponse(success=True, data=results, count=len(results))
+            
+            return self.resilience.execute(
+                "aggregate",
+                lambda: self._read_first_page(
+                    CursorEntry(collection.aggregate(pipeline, **options), namespace, comment),
+                    page_size, max_bytes
+                ),
+                kind
+            )
+            
+        except PyMongoError as e:
+            self._record_error("aggregate", e)
+            logger.error(f"执行聚合管道失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"执行聚合管道失败: {str(e)}"
+            )
+        except SpillQuotaExceeded as e:
+            logger.error(f"执行聚合管道失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"执行聚合管道失败: {str(e)}"
+            )
+    
+    def _collect_or_spill(self, documents: Iterable[Dict[str, Any]],
+                          namespace: str) -> Union[List[Dict[str, Any]], SpillFile]:
+        """
+        读取全部结果，累计大小超过溢出阈值后把已读取和剩余的文档写入溢出文件
+        
+        Args:
+            documents: 结果文档迭代器
+            namespace: 结果来源的命名空间
+            
+        Returns:
+            未超过阈值时返回文档列表，否则返回溢出文件
+        """
+        threshold = self.spill_threshold_bytes
+        if not threshold:
+            return list(documents)
+        
+        buffered: List[Dict[str, Any]] = []
+        total_bytes = 0
+        writer = None
+        try:
+            for document in documents:
+                if writer is not None:
+                    writer.write(document)
+                    continue
+                buffered.append(document)
+                total_bytes += len(bson.encode(document))
+                if total_bytes > threshold:
+                    writer = self.spills.create(namespace)
+                    for pending in buffered:
+                        writer.write(pending)
+                    buffered = []
+        except BaseException:
+            if writer is not None:
+                writer.abort()
+            raise
+        
+        if writer is None:
+            return buffered
+        spill = writer.finish()
+        metrics.incr("spilled_results", namespace=namespace)
+        metrics.incr("spilled_bytes", spill.size, namespace=namespace)
+        logger.info(f"{namespace} 的 {spill.rows} 行结果已写入溢出文件 {spill.spill_id}（{spill.size} 字节）")
+        return spill
+    
+    def read_spill(self, spill_id: str, start: int = 0, count: int = None,
+                   offset: int = None, length: int = None) -> bytes:
+        """
+        读取溢出文件的一部分
+        
+        指定offset时按字节范围读取，否则按行读取
+        
+        Args:
+            spill_id: 溢出文件ID
+            start: 起始行（从0开始）
+            count: 读取的行数，不超过MONGODB_SPILL_MAX_READ_LINES
+            offset: 起始字节偏移
+            length: 读取的字节数，不超过MONGODB_MAX_RESPONSE_BYTES
+            
+        Returns:
+            NDJSON内容
+        """
+        spill = self.spills.get(spill_id)
+        if spill is None:
+            raise ValueError(f"溢出文件不存在或已过期: {spill_id}")
+        if offset is not None:
+            if offset < 0 or (length is not None and length < 0):
+                raise ValueError("offset和length不能为负数")
+            length = min(length or self.max_response_bytes, self.max_response_bytes)
+            return spill.read_bytes(offset, length)
+        if start < 0 or (count is not None and count < 0):
+            raise ValueError("start和count不能为负数")
+        count = min(count or self.spill_max_read_lines, self.spill_max_read_lines)
+        return spill.read_lines(start, count)
+    
+    def read_collection_page(self, database_name: str, collection_name: str,
+                             page: str = None, page_size: int = None) -> str:
+        """
+        按 _id 升序读取集合的一页文档（键集分页）
+        
+        使用命名空间的读取策略（默认投影和裁剪），最近读取的页缓存在LRU中，
+        集合被写入后失效
+        
+        Args:
+            database_name: 数据库名称
+            collection_name: 集合名称
+            page: 上一页返回的页码令牌，为空时读取第一页
+            page_size: 每页文档数量，默认MONGODB_BROWSE_PAGE_SIZE，不超过MONGODB_PAGE_SIZE
+            
+        Returns:
+            Extended JSON文本，包含documents、count和下一页的资源URI next_page
+        """
+        page_size = min(page_size or self.browse_page_size, self.page_size)
+        if page_size <= 0:
+            raise ValueError("page_size必须大于0")
+        namespace = f"{database_name}.{collection_name}"
+        key = cache_key(namespace, "page", page or "", page_size)
+        cached = self.page_cache.get(key)
+        if cached is not MISSING:
+            metrics.incr("page_cache_hits")
+            return cached
+        
+        collection = self.get_collection(database_name, collection_name)
+        filter_dict = {"_id": {"$gt": decode_page_token(page)}} if page else {}
+        policy = self.read_policies.get(database_name, collection_name)
+        
+        def run_query() -> List[Dict[str, Any]]:
+            # 多读一个文档判断是否还有下一页
+            if policy is not None and policy.trims:
+                pipeline = policy.build_pipeline(filter_dict, [("_id", 1)], 0, page_size + 1)
+                options: Dict[str, Any] = {"comment": current_operation_id.get()}
+                if self._timeout_ms(None):
+                    options["maxTimeMS"] = self._timeout_ms(None)
+                return list(policy.unwrap(collection.aggregate(pipeline, **options)))
+            cursor = collection.find(
+                filter=filter_dict,
+                projection=policy.projection if policy is not None else None,
+                max_time_ms=self._timeout_ms(None),
+                comment=current_operation_id.get()
+            )
+            return list(cursor.sort("_id", 1).limit(page_size + 1))
+        
+        documents = self.resilience.execute("read_collection_page", run_query)
+        next_page = None
+        if len(documents) > page_size:
+            documents = documents[:page_size]
+            if "_id" not in documents[-1]:
+                raise ValueError(f"{namespace} 的读取策略投影排除了 _id，无法分页浏览")
+            next_page = collection_uri(
+                database_name, collection_name, encode_page_token(documents[-1]["_id"]), page_size
+            )
+        
+        content = render({
+            "namespace": namespace,
+            "documents": documents,
+            "count": len(documents),
+            "next_page": next_page,
+        })
+        metrics.incr("page_cache_misses")
+        self.page_cache.set(key, content)
+        return content
+    
+    def read_catalog(self) -> str:
+        """
+        读取数据库和集合目录
+        
+        目录缓存MONGODB_CATALOG_CACHE_TTL秒，新建或删除的集合在缓存过期后出现
+        
+        Returns:
+            Extended JSON文本，每个集合带有浏览资源和元数据资源的URI
+        """
+        key = cache_key("", "catalog")
+        cached = self.catalog_cache.get(key)
+        if cached is not MISSING:
+            return cached
+        
+        def build() -> List[Dict[str, Any]]:
+            databases = []
+            for database_name in self.client.list_database_names():
+                collections = [
+                    {
+                        "name": info["name"],
+                        "type": info.get("type", "collection"),
+                        "resource": collection_uri(database_name, info["name"]),
+                        "metadata": metadata_uri(database_name, info["name"]),
+                    }
+                    for info in self.get_database(database_name).list_collections()
+                ]
+                collections.sort(key=lambda collection: collection["name"])
+                databases.append({"name": database_name, "collections": collections})
+            return databases
+        
+        content = render({"databases": self.resilience.execute("read_catalog", build)})
+        self.catalog_cache.set(key, content)
+        return content
+    
+    def read_collection_metadata(self, database_name: str, collection_name: str) -> str:
+        """
+        读取集合元数据：估算文档数量、索引、集合选项和读取策略
+        
+        结果与目录使用同一个缓存，集合被写入后失效
+        
+        Args:
+            database_name: 数据库名称
+            collection_name: 集合名称
+            
+        Returns:
+            Extended JSON文本
+        """
+        namespace = f"{database_name}.{collection_name}"
+        key = cache_key(namespace, "metadata")
+        cached = self.catalog_cache.get(key)
+        if cached is not MISSING:
+            return cached
+        
+        database = self.get_database(database_name)
+        collection = database[collection_name]
+        
+        def build() -> Dict[str, Any]:
+            infos = list(database.list_collections(filter={"name": collection_name}))
+            if not infos:
+                raise ValueError(f"集合不存在: {namespace}")
+            return {
+                "namespace": namespace,
+                "type": infos[0].get("type", "collection"),
+                "options": infos[0].get("options", {}),
+                "estimated_count": collection.estimated_document_count(),
+                "indexes": [
+                    {"name": index["name"], "key": [{field: direction} for field, direction in index["key"].items()]}
+                    for index in collection.list_indexes()
+                ],
+            }
+        
+        metadata = self.resilience.execute("read_collection_metadata", build)
+        policy = self.read_policies.get(database_name, collection_name)
+        metadata["read_policy"] = policy.describe() if policy is not None else None
+        metadata["resource"] = collection_uri(database_name, collection_name)
+        content = render(metadata)
+        self.catalog_cache.set(key, content)
+        return content
+    
+    def drop_spill(self, spill_id: str) -> MongoResponse:
+        """
+        删除溢出文件
+        
+        Args:
+            spill_id: 溢出文件ID
+            
+        Returns:
+            删除结果的响应对象
+        """
+        if not self.spills.delete(spill_id):
+            return MongoResponse(
+                success=False,
+                error=f"溢出文件不存在或已过期: {spill_id}"
+            )
+        return MongoResponse(success=True, data={"spill_id": spill_id}, count=1)
+    
+    def _read_first_page(self, entry: CursorEntry, page_size: int,
+                         max_bytes: int = None) -> MongoResponse:
+        """
+        读取新游标的第一页，未读完时注册到游标注册表
+        
+        Args:
+            entry: 新建的游标
+            page_size: 每页返回的文档数量
+            max_bytes: 每页返回的字节上限
+            
+        Returns:
+            包含第一页结果的响应对象
+        """
+        try:
+            results = entry.read_page(page_size, max_bytes or self.max_response_bytes)
+        except Exception:
+            entry.close()
+            raise
+        
+        cursor_id = None
+        if entry.exhausted:
+            entry.close()
+        else:
+            cursor_id = self.cursors.register(entry)
+        
+        return MongoResponse(
+            success=True,
+            data=results,
+            count=len(results),
+            cursor_id=cursor_id
+        )
+    
+    def get_more(self, cursor_id: str, page_size: int = None,
+                 max_bytes: int = None) -> MongoResponse:
+        """
+        继续读取分页游标
+        
+        Args:
+            cursor_id: 上一页响应中的游标ID
+            page_size: 每页返回的文档数量
+            max_bytes: 每页返回的字节上限
+            
+        Returns:
+            包含下一页结果的响应对象，读完后cursor_id为空
+        """
+        entry = self.cursors.get(cursor_id)
+        if entry is None:
+            return MongoResponse(
+                success=False,
+                error=f"游标不存在或已过期: {cursor_id}"
+            )
+        
+        try:
+            results = entry.read_page(
+                page_size or self.page_size, max_bytes or self.max_response_bytes
+            )
+        except PyMongoError as e:
+            self.cursors.close(cursor_id)
+            self._record_error("get_more", e)
+            logger.error(f"读取游标失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"读取游标失败: {str(e)}"
+            )
+        
+        if entry.exhausted:
+            self.cursors.close(cursor_id)
+            cursor_id = None
+        
+        return MongoResponse(
+            success=True,
+            data=results,
+            count=len(results),
+            cursor_id=cursor_id
+        )
+    
+    def close_cursor(self, cursor_id: str) -> MongoResponse:
+        """
+        关闭分页游标
+        
+        Args:
+            cursor_id: 游标ID
+            
+        Returns:
+            关闭结果的响应对象
+        """
+        if not self.cursors.close(cursor_id):
+            return MongoResponse(
+                success=False,
+                error=f"游标不存在或已过期: {cursor_id}"
+            )
+        return MongoResponse(success=True, data={"cursor_id": cursor_id}, count=1)
+    
+    def watch(self, database_name: str = None, collection_name: str = None,
+              pipeline: List[Dict[str, Any]] = None,
+              full_document: str = None,
+              full_document_before_change: str = None,
+              resume_after: Dict[str, Any] = None,
+              batch_size: int = None) -> MongoResponse:
+        """
+        打开变更流
+        
+        指定集合时监听该集合，只指定数据库时监听整个数据库，都不指定时监听整个集群。
+        事件由后台线程读取到缓冲区，通过watch_next按批次取出
+        
+        Args:
+            database_name: 数据库名称
+            collection_name: 集合名称
+            pipeline: 过滤事件的管道，例如 [{"$match": {"operationType": "insert"}}]
+            full_document: fullDocument选项，例如 updateLookup、whenAvailable、required
+            full_document_before_change: fullDocumentBeforeChange选项
+            resume_after: 从之前返回的恢复令牌之后继续
+            batch_size: 每次从服务器读取的事件数量
+            
+        Returns:
+            包含stream_id的响应对象
+        """
+        try:
+            if collection_name and not database_name:
+                raise ValueError("指定集合时必须同时指定数据库")
+            if collection_name:
+                target = self.get_collection(database_name, collection_name)
+                namespace = f"{database_name}.{collection_name}"
+            elif database_name:
+                target = self.get_database(database_name)
+                namespace = database_name
+            else:
+                if not self.client:
+                    raise ConnectionError("MongoDB客户端未连接")
+                target = self.client
+                namespace = "*"
+            
+            options: Dict[str, Any] = {
+                "max_await_time_ms": 1000,
+                "comment": current_operation_id.get()
+            }
+            if full_document:
+                options["full_document"] = full_document
+            if full_document_before_change:
+                options["full_document_before_change"] = full_document_before_change
+            if resume_after:
+                options["resume_after"] = resume_after
+            if batch_size:
+                options["batch_size"] = batch_size
+            
+            stream = self.resilience.execute("watch", lambda: target.watch(pipeline or [], **options))
+            stream_id = self.streams.register(
+                ChangeStreamEntry(stream, namespace, self.watch_buffer_size)
+            )
+            return MongoResponse(
+                success=True,
+                data={"stream_id": stream_id, "namespace": namespace},
+                count=1
+            )
+            
+        except (PyMongoError, ValueError) as e:
+            self._record_error("watch", e)
+            logger.error(f"打开变更流失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"打开变更流失败: {str(e)}"
+            )
+    
+    def watch_next(self, stream_id: str, max_events: int = 100,
+                   max_wait_ms: int = 1000) -> MongoResponse:
+        """
+        从变更流取出一批事件
+        
+        Args:
+            stream_id: watch返回的流ID
+            max_events: 本批最多返回的事件数量
+            max_wait_ms: 没有缓冲事件时最多等待的毫秒数
+            
+        Returns:
+            包含事件、恢复令牌以及缓冲和延迟统计的响应对象
+        """
+        entry = self.streams.get(stream_id)
+        if entry is None:
+            return MongoResponse(
+                success=False,
+                error=f"变更流不存在或已过期: {stream_id}"
+            )
+        
+        events, resume_token = entry.read(max(1, max_events), max(0, max_wait_ms) / 1000)
+        stats = entry.stats()
+        metrics.set_gauge("watch_buffered", stats["buffered"], namespace=entry.namespace)
+        metrics.set_gauge("watch_lag_ms", stats["lag_ms"], namespace=entry.namespace)
+        
+        if entry.error is not None and not events:
+            self.streams.close(stream_id)
+            self._record_error("watch", entry.error)
+            logger.error(f"变更流读取失败: {str(entry.error)}")
+            return MongoResponse(
+                success=False,
+                data={"resume_token": json.loads(json_util.dumps(resume_token))},
+                error=f"变更流读取失败: {str(entry.error)}"
+            )
+        
+        data: Dict[str, Any] = {
+            "stream_id": stream_id,
+            # 使用宽松Extended JSON，ObjectId、时间戳等类型可以直接序列化
+            "events": json.loads(json_util.dumps(events, json_options=json_util.RELAXED_JSON_OPTIONS)),
+            "resume_token": json.loads(json_util.dumps(resume_token)),
+            **stats
+        }
+        if entry.done and not stats["buffered"]:
+            # 变更流已结束（例如集合被删除产生invalidate事件）
+            self.streams.close(stream_id)
+            data["stream_id"] = None
+        return MongoResponse(success=True, data=data, count=len(events))
+    
+    def close_watch(self, stream_id: str) -> MongoResponse:
+        """
+        关闭变更流
+        
+        Args:
+            stream_id: 流ID
+            
+        Returns:
+            关闭结果的响应对象
+        """
+        if not self.streams.close(stream_id):
+            return MongoResponse(
+                success=False,
+                error=f"变更流不存在或已过期: {stream_id}"
+            )
+        return MongoResponse(success=True, data={"stream_id": stream_id}, count=1)
+    
+    def create_materialized_view(self, name: str, database_name: str,
+                                 source_collection: str,
+                                 pipeline: List[Dict[str, Any]],
+                                 target_collection: str,
+                                 watermark_field: str = None,
+                                 merge_on: Any = "_id",
+                                 when_matched: Any = "replace",
+                                 refresh_interval: float = None,
+                                 max_time_ms: int = None) -> MongoResponse:
+        """
+        注册物化视图并执行首次全量刷新
+        
+        Args:
+            name: 视图名称
+            database_name: 数据库名称
+            source_collection: 源集合
+            pipeline: 聚合管道，不能包含$out或$merge
+            target_collection: 目标集合
+            watermark_field: 高水位字段（时间戳或_id），为空时每次刷新都是全量
+            merge_on: 增量刷新时$merge的匹配字段
+            when_matched: 增量刷新时$merge的whenMatched
+            refresh_interval: 自动刷新间隔（秒），为空时仅按需刷新
+            max_time_ms: 首次刷新的服务器端执行时间上限（毫秒）
+            
+        Returns:
+            包含首次刷新结果的响应对象
+        """
+        try:
+            if self.views.get(name) is not None:
+                raise ValueError(f"物化视图 {name} 已存在")
+            if any(key in ("$out", "$merge") for stage in pipeline for key in stage):
+                raise ValueError("物化视图的管道不能包含$out或$merge")
+            if source_collection == target_collection:
+                raise ValueError("目标集合不能与源集合相同")
+            if watermark_field and aggregates_documents(pipeline) and \
+                    not isinstance(when_matched, list):
+                raise ValueError(
+                    "包含$group等分组阶段的管道增量刷新时只处理新文档，"
+                    "结果会替换目标集合中的累计值；请传入合并新旧值的when_matched更新管道"
+                    "（例如 [{\"$set\": {\"total\": {\"$add\": [\"$total\", \"$$new.total\"]}}}]），"
+                    "或不设置watermark_field，每次全量刷新"
+                )
+            
+            view = MaterializedView(
+                name, database_name, source_collection, pipeline, target_collection,
+                watermark_field=watermark_field,
+                merge_on=merge_on,
+                when_matched=when_matched,
+                refresh_interval=refresh_interval
+            )
+            self.resilience.execute("create_materialized_view", lambda: self.views.save(view), WRITE)
+            result = self.refresh_materialized_view(name, full=True, max_time_ms=max_time_ms)
+            if not result.success:
+                # 首次刷新失败时不保留视图定义
+                self.resilience.execute(
+                    "create_materialized_view", lambda: self.views.remove(name), WRITE
+                )
+            return result
+            
+        except (PyMongoError, ValueError) as e:
+            self._record_error("create_materialized_view", e)
+            logger.error(f"创建物化视图失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"创建物化视图失败: {str(e)}"
+            )
+    
+    def refresh_materialized_view(self, name: str, full: bool = False,
+                                  max_time_ms: int = None) -> MongoResponse:
+        """
+        刷新物化视图
+        
+        增量刷新只处理高水位字段不小于（累计型whenMatched时为大于）上次高水位、
+        且不超过本次开始时最大值的文档，通过$merge合并进目标集合；全量刷新
+        （或视图不能增量刷新）用$out整体替换目标集合。执行前先在元数据集合中把高水位
+        从上次的值推进到本次上界，其他进程已经推进过时跳过本次刷新
+        
+        Args:
+            name: 视图名称
+            full: 是否强制全量刷新
+            max_time_ms: 服务器端执行时间上限（毫秒）
+            
+        Returns:
+            包含刷新方式、高水位和耗时的响应对象
+        """
+        try:
+            view = self.views.get(name)
+            if view is None:
+                raise ValueError(f"物化视图 {name} 不存在")
+            source = self.get_collection(view.database, view.source)
+            target = self.get_collection(view.database, view.target)
+            
+            with view.lock:
+                started = time.perf_counter()
+                upper = None
+                if view.watermark_field:
+                    latest = self.resilience.execute(
+                        "refresh_materialized_view",
+                        lambda: source.find_one(
+                            {view.watermark_field: {"$exists": True}},
+                            {view.watermark_field: 1},
+                            sort=[(view.watermark_field, pymongo.DESCENDING)]
+                        )
+                    )
+                    if latest is not None:
+                        upper = extract_field([latest], view.watermark_field)[0]
+                
+                full = full or not view.incremental or upper is None or \
+                    view.high_water_mark is None
+                if not full and upper == view.high_water_mark:
+                    view.schedule_next()
+                    return MongoResponse(
+                        success=True,
+                        data={**view.describe(), "mode": "skipped"},
+                        count=0
+                    )
+                
+                options: Dict[str, Any] = {"allowDiskUse": True}
+                timeout_ms = self._timeout_ms(max_time_ms)
+                if timeout_ms:
+                    options["maxTimeMS"] = timeout_ms
+                comment = current_operation_id.get()
+                if comment:
+                    options["comment"] = comment
+                pipeline = view.build_pipeline(upper, full)
+                
+                def run_refresh() -> None:
+                    with source.aggregate(pipeline, **options):
+                        pass
+                
+                claimed = self.resilience.execute(
+                    "refresh_materialized_view", lambda: self.views.claim(view, upper), WRITE
+                )
+                if not claimed:
+                    logger.info(f"物化视图 {name} 已由其他进程刷新，跳过本次刷新")
+                    self.views.get(name)
+                    view.schedule_next()
+                    return MongoResponse(
+                        success=True,
+                        data={**view.describe(), "mode": "skipped"},
+                        count=0
+                    )
+                try:
+                    self.resilience.execute("refresh_materialized_view", run_refresh, MULTI_WRITE)
+                    if view.merge_on != "_id":
+                        keys = [view.merge_on] if isinstance(view.merge_on, str) else view.merge_on
+                        self.resilience.execute(
+                            "refresh_materialized_view",
+                            lambda: target.create_index([(key, 1) for key in keys], unique=True)
+                        )
+                except PyMongoError:
+                    try:
+                        self.views.release(view, upper)
+                    except PyMongoError as e:
+                        logger.error(f"退回物化视图 {name} 的高水位失败: {str(e)}")
+                    raise
+                self._invalidate(view.database, view.target)
+                
+                view.mark_refreshed(upper, round((time.perf_counter() - started) * 1000, 1))
+                self.resilience.execute(
+                    "refresh_materialized_view", lambda: self.views.record_refresh(view), WRITE
+                )
+                return MongoResponse(
+                    success=True,
+                    data={**view.describe(), "mode": "full" if full else "incremental"},
+                    count=1
+                )
+            
+        except (PyMongoError, ValueError) as e:
+            self._record_error("refresh_materialized_view", e)
+            logger.error(f"刷新物化视图失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"刷新物化视图失败: {str(e)}"
+            )
+    
+    def query_materialized_view(self, name: str,
+                                filter_dict: Dict[str, Any] = None,
+                                projection: Dict[str, Any] = None,
+                                sort: List[tuple] = None,
+                                limit: int = None,
+                                skip: int = 0,
+                                max_time_ms: int = None) -> MongoResponse:
+        """
+        查询物化视图的目标集合
+        
+        Args:
+            name: 视图名称
+            filter_dict: 查询过滤器
+            projection: 投影字段
+            sort: 排序条件
+            limit: 限制数量
+            skip: 跳过数量
+            max_time_ms: 服务器端执行时间上限（毫秒）
+            
+        Returns:
+            包含查询结果的响应对象
+        """
+        view = self.views.get(name)
+        if view is None:
+            return MongoResponse(success=False, error=f"物化视图 {name} 不存在")
+        return self.find_documents(
+            view.database, view.target, filter_dict, projection, sort, limit, skip,
+            max_time_ms
+        )
+    
+    def list_materialized_views(self) -> MongoResponse:
+        """
+        列出所有物化视图
+        
+        Returns:
+            包含视图定义和刷新状态的响应对象
+        """
+        try:
+            views = [view.describe() for view in self.views.list()]
+            return MongoResponse(success=True, data=views, count=len(views))
+        except PyMongoError as e:
+            logger.error(f"列出物化视图失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"列出物化视图失败: {str(e)}"
+            )
+    
+    def drop_materialized_view(self, name: str, drop_target: bool = False) -> MongoResponse:
+        """
+        删除物化视图
+        
+        Args:
+            name: 视图名称
+            drop_target: 是否同时删除目标集合
+            
+        Returns:
+            删除结果的响应对象
+        """
+        try:
+            view = self.views.get(name)
+            if view is None:
+                raise ValueError(f"物化视图 {name} 不存在")
+            with view.lock:
+                self.resilience.execute(
+                    "drop_materialized_view", lambda: self.views.remove(name), WRITE
+                )
+                if drop_target:
+                    self.resilience.execute(
+                        "drop_materialized_view",
+                        lambda: self.get_collection(view.database, view.target).drop()
+                    )
+                    self._invalidate(view.database, view.target)
+            return MongoResponse(
+                success=True,
+                data={"name": name, "target_dropped": drop_target},
+                count=1
+            )
+        except (PyMongoError, ValueError) as e:
+            logger.error(f"删除物化视图失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"删除物化视图失败: {str(e)}"
+            )
+    
+    def register_query_template(self, name: str, database_name: str, collection_name: str,
+                                parameters: Dict[str, Any] = None,
+                                filter_dict: Dict[str, Any] = None,
+                                projection: Dict[str, Any] = None,
+                                sort: List[Any] = None,
+                                limit: int = None,
+                                pipeline: List[Dict[str, Any]] = None,
+                                allow_collection_scan: bool = False,
+                                replace: bool = False) -> MongoResponse:
+        """
+        注册查询模板
+        
+        模板在注册时解析一次，并检查集合上是否有可用的索引
+        
+        Args:
+            name: 模板名称
+            database_name: 数据库名称
+            collection_name: 集合名称
+            parameters: 参数名称到类型的映射，例如 {"status": "string", "since": "date"}
+            filter_dict: 带 {"$param": 名称} 占位符的过滤器
+            projection: 投影字段
+            sort: 排序规则
+            limit: 默认返回数量
+            pipeline: 带占位符的聚合管道，与filter/projection/sort互斥
+            allow_collection_scan: 没有可用索引时是否仍允许注册
+            replace: 是否替换同名模板
+            
+        Returns:
+            包含模板定义和索引检查结果的响应对象
+        """
+        try:
+            template = QueryTemplate(
+                name, database_name, collection_name, parameters,
+                filter_dict=filter_dict,
+                projection=projection,
+                sort=sort,
+                limit=limit,
+                pipeline=pipeline,
+                allow_collection_scan=allow_collection_scan
+            )
+            collection = self.get_collection(database_name, collection_name)
+            indexes = self.resilience.execute(
+                "register_query_template", lambda: list(collection.list_indexes())
+            )
+            template.index_check = template.check_indexes(indexes)
+            if not template.index_check["indexed"] and not allow_collection_scan:
+                raise ValueError(
+                    f"模板 {name} 没有可用的索引（查询字段: "
+                    f"{', '.join(template.index_check['fields']) or '无'}），"
+                    "请先创建索引或设置allow_collection_scan"
+                )
+            self.templates.add(template, replace)
+            return MongoResponse(success=True, data=template.describe(), count=1)
+            
+        except (PyMongoError, ValueError) as e:
+            self._record_error("register_query_template", e)
+            logger.error(f"注册查询模板失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"注册查询模板失败: {str(e)}"
+            )
+    
+    def load_query_templates(self, path: str) -> int:
+        """
+        从JSON文件加载查询模板
+        
+        文件内容为模板定义的列表，字段与register_query_template的参数相同
+        （database、collection、filter可以使用工具参数的名称），值可以使用Extended JSON。
+        未指定replace时替换元数据集合中的同名模板，重启和多个工作进程重复加载不会报错
+        
+        Args:
+            path: 文件路径
+            
+        Returns:
+            成功注册的模板数量
+        """
+        with open(path, encoding="utf-8") as f:
+            definitions = json_util.loads(f.read())
+        loaded = 0
+        for definition in definitions:
+            definition = dict(definition)
+            for alias, argument in (("database", "database_name"),
+                                    ("collection", "collection_name"),
+                                    ("filter", "filter_dict")):
+                if alias in definition:
+                    definition[argument] = definition.pop(alias)
+            definition.setdefault("replace", True)
+            try:
+                result = self.register_query_template(**definition)
+            except TypeError as e:
+                logger.error(f"查询模板定义无效: {str(e)}")
+                continue
+            if result.success:
+                loaded += 1
+        logger.info(f"从 {path} 加载了 {loaded} 个查询模板")
+        return loaded
+    
+    def run_query_template(self, name: str, params: Dict[str, Any] = None,
+                           limit: int = None, max_time_ms: int = None) -> MongoResponse:
+        """
+        运行查询模板
+        
+        首次运行以及之后每隔MONGODB_TEMPLATE_EXPLAIN_EVERY次运行时检查执行计划，
+        获胜计划与上一次不同时记录为计划变化
+        
+        Args:
+            name: 模板名称
+            params: 参数值
+            limit: 覆盖模板的默认返回数量（仅find模板）
+            max_time_ms: 服务器端执行时间上限（毫秒）
+            
+        Returns:
+            与find_documents或aggregate相同的响应对象
+        """
+        template = self.templates.get(name)
+        if template is None:
+            return MongoResponse(success=False, error=f"查询模板 {name} 不存在")
+        try:
+            bound = template.bind(params)
+        except ValueError as e:
+            return MongoResponse(success=False, error=f"运行查询模板失败: {str(e)}")
+        
+        if template.stats.should_explain(self.template_explain_every):
+            self._explain_template(template, bound)
+        
+        started = time.perf_counter()
+        if template.pipeline is not None:
+            result = self.aggregate(
+                template.database, template.collection, bound["pipeline"],
+                max_time_ms=max_time_ms
+            )
+        else:
+            result = self.find_documents(
+                template.database, template.collection, bound["filter"],
+                template.projection, template.sort, limit or template.limit, 0,
+                max_time_ms
+            )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        template.stats.record_run(elapsed_ms, result.success)
+        metrics.incr("template_runs", template=name)
+        metrics.incr("template_latency_ms", elapsed_ms, template=name)
+        return result
+    
+    def _explain_template(self, template: QueryTemplate, bound: Dict[str, Any]) -> None:
+        """检查模板当前的获胜计划，失败时只记录日志"""
+        try:
+            database = self.get_database(template.database)
+            explain = self.resilience.execute(
+                "run_query_template",
+                lambda: database.command(
+                    "explain", template.explain_command(bound), verbosity="queryPlanner"
+                )
+            )
+        except PyMongoError as e:
+            logger.warning(f"检查查询模板 {template.name} 的执行计划失败: {str(e)}")
+            return
+        signature = plan_signature(explain)
+        if template.stats.record_plan(signature):
+            metrics.incr("template_plan_changes", template=template.name)
+            logger.warning(f"查询模板 {template.name} 的执行计划变为 {signature}")
+    
+    def list_query_templates(self) -> MongoResponse:
+        """
+        列出查询模板
+        
+        Returns:
+            包含模板定义、索引检查结果和运行统计的响应对象
+        """
+        templates = [template.describe() for template in self.templates.list()]
+        return MongoResponse(success=True, data=templates, count=len(templates))
+    
+    def drop_query_template(self, name: str) -> MongoResponse:
+        """
+        删除查询模板
+        
+        Args:
+            name: 模板名称
+            
+        Returns:
+            删除结果的响应对象
+        """
+        if not self.templates.remove(name):
+            return MongoResponse(success=False, error=f"查询模板 {name} 不存在")
+        return MongoResponse(success=True, data={"name": name}, count=1)
+    
+    def create_index(self, database_name: str, collection_name: str,
+                     keys: List[tuple], name: str = None,
+                     unique: bool = False, sparse: bool = False,
+                     background: bool = True) -> MongoResponse:
+        """
+        创建索引
+        
+        Args:
+            database_name: 数据库名称
+            collection_name: 集合名称
+            keys: 索引键
+            name: 索引名称
+            unique: 是否唯一索引
+            sparse: 是否稀疏索引
+            background: 已废弃，仅为兼容保留，不再发送给服务器
+            
+        Returns:
+            包含创建索引结果的响应对象
+        """
+        try:
+            collection = self.get_collection(database_name, collection_name)
+            
+            # background选项自MongoDB 4.2起被忽略，不再发送
+            index_options = {
+                "unique": unique,
+                "sparse": sparse
+            }
+            
+            if name:
+                index_options["name"] = name
+            
+            result = self.resilience.execute(
+                "create_index", lambda: collection.create_index(keys, **index_options)
+            )
+            self.distinct_plan_cache.invalidate_namespace(f"{database_name}.{collection_name}")
+            
+            return MongoResponse(
+                success=True,
+                data={"index_name": result},
+                count=1
+            )
+            
+        except PyMongoError as e:
+            logger.error(f"创建索引失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"创建索引失败: {str(e)}"
+            )
+    
+    @staticmethod
+    def _index_model(spec: Dict[str, Any]) -> IndexModel:
+        """
+        将索引描述转换为IndexModel
+        
+        Args:
+            spec: 包含keys以及可选的name、unique、sparse、partial_filter_expression、
+                expire_after_seconds的字典
+                
+        Returns:
+            IndexModel
+        """
+        keys = spec.get("keys")
+        if not keys:
+            raise ValueError("索引描述缺少keys")
+        if isinstance(keys, list):
+            keys = [tuple(key) if isinstance(key, list) else key for key in keys]
+        options: Dict[str, Any] = {}
+        for field, option in (("name", "name"), ("unique", "unique"), ("sparse", "sparse"),
+                              ("partial_filter_expression", "partialFilterExpression"),
+                              ("expire_after_seconds", "expireAfterSeconds")):
+            if spec.get(field) is not None:
+                options[option] = spec[field]
+        return IndexModel(keys, **options)
+    
+    def create_indexes(self, database_name: str, collection_name: str,
+                       indexes: List[Dict[str, Any]], wait: bool = False,
+                       commit_quorum: Any = None) -> MongoResponse:
+        """
+        用一条createIndexes命令创建多个索引
+        
+        同一命令中的索引共享一次集合扫描。默认在后台线程中发起命令并立即返回，
+        进度通过index_build_progress查询
+        
+        Args:
+            database_name: 数据库名称
+            collection_name: 集合名称
+            indexes: 索引描述列表
+            wait: 是否等待构建完成
+            commit_quorum: 副本集中需要完成构建的成员数量或 "majority"、"votingMembers"
+            
+        Returns:
+            包含build_id和索引名称的响应对象
+        """
+        try:
+            if not indexes:
+                raise ValueError("至少需要一个索引描述")
+            collection = self.get_collection(database_name, collection_name)
+            models = [self._index_model(spec) for spec in indexes]
+            build = IndexBuild(
+                f"{database_name}.{collection_name}",
+                [model.document["name"] for model in models]
+            )
+            options: Dict[str, Any] = {"comment": build.build_id}
+            if commit_quorum is not None:
+                options["commitQuorum"] = commit_quorum
+            
+            def run_build() -> None:
+                try:
+                    # createIndexes对已存在的相同索引是幂等的，可以安全重试
+                    self.resilience.execute(
+                        "create_indexes",
+                        lambda: collection.create_indexes(models, **options),
+                        WRITE
+                    )
+                    self.distinct_plan_cache.invalidate_namespace(
+                        f"{database_name}.{collection_name}"
+                    )
+                    build.finish()
+                except Exception as e:
+                    self._record_error("create_indexes", e)
+                    logger.error(f"创建索引失败: {str(e)}")
+                    build.finish(str(e))
+            
+            self.index_builds.add(build)
+            if wait:
+                run_build()
+                if build.error:
+                    return MongoResponse(
+                        success=False,
+                        data=build.describe(),
+                        error=f"创建索引失败: {build.error}"
+                    )
+            else:
+                threading.Thread(
+                    target=run_build, name=f"index-build-{build.build_id}", daemon=True
+                ).start()
+            return MongoResponse(success=True, data=build.describe(), count=len(models))
+            
+        except (PyMongoError, ValueError, TypeError) as e:
+            logger.error(f"创建索引失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"创建索引失败: {str(e)}"
+            )
+    
+    def index_build_progress(self, database_name: str = None, collection_name: str = None,
+                             build_id: str = None) -> MongoResponse:
+        """
+        查询索引构建进度
+        
+        从$currentOp读取正在进行的索引构建（阶段、已处理键数量、耗时和当前阶段预计剩余时间），
+        并与create_indexes发起的构建按命名空间和索引名称对应
+        
+        Args:
+            database_name: 数据库名称
+            collection_name: 集合名称
+            build_id: create_indexes返回的构建ID
+            
+        Returns:
+            包含builds（本服务器发起的构建）和operations（服务器上所有进行中的索引构建）的响应对象
+        """
+        try:
+            namespace = None
+            if build_id:
+                build = self.index_builds.get(build_id)
+                if build is None:
+                    raise ValueError(f"索引构建 {build_id} 不存在")
+                builds = [build]
+                namespace = build.namespace
+            else:
+                if database_name and collection_name:
+                    namespace = f"{database_name}.{collection_name}"
+                builds = self.index_builds.list(namespace)
+            
+            match: Dict[str, Any] = {"$or": [
+                {"command.createIndexes": {"$exists": True}},
+                {"msg": {"$regex": "^Index Build"}}
+            ]}
+            if namespace:
+                match["ns"] = namespace
+            elif database_name:
+                match["ns"] = {"$regex": f"^{re.escape(database_name)}\\."}
+            
+            def current_index_ops(scope: Dict[str, Any]) -> List[Dict[str, Any]]:
+                pipeline = [{"$currentOp": scope}, {"$match": match}]
+                with self.client.admin.aggregate(pipeline) as cursor:
+                    return list(cursor)
+            
+            try:
+                # 构建线程属于内部操作，需要allUsers才能看到，没有权限时退回只看自己的操作
+                ops = self.resilience.execute(
+                    "index_build_progress", lambda: current_index_ops({"allUsers": True})
+                )
+            except OperationFailure:
+                ops = self.resilience.execute(
+                    "index_build_progress", lambda: current_index_ops({"ownOps": True})
+                )
+            operations = self.index_builds.summarize(ops)
+            
+            reports = []
+            for build in builds:
+                report = build.describe()
+                report["operations"] = [
+                    op for op in operations
+                    if op["namespace"] == build.namespace
+                    and set(op["indexes"]) & set(build.names)
+                ]
+                reports.append(report)
+            
+            return MongoResponse(
+                success=True,
+                data={"builds": reports, "operations": operations},
+                count=len(operations)
+            )
+            
+        except (PyMongoError, ValueError) as e:
+            logger.error(f"查询索引构建进度失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"查询索引构建进度失败: {str(e)}"
+            )
+    
+    def list_indexes(self, database_name: str, collection_name: str) -> MongoResponse:
+        """
+        列出集合的所有索引
+        
+        Args:
+            database_name: 数据库名称
+            collection_name: 集合名称
+            
+        Returns:
+            包含索引列表的响应对象
+        """
+        try:
+            collection = self.get_collection(database_name, collection_name)
+            indexes = []
+            
+            index_infos = self.resilience.execute(
+                "list_indexes", lambda: list(collection.list_indexes())
+            )
+            for index_info in index_infos:
+                indexes.append(IndexInfo(
+                    name=index_info["name"],
+                    key=[{field: direction} for field, direction in index_info["key"].items()],
+                    unique=index_info.get("unique", False),
+                    sparse=index_info.get("sparse", False),
+                    background=index_info.get("background", True)
+                ))
+            
+            return MongoResponse(
+                success=True,
+                data=indexes,
+                count=len(indexes)
+            )
+            
+        except PyMongoError as e:
+            logger.error(f"列出索引失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"列出索引失败: {str(e)}"
+            )
+    
+    def index_report(self, database_name: str, collection_name: str = None,
+                     min_age_hours: float = 24, limit: int = 50) -> MongoResponse:
+        """
+        索引使用分析报告
+        
+        对数据库中的每个集合（或指定集合）并行读取索引定义、$indexStats和$collStats，
+        找出未使用和前缀冗余的索引，并按删除后节省的写入开销排序
+        
+        Args:
+            database_name: 数据库名称
+            collection_name: 集合名称，为空时分析数据库中的所有集合
+            min_age_hours: 访问统计至少覆盖多少小时才把零访问视为未使用
+            limit: 返回的删除候选数量上限
+            
+        Returns:
+            包含每个集合的索引分析和排序后删除候选的响应对象
+        """
+        try:
+            db = self.get_database(database_name)
+            if collection_name:
+                names = [collection_name]
+            else:
+                names = self.resilience.execute(
+                    "index_report",
+                    lambda: db.list_collection_names(filter={"type": "collection"})
+                )
+                names = sorted(name for name in names if not name.startswith("system."))
+            
+            comment = current_operation_id.get()
+            min_age = datetime.timedelta(hours=min_age_hours)
+            
+            def collect(name: str) -> Dict[str, Any]:
+                collection = db[name]
+                
+                def read(pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+                    with collection.aggregate(pipeline, comment=comment) as cursor:
+                        return list(cursor)
+                
+                indexes = self.resilience.execute(
+                    "index_report", lambda: [dict(index) for index in collection.list_indexes()]
+                )
+                index_stats = self.resilience.execute(
+                    "index_report", lambda: read([{"$indexStats": {}}])
+                )
+                collection_stats = self.resilience.execute(
+                    "index_report",
+                    lambda: read([{"$collStats": {"latencyStats": {}, "storageStats": {}}}])
+                )
+                return analyze_collection(
+                    f"{database_name}.{name}", indexes, index_stats, collection_stats, min_age
+                )
+            
+            collections = []
+            errors = []
+            workers = max(1, min(self.index_report_concurrency, len(names)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [(name, executor.submit(collect, name)) for name in names]
+                for name, future in futures:
+                    try:
+                        collections.append(future.result())
+                    except PyMongoError as e:
+                        errors.append({"namespace": f"{database_name}.{name}", "error": str(e)})
+            
+            candidates = rank_candidates([
+                candidate for report in collections for candidate in report.pop("drop_candidates")
+            ])
+            return MongoResponse(
+                success=True,
+                data={
+                    "drop_candidates": candidates[:limit],
+                    "collections": collections,
+                    "errors": errors
+                },
+                count=len(candidates)
+            )
+            
+        except PyMongoError as e:
+            self._record_error("index_report", e)
+            logger.error(f"生成索引报告失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"生成索引报告失败: {str(e)}"
+            )
+    
+    def gridfs_put(self, database_name: str, local_path: str, filename: str = None,
+                   bucket: str = "fs", chunk_size_bytes: int = None,
+                   metadata: Dict[str, Any] = None) -> MongoResponse:
+        """
+        把本地文件流式上传到GridFS存储桶
+        
+        按块读取本地文件并写入上传流，内存占用与文件大小无关；上传失败时删除已写入的块
+        
+        Args:
+            database_name: 数据库名称
+            local_path: MONGODB_GRIDFS_DIR 下的本地文件路径
+            filename: GridFS中的文件名，默认为本地文件名
+            bucket: 存储桶名称
+            chunk_size_bytes: 块大小，默认MONGODB_GRIDFS_CHUNK_SIZE
+            metadata: 文件元数据
+            
+        Returns:
+            包含文件ID、长度、块大小和SHA-256的响应对象
+        """
+        try:
+            path = resolve_local_path(self.gridfs_dir, local_path)
+            if not os.path.isfile(path):
+                raise BlobError(f"本地文件不存在: {local_path}")
+            chunk_size = chunk_size_bytes or self.gridfs_chunk_size
+            if chunk_size <= 0 or chunk_size > 16 * 1024 * 1024 - 1024:
+                raise BlobError("chunk_size_bytes必须大于0且小于16MB")
+            filename = filename or os.path.basename(path)
+            grid = GridFSBucket(self.get_database(database_name), bucket_name=bucket)
+            
+            def upload():
+                # 每次重试都从头上传，失败的上传会删除已写入的块
+                digest = hashlib.sha256()
+                stream = grid.open_upload_stream(
+                    filename, chunk_size_bytes=chunk_size, metadata=metadata
+                )
+                try:
+                    for block in read_file_blocks(path, chunk_size, digest):
+                        stream.write(block)
+                    stream.close()
+                except BaseException:
+                    stream.abort()
+                    raise
+                return stream._id, stream.length, digest.hexdigest()
+            
+            file_id, length, sha256 = self.resilience.execute("gridfs_put", upload, WRITE)
+            self._invalidate(database_name, f"{bucket}.files")
+            self._invalidate(database_name, f"{bucket}.chunks")
+            metrics.incr("gridfs_uploaded_bytes", length, bucket=bucket)
+            return MongoResponse(
+                success=True,
+                data={
+                    "file_id": str(file_id),
+                    "filename": filename,
+                    "length": length,
+                    "chunk_size": chunk_size,
+                    "sha256": sha256
+                },
+                count=1
+            )
+            
+        except (BlobError, OSError) as e:
+            return MongoResponse(success=False, error=f"上传GridFS文件失败: {str(e)}")
+        except PyMongoError as e:
+            self._record_error("gridfs_put", e)
+            logger.error(f"上传GridFS文件失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"上传GridFS文件失败: {str(e)}"
+            )
+    
+    def gridfs_get(self, database_name: str, file_id: str = None, filename: str = None,
+                   local_path: str = None, bucket: str = "fs", offset: int = 0,
+                   length: int = None, overwrite: bool = False) -> MongoResponse:
+        """
+        从GridFS存储桶下载文件或其中的字节范围
+        
+        按块范围并行读取chunks集合并按顺序写出，同时在内存中的块数不超过
+        MONGODB_GRIDFS_READ_PARALLELISM × MONGODB_GRIDFS_READ_BATCH_CHUNKS。
+        指定local_path时写入本地文件，否则以base64内联返回（不超过MONGODB_GRIDFS_MAX_INLINE_BYTES）
+        
+        Args:
+            database_name: 数据库名称
+            file_id: 文件ID
+            filename: 文件名，未指定file_id时读取该文件名最新上传的版本
+            local_path: MONGODB_GRIDFS_DIR 下的目标路径
+            bucket: 存储桶名称
+            offset: 起始字节
+            length: 读取的字节数，默认读到文件末尾
+            overwrite: 目标文件已存在时是否覆盖
+            
+        Returns:
+            包含文件描述、读取的范围和SHA-256的响应对象
+        """
+        try:
+            if not file_id and not filename:
+                raise BlobError("必须指定file_id或filename")
+            if offset < 0 or (length is not None and length < 0):
+                raise BlobError("offset和length不能为负数")
+            database = self.get_database(database_name)
+            if file_id:
+                query = {"_id": ObjectId(file_id) if ObjectId.is_valid(file_id) else file_id}
+            else:
+                query = {"filename": filename}
+            file_document = self.resilience.execute(
+                "gridfs_get",
+                lambda: database[f"{bucket}.files"].find_one(query, sort=[("uploadDate", -1)])
+            )
+            if file_document is None:
+                raise BlobError(f"GridFS文件不存在: {file_id or filename}")
+            
+            total = file_document.get("length", 0)
+            offset = min(offset, total)
+            length = total - offset if length is None else min(length, total - offset)
+            if local_path is None and length > self.gridfs_max_inline_bytes:
+                raise BlobError(
+                    f"读取范围 {length} 字节超过内联上限 {self.gridfs_max_inline_bytes}，"
+                    f"请指定local_path或缩小length"
+                )
+            
+            reader = RangeReader(
+                database[f"{bucket}.chunks"],
+                parallelism=self.gridfs_read_parallelism,
+                batch_chunks=self.gridfs_read_batch_chunks,
+                execute=lambda fn: self.resilience.execute("gridfs_get", fn)
+            )
+            digest = hashlib.sha256()
+            data = describe_file(file_document)
+            data.update({"offset": offset, "bytes": length})
+            
+            if local_path is None:
+                content = bytearray()
+                
+                def collect(block: bytes) -> None:
+                    digest.update(block)
+                    content.extend(block)
+                
+                reader.read(file_document, offset, length, collect)
+                data["content_base64"] = base64.b64encode(content).decode("ascii")
+            else:
+                path = resolve_local_path(self.gridfs_dir, local_path)
+                
+                def download(f) -> None:
+                    def sink(block: bytes) -> None:
+                        digest.update(block)
+                        f.write(block)
+                    reader.read(file_document, offset, length, sink)
+                
+                write_atomically(path, overwrite, download)
+                data["local_path"] = path
+            
+            data["sha256"] = digest.hexdigest()
+            metrics.incr("gridfs_downloaded_bytes", length, bucket=bucket)
+            return MongoResponse(success=True, data=data, count=1)
+            
+        except (BlobError, OSError) as e:
+            return MongoResponse(success=False, error=f"下载GridFS文件失败: {str(e)}")
+        except PyMongoError as e:
+            self._record_error("gridfs_get", e)
+            logger.error(f"下载GridFS文件失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"下载GridFS文件失败: {str(e)}"
+            )
+    
+    def gridfs_list(self, database_name: str, bucket: str = "fs",
+                    filter_dict: Dict[str, Any] = None, limit: int = 100) -> MongoResponse:
+        """
+        列出GridFS存储桶中的文件
+        
+        Args:
+            database_name: 数据库名称
+            bucket: 存储桶名称
+            filter_dict: files集合上的查询条件（例如按filename或metadata过滤）
+            limit: 返回的文件数量上限
+            
+        Returns:
+            按上传时间降序排列的文件描述
+        """
+        try:
+            files = self.get_database(database_name)[f"{bucket}.files"]
+            documents = self.resilience.execute(
+                "gridfs_list",
+                lambda: list(files.find(filter_dict or {}, sort=[("uploadDate", -1)], limit=limit))
+            )
+            data = [describe_file(document) for document in documents]
+            return MongoResponse(success=True, data=data, count=len(data))
+            
+        except PyMongoError as e:
+            self._record_error("gridfs_list", e)
+            logger.error(f"列出GridFS文件失败: {str(e)}")
+            return MongoResponse(
+                success=False,
+                error=f"列出GridFS文件失败: {str(e)}"
             )
     
     def close(self) -> None:
         """关闭数据库连接"""
+        self.cursors.close_all()
+        self.streams.close_all()
+        self.spills.close_all()
         if self.client:
             self.client.close()
             logger.info("MongoDB连接已关闭") 
\ No newline at end of file
@@ -0,0 +1,286 @@
+"""
+Extended JSON 参数解析
+
+工具参数以普通JSON传入，{"$oid": ...}、{"$date": ...}、{"$numberDecimal": ...} 等
+Canonical/Relaxed Extended JSON写法需要转换为BSON类型，查询才能与库中存储的值匹配并使用索引。
+可选地把过滤器中 _id 字段的24位十六进制字符串转换为ObjectId
+"""
+
+import json
+import re
+from typing import Any, Dict
+
+from bson import ObjectId, json_util
+
+from .cache import MISSING, TTLCache
+
+# Extended JSON类型包装使用的键，出现其中任意一个的对象交给json_util解析。
+# $regex/$options 同时是查询运算符，{"$ref": ..., "$id": ...} 按原样编码就是DBRef，
+# 两者都不转换；正则表达式使用 {"$regularExpression": {"pattern": ..., "options": ...}}
+_EJSON_KEYS = frozenset((
+    "$oid", "$date", "$numberDecimal", "$numberLong", "$numberInt", "$numberDouble",
+    "$binary", "$uuid", "$regularExpression", "$timestamp", "$minKey",
+    "$maxKey", "$symbol", "$code", "$dbPointer", "$undefined",
+))
+
+# 值可以是_id比较对象的查询运算符
+_ID_OPERATORS = ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin")
+
+# 包含子过滤器列表的逻辑运算符
+_LOGICAL_OPERATORS = ("$and", "$or", "$nor")
+
+# 带有子管道（pipeline字段）的聚合阶段
+_SUB_PIPELINE_STAGES = ("$lookup", "$unionWith")
+
+_HEX_ID = re.compile(r"^[0-9a-fA-F]{24}$")
+
+# 各类参数：过滤器（可转换_id）、管道（$match阶段可转换_id）、其他只解析Extended JSON的参数、文档（不缓存）
+FILTER_ARGUMENTS = ("filter",)
+PIPELINE_ARGUMENTS = ("pipeline",)
+VALUE_ARGUMENTS = ("update", "let", "when_matched", "indexes")
+DOCUMENT_ARGUMENTS = ("document",)
+
+
+def _has_ejson(value: Any) -> bool:
+    """是否包含Extended JSON类型包装"""
+    if isinstance(value, dict):
+        return not _EJSON_KEYS.isdisjoint(value) or any(_has_ejson(item) for item in value.values())
+    if isinstance(value, list):
+        return any(_has_ejson(item) for item in value)
+    return False
+
+
+def decode_value(value: Any) -> Any:
+    """
+    将Extended JSON写法转换为BSON类型
+
+    只重建包含转换的路径，不含Extended JSON的子对象原样返回
+
+    Args:
+        value: 已从JSON解析出的值
+
+    Returns:
+        转换后的值
+    """
+    if isinstance(value, dict):
+        result = None
+        for key, item in value.items():
+            decoded = decode_value(item)
+            if decoded is not item:
+                if result is None:
+                    result = dict(value)
+                result[key] = decoded
+        document = value if result is None else result
+        if not _EJSON_KEYS.isdisjoint(document):
+            # object_hook会从传入的字典中弹出键，不能把调用方的对象交给它
+            return json_util.object_hook(dict(document))
+        return document
+    if isinstance(value, list):
+        result = None
+        for position, item in enumerate(value):
+            decoded = decode_value(item)
+            if decoded is not item:
+                if result is None:
+                    result = list(value)
+                result[position] = decoded
+        return value if result is None else result
+    return value
+
+
+def _coerce_id_value(value: Any) -> Any:
+    """把24位十六进制字符串（或其列表）转换为ObjectId"""
+    if isinstance(value, str) and _HEX_ID.match(value):
+        return ObjectId(value)
+    if isinstance(value, list):
+        return [_coerce_id_value(item) for item in value]
+    if isinstance(value, dict):
+        return {
+            key: _coerce_id_value(item) if key in _ID_OPERATORS or key == "$not" else item
+            for key, item in value.items()
+        }
+    return value
+
+
+def _is_id_field(key: str) -> bool:
+    return key == "_id" or key.endswith("._id")
+
+
+def coerce_object_ids(filter_dict: Any) -> Any:
+    """
+    将过滤器中 _id（以及 xxx._id）字段的24位十六进制字符串转换为ObjectId
+
+    支持直接比较、$eq/$in/$not等运算符、$and/$or/$nor中的子过滤器以及$elemMatch子过滤器
+
+    Args:
+        filter_dict: 查询过滤器
+
+    Returns:
+        转换后的过滤器
+    """
+    if not isinstance(filter_dict, dict):
+        return filter_dict
+    result: Dict[str, Any] = {}
+    for key, value in filter_dict.items():
+        if _is_id_field(key):
+            value = _coerce_id_value(value)
+        elif key in _LOGICAL_OPERATORS and isinstance(value, list):
+            value = [coerce_object_ids(item) for item in value]
+        elif isinstance(value, dict) and isinstance(value.get("$elemMatch"), dict):
+            value = {**value, "$elemMatch": coerce_object_ids(value["$elemMatch"])}
+        result[key] = value
+    return result
+
+
+def coerce_pipeline_ids(stages: Any) -> Any:
+    """
+    将聚合管道 $match 阶段中的 _id 字符串转换为ObjectId
+
+    包括$lookup/$unionWith子管道和$facet各分支中的$match阶段
+
+    Args:
+        stages: 聚合管道
+
+    Returns:
+        转换后的管道
+    """
+    if not isinstance(stages, list):
+        return stages
+    result = []
+    for stage in stages:
+        if isinstance(stage, dict):
+            if "$match" in stage:
+                stage = {**stage, "$match": coerce_object_ids(stage["$match"])}
+            for name in _SUB_PIPELINE_STAGES:
+                spec = stage.get(name)
+                if isinstance(spec, dict) and "pipeline" in spec:
+                    spec = {**spec, "pipeline": coerce_pipeline_ids(spec["pipeline"])}
+                    stage = {**stage, name: spec}
+            if isinstance(stage.get("$facet"), dict):
+                stage = {**stage, "$facet": {
+                    branch: coerce_pipeline_ids(pipeline) for branch, pipeline in stage["$facet"].items()
+                }}
+        result.append(stage)
+    return result
+
+
+def _has_hex_id(filter_dict: Any) -> bool:
+    """过滤器中是否可能有需要转换的 _id 字符串"""
+    if not isinstance(filter_dict, dict):
+        return False
+    for key, value in filter_dict.items():
+        if _is_id_field(key):
+            return True
+        if key in _LOGICAL_OPERATORS and isinstance(value, list):
+            if any(_has_hex_id(item) for item in value):
+                return True
+        if isinstance(value, dict) and _has_hex_id(value.get("$elemMatch")):
+            return True
+    return False
+
+
+def _pipeline_has_hex_id(stages: Any) -> bool:
+    """管道（包括子管道和$facet分支）的 $match 阶段中是否可能有需要转换的 _id 字符串"""
+    if not isinstance(stages, list):
+        return False
+    for stage in stages:
+        if not isinstance(stage, dict):
+            continue
+        if _has_hex_id(stage.get("$match")):
+            return True
+        for name in _SUB_PIPELINE_STAGES:
+            spec = stage.get(name)
+            if isinstance(spec, dict) and _pipeline_has_hex_id(spec.get("pipeline")):
+                return True
+        facet = stage.get("$facet")
+        if isinstance(facet, dict) and any(_pipeline_has_hex_id(item) for item in facet.values()):
+            return True
+    return False
+
+
+class ExtendedJsonDecoder:
+    """
+    工具参数解析器
+
+    需要转换的参数按原始JSON文本缓存解析结果，重复的过滤器和管道只解析一次。
+    缓存的结果会被多次调用共享，数据库层只读取这些参数，不会修改它们；
+    文档参数会被驱动补充_id，因此不缓存
+    """
+
+    def __init__(self, coerce_ids: bool = False, cache_size: int = 1024):
+        """
+        初始化解析器
+
+        Args:
+            coerce_ids: 是否把过滤器中 _id 的24位十六进制字符串转换为ObjectId
+            cache_size: 解析缓存的条目数量上限
+        """
+        self.coerce_ids = coerce_ids
+        self.cache = TTLCache(ttl=float("inf"), max_entries=cache_size)
+
+    def _cached(self, kind: str, value: Any, needs_work: bool, convert) -> Any:
+        """需要转换时按原始JSON文本查缓存，未命中时转换并写入缓存"""
+        if not needs_work:
+            return value
+        try:
+            key = (kind, json.dumps(value, separators=(",", ":")))
+        except (TypeError, ValueError):
+            return convert(value)
+        cached = self.cache.get(key)
+        if cached is MISSING:
+            cached = convert(value)
+            self.cache.set(key, cached)
+        return cached
+
+    def decode_filter(self, value: Any) -> Any:
+        """解析过滤器，开启时转换 _id"""
+        coerce = self.coerce_ids and _has_hex_id(value)
+        return self._cached(
+            "filter", value, coerce or _has_ejson(value),
+            lambda raw: coerce_object_ids(decode_value(raw)) if coerce else decode_value(raw)
+        )
+
+    def decode_pipeline(self, value: Any) -> Any:
+        """解析聚合管道，开启时转换 $match 阶段中的 _id"""
+        if not isinstance(value, list):
+            return self.decode_value(value)
+        coerce = self.coerce_ids and _pipeline_has_hex_id(value)
+
+        def convert(raw: Any) -> Any:
+            stages = decode_value(raw)
+            return coerce_pipeline_ids(stages) if coerce else stages
+
+        return self._cached("pipeline", value, coerce or _has_ejson(value), convert)
+
+    def decode_value(self, value: Any) -> Any:
+        """解析其他参数（更新、let变量等）"""
+        return self._cached("value", value, _has_ejson(value), decode_value)
+
+    def decode_arguments(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        解析一次工具调用的参数
+
+        Args:
+            arguments: 工具参数
+
+        Returns:
+            解析后的参数，未变化时返回原字典
+        """
+        result = None
+        for name, value in arguments.items():
+            if value is None:
+                continue
+            if name in FILTER_ARGUMENTS:
+                decoded = self.decode_filter(value)
+            elif name in PIPELINE_ARGUMENTS:
+                decoded = self.decode_pipeline(value)
+            elif name in VALUE_ARGUMENTS:
+                decoded = self.decode_value(value)
+            elif name in DOCUMENT_ARGUMENTS:
+                decoded = decode_value(value)
+            else:
+                continue
+            if decoded is not value:
+                if result is None:
+                    result = dict(arguments)
+                result[name] = decoded
+        return arguments if result is None else result
@@ -0,0 +1,182 @@
+"""
+索引构建跟踪
+
+记录通过create_indexes发起的索引构建，并把$currentOp中索引构建操作的
+阶段、进度和耗时整理为进度报告
+"""
+
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# 构建状态
+BUILDING = "building"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# 部分版本在msg末尾附带 "123/456 27%" 形式的进度，比较阶段时去掉
+_PROGRESS_SUFFIX = re.compile(r"[:\s]*\d+/\d+(\s+\d+%)?\s*$")
+
+
+class IndexBuild:
+    """一次createIndexes调用"""
+
+    def __init__(self, namespace: str, names: List[str]):
+        """
+        初始化构建记录
+
+        Args:
+            namespace: 集合命名空间
+            names: 本次构建的索引名称
+        """
+        self.build_id = uuid.uuid4().hex
+        self.namespace = namespace
+        self.names = names
+        self.status = BUILDING
+        self.error: Optional[str] = None
+        self.started = time.monotonic()
+        self.elapsed: Optional[float] = None
+
+    def finish(self, error: Optional[str] = None) -> None:
+        """记录构建结束"""
+        self.status = FAILED if error else COMPLETED
+        self.error = error
+        self.elapsed = time.monotonic() - self.started
+
+    def describe(self) -> Dict[str, Any]:
+        """生成可直接序列化的构建描述"""
+        elapsed = self.elapsed if self.elapsed is not None else time.monotonic() - self.started
+        return {
+            "build_id": self.build_id,
+            "namespace": self.namespace,
+            "indexes": list(self.names),
+            "status": self.status,
+            "error": self.error,
+            "elapsed_s": round(elapsed, 1),
+        }
+
+
+class IndexBuildRegistry:
+    """最近发起的索引构建，超过上限时丢弃最早的记录"""
+
+    def __init__(self, max_builds: int = 100):
+        self.max_builds = max_builds
+        self._builds: "OrderedDict[str, IndexBuild]" = OrderedDict()
+        # opid -> (阶段, 第一次看到该阶段时的 (已运行秒数, 已处理数量))，按最近观测排序
+        self._phases: "OrderedDict[str, Tuple[Tuple[Any, Any], Tuple[float, int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, build: IndexBuild) -> None:
+        """登记构建"""
+        with self._lock:
+            self._builds[build.build_id] = build
+            while len(self._builds) > self.max_builds:
+                self._builds.popitem(last=False)
+
+    def get(self, build_id: str) -> Optional[IndexBuild]:
+        """按ID获取构建"""
+        with self._lock:
+            return self._builds.get(build_id)
+
+    def list(self, namespace: Optional[str] = None) -> List[IndexBuild]:
+        """列出构建，可按命名空间过滤"""
+        with self._lock:
+            return [
+                build for build in self._builds.values()
+                if namespace is None or build.namespace == namespace
+            ]
+
+    def summarize(self, ops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        整理$currentOp中的索引构建操作，并记录每个操作当前阶段的起点
+
+        同一阶段的后续查询按该阶段内的处理速度估算剩余时间。记录的操作数量超过上限时
+        丢弃最久没有观测到的记录
+
+        Args:
+            ops: $currentOp返回的索引构建操作
+
+        Returns:
+            summarize_operation的结果列表
+        """
+        summaries = []
+        with self._lock:
+            for op in ops:
+                opid = str(op.get("opid"))
+                progress = op.get("progress") or {}
+                phase = (_phase_name(op.get("msg")), progress.get("total"))
+                known = self._phases.get(opid)
+                done = progress.get("done")
+                if known is None or known[0] != phase or (done or 0) < known[1][1]:
+                    known = (phase, (_elapsed_seconds(op), done or 0))
+                    first_seen = True
+                else:
+                    first_seen = False
+                self._phases[opid] = known
+                self._phases.move_to_end(opid)
+                summaries.append(summarize_operation(op, None if first_seen else known[1]))
+            while len(self._phases) > self.max_builds:
+                self._phases.popitem(last=False)
+        return summaries
+
+
+def _phase_name(message: Optional[str]) -> Optional[str]:
+    """去掉阶段描述末尾的进度数字"""
+    return _PROGRESS_SUFFIX.sub("", message) if message else message
+
+
+def _elapsed_seconds(op: Dict[str, Any]) -> float:
+    """操作已运行的秒数"""
+    if op.get("microsecs_running") is not None:
+        return op["microsecs_running"] / 1_000_000
+    return float(op.get("secs_running") or 0)
+
+
+def summarize_operation(op: Dict[str, Any],
+                        phase_start: Optional[Tuple[float, int]] = None) -> Dict[str, Any]:
+    """
+    整理$currentOp中的一个索引构建操作
+
+    剩余时间优先按当前阶段内的处理速度估算（eta_basis为phase），需要同一阶段之前的
+    一次观测phase_start；没有时只能按整个操作的平均速度估算（eta_basis为operation），
+    前面阶段的耗时也计入其中，第一阶段之后的估计偏大
+
+    Args:
+        op: $currentOp返回的操作文档
+        phase_start: 当前阶段中较早一次观测的 (已运行秒数, 已处理数量)
+
+    Returns:
+        包含阶段、已处理键数量、百分比、耗时和预计剩余时间的字典
+    """
+    command = op.get("command") or {}
+    progress = op.get("progress") or {}
+    done = progress.get("done")
+    total = progress.get("total")
+    elapsed = _elapsed_seconds(op)
+
+    summary: Dict[str, Any] = {
+        "opid": str(op.get("opid")),
+        "namespace": op.get("ns"),
+        "indexes": [index.get("name") for index in command.get("indexes", [])],
+        "phase": op.get("msg"),
+        "done": done,
+        "total": total,
+        "percent": None,
+        "elapsed_s": round(elapsed, 1),
+        "eta_s": None,
+        "eta_basis": None,
+    }
+    if done is not None and total:
+        summary["percent"] = round(done / total * 100, 1)
+        if 0 < done < total:
+            if phase_start is not None and elapsed > phase_start[0] and done > phase_start[1]:
+                rate = (done - phase_start[1]) / (elapsed - phase_start[0])
+                summary["eta_s"] = round((total - done) / rate, 1)
+                summary["eta_basis"] = "phase"
+            else:
+                summary["eta_s"] = round(elapsed * (total - done) / done, 1)
+                summary["eta_basis"] = "operation"
+    return summary
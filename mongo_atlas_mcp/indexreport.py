@@ -0,0 +1,205 @@
+"""
+索引使用分析
+
+合并$indexStats的访问计数、$collStats的索引大小和写入次数，以及索引键前缀重叠检测，
+找出未使用或被其他索引覆盖的索引，并按删除后节省的写入开销排序
+"""
+
+import datetime
+from typing import Any, Dict, List, Optional
+
+# 不能用前缀关系判断冗余的特殊索引类型
+_SPECIAL_INDEX_TYPES = ("text", "2d", "2dsphere", "hashed", "geoHaystack")
+
+# 带有这些选项的索引行为不同于普通索引，不作为冗余候选
+_BEHAVIOR_OPTIONS = (
+    "unique", "sparse", "partialFilterExpression", "expireAfterSeconds", "collation"
+)
+
+
+def _key_items(index: Dict[str, Any]) -> List[tuple]:
+    """索引键的 (字段, 方向) 列表"""
+    return list(index["key"].items())
+
+
+def _is_plain(index: Dict[str, Any]) -> bool:
+    """是否为不带特殊类型和行为选项的普通索引"""
+    if index["name"] == "_id_":
+        return False
+    if any(direction in _SPECIAL_INDEX_TYPES for _, direction in _key_items(index)):
+        return False
+    return not any(index.get(option) for option in _BEHAVIOR_OPTIONS)
+
+
+def find_redundant(indexes: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    检测前缀冗余的索引
+
+    普通索引A的键是索引B的键的前缀（字段和方向都相同）时，B可以满足A能满足的查询，A是冗余的。
+    键完全相同的两个索引只保留名称较小的一个
+
+    Args:
+        indexes: list_indexes返回的索引定义
+
+    Returns:
+        冗余索引名称到覆盖它的索引名称的映射
+    """
+    redundant: Dict[str, str] = {}
+    for candidate in indexes:
+        if not _is_plain(candidate):
+            continue
+        keys = _key_items(candidate)
+        for other in indexes:
+            if other is candidate or other["name"] in redundant:
+                continue
+            if any(direction in _SPECIAL_INDEX_TYPES for _, direction in _key_items(other)):
+                continue
+            if other.get("partialFilterExpression") or other.get("sparse"):
+                # 部分索引和稀疏索引不包含所有文档，不能覆盖普通索引
+                continue
+            other_keys = _key_items(other)
+            if other_keys[:len(keys)] != keys:
+                continue
+            if len(other_keys) > len(keys) or other["name"] < candidate["name"]:
+                redundant[candidate["name"]] = other["name"]
+                break
+    return redundant
+
+
+def merge_index_stats(stats: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    合并$indexStats结果（分片集群中每个分片各返回一条）
+
+    Args:
+        stats: $indexStats返回的文档
+
+    Returns:
+        索引名称到 {ops, since} 的映射，since取最晚的统计起点
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    for entry in stats:
+        accesses = entry.get("accesses") or {}
+        item = merged.setdefault(entry["name"], {"ops": 0, "since": None})
+        item["ops"] += int(accesses.get("ops", 0))
+        since = accesses.get("since")
+        if since is not None and (item["since"] is None or since > item["since"]):
+            item["since"] = since
+    return merged
+
+
+def merge_collection_stats(stats: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    合并$collStats结果
+
+    Args:
+        stats: 带latencyStats和storageStats的$collStats文档
+
+    Returns:
+        包含count、size、total_index_size、index_sizes和write_ops的字典
+    """
+    merged: Dict[str, Any] = {
+        "count": 0, "size": 0, "total_index_size": 0, "index_sizes": {}, "write_ops": 0
+    }
+    for entry in stats:
+        storage = entry.get("storageStats") or {}
+        latency = entry.get("latencyStats") or {}
+        merged["count"] += int(storage.get("count", 0))
+        merged["size"] += int(storage.get("size", 0))
+        merged["total_index_size"] += int(storage.get("totalIndexSize", 0))
+        for name, size in (storage.get("indexSizes") or {}).items():
+            merged["index_sizes"][name] = merged["index_sizes"].get(name, 0) + int(size)
+        merged["write_ops"] += int((latency.get("writes") or {}).get("ops", 0))
+    return merged
+
+
+def analyze_collection(namespace: str, indexes: List[Dict[str, Any]],
+                       index_stats: List[Dict[str, Any]],
+                       collection_stats: List[Dict[str, Any]],
+                       min_age: datetime.timedelta,
+                       now: Optional[datetime.datetime] = None) -> Dict[str, Any]:
+    """
+    分析单个集合的索引
+
+    Args:
+        namespace: 集合命名空间
+        indexes: list_indexes返回的索引定义
+        index_stats: $indexStats结果
+        collection_stats: $collStats结果
+        min_age: 访问统计至少覆盖多长时间才把零访问视为未使用
+        now: 当前时间（UTC）
+
+    Returns:
+        包含集合统计、每个索引的分析结果和删除候选的字典
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    usage = merge_index_stats(index_stats)
+    storage = merge_collection_stats(collection_stats)
+    redundant = find_redundant(indexes)
+
+    report_indexes = []
+    candidates = []
+    for index in indexes:
+        name = index["name"]
+        accesses = usage.get(name, {"ops": None, "since": None})
+        since = accesses["since"]
+        if since is not None and since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.timezone.utc)
+        observed = since is not None and now - since >= min_age
+        unused = observed and accesses["ops"] == 0 and name != "_id_"
+        size = storage["index_sizes"].get(name)
+
+        item = {
+            "name": name,
+            "key": [[field, direction] for field, direction in _key_items(index)],
+            "accesses": accesses["ops"],
+            "since": since.isoformat() if since else None,
+            "size_bytes": size,
+            "unused": unused,
+            "redundant_of": redundant.get(name),
+        }
+        report_indexes.append(item)
+
+        reasons = []
+        if unused:
+            reasons.append("unused")
+        if name in redundant:
+            reasons.append(f"prefix_of:{redundant[name]}")
+        if reasons and not index.get("unique"):
+            candidates.append({
+                "namespace": namespace,
+                "name": name,
+                "key": item["key"],
+                "reasons": reasons,
+                "accesses": accesses["ops"],
+                "size_bytes": size,
+                # 每次写入都要维护该索引，删除后节省的索引维护次数约等于集合写入次数
+                "write_ops_saved": storage["write_ops"],
+            })
+
+    return {
+        "namespace": namespace,
+        "count": storage["count"],
+        "size_bytes": storage["size"],
+        "total_index_size_bytes": storage["total_index_size"],
+        "write_ops": storage["write_ops"],
+        "indexes": report_indexes,
+        "drop_candidates": candidates,
+    }
+
+
+def rank_candidates(candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    按删除后节省的写入开销排序
+
+    先按集合写入次数（每次写入少维护一个索引），再按索引大小（缓存和磁盘占用），
+    同时未使用且冗余的索引排在前面
+    """
+    return sorted(
+        candidates,
+        key=lambda item: (
+            item["write_ops_saved"],
+            len(item["reasons"]),
+            item["size_bytes"] or 0,
+        ),
+        reverse=True,
+    )
@@ -0,0 +1,134 @@
+"""
+MongoDB Atlas MCP 运行指标
+
+以线程安全的方式统计计数器和瞬时值，供get_metrics工具查询
+"""
+
+import threading
+from collections import defaultdict
+from typing import Any, Dict
+
+from pymongo import monitoring
+
+
+class Metrics:
+    """
+    运行指标
+
+    计数器名称可以附带标签，标签会被格式化到名称中，例如 timeouts{operation=find_documents}
+    """
+
+    def __init__(self):
+        """初始化指标存储"""
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> str:
+        """生成带标签的指标名称"""
+        if not labels:
+            return name
+        label_text = ",".join(f"{key}={labels[key]}" for key in sorted(labels))
+        return f"{name}{{{label_text}}}"
+
+    def incr(self, name: str, value: float = 1, **labels: Any) -> None:
+        """
+        增加计数器
+
+        Args:
+            name: 指标名称
+            value: 增加的数值
+            labels: 指标标签
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] += value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        """
+        设置瞬时值
+
+        Args:
+            name: 指标名称
+            value: 当前数值
+            labels: 指标标签
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        获取所有指标的当前值
+
+        Returns:
+            指标名称到数值的映射
+        """
+        with self._lock:
+            return {"counters": dict(self._counters), "gauges": dict(self._gauges)}
+
+    def reset(self) -> None:
+        """清空所有指标"""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+
+
+# 进程内共享的指标实例
+metrics = Metrics()
+
+
+class ConnectionPoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    连接池指标
+
+    统计所有服务器连接池中打开的连接数（mongo_connections_open）、
+    正在使用的连接数（mongo_connections_in_use）和获取连接失败的次数
+    """
+
+    def __init__(self):
+        self._open = 0
+        self._in_use = 0
+        self._lock = threading.Lock()
+
+    def _adjust(self, opened: int = 0, used: int = 0) -> None:
+        with self._lock:
+            self._open += opened
+            self._in_use += used
+            metrics.set_gauge("mongo_connections_open", self._open)
+            metrics.set_gauge("mongo_connections_in_use", self._in_use)
+
+    def connection_created(self, event) -> None:
+        metrics.incr("mongo_connections_created")
+        self._adjust(opened=1)
+
+    def connection_closed(self, event) -> None:
+        self._adjust(opened=-1)
+
+    def connection_checked_out(self, event) -> None:
+        self._adjust(used=1)
+
+    def connection_checked_in(self, event) -> None:
+        self._adjust(used=-1)
+
+    def connection_check_out_failed(self, event) -> None:
+        metrics.incr("mongo_connection_checkout_failures", reason=event.reason)
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_check_out_started(self, event) -> None:
+        pass
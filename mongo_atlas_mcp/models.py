@@ -1,35 +1,37 @@
 """
 MongoDB Atlas MCP 数据模型
 
-定义请求和响应的数据结构
+定义请求和响应的数据结构。请求模型使用pydantic校验输入；
+响应使用TypedDict和slots数据类，数据库层直接构造最终的字典，不再逐项校验和转换
 """
 
-from typing import Optional, List, Dict, Any, Union
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Any, TypedDict, Union
 from pydantic import BaseModel, Field
 
 
-class DatabaseInfo(BaseModel):
-    """数据库信息模型"""
-    name: str = Field(..., description="数据库名称")
-    size_on_disk: Optional[int] = Field(None, description="数据库大小（字节）")
-    empty: Optional[bool] = Field(None, description="是否为空")
+class DatabaseInfo(TypedDict):
+    """数据库信息"""
+    name: str                      # 数据库名称
+    size_on_disk: Optional[int]    # 数据库大小（字节）
+    empty: Optional[bool]          # 是否为空
 
 
-class CollectionInfo(BaseModel):
-    """集合信息模型"""
-    name: str = Field(..., description="集合名称")
-    count: Optional[int] = Field(None, description="文档数量")
-    size: Optional[int] = Field(None, description="集合大小（字节）")
-    avg_obj_size: Optional[int] = Field(None, description="平均对象大小")
+class CollectionInfo(TypedDict):
+    """集合信息"""
+    name: str                      # 集合名称
+    count: Optional[int]           # 文档数量
+    size: Optional[int]            # 集合大小（字节）
+    avg_obj_size: Optional[int]    # 平均对象大小
 
 
-class IndexInfo(BaseModel):
-    """索引信息模型"""
-    name: str = Field(..., description="索引名称")
-    key: List[Dict[str, Union[str, int]]] = Field(..., description="索引键")
-    unique: bool = Field(False, description="是否唯一索引")
-    sparse: bool = Field(False, description="是否稀疏索引")
-    background: bool = Field(True, description="是否后台创建")
+class IndexInfo(TypedDict):
+    """索引信息"""
+    name: str                                  # 索引名称
+    key: List[Dict[str, Union[str, int]]]      # 索引键，[{字段: 方向}, ...]
+    unique: bool                               # 是否唯一索引
+    sparse: bool                               # 是否稀疏索引
+    background: bool                           # 是否后台创建
 
 
 class FindDocumentsRequest(BaseModel):
@@ -82,12 +84,28 @@ class CreateIndexRequest(BaseModel):
     name: Optional[str] = Field(None, description="索引名称")
     unique: bool = Field(False, description="是否唯一索引")
     sparse: bool = Field(False, description="是否稀疏索引")
-    background: bool = Field(True, description="是否后台创建")
-
-
-class MongoResponse(BaseModel):
-    """MongoDB操作响应模型"""
-    success: bool = Field(..., description="操作是否成功")
-    data: Optional[Any] = Field(None, description="响应数据")
-    error: Optional[str] = Field(None, description="错误信息")
-    count: Optional[int] = Field(None, description="影响文档数量") 
\ No newline at end of file
+    background: bool = Field(True, description="已废弃，不再发送给服务器")
+
+
+@dataclass(slots=True)
+class MongoResponse:
+    """
+    MongoDB操作响应
+
+    data原样引用数据库层构造的结果，model_dump只组装外层字典，不复制或校验data
+    """
+    success: bool                       # 操作是否成功
+    data: Optional[Any] = None          # 响应数据
+    error: Optional[str] = None         # 错误信息
+    count: Optional[int] = None         # 影响文档数量
+    cursor_id: Optional[str] = None     # 未读完结果的游标ID，可通过get_more继续读取
+
+    def model_dump(self) -> Dict[str, Any]:
+        """转换为工具返回的字典"""
+        return {
+            "success": self.success,
+            "data": self.data,
+            "error": self.error,
+            "count": self.count,
+            "cursor_id": self.cursor_id,
+        }
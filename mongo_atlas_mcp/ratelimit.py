@@ -0,0 +1,129 @@
+"""
+MongoDB Atlas MCP 限流
+
+按 (工具, 命名空间, MCP会话) 维护令牌桶，限制单个客户端的调用速率
+"""
+
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class TokenBucket:
+    """
+    令牌桶
+
+    以固定速率补充令牌，桶容量即允许的突发调用数量
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        """
+        初始化令牌桶
+
+        Args:
+            rate: 每秒补充的令牌数量
+            burst: 桶容量
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        """按经过的时间补充令牌"""
+        # now可能早于创建桶时记录的时间，不能因此扣减令牌
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def try_acquire(self, now: float) -> float:
+        """
+        尝试取出一个令牌
+
+        Args:
+            now: 当前单调时间
+
+        Returns:
+            0表示成功，否则为需要等待的秒数
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        """令牌桶是否已补满（长时间未使用）"""
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class RateLimiter:
+    """
+    限流器
+
+    每个 (工具, 命名空间, 会话) 使用独立的令牌桶，速率和容量可以按工具单独配置
+    """
+
+    def __init__(self, rate: float = 50, burst: float = 100,
+                 tool_limits: Optional[Dict[str, Dict[str, float]]] = None,
+                 max_buckets: int = 10000):
+        """
+        初始化限流器
+
+        Args:
+            rate: 默认每秒允许的调用次数，0表示不限流
+            burst: 默认允许的突发调用次数
+            tool_limits: 按工具覆盖的配置，形如 {"delete_document": {"rate": 5, "burst": 10}}，
+                只配置rate时容量等于rate
+            max_buckets: 令牌桶数量超过该值时清理已补满的桶
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tool_limits = tool_limits or {}
+        self.max_buckets = max_buckets
+        self._buckets: Dict[Tuple[str, Optional[str], str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _limits_for(self, tool_name: str) -> Tuple[float, float]:
+        """获取工具对应的速率和容量"""
+        limits = self.tool_limits.get(tool_name)
+        if limits is None:
+            return float(self.rate), max(float(self.burst), 1.0)
+        rate = float(limits.get("rate", self.rate))
+        # 单独配置了速率但没有配置容量时，突发不超过一秒的速率，而不是沿用全局容量
+        burst = float(limits.get("burst", rate if "rate" in limits else self.burst))
+        return rate, max(burst, 1.0)
+
+    def check(self, tool_name: str, namespace: Optional[str], session_id: str) -> float:
+        """
+        检查一次调用是否允许执行
+
+        Args:
+            tool_name: 工具名称
+            namespace: 调用所在的命名空间
+            session_id: MCP会话ID
+
+        Returns:
+            0表示允许执行，否则为建议的重试等待秒数
+        """
+        rate, burst = self._limits_for(tool_name)
+        if rate <= 0:
+            return 0.0
+        key = (tool_name, namespace, session_id)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_buckets:
+                    self._prune(now)
+                bucket = TokenBucket(rate, burst)
+                self._buckets[key] = bucket
+            return bucket.try_acquire(now)
+
+    def _prune(self, now: float) -> None:
+        """清理已补满的令牌桶（调用方需持有锁）"""
+        for key in [key for key, bucket in self._buckets.items() if bucket.is_full(now)]:
+            del self._buckets[key]
@@ -0,0 +1,282 @@
+"""
+读取策略
+
+未指定投影的查询按命名空间使用默认投影，并在服务器端裁剪过深的嵌套文档、过长的数组、
+字符串和二进制数据。裁剪通过聚合表达式完成，被裁剪字段的路径随文档一起返回，
+调用方可以通过显式投影取回完整字段
+"""
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 响应文档中记录被裁剪字段路径的键
+TRIMMED_KEY = "_trimmed"
+
+# 未限制深度时，裁剪表达式递归的层数上限；更深的值原样返回
+_MAX_EXPRESSION_DEPTH = 8
+
+
+class ReadPolicy:
+    """
+    单个命名空间的读取策略
+
+    裁剪表达式在创建时生成一次，每次查询直接追加到管道末尾
+    """
+
+    def __init__(self, projection: Dict[str, Any] = None, max_depth: int = 0,
+                 max_array_length: int = 0, max_string_length: int = 0):
+        """
+        初始化读取策略
+
+        Args:
+            projection: 未指定投影时使用的默认投影
+            max_depth: 保留的文档嵌套层数，顶层字段为第1层，更深的子文档替换为空文档，0表示不限制
+            max_array_length: 数组保留的元素数量，0表示不限制
+            max_string_length: 字符串保留的字符数（二进制数据为字节数），0表示不限制
+        """
+        if max_depth < 0 or max_array_length < 0 or max_string_length < 0:
+            raise ValueError("裁剪上限不能为负数")
+        if max_depth > _MAX_EXPRESSION_DEPTH:
+            raise ValueError(f"max_depth不能超过 {_MAX_EXPRESSION_DEPTH}")
+        self.projection = projection or None
+        self.max_depth = max_depth
+        self.max_array_length = max_array_length
+        self.max_string_length = max_string_length
+        self._stage = self._build_stage() if self.trims else None
+
+    @property
+    def trims(self) -> bool:
+        """是否需要裁剪"""
+        return bool(self.max_depth or self.max_array_length or self.max_string_length)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "ReadPolicy":
+        """从配置字典创建"""
+        unknown = set(config) - {"projection", "max_depth", "max_array_length", "max_string_length"}
+        if unknown:
+            raise ValueError(f"读取策略包含未知配置: {', '.join(sorted(unknown))}")
+        return cls(
+            projection=config.get("projection"),
+            max_depth=int(config.get("max_depth", 0)),
+            max_array_length=int(config.get("max_array_length", 0)),
+            max_string_length=int(config.get("max_string_length", 0)),
+        )
+
+    # 以下表达式按剩余深度 depth 递归生成，变量名带上深度避免嵌套作用域中的混淆
+
+    def _cut(self) -> bool:
+        """深度用尽时是否把子文档替换为空文档（未限制深度时原样返回）"""
+        return bool(self.max_depth)
+
+    def _scalar_rules(self, value: str) -> List[Tuple[Any, Any, Any]]:
+        """字符串、二进制数据和嵌套数组的裁剪规则：(类型条件, 超限条件, 裁剪后的值)"""
+        rules = []
+        if self.max_string_length:
+            limit = self.max_string_length
+            rules.append((
+                {"$eq": [{"$type": value}, "string"]},
+                {"$gt": [{"$strLenCP": value}, limit]},
+                {"$substrCP": [value, 0, limit]}
+            ))
+            rules.append((
+                {"$eq": [{"$type": value}, "binData"]},
+                {"$gt": [{"$binarySize": value}, limit]},
+                {"$concat": ["<binData ", {"$toString": {"$binarySize": value}}, " bytes>"]}
+            ))
+        if self.max_array_length:
+            rules.append((
+                {"$isArray": value},
+                {"$gt": [{"$size": value}, self.max_array_length]},
+                {"$slice": [value, self.max_array_length]}
+            ))
+        return rules
+
+    def _trim_element(self, value: str, depth: int) -> Dict[str, Any]:
+        """裁剪单个值（不是外层数组本身）"""
+        if depth > 0:
+            field = f"$$f{depth}"
+            document = {"$arrayToObject": {"$map": {
+                "input": {"$objectToArray": value},
+                "as": f"f{depth}",
+                "in": {"k": f"{field}.k", "v": self._trim(f"{field}.v", depth - 1)}
+            }}}
+        else:
+            document = {"$literal": {}} if self._cut() else value
+        branches = [{"case": {"$eq": [{"$type": value}, "object"]}, "then": document}]
+        branches.extend(
+            {"case": case, "then": {"$cond": [exceeded, trimmed, value]}}
+            for case, exceeded, trimmed in self._scalar_rules(value)
+        )
+        return {"$switch": {"branches": branches, "default": value}}
+
+    def _trim(self, value: str, depth: int) -> Dict[str, Any]:
+        """裁剪一个字段值：数组先截断再逐个裁剪元素，其他值作为单个元素裁剪"""
+        bound = f"$$v{depth}"
+        elements = bound
+        if self.max_array_length:
+            elements = {"$slice": [bound, self.max_array_length]}
+        return {"$let": {
+            "vars": {f"v{depth}": value},
+            "in": {"$let": {
+                "vars": {f"items{depth}": {"$map": {
+                    "input": {"$cond": [{"$isArray": bound}, elements, [bound]]},
+                    "as": f"e{depth}",
+                    "in": self._trim_element(f"$$e{depth}", depth)
+                }}},
+                "in": {"$cond": [
+                    {"$isArray": bound},
+                    f"$$items{depth}",
+                    {"$arrayElemAt": [f"$$items{depth}", 0]}
+                ]}
+            }}
+        }}
+
+    def _mark_element(self, value: str, path: str, depth: int) -> Dict[str, Any]:
+        """单个值中被裁剪的字段路径"""
+        if depth > 0:
+            document = {"$reduce": {
+                "input": {"$objectToArray": value},
+                "initialValue": [],
+                "in": {"$setUnion": [
+                    "$$value",
+                    self._marks("$$this.v", {"$concat": [path, ".", "$$this.k"]}, depth - 1)
+                ]}
+            }}
+        elif self._cut():
+            document = {"$cond": [{"$eq": [value, {"$literal": {}}]}, [], [path]]}
+        else:
+            document = []
+        branches = [{"case": {"$eq": [{"$type": value}, "object"]}, "then": document}]
+        branches.extend(
+            {"case": case, "then": {"$cond": [exceeded, [path], []]}}
+            for case, exceeded, _ in self._scalar_rules(value)
+        )
+        return {"$switch": {"branches": branches, "default": []}}
+
+    def _marks(self, value: Any, path: Any, depth: int) -> Dict[str, Any]:
+        """一个字段值中被裁剪的字段路径，数组元素与数组共用路径"""
+        bound = f"$$m{depth}"
+        bound_path = f"$$p{depth}"
+        truncated: Any = []
+        elements: Any = bound
+        if self.max_array_length:
+            truncated = {"$cond": [
+                {"$and": [
+                    {"$isArray": bound},
+                    {"$gt": [{"$size": {"$cond": [{"$isArray": bound}, bound, []]}},
+                             self.max_array_length]}
+                ]},
+                [bound_path],
+                []
+            ]}
+            elements = {"$slice": [bound, self.max_array_length]}
+        return {"$let": {
+            "vars": {f"m{depth}": value, f"p{depth}": path},
+            "in": {"$setUnion": [
+                truncated,
+                {"$reduce": {
+                    "input": {"$map": {
+                        "input": {"$cond": [{"$isArray": bound}, elements, [bound]]},
+                        "as": f"x{depth}",
+                        "in": self._mark_element(f"$$x{depth}", bound_path, depth)
+                    }},
+                    "initialValue": [],
+                    "in": {"$setUnion": ["$$value", "$$this"]}
+                }}
+            ]}
+        }}
+
+    def _build_stage(self) -> Dict[str, Any]:
+        """生成裁剪阶段，输出 {doc: 裁剪后的文档, trimmed: 被裁剪的字段路径}"""
+        depth = (self.max_depth or _MAX_EXPRESSION_DEPTH) - 1
+        return {"$replaceWith": {
+            "doc": {"$arrayToObject": {"$map": {
+                "input": {"$objectToArray": "$$ROOT"},
+                "as": "root",
+                "in": {"k": "$$root.k", "v": {"$cond": [
+                    {"$eq": ["$$root.k", "_id"]},
+                    "$$root.v",
+                    self._trim("$$root.v", depth)
+                ]}}
+            }}},
+            "trimmed": {"$reduce": {
+                "input": {"$objectToArray": "$$ROOT"},
+                "initialValue": [],
+                "in": {"$setUnion": ["$$value", {"$cond": [
+                    {"$eq": ["$$this.k", "_id"]},
+                    [],
+                    self._marks("$$this.v", "$$this.k", depth)
+                ]}]}
+            }}
+        }}
+
+    def build_pipeline(self, filter_dict: Dict[str, Any], sort: List[Any] = None,
+                       skip: int = 0, limit: int = None) -> List[Dict[str, Any]]:
+        """
+        生成与find等价、并在末尾裁剪结果的聚合管道
+
+        Args:
+            filter_dict: 查询过滤器
+            sort: 排序规则
+            skip: 跳过文档数量
+            limit: 限制返回数量
+
+        Returns:
+            聚合管道
+        """
+        pipeline: List[Dict[str, Any]] = [{"$match": filter_dict or {}}]
+        if sort:
+            pipeline.append({"$sort": {field: direction for field, direction in sort}})
+        if skip:
+            pipeline.append({"$skip": skip})
+        if limit:
+            pipeline.append({"$limit": limit})
+        if self.projection:
+            pipeline.append({"$project": self.projection})
+        pipeline.append(self._stage)
+        return pipeline
+
+    @staticmethod
+    def unwrap(results: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """逐个取出裁剪后的文档，有字段被裁剪时在文档中记录其路径"""
+        for result in results:
+            document = result["doc"]
+            if result["trimmed"]:
+                document[TRIMMED_KEY] = sorted(result["trimmed"])
+            yield document
+
+    def describe(self) -> Dict[str, Any]:
+        """生成可直接序列化的策略描述"""
+        return {
+            "projection": self.projection,
+            "max_depth": self.max_depth,
+            "max_array_length": self.max_array_length,
+            "max_string_length": self.max_string_length,
+        }
+
+
+class ReadPolicies:
+    """
+    按命名空间查找读取策略
+
+    配置的键可以是 "数据库.集合"、"数据库.*" 或 "*"，按此顺序匹配
+    """
+
+    def __init__(self, config: Dict[str, Dict[str, Any]] = None):
+        """
+        初始化读取策略表
+
+        Args:
+            config: 命名空间到策略配置的映射
+        """
+        self._policies = {
+            namespace: ReadPolicy.from_config(policy)
+            for namespace, policy in (config or {}).items()
+        }
+
+    def get(self, database_name: str, collection_name: str) -> Optional[ReadPolicy]:
+        """获取命名空间适用的策略，没有时返回None"""
+        for key in (f"{database_name}.{collection_name}", f"{database_name}.*", "*"):
+            policy = self._policies.get(key)
+            if policy is not None:
+                return policy
+        return None
@@ -0,0 +1,238 @@
+"""
+MongoDB Atlas 容错层
+
+为MongoAtlasManager的操作提供带抖动的指数退避重试，以及按集群的熔断器。
+熔断器打开期间调用立即失败，避免在服务器选择超时上堆积请求
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, TypeVar
+
+from pymongo.errors import (
+    ConnectionFailure, NotPrimaryError, PyMongoError, ServerSelectionTimeoutError
+)
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 操作类型：幂等读取、单文档写入（可重试写）、多文档写入（不重试）
+READ = "read"
+WRITE = "write"
+MULTI_WRITE = "multi_write"
+
+
+class CircuitOpenError(PyMongoError):
+    """熔断器处于打开状态，调用被直接拒绝"""
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    在window秒内出现failure_threshold次连接类错误后打开，
+    reset_timeout秒后进入半开状态，放行一个探测请求，成功则关闭，失败则重新打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5,
+                 window: float = 10.0, reset_timeout: float = 30.0):
+        """
+        初始化熔断器
+
+        Args:
+            name: 集群名称，用于日志和指标
+            failure_threshold: 打开熔断器所需的失败次数
+            window: 统计失败次数的时间窗口（秒）
+            reset_timeout: 打开后多久允许探测请求（秒）
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures: Deque[float] = deque()
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """
+        调用前检查熔断器状态
+
+        Raises:
+            CircuitOpenError: 熔断器打开，或半开状态下已有探测请求在执行
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            retry_in = max(0.0, self.reset_timeout - (now - self._opened_at))
+        metrics.incr("circuit_rejections", cluster=self.name)
+        raise CircuitOpenError(f"集群 {self.name} 熔断中，约 {retry_in:.1f} 秒后重试")
+
+    def record_success(self) -> None:
+        """记录一次成功调用"""
+        with self._lock:
+            self._probing = False
+            if self.state != self.CLOSED:
+                self._failures.clear()
+                self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        """记录一次连接类失败"""
+        with self._lock:
+            now = time.monotonic()
+            self._probing = False
+            if self.state == self.HALF_OPEN:
+                self._open(now)
+                return
+            self._failures.append(now)
+            while self._failures and now - self._failures[0] > self.window:
+                self._failures.popleft()
+            if self.state == self.CLOSED and len(self._failures) >= self.failure_threshold:
+                self._open(now)
+
+    def release_probe(self) -> None:
+        """探测请求因非数据库错误结束时释放探测名额"""
+        with self._lock:
+            self._probing = False
+
+    def _open(self, now: float) -> None:
+        """打开熔断器（调用方需持有锁）"""
+        self._opened_at = now
+        self._failures.clear()
+        self._set_state(self.OPEN)
+
+    def _set_state(self, state: str) -> None:
+        """切换状态并更新指标（调用方需持有锁）"""
+        if state != self.state:
+            logger.warning(f"集群 {self.name} 熔断器状态: {self.state} -> {state}")
+        self.state = state
+        metrics.set_gauge("circuit_open", 0 if state == self.CLOSED else 1, cluster=self.name)
+
+
+class RetryPolicy:
+    """
+    重试策略
+
+    使用全抖动的指数退避：第n次重试前等待 [0, min(max_delay, base_delay * 2^n)] 内的随机时间
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.1,
+                 max_delay: float = 2.0):
+        """
+        初始化重试策略
+
+        Args:
+            max_attempts: 最多尝试次数（包含第一次）
+            base_delay: 退避基数（秒）
+            max_delay: 单次等待上限（秒）
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """计算第attempt次重试前的等待时间"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    @staticmethod
+    def is_retryable(error: PyMongoError, kind: str) -> bool:
+        """
+        判断错误是否可以重试
+
+        读取在任何瞬时连接错误后都可重试；单文档写入只在能确认未被执行的错误
+        （服务器选择失败、节点非主节点）或带RetryableWriteError标签的错误后重试；
+        多文档写入不重试
+        """
+        if isinstance(error, CircuitOpenError):
+            return False
+        # maxTimeMS/timeoutMS超时不是瞬时错误，服务器选择超时除外
+        if error.timeout and not isinstance(error, ServerSelectionTimeoutError):
+            return False
+        if kind == READ:
+            return isinstance(error, ConnectionFailure) or error.has_error_label(
+                "RetryableReadError"
+            )
+        if kind == WRITE:
+            return isinstance(error, (ServerSelectionTimeoutError, NotPrimaryError)) or \
+                error.has_error_label("RetryableWriteError")
+        return False
+
+
+class ResilientExecutor:
+    """
+    容错执行器
+
+    组合熔断器和重试策略执行数据库操作
+    """
+
+    def __init__(self, breaker: CircuitBreaker, policy: RetryPolicy):
+        """
+        初始化容错执行器
+
+        Args:
+            breaker: 集群熔断器
+            policy: 重试策略
+        """
+        self.breaker = breaker
+        self.policy = policy
+
+    def execute(self, operation: str, fn: Callable[[], T], kind: str = READ) -> T:
+        """
+        执行数据库操作
+
+        Args:
+            operation: 操作名称，用于日志和指标
+            fn: 无参数的操作函数，每次重试都会重新调用
+            kind: 操作类型，READ、WRITE 或 MULTI_WRITE
+
+        Returns:
+            操作函数的返回值
+
+        Raises:
+            PyMongoError: 重试耗尽或错误不可重试
+        """
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                result = fn()
+            except ConnectionFailure as e:
+                self.breaker.record_failure()
+                error = e
+            except PyMongoError as e:
+                # 服务器正常响应的错误（如查询错误）不计入熔断
+                self.breaker.record_success()
+                error = e
+            except BaseException:
+                self.breaker.release_probe()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+            attempt += 1
+            if attempt >= self.policy.max_attempts or not self.policy.is_retryable(error, kind):
+                raise error
+            delay = self.policy.delay(attempt)
+            metrics.incr("retries", operation=operation)
+            logger.warning(
+                f"{operation} 第 {attempt} 次失败，{delay:.2f} 秒后重试: {str(error)}"
+            )
+            time.sleep(delay)
@@ -0,0 +1,238 @@
+"""
+MongoDB 集合结构推断
+
+以流式方式合并样本文档的类型树，统计字段路径、类型分布、空值比例、数组长度和示例值。
+累加器可以持续合并新的样本或变更流中的新文档，从而增量细化已缓存的结构；
+按 _id 去重，同一文档不会被重复计入
+"""
+
+import datetime
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import Binary, Decimal128, Int64, ObjectId, json_util
+
+# 每个字段保留的示例值数量和示例字符串最大长度
+_MAX_EXAMPLES = 3
+_MAX_EXAMPLE_LENGTH = 80
+
+
+def bson_type_name(value: Any) -> str:
+    """
+    获取值对应的BSON类型名称
+
+    Args:
+        value: 文档中的值
+
+    Returns:
+        类型名称，例如 string、int、objectId
+    """
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, Int64):
+        return "long"
+    if isinstance(value, int):
+        return "int" if -2 ** 31 <= value < 2 ** 31 else "long"
+    if isinstance(value, float):
+        return "double"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, dict):
+        return "object"
+    if isinstance(value, list):
+        return "array"
+    if isinstance(value, ObjectId):
+        return "objectId"
+    if isinstance(value, datetime.datetime):
+        return "date"
+    if isinstance(value, Decimal128):
+        return "decimal"
+    if isinstance(value, (Binary, bytes)):
+        return "binData"
+    return type(value).__name__
+
+
+def example_value(value: Any) -> Any:
+    """将示例值转换为可直接序列化的简短形式"""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = str(value)
+    if len(text) > _MAX_EXAMPLE_LENGTH:
+        text = text[:_MAX_EXAMPLE_LENGTH] + "..."
+    return text
+
+
+class FieldStats:
+    """单个字段路径的统计信息"""
+
+    __slots__ = ("count", "documents", "null_documents", "last_document", "last_null_document",
+                 "types", "nulls", "item_types",
+                 "array_count", "array_min", "array_max", "array_total", "examples")
+
+    def __init__(self):
+        # count按取值计数（数组中子文档的字段每个元素计一次），documents按文档计数
+        self.count = 0
+        self.documents = 0
+        self.null_documents = 0
+        self.last_document = -1
+        self.last_null_document = -1
+        self.types: Counter = Counter()
+        self.nulls = 0
+        self.item_types: Counter = Counter()
+        self.array_count = 0
+        self.array_min: Optional[int] = None
+        self.array_max: Optional[int] = None
+        self.array_total = 0
+        self.examples: List[Any] = []
+
+    def observe(self, value: Any, document: int) -> None:
+        """
+        记录一次取值
+
+        Args:
+            value: 字段的值
+            document: 所在文档的序号，同一文档中的多次取值只计一次出现
+        """
+        type_name = bson_type_name(value)
+        self.count += 1
+        if document != self.last_document:
+            self.last_document = document
+            self.documents += 1
+        self.types[type_name] += 1
+        if value is None:
+            self.nulls += 1
+            if document != self.last_null_document:
+                self.last_null_document = document
+                self.null_documents += 1
+        elif isinstance(value, list):
+            length = len(value)
+            self.array_count += 1
+            self.array_total += length
+            self.array_min = length if self.array_min is None else min(self.array_min, length)
+            self.array_max = length if self.array_max is None else max(self.array_max, length)
+            self.item_types.update(bson_type_name(item) for item in value)
+        elif not isinstance(value, dict) and len(self.examples) < _MAX_EXAMPLES:
+            example = example_value(value)
+            if example not in self.examples:
+                self.examples.append(example)
+
+    def report(self, path: str, total: int) -> Dict[str, Any]:
+        """生成该字段的统计报告"""
+        result: Dict[str, Any] = {
+            "path": path,
+            "count": self.count,
+            "presence": round(self.documents / total, 4) if total else 0.0,
+            "null_rate": round(self.null_documents / total, 4) if total else 0.0,
+            "types": dict(self.types.most_common()),
+        }
+        if self.array_count:
+            result["array"] = {
+                "min_length": self.array_min,
+                "max_length": self.array_max,
+                "avg_length": round(self.array_total / self.array_count, 2),
+                "item_types": dict(self.item_types.most_common()),
+            }
+        if self.examples:
+            result["examples"] = list(self.examples)
+        return result
+
+
+class SchemaAccumulator:
+    """
+    集合结构累加器
+
+    字段路径使用点号表示法，数组中子文档的字段与查询时的写法一致，例如 items.sku。
+    presence和null_rate按文档计算：包含该路径（或该路径为null）的文档数 / 文档总数
+    """
+
+    def __init__(self, max_fields: int = 1000, max_tracked_ids: int = 100000):
+        """
+        初始化累加器
+
+        Args:
+            max_fields: 最多跟踪的字段路径数量，超出后忽略新字段
+            max_tracked_ids: 用于去重的 _id 数量上限，超出后新文档不再去重
+        """
+        self.max_fields = max_fields
+        self.max_tracked_ids = max_tracked_ids
+        self.documents = 0
+        self.duplicates = 0
+        self.fields: Dict[str, FieldStats] = {}
+        self.truncated = False
+        self._seen_ids = set()
+        self._lock = threading.Lock()
+
+    def add(self, documents: Iterable[Dict[str, Any]]) -> int:
+        """
+        合并一批文档，已经合并过的 _id 会被跳过
+
+        Args:
+            documents: 文档迭代器，逐个读取，不会整体放入内存
+
+        Returns:
+            本次合并的文档数量
+        """
+        added = 0
+        for document in documents:
+            with self._lock:
+                if not self._first_time(document):
+                    self.duplicates += 1
+                    continue
+                self._walk(document, "", self.documents)
+                self.documents += 1
+            added += 1
+        return added
+
+    def _first_time(self, document: Dict[str, Any]) -> bool:
+        """记录文档的 _id，已经见过时返回False（调用方需持有锁）"""
+        if "_id" not in document:
+            return True
+        document_id = document["_id"]
+        try:
+            hash(document_id)
+        except TypeError:
+            document_id = json_util.dumps(document_id)
+        if document_id in self._seen_ids:
+            return False
+        if len(self._seen_ids) < self.max_tracked_ids:
+            self._seen_ids.add(document_id)
+        return True
+
+    def _walk(self, document: Dict[str, Any], prefix: str, number: int) -> None:
+        """递归记录文档中的字段（调用方需持有锁）"""
+        for key, value in document.items():
+            path = f"{prefix}{key}"
+            stats = self.fields.get(path)
+            if stats is None:
+                if len(self.fields) >= self.max_fields:
+                    self.truncated = True
+                    continue
+                stats = self.fields[path] = FieldStats()
+            stats.observe(value, number)
+            if isinstance(value, dict):
+                self._walk(value, f"{path}.", number)
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, dict):
+                        self._walk(item, f"{path}.", number)
+
+    def report(self) -> Dict[str, Any]:
+        """
+        生成结构报告
+
+        Returns:
+            包含样本文档数量和按路径排序的字段统计
+        """
+        with self._lock:
+            return {
+                "sampled_documents": self.documents,
+                "duplicates_skipped": self.duplicates,
+                "fields": [
+                    self.fields[path].report(path, self.documents)
+                    for path in sorted(self.fields)
+                ],
+                "truncated": self.truncated,
+            }
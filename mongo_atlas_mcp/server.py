@@ -6,19 +6,74 @@ MongoDB Atlas MCP Server
 """
 
 import asyncio
+import functools
+import json
 import logging
-from typing import Dict, Any, List
+import os
+import uuid
+from typing import Dict, Any, List, Callable
+import orjson
+from bson.errors import InvalidId
 from fastmcp import FastMCP
+from fastmcp.server.dependencies import get_context
+from fastmcp.tools.base import ToolResult
+from mcp.types import TextContent
+from mcp_types.version import MODERN_PROTOCOL_VERSIONS
 
 try:
     from .database import MongoAtlasManager
+    from .admission import AdmissionController, Overloaded, is_expensive, namespace_of
+    from .context import current_operation_id, current_session_id
+    from .ejson import ExtendedJsonDecoder
+    from .metrics import metrics
+    from .ratelimit import RateLimiter
+    from .sessions import SessionBusy, SessionRegistry
 except ImportError:
     from database import MongoAtlasManager
+    from admission import AdmissionController, Overloaded, is_expensive, namespace_of
+    from context import current_operation_id, current_session_id
+    from ejson import ExtendedJsonDecoder
+    from metrics import metrics
+    from ratelimit import RateLimiter
+    from sessions import SessionBusy, SessionRegistry
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# HTTP客户端用来标识会话的请求头
+SESSION_HEADER = "x-mcp-session-id"
+
+# 多进程模式下主进程转发请求时写入客户端地址的请求头
+FORWARDED_HEADER = "x-forwarded-for"
+
+# 主进程连接工作进程时使用的地址
+_LOOPBACK_HOSTS = ("127.0.0.1", "::1")
+
+# 工具结果的JSON编码选项，ObjectId、Decimal128等无法直接编码的值转换为字符串
+_JSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _tool_result(result: Any) -> Any:
+    """
+    把工具返回的字典编码为MCP工具结果
+    
+    用orjson一次生成文本内容，结构化内容从同一份JSON解析得到，
+    不再经过FastMCP对返回值的逐项转换和重复序列化。无法编码时原样返回，交给FastMCP处理
+    """
+    if not isinstance(result, dict):
+        return result
+    try:
+        payload = orjson.dumps(result, default=str, option=_JSON_OPTIONS)
+    except orjson.JSONEncodeError:
+        return result
+    return ToolResult.model_construct(
+        content=[TextContent(type="text", text=payload.decode())],
+        structured_content=orjson.loads(payload),
+        meta=None,
+        is_error=False
+    )
+
 
 class MongoAtlasMCPServer:
     """
@@ -31,13 +86,259 @@ class MongoAtlasMCPServer:
         """初始化MCP服务器"""
         self.mongo_manager = MongoAtlasManager()
         self.mcp = FastMCP()
+        # 工具名称到处理函数的映射，供batch工具调度
+        self._tools: Dict[str, Callable[..., Any]] = {}
+        self.batch_concurrency = int(os.getenv('MCP_BATCH_CONCURRENCY', '8'))
+        self.batch_max_operations = int(os.getenv('MCP_BATCH_MAX_OPERATIONS', '50'))
+        self.fast_responses = os.getenv('MCP_FAST_RESPONSES', 'true').lower() == 'true'
+        self.view_scheduler_interval = float(os.getenv('MCP_VIEW_SCHEDULER_INTERVAL', '5'))
+        self.admission = AdmissionController(
+            max_concurrent=int(os.getenv('MCP_MAX_CONCURRENT', '32')),
+            max_per_namespace=int(os.getenv('MCP_MAX_CONCURRENT_PER_NAMESPACE', '8')),
+            max_cheap=int(os.getenv('MCP_MAX_CHEAP_CONCURRENT', '32')),
+            max_expensive=int(os.getenv('MCP_MAX_EXPENSIVE_CONCURRENT', '4')),
+            max_queue=int(os.getenv('MCP_ADMISSION_QUEUE_SIZE', '64')),
+            queue_timeout=float(os.getenv('MCP_ADMISSION_QUEUE_TIMEOUT_MS', '5000')) / 1000
+        )
+        self.ejson = ExtendedJsonDecoder(
+            coerce_ids=os.getenv('MCP_COERCE_OBJECT_IDS', 'false').lower() == 'true',
+            cache_size=int(os.getenv('MCP_EJSON_CACHE_SIZE', '1024'))
+        )
+        self.rate_limiter = RateLimiter(
+            rate=float(os.getenv('MCP_RATE_LIMIT_PER_SECOND', '50')),
+            burst=float(os.getenv('MCP_RATE_LIMIT_BURST', '100')),
+            tool_limits=json.loads(os.getenv('MCP_RATE_LIMITS', '{}'))
+        )
+        self.transport = os.getenv('MCP_TRANSPORT', 'stdio')
+        self.stateless_http = os.getenv('MCP_STATELESS_HTTP', 'false').lower() == 'true'
+        # 多进程模式的工作进程只接受主进程转发的请求
+        self.behind_proxy = os.getenv('MCP_WORKER_INDEX') is not None
+        self.sessions = SessionRegistry(
+            max_concurrent_per_session=int(os.getenv('MCP_MAX_CONCURRENT_PER_SESSION', '8')),
+            idle_ttl=float(os.getenv('MCP_SESSION_IDLE_TTL', '1800'))
+        )
         self._register_tools()
+        self._register_resources()
+    
+    def _tool(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        """
+        注册工具
+        
+        将同步工具函数包装为可取消的异步调用后在FastMCP中注册，
+        同时记录到内部工具表，使batch工具可以按名称调用。
+        开启MCP_FAST_RESPONSES时，注册到FastMCP的函数直接返回编码好的工具结果
+        """
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await self._call_tool(fn, args, kwargs)
+        
+        self._tools[fn.__name__] = wrapper
+        if not self.fast_responses:
+            return self.mcp.tool(wrapper)
+        
+        @functools.wraps(fn)
+        async def respond(*args, **kwargs):
+            return _tool_result(await wrapper(*args, **kwargs))
+        
+        return self.mcp.tool(respond)
+    
+    def _session_id(self) -> str:
+        """
+        获取当前MCP会话ID，不在会话中时沿用上下文中的值
+        
+        有传输层会话时总是使用它：有状态streamable HTTP的 Mcp-Session-Id（只有建立会话的协议版本
+        由传输层校验）、SSE和stdio连接的会话ID。无会话的请求（MCP_STATELESS_HTTP，或不建立会话的
+        协议版本）每次都是新连接，这时才使用客户端自报的 X-MCP-Session-Id 请求头（加前缀，
+        不会与真实会话重名），没有时按客户端地址归并。多进程模式下请求来自本机的主进程，
+        客户端地址取主进程写入的 X-Forwarded-For
+        """
+        try:
+            context = get_context()
+        except RuntimeError:
+            return current_session_id.get()
+        request_context = context.request_context
+        request = getattr(request_context, "request", None) if request_context else None
+        headers = getattr(request, "headers", None)
+        if headers is None or self.transport == "sse":
+            # stdio连接和SSE连接在整个会话期间保持不变
+            return context.session_id
+        protocol_version = getattr(request_context, "protocol_version", None)
+        if not self.stateless_http and protocol_version not in MODERN_PROTOCOL_VERSIONS:
+            session_id = headers.get("mcp-session-id")
+            if session_id:
+                return session_id
+        claimed = headers.get(SESSION_HEADER)
+        if claimed:
+            return f"header:{claimed}"
+        if request.client is not None:
+            host = request.client.host
+            forwarded = headers.get(FORWARDED_HEADER)
+            if forwarded and self.behind_proxy and host in _LOOPBACK_HOSTS:
+                host = forwarded
+            return f"client:{host}"
+        return context.session_id
+    
+    async def _call_tool(self, fn: Callable[..., Any], args: tuple,
+                         kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        在线程池中执行工具函数
+        
+        调用先按 (工具, 命名空间, 会话) 限流，再经过会话并发上限和准入控制，
+        超出速率时返回throttled和建议的重试时间，过载时返回overloaded错误。
+        每次调用分配一个操作ID，数据库层将其作为comment附加到命令上。
+        当MCP请求被取消或客户端断开时，按操作ID终止服务器上仍在执行的命令。
+        过滤器、更新、管道和文档参数中的Extended JSON在这里统一转换为BSON类型
+        """
+        namespace = namespace_of(kwargs)
+        session_id = self._session_id()
+        retry_after = self.rate_limiter.check(fn.__name__, namespace, session_id)
+        if retry_after:
+            metrics.incr("throttled", tool=fn.__name__)
+            return {
+                "success": False,
+                "error": f"调用过于频繁，请在 {retry_after:.2f} 秒后重试",
+                "throttled": True,
+                "retry_after": round(retry_after, 3)
+            }
+        
+        try:
+            kwargs = self.ejson.decode_arguments(kwargs)
+        except (ValueError, TypeError, InvalidId) as e:
+            return {
+                "success": False,
+                "error": f"Extended JSON参数解析失败: {str(e)}"
+            }
+        
+        operation_id = uuid.uuid4().hex
+        token = current_operation_id.set(operation_id)
+        session_token = current_session_id.set(session_id)
+        try:
+            with self.sessions.track(session_id, fn.__name__) as session:
+                async with self.admission.admit(
+                    namespace, is_expensive(fn.__name__, kwargs)
+                ):
+                    result = await asyncio.to_thread(fn, *args, **kwargs)
+                if not result.get("success", True):
+                    self.sessions.record_error(session)
+                return result
+        except SessionBusy as e:
+            logger.warning(f"工具 {fn.__name__} 调用被拒绝: {str(e)}")
+            return {
+                "success": False,
+                "error": f"会话繁忙: {str(e)}",
+                "overloaded": True
+            }
+        except Overloaded as e:
+            logger.warning(f"工具 {fn.__name__} 调用被拒绝: {str(e)}")
+            return {
+                "success": False,
+                "error": f"服务器过载: {str(e)}",
+                "overloaded": True
+            }
+        except asyncio.CancelledError:
+            metrics.incr("cancellations", tool=fn.__name__)
+            logger.info(f"工具 {fn.__name__} 调用已取消，正在终止操作 {operation_id}")
+            # 当前任务已被取消，不能再等待，交给线程池在后台执行
+            asyncio.get_running_loop().run_in_executor(
+                None, self.mongo_manager.cancel_operation, operation_id
+            )
+            raise
+        finally:
+            current_operation_id.reset(token)
+            current_session_id.reset(session_token)
+    
+    async def _run_batch(self, operations: List[Dict[str, Any]],
+                         concurrency: int = None) -> Dict[str, Any]:
+        """
+        并发执行多个工具操作
+        
+        Args:
+            operations: 操作列表，每项形如 {"tool": 工具名称, "args": 参数字典}
+            concurrency: 并发上限，不超过服务器配置的MCP_BATCH_CONCURRENCY
+            
+        Returns:
+            按输入顺序排列的结果，单个操作失败不影响其他操作
+        """
+        if len(operations) > self.batch_max_operations:
+            return {
+                "success": False,
+                "error": f"批量操作数量 {len(operations)} 超过上限 {self.batch_max_operations}"
+            }
+        
+        limit = max(1, min(concurrency or self.batch_concurrency, self.batch_concurrency))
+        semaphore = asyncio.Semaphore(limit)
+        
+        async def run_one(operation: Dict[str, Any]) -> Dict[str, Any]:
+            tool_name = operation.get("tool") if isinstance(operation, dict) else None
+            handler = self._tools.get(tool_name)
+            if handler is None:
+                return {"tool": tool_name, "success": False, "error": f"未知工具: {tool_name}"}
+            args = operation.get("args") or {}
+            async with semaphore:
+                try:
+                    result = await handler(**args)
+                except Exception as e:
+                    logger.error(f"批量操作 {tool_name} 失败: {str(e)}")
+                    result = {"success": False, "error": f"{tool_name} 执行失败: {str(e)}"}
+            return {"tool": tool_name, **result}
+        
+        results = await asyncio.gather(*(run_one(op) for op in operations))
+        return {
+            "success": True,
+            "data": list(results),
+            "count": len(results),
+            "failed": sum(1 for r in results if not r.get("success"))
+        }
+    
+    def _register_resources(self) -> None:
+        """注册资源"""
+        
+        @self.mcp.resource("mongodb://catalog", name="catalog", mime_type="application/json")
+        async def catalog() -> str:
+            """数据库和集合目录，每个集合带有浏览资源和元数据资源的URI"""
+            return await asyncio.to_thread(self.mongo_manager.read_catalog)
+        
+        @self.mcp.resource(
+            "mongodb://{database}/{collection}{?page,page_size}",
+            name="collection",
+            mime_type="application/json"
+        )
+        async def collection_page(database: str, collection: str, page: str = None,
+                                  page_size: int = None) -> str:
+            """按 _id 升序分页浏览集合文档，next_page为下一页的资源URI"""
+            return await asyncio.to_thread(
+                self.mongo_manager.read_collection_page, database, collection, page, page_size
+            )
+        
+        @self.mcp.resource(
+            "mongodb://{database}/{collection}/metadata",
+            name="collection_metadata",
+            mime_type="application/json"
+        )
+        async def collection_metadata(database: str, collection: str) -> str:
+            """集合元数据：估算文档数量、索引、集合选项和读取策略"""
+            return await asyncio.to_thread(
+                self.mongo_manager.read_collection_metadata, database, collection
+            )
+        
+        @self.mcp.resource(
+            "mongodb-spill://{spill_id}{?start,count,offset,length}",
+            name="spill",
+            mime_type="application/x-ndjson"
+        )
+        async def read_spill(spill_id: str, start: int = 0, count: int = None,
+                             offset: int = None, length: int = None) -> str:
+            """读取溢出文件：按行（start、count）或按字节范围（offset、length），每行一个Extended JSON文档"""
+            data = await asyncio.to_thread(
+                self.mongo_manager.read_spill, spill_id, start, count, offset, length
+            )
+            return data.decode("utf-8", errors="replace")
     
     def _register_tools(self) -> None:
         """注册所有可用的工具"""
         
         # 使用装饰器注册工具
-        @self.mcp.tool
+        @self._tool
         def list_databases() -> Dict[str, Any]:
             """列出MongoDB Atlas中的所有数据库"""
             try:
@@ -50,7 +351,7 @@ class MongoAtlasMCPServer:
                     "error": f"列出数据库失败: {str(e)}"
                 }
         
-        @self.mcp.tool
+        @self._tool
         def list_collections(database: str) -> Dict[str, Any]:
             """列出指定数据库中的所有集合"""
             try:
@@ -63,7 +364,7 @@ class MongoAtlasMCPServer:
                     "error": f"列出集合失败: {str(e)}"
                 }
         
-        @self.mcp.tool
+        @self._tool
         def find_documents(
             database: str, 
             collection: str, 
@@ -71,12 +372,14 @@ class MongoAtlasMCPServer:
             projection: Dict[str, Any] = None,
             sort: List = None,
             limit: int = None,
-            skip: int = 0
+            skip: int = 0,
+            max_time_ms: int = None
         ) -> Dict[str, Any]:
             """查询文档"""
             try:
                 result = self.mongo_manager.find_documents(
-                    database, collection, filter, projection, sort, limit, skip
+                    database, collection, filter, projection, sort, limit, skip,
+                    max_time_ms
                 )
                 return result.model_dump()
             except Exception as e:
@@ -86,15 +389,142 @@ class MongoAtlasMCPServer:
                     "error": f"查询文档失败: {str(e)}"
                 }
         
-        @self.mcp.tool
+        @self._tool
+        def count_documents(
+            database: str,
+            collection: str,
+            filter: Dict[str, Any] = None,
+            exact: bool = False,
+            use_cache: bool = False,
+            max_time_ms: int = None
+        ) -> Dict[str, Any]:
+            """统计文档数量，空过滤器时使用元数据估算，结果标明exact、estimated或cached"""
+            try:
+                result = self.mongo_manager.count_documents(
+                    database, collection, filter, exact, use_cache, max_time_ms
+                )
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"统计文档数量失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"统计文档数量失败: {str(e)}"
+                }
+        
+        @self._tool
+        def distinct(
+            database: str,
+            collection: str,
+            field: str,
+            filter: Dict[str, Any] = None,
+            max_values: int = None,
+            use_cache: bool = True,
+            max_time_ms: int = None
+        ) -> Dict[str, Any]:
+            """获取字段的不同取值，标明是否使用了DISTINCT_SCAN索引扫描"""
+            try:
+                result = self.mongo_manager.distinct(
+                    database, collection, field, filter, max_values, use_cache, max_time_ms
+                )
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"获取不同取值失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"获取不同取值失败: {str(e)}"
+                }
+        
+        @self._tool
+        def infer_schema(
+            database: str,
+            collection: str,
+            sample_size: int = None,
+            refine: bool = False,
+            refresh: bool = False,
+            max_time_ms: int = None
+        ) -> Dict[str, Any]:
+            """抽样推断集合结构：字段路径、类型分布、空值比例、数组长度和示例值"""
+            try:
+                result = self.mongo_manager.infer_schema(
+                    database, collection, sample_size, refine, refresh, max_time_ms
+                )
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"推断集合结构失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"推断集合结构失败: {str(e)}"
+                }
+        
+        @self._tool
+        def approximate_stats(
+            database: str,
+            collection: str,
+            field: str,
+            filter: Dict[str, Any] = None,
+            method: str = "sample",
+            sample_size: int = None,
+            max_documents: int = None,
+            quantiles: List[float] = None,
+            max_time_ms: int = None
+        ) -> Dict[str, Any]:
+            """计算字段的近似统计：HyperLogLog不同值数量、t-digest分位数、均值置信区间和抽样值"""
+            try:
+                result = self.mongo_manager.approximate_stats(
+                    database, collection, field, filter, method,
+                    sample_size, max_documents, quantiles, max_time_ms
+                )
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"计算近似统计失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"计算近似统计失败: {str(e)}"
+                }
+        
+        @self._tool
+        def vector_search(
+            database: str,
+            collection: str,
+            field: str,
+            query_vector: List[float],
+            k: int = 10,
+            metric: str = "cosine",
+            filter: Dict[str, Any] = None,
+            index: str = None,
+            engine: str = "auto",
+            num_candidates: int = None,
+            projection: Dict[str, Any] = None,
+            refresh: bool = False,
+            rebuild: bool = False,
+            max_time_ms: int = None
+        ) -> Dict[str, Any]:
+            """向量相似度检索：指定Atlas向量索引时使用$vectorSearch，否则使用本地NumPy引擎"""
+            try:
+                result = self.mongo_manager.vector_search(
+                    database, collection, field, query_vector, k, metric, filter,
+                    index, engine, num_candidates, projection, refresh, rebuild, max_time_ms
+                )
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"向量检索失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"向量检索失败: {str(e)}"
+                }
+        
+        @self._tool
         def insert_document(
             database: str, 
             collection: str,
-            document: Dict[str, Any]
+            document: Dict[str, Any],
+            max_time_ms: int = None
         ) -> Dict[str, Any]:
             """插入文档"""
             try:
-                result = self.mongo_manager.insert_document(database, collection, document)
+                result = self.mongo_manager.insert_document(
+                    database, collection, document, max_time_ms
+                )
                 return result.model_dump()
             except Exception as e:
                 logger.error(f"插入文档失败: {str(e)}")
@@ -103,19 +533,23 @@ class MongoAtlasMCPServer:
                     "error": f"插入文档失败: {str(e)}"
                 }
         
-        @self.mcp.tool
+        @self._tool
         def update_document(
             database: str, 
             collection: str,
             filter: Dict[str, Any], 
             update: Dict[str, Any],
             upsert: bool = False, 
-            multi: bool = False
+            multi: bool = False,
+            max_time_ms: int = None,
+            chunked: bool = False,
+            batch_size: int = None
         ) -> Dict[str, Any]:
-            """更新文档"""
+            """更新文档；multi和chunked同时为true时按_id分批在后台更新，返回任务ID"""
             try:
                 result = self.mongo_manager.update_document(
-                    database, collection, filter, update, upsert, multi
+                    database, collection, filter, update, upsert, multi, max_time_ms,
+                    chunked, batch_size
                 )
                 return result.model_dump()
             except Exception as e:
@@ -125,16 +559,21 @@ class MongoAtlasMCPServer:
                     "error": f"更新文档失败: {str(e)}"
                 }
         
-        @self.mcp.tool
+        @self._tool
         def delete_document(
             database: str, 
             collection: str,
             filter: Dict[str, Any], 
-            multi: bool = False
+            multi: bool = False,
+            max_time_ms: int = None,
+            chunked: bool = False,
+            batch_size: int = None
         ) -> Dict[str, Any]:
-            """删除文档"""
+            """删除文档；multi和chunked同时为true时按_id分批在后台删除，返回任务ID"""
             try:
-                result = self.mongo_manager.delete_document(database, collection, filter, multi)
+                result = self.mongo_manager.delete_document(
+                    database, collection, filter, multi, max_time_ms, chunked, batch_size
+                )
                 return result.model_dump()
             except Exception as e:
                 logger.error(f"删除文档失败: {str(e)}")
@@ -143,15 +582,76 @@ class MongoAtlasMCPServer:
                     "error": f"删除文档失败: {str(e)}"
                 }
         
-        @self.mcp.tool
+        @self._tool
+        def bulk_job_status(job_id: str = None) -> Dict[str, Any]:
+            """查询分批删除/更新任务的进度，不指定job_id时列出最近的任务"""
+            try:
+                result = self.mongo_manager.bulk_job_status(job_id)
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"查询分批任务失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"查询分批任务失败: {str(e)}"
+                }
+        
+        @self._tool
+        def resume_bulk_job(job_id: str, batch_size: int = None) -> Dict[str, Any]:
+            """从最后处理的_id继续执行中断、失败或取消的分批任务"""
+            try:
+                result = self.mongo_manager.resume_bulk_job(job_id, batch_size)
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"恢复分批任务失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"恢复分批任务失败: {str(e)}"
+                }
+        
+        @self._tool
+        def cancel_bulk_job(job_id: str) -> Dict[str, Any]:
+            """取消正在运行的分批任务，当前批次完成后停止"""
+            try:
+                result = self.mongo_manager.cancel_bulk_job(job_id)
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"取消分批任务失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"取消分批任务失败: {str(e)}"
+                }
+        
+        @self._tool
         def aggregate(
             database: str, 
             collection: str,
-            pipeline: List[Dict[str, Any]]
+            pipeline: List[Dict[str, Any]],
+            allow_disk_use: bool = None,
+            batch_size: int = None,
+            max_time_ms: int = None,
+            hint: Any = None,
+            collation: Dict[str, Any] = None,
+            let: Dict[str, Any] = None,
+            page_size: int = None,
+            max_bytes: int = None,
+            auto_limit: int = None,
+            spill: bool = False
         ) -> Dict[str, Any]:
-            """执行聚合管道"""
+            """执行聚合管道，结果分页返回，未读完时可用get_more继续读取；spill为true时一次读完，过大的结果写入溢出文件"""
             try:
-                result = self.mongo_manager.aggregate(database, collection, pipeline)
+                result = self.mongo_manager.aggregate(
+                    database, collection, pipeline,
+                    allow_disk_use=allow_disk_use,
+                    batch_size=batch_size,
+                    max_time_ms=max_time_ms,
+                    hint=hint,
+                    collation=collation,
+                    let=let,
+                    page_size=page_size,
+                    max_bytes=max_bytes,
+                    auto_limit=auto_limit,
+                    spill=spill
+                )
                 return result.model_dump()
             except Exception as e:
                 logger.error(f"执行聚合管道失败: {str(e)}")
@@ -160,7 +660,269 @@ class MongoAtlasMCPServer:
                     "error": f"执行聚合管道失败: {str(e)}"
                 }
         
-        @self.mcp.tool
+        @self._tool
+        def get_more(
+            cursor_id: str,
+            page_size: int = None,
+            max_bytes: int = None
+        ) -> Dict[str, Any]:
+            """继续读取分页游标的下一页结果"""
+            try:
+                result = self.mongo_manager.get_more(cursor_id, page_size, max_bytes)
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"读取游标失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"读取游标失败: {str(e)}"
+                }
+        
+        @self._tool
+        def close_cursor(cursor_id: str) -> Dict[str, Any]:
+            """关闭不再需要的分页游标"""
+            try:
+                result = self.mongo_manager.close_cursor(cursor_id)
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"关闭游标失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"关闭游标失败: {str(e)}"
+                }
+        
+        @self._tool
+        def drop_spill(spill_id: str) -> Dict[str, Any]:
+            """删除不再需要的溢出文件"""
+            try:
+                result = self.mongo_manager.drop_spill(spill_id)
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"删除溢出文件失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"删除溢出文件失败: {str(e)}"
+                }
+        
+        @self._tool
+        def watch(
+            database: str = None,
+            collection: str = None,
+            pipeline: List[Dict[str, Any]] = None,
+            full_document: str = None,
+            full_document_before_change: str = None,
+            resume_after: Dict[str, Any] = None,
+            batch_size: int = None
+        ) -> Dict[str, Any]:
+            """打开集合、数据库或集群级别的变更流，事件在服务器端缓冲，用watch_next按批读取"""
+            try:
+                result = self.mongo_manager.watch(
+                    database, collection, pipeline, full_document,
+                    full_document_before_change, resume_after, batch_size
+                )
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"打开变更流失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"打开变更流失败: {str(e)}"
+                }
+        
+        @self._tool
+        def watch_next(
+            stream_id: str,
+            max_events: int = 100,
+            max_wait_ms: int = 1000
+        ) -> Dict[str, Any]:
+            """读取变更流的下一批事件，返回恢复令牌和消费延迟"""
+            try:
+                result = self.mongo_manager.watch_next(stream_id, max_events, max_wait_ms)
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"读取变更流失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"读取变更流失败: {str(e)}"
+                }
+        
+        @self._tool
+        def close_watch(stream_id: str) -> Dict[str, Any]:
+            """关闭变更流"""
+            try:
+                result = self.mongo_manager.close_watch(stream_id)
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"关闭变更流失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"关闭变更流失败: {str(e)}"
+                }
+        
+        @self._tool
+        def create_materialized_view(
+            name: str,
+            database: str,
+            source_collection: str,
+            pipeline: List[Dict[str, Any]],
+            target_collection: str,
+            watermark_field: str = None,
+            merge_on: Any = "_id",
+            when_matched: Any = "replace",
+            refresh_interval: float = None,
+            max_time_ms: int = None
+        ) -> Dict[str, Any]:
+            """注册物化视图：管道结果写入目标集合，可按计划或按需增量刷新"""
+            try:
+                result = self.mongo_manager.create_materialized_view(
+                    name, database, source_collection, pipeline, target_collection,
+                    watermark_field, merge_on, when_matched, refresh_interval, max_time_ms
+                )
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"创建物化视图失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"创建物化视图失败: {str(e)}"
+                }
+        
+        @self._tool
+        def refresh_materialized_view(
+            name: str,
+            full: bool = False,
+            max_time_ms: int = None
+        ) -> Dict[str, Any]:
+            """刷新物化视图，默认只处理高水位之后的新文档"""
+            try:
+                result = self.mongo_manager.refresh_materialized_view(name, full, max_time_ms)
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"刷新物化视图失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"刷新物化视图失败: {str(e)}"
+                }
+        
+        @self._tool
+        def query_materialized_view(
+            name: str,
+            filter: Dict[str, Any] = None,
+            projection: Dict[str, Any] = None,
+            sort: List = None,
+            limit: int = None,
+            skip: int = 0,
+            max_time_ms: int = None
+        ) -> Dict[str, Any]:
+            """查询物化视图的目标集合"""
+            try:
+                result = self.mongo_manager.query_materialized_view(
+                    name, filter, projection, sort, limit, skip, max_time_ms
+                )
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"查询物化视图失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"查询物化视图失败: {str(e)}"
+                }
+        
+        @self._tool
+        def list_materialized_views() -> Dict[str, Any]:
+            """列出所有物化视图及其刷新状态"""
+            try:
+                result = self.mongo_manager.list_materialized_views()
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"列出物化视图失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"列出物化视图失败: {str(e)}"
+                }
+        
+        @self._tool
+        def drop_materialized_view(name: str, drop_target: bool = False) -> Dict[str, Any]:
+            """删除物化视图定义，可同时删除目标集合"""
+            try:
+                result = self.mongo_manager.drop_materialized_view(name, drop_target)
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"删除物化视图失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"删除物化视图失败: {str(e)}"
+                }
+        
+        @self._tool
+        def register_template(
+            name: str,
+            database: str,
+            collection: str,
+            parameters: Dict[str, Any] = None,
+            filter: Dict[str, Any] = None,
+            projection: Dict[str, Any] = None,
+            sort: List = None,
+            limit: int = None,
+            pipeline: List[Dict[str, Any]] = None,
+            allow_collection_scan: bool = False,
+            replace: bool = False
+        ) -> Dict[str, Any]:
+            """注册命名查询模板，值位置用 {"$param": 名称} 占位，注册时检查可用索引"""
+            try:
+                result = self.mongo_manager.register_query_template(
+                    name, database, collection, parameters, filter, projection, sort,
+                    limit, pipeline, allow_collection_scan, replace
+                )
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"注册查询模板失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"注册查询模板失败: {str(e)}"
+                }
+        
+        @self._tool
+        def run_template(
+            name: str,
+            params: Dict[str, Any] = None,
+            limit: int = None,
+            max_time_ms: int = None
+        ) -> Dict[str, Any]:
+            """按名称运行查询模板，只需传入参数值"""
+            try:
+                result = self.mongo_manager.run_query_template(name, params, limit, max_time_ms)
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"运行查询模板失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"运行查询模板失败: {str(e)}"
+                }
+        
+        @self._tool
+        def list_templates() -> Dict[str, Any]:
+            """列出查询模板及其延迟和执行计划统计"""
+            try:
+                result = self.mongo_manager.list_query_templates()
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"列出查询模板失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"列出查询模板失败: {str(e)}"
+                }
+        
+        @self._tool
+        def drop_template(name: str) -> Dict[str, Any]:
+            """删除查询模板"""
+            try:
+                result = self.mongo_manager.drop_query_template(name)
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"删除查询模板失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"删除查询模板失败: {str(e)}"
+                }
+        
+        @self._tool
         def create_index(
             database: str, 
             collection: str,
@@ -183,7 +945,45 @@ class MongoAtlasMCPServer:
                     "error": f"创建索引失败: {str(e)}"
                 }
         
-        @self.mcp.tool
+        @self._tool
+        def create_indexes(
+            database: str,
+            collection: str,
+            indexes: List[Dict[str, Any]],
+            wait: bool = False,
+            commit_quorum: Any = None
+        ) -> Dict[str, Any]:
+            """用一条createIndexes命令创建多个索引（共享一次集合扫描），默认不等待构建完成"""
+            try:
+                result = self.mongo_manager.create_indexes(
+                    database, collection, indexes, wait, commit_quorum
+                )
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"创建索引失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"创建索引失败: {str(e)}"
+                }
+        
+        @self._tool
+        def index_build_progress(
+            database: str = None,
+            collection: str = None,
+            build_id: str = None
+        ) -> Dict[str, Any]:
+            """查询索引构建进度：阶段、已处理键数量、耗时和预计剩余时间"""
+            try:
+                result = self.mongo_manager.index_build_progress(database, collection, build_id)
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"查询索引构建进度失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"查询索引构建进度失败: {str(e)}"
+                }
+        
+        @self._tool
         def list_indexes(database: str, collection: str) -> Dict[str, Any]:
             """列出集合的所有索引"""
             try:
@@ -195,15 +995,179 @@ class MongoAtlasMCPServer:
                     "success": False,
                     "error": f"列出索引失败: {str(e)}"
                 }
+        
+        @self._tool
+        def index_report(
+            database: str,
+            collection: str = None,
+            min_age_hours: float = 24,
+            limit: int = 50
+        ) -> Dict[str, Any]:
+            """分析索引使用情况，列出未使用和前缀冗余的索引，按删除后节省的写入开销排序"""
+            try:
+                result = self.mongo_manager.index_report(database, collection, min_age_hours, limit)
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"生成索引报告失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"生成索引报告失败: {str(e)}"
+                }
+        
+        @self._tool
+        def gridfs_put(
+            database: str,
+            local_path: str,
+            filename: str = None,
+            bucket: str = "fs",
+            chunk_size_bytes: int = None,
+            metadata: Dict[str, Any] = None
+        ) -> Dict[str, Any]:
+            """把MONGODB_GRIDFS_DIR下的本地文件流式上传到GridFS，可指定块大小"""
+            try:
+                result = self.mongo_manager.gridfs_put(
+                    database, local_path, filename, bucket, chunk_size_bytes, metadata
+                )
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"上传GridFS文件失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"上传GridFS文件失败: {str(e)}"
+                }
+        
+        @self._tool
+        def gridfs_get(
+            database: str,
+            file_id: str = None,
+            filename: str = None,
+            local_path: str = None,
+            bucket: str = "fs",
+            offset: int = 0,
+            length: int = None,
+            overwrite: bool = False
+        ) -> Dict[str, Any]:
+            """并行读取GridFS文件或其中的字节范围，写入本地文件或以base64返回较小的范围"""
+            try:
+                result = self.mongo_manager.gridfs_get(
+                    database, file_id, filename, local_path, bucket, offset, length, overwrite
+                )
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"下载GridFS文件失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"下载GridFS文件失败: {str(e)}"
+                }
+        
+        @self._tool
+        def gridfs_list(
+            database: str,
+            bucket: str = "fs",
+            filter: Dict[str, Any] = None,
+            limit: int = 100
+        ) -> Dict[str, Any]:
+            """列出GridFS存储桶中的文件，按上传时间降序排列"""
+            try:
+                result = self.mongo_manager.gridfs_list(database, bucket, filter, limit)
+                return result.model_dump()
+            except Exception as e:
+                logger.error(f"列出GridFS文件失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"列出GridFS文件失败: {str(e)}"
+                }
+        
+        @self.mcp.tool
+        def get_metrics() -> Dict[str, Any]:
+            """获取服务器运行指标，如超时和取消次数，以及各会话的调用统计"""
+            return {
+                "success": True,
+                "data": {
+                    **metrics.snapshot(),
+                    "sessions": self.sessions.snapshot(),
+                    "worker": os.getenv('MCP_WORKER_INDEX')
+                }
+            }
+        
+        # batch本身不进入工具表，避免嵌套调用
+        @self.mcp.tool
+        async def batch(
+            operations: List[Dict[str, Any]],
+            concurrency: int = None
+        ) -> Dict[str, Any]:
+            """在一次调用中并发执行多个工具操作，按顺序返回各自结果"""
+            try:
+                return await self._run_batch(operations, concurrency)
+            except Exception as e:
+                logger.error(f"批量操作失败: {str(e)}")
+                return {
+                    "success": False,
+                    "error": f"批量操作失败: {str(e)}"
+                }
+    
+    async def _refresh_views_loop(self) -> None:
+        """定期刷新到期的物化视图，刷新按重量操作经过准入控制"""
+        while True:
+            await asyncio.sleep(self.view_scheduler_interval)
+            try:
+                due = await asyncio.to_thread(self.mongo_manager.views.due)
+            except Exception as e:
+                logger.warning(f"读取物化视图失败: {str(e)}")
+                continue
+            for view in due:
+                try:
+                    async with self.admission.admit(view.namespace, True):
+                        result = await asyncio.to_thread(
+                            self.mongo_manager.refresh_materialized_view, view.name
+                        )
+                except Overloaded as e:
+                    # 保持到期状态，下一轮再试
+                    logger.warning(f"物化视图 {view.name} 刷新被推迟: {str(e)}")
+                    continue
+                if not result.success:
+                    view.schedule_next()
+                    logger.warning(f"物化视图 {view.name} 自动刷新失败: {result.error}")
     
-    async def run(self) -> None:
-        """运行MCP服务器"""
+    async def run(self, transport: str = None, host: str = None, port: int = None,
+                  path: str = None) -> None:
+        """
+        运行MCP服务器
+        
+        stdio模式下每个客户端启动自己的服务器进程；http（streamable HTTP）和sse模式下
+        一个服务器进程同时服务多个客户端会话，共享同一个MongoDB连接池
+        
+        Args:
+            transport: stdio、http或sse，默认MCP_TRANSPORT（stdio）
+            host: HTTP监听地址，默认MCP_HOST（127.0.0.1）
+            port: HTTP监听端口，默认MCP_PORT（8000）
+            path: HTTP端点路径，默认MCP_HTTP_PATH（未设置时http为/mcp，sse为/sse）
+        """
+        transport = transport or os.getenv('MCP_TRANSPORT', 'stdio')
+        if transport not in ("stdio", "http", "sse"):
+            raise ValueError(f"不支持的传输方式: {transport}")
+        self.transport = transport
+        # 多进程工作模式下只由0号工作进程自动刷新物化视图
+        scheduler = None
+        if os.getenv('MCP_WORKER_INDEX', '0') == '0':
+            scheduler = asyncio.create_task(self._refresh_views_loop())
         try:
-            logger.info("启动MongoDB Atlas MCP服务器...")
-            await self.mcp.run_stdio_async()
+            logger.info(f"启动MongoDB Atlas MCP服务器（{transport}）...")
+            if transport == "stdio":
+                await self.mcp.run_stdio_async()
+            else:
+                await self.mcp.run_http_async(
+                    transport=transport,
+                    host=host or os.getenv('MCP_HOST', '127.0.0.1'),
+                    port=port or int(os.getenv('MCP_PORT', '8000')),
+                    path=path or os.getenv('MCP_HTTP_PATH') or None,
+                    stateless_http=self.stateless_http if transport == "http" else None
+                )
         except KeyboardInterrupt:
             logger.info("收到中断信号，正在关闭服务器...")
         finally:
+            if scheduler is not None:
+                scheduler.cancel()
             self.mongo_manager.close()
             logger.info("MongoDB Atlas MCP服务器已关闭")
 
@@ -0,0 +1,140 @@
+"""
+MongoDB Atlas MCP 会话统计与限制
+
+HTTP/SSE传输下一个服务器进程同时服务多个客户端会话，共享同一个MongoDB连接池。
+每个会话单独限制同时执行的调用数量，并统计调用次数、错误次数和延迟
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List
+
+from .metrics import metrics
+
+# 每个会话保留的延迟样本数量
+_LATENCY_SAMPLES = 256
+
+
+class SessionBusy(Exception):
+    """会话同时执行的调用超过上限"""
+
+
+class SessionStats:
+    """单个会话的统计"""
+
+    __slots__ = ("session_id", "last_seen", "calls", "errors", "in_flight", "latencies")
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.last_seen = time.monotonic()
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.latencies: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+
+    def describe(self) -> Dict[str, Any]:
+        """生成可直接序列化的统计"""
+        samples = sorted(self.latencies)
+        return {
+            "session_id": self.session_id,
+            "calls": self.calls,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "p50_ms": round(samples[len(samples) // 2], 2) if samples else None,
+            "p95_ms": round(samples[int(len(samples) * 0.95)], 2) if samples else None,
+            "idle_s": round(time.monotonic() - self.last_seen, 1),
+        }
+
+
+class SessionRegistry:
+    """
+    会话注册表
+
+    会话在第一次调用时创建，空闲超过idle_ttl且没有进行中的调用时移除
+    """
+
+    def __init__(self, max_concurrent_per_session: int = 8, idle_ttl: float = 1800):
+        """
+        初始化会话注册表
+
+        Args:
+            max_concurrent_per_session: 每个会话同时执行的调用上限，0表示不限制
+            idle_ttl: 会话统计在空闲多少秒后移除
+        """
+        self.max_concurrent_per_session = max_concurrent_per_session
+        self.idle_ttl = idle_ttl
+        self._sessions: Dict[str, SessionStats] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self, session_id: str, tool_name: str) -> Iterator[SessionStats]:
+        """
+        登记一次调用，退出时记录延迟
+
+        工具返回失败结果时由调用方调用record_error，异常会自动计为错误
+
+        Args:
+            session_id: MCP会话ID
+            tool_name: 工具名称
+
+        Raises:
+            SessionBusy: 会话同时执行的调用已达上限
+        """
+        with self._lock:
+            self._purge()
+            stats = self._sessions.get(session_id)
+            if stats is None:
+                stats = self._sessions[session_id] = SessionStats(session_id)
+                metrics.incr("sessions_started")
+            limit = self.max_concurrent_per_session
+            if limit and stats.in_flight >= limit:
+                metrics.incr("session_rejections", tool=tool_name)
+                raise SessionBusy(f"会话同时执行的调用超过上限 {limit}")
+            stats.in_flight += 1
+            stats.calls += 1
+            stats.last_seen = time.monotonic()
+            metrics.set_gauge("sessions_active", len(self._sessions))
+        started = time.perf_counter()
+        try:
+            yield stats
+        except BaseException:
+            with self._lock:
+                stats.errors += 1
+            raise
+        finally:
+            with self._lock:
+                stats.in_flight -= 1
+                stats.last_seen = time.monotonic()
+                stats.latencies.append((time.perf_counter() - started) * 1000)
+
+    def record_error(self, stats: SessionStats) -> None:
+        """记录一次返回失败结果的调用"""
+        with self._lock:
+            stats.errors += 1
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """
+        获取所有会话的统计
+
+        Returns:
+            按调用次数降序排列的会话统计
+        """
+        with self._lock:
+            self._purge()
+            sessions = [stats.describe() for stats in self._sessions.values()]
+        sessions.sort(key=lambda stats: stats["calls"], reverse=True)
+        return sessions
+
+    def _purge(self) -> None:
+        """移除空闲的会话（调用方需持有锁）"""
+        cutoff = time.monotonic() - self.idle_ttl
+        idle = [
+            session_id for session_id, stats in self._sessions.items()
+            if stats.in_flight == 0 and stats.last_seen < cutoff
+        ]
+        for session_id in idle:
+            del self._sessions[session_id]
+        if idle:
+            metrics.set_gauge("sessions_active", len(self._sessions))
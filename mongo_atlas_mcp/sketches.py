@@ -0,0 +1,299 @@
+"""
+近似统计草图
+
+HyperLogLog（基数估计）、合并式t-digest（分位数）和水塘抽样，
+均按批次使用NumPy向量化更新，供approximate_stats工具流式处理游标
+"""
+
+import hashlib
+import math
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from bson import json_util
+
+def _value_hash(value: Any) -> int:
+    """
+    计算单个值的64位hash
+
+    对类型名和值的稳定编码（标量直接拼接，文档、数组等用Extended JSON）做blake2b摘要，
+    结果不受进程hash随机化影响，同一个值在不同进程、不同批次中得到相同的hash
+    """
+    if isinstance(value, str):
+        encoded = "str:" + value
+    elif value is None or isinstance(value, (bool, int, float)):
+        encoded = f"{type(value).__name__}:{value!r}"
+    else:
+        encoded = json_util.dumps([type(value).__name__, value], sort_keys=True)
+    digest = hashlib.blake2b(encoded.encode("utf-8", "surrogatepass"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def hash_values(values: List[Any]) -> np.ndarray:
+    """
+    计算一批值的64位hash
+
+    Args:
+        values: 任意值列表
+
+    Returns:
+        uint64数组
+    """
+    return np.fromiter((_value_hash(value) for value in values), dtype=np.uint64, count=len(values))
+
+
+class HyperLogLog:
+    """
+    HyperLogLog基数估计
+
+    使用2^precision个寄存器，标准误差约为 1.04 / sqrt(2^precision)
+    """
+
+    def __init__(self, precision: int = 14):
+        """
+        初始化HyperLogLog
+
+        Args:
+            precision: 寄存器数量的二进制位数（4-18）
+        """
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = np.zeros(self.size, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray) -> None:
+        """
+        合并一批hash值
+
+        Args:
+            hashes: uint64数组
+        """
+        if not len(hashes):
+            return
+        remaining_bits = 64 - self.precision
+        index = (hashes >> np.uint64(remaining_bits)).astype(np.int64)
+        rest = hashes & np.uint64((1 << remaining_bits) - 1)
+        # 剩余位中第一个1的位置（从高位数起，从1开始）
+        bit_length = np.zeros(len(rest), dtype=np.int64)
+        nonzero = rest > 0
+        bit_length[nonzero] = np.frexp(rest[nonzero].astype(np.float64))[1]
+        rank = (remaining_bits - np.minimum(bit_length, remaining_bits) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    @property
+    def relative_error(self) -> float:
+        """标准误差"""
+        return 1.04 / math.sqrt(self.size)
+
+    def estimate(self) -> float:
+        """
+        估计基数
+
+        Returns:
+            不同值数量的估计值
+        """
+        m = float(self.size)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # 小基数时使用线性计数
+            return m * math.log(m / zeros)
+        return raw
+
+
+class TDigest:
+    """
+    合并式t-digest分位数草图
+
+    每批数据与已有质心一起排序，再按k1尺度函数把相邻点合并为质心，全部使用NumPy运算
+    """
+
+    def __init__(self, compression: float = 200):
+        """
+        初始化t-digest
+
+        Args:
+            compression: 压缩参数，越大越精确，质心数量约为其一半
+        """
+        self.compression = compression
+        self.means = np.empty(0, dtype=np.float64)
+        self.weights = np.empty(0, dtype=np.float64)
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    @property
+    def count(self) -> float:
+        """已合并的数据量"""
+        return float(self.weights.sum())
+
+    def add(self, values: np.ndarray) -> None:
+        """
+        合并一批数值
+
+        Args:
+            values: float64数组
+        """
+        if not len(values):
+            return
+        batch_min, batch_max = float(values.min()), float(values.max())
+        self.min = batch_min if self.min is None else min(self.min, batch_min)
+        self.max = batch_max if self.max is None else max(self.max, batch_max)
+
+        means = np.concatenate([self.means, values.astype(np.float64)])
+        weights = np.concatenate([self.weights, np.ones(len(values))])
+        order = np.argsort(means, kind="mergesort")
+        means, weights = means[order], weights[order]
+
+        total = weights.sum()
+        cumulative = np.cumsum(weights)
+        q_mid = (cumulative - weights / 2) / total
+        # k1尺度函数：两端质心更小，中间质心更大
+        k = self.compression / (2 * math.pi) * np.arcsin(2 * q_mid - 1)
+        cluster = np.floor(k - k.min()).astype(np.int64)
+        cluster = np.unique(cluster, return_inverse=True)[1]
+
+        merged_weights = np.bincount(cluster, weights=weights)
+        self.means = np.bincount(cluster, weights=means * weights) / merged_weights
+        self.weights = merged_weights
+
+    def quantile(self, q: float) -> Dict[str, float]:
+        """
+        估计分位数
+
+        Args:
+            q: 分位点（0-1）
+
+        Returns:
+            包含value和rank_error的字典，rank_error为该分位数所在质心覆盖的秩范围的一半（占总量比例）
+        """
+        total = self.weights.sum()
+        cumulative = np.cumsum(self.weights)
+        centers = (cumulative - self.weights / 2) / total
+        xs = np.concatenate([[0.0], centers, [1.0]])
+        ys = np.concatenate([[self.min], self.means, [self.max]])
+        position = int(min(np.searchsorted(cumulative / total, q), len(self.weights) - 1))
+        return {
+            "value": float(np.interp(q, xs, ys)),
+            "rank_error": round(float(self.weights[position] / total / 2), 6),
+        }
+
+
+class Reservoir:
+    """
+    水塘抽样
+
+    以均匀概率保留最多capacity个值，按批次向量化处理
+    """
+
+    def __init__(self, capacity: int = 20, seed: Optional[int] = None):
+        """
+        初始化水塘
+
+        Args:
+            capacity: 保留的样本数量
+            seed: 随机数种子
+        """
+        self.capacity = capacity
+        self.seen = 0
+        self.items: List[Any] = []
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, values: List[Any]) -> None:
+        """
+        合并一批值
+
+        Args:
+            values: 任意值列表
+        """
+        start = 0
+        if len(self.items) < self.capacity:
+            start = min(self.capacity - len(self.items), len(values))
+            self.items.extend(values[:start])
+            self.seen += start
+        remaining = len(values) - start
+        if remaining <= 0:
+            return
+        # 第i个值（全局序号seen+i）以 capacity/(seen+i+1) 的概率替换随机位置
+        positions = self._rng.integers(0, self.seen + np.arange(1, remaining + 1))
+        selected = np.nonzero(positions < self.capacity)[0]
+        for offset in selected:
+            self.items[int(positions[offset])] = values[start + int(offset)]
+        self.seen += remaining
+
+
+def extract_field(documents: Iterable[Dict[str, Any]], path: str) -> List[Any]:
+    """
+    按点号路径取出字段值，缺失的字段被跳过
+
+    Args:
+        documents: 文档列表
+        path: 字段路径，例如 address.city
+
+    Returns:
+        字段值列表
+    """
+    keys = path.split(".")
+    values = []
+    for document in documents:
+        value: Any = document
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            values.append(value)
+    return values
+
+
+def numeric_array(values: List[Any]) -> np.ndarray:
+    """取出数值（不含布尔值）组成float64数组"""
+    return np.fromiter(
+        (float(value) for value in values
+         if isinstance(value, (int, float)) and not isinstance(value, bool)),
+        dtype=np.float64
+    )
+
+
+class FieldSketch:
+    """
+    单个字段的组合草图
+
+    同时维护HyperLogLog、t-digest、水塘抽样以及数值字段的计数、和与平方和
+    """
+
+    def __init__(self, precision: int = 14, compression: float = 200,
+                 reservoir_size: int = 20):
+        """
+        初始化组合草图
+
+        Args:
+            precision: HyperLogLog精度
+            compression: t-digest压缩参数
+            reservoir_size: 水塘抽样保留的样本数量
+        """
+        self.hll = HyperLogLog(precision)
+        self.digest = TDigest(compression)
+        self.reservoir = Reservoir(reservoir_size)
+        self.values = 0
+        self.numeric_count = 0
+        self.numeric_sum = 0.0
+        self.numeric_sumsq = 0.0
+
+    def add(self, values: List[Any]) -> None:
+        """
+        合并一批字段值
+
+        Args:
+            values: 字段值列表
+        """
+        if not values:
+            return
+        self.values += len(values)
+        self.hll.add_hashes(hash_values(values))
+        self.reservoir.add(values)
+        numbers = numeric_array(values)
+        if len(numbers):
+            self.digest.add(numbers)
+            self.numeric_count += len(numbers)
+            self.numeric_sum += float(numbers.sum())
+            self.numeric_sumsq += float(np.dot(numbers, numbers))
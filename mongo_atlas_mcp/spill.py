@@ -0,0 +1,283 @@
+"""
+结果溢出文件
+
+超过阈值的查询结果逐个文档写入本地NDJSON临时文件（每行一个Relaxed Extended JSON文档），
+不再整体保留在内存中。文件通过mmap按行或按字节范围读取，超过保留时间或磁盘配额时删除
+"""
+
+import datetime
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from bson import json_util
+
+from .schema import SchemaAccumulator
+
+logger = logging.getLogger(__name__)
+
+# 每隔多少行记录一次行起始偏移，按行读取时从最近的记录点向后查找
+_INDEX_INTERVAL = 1024
+
+# 生成结构摘要时采样的行数
+_SCHEMA_SAMPLE = 1000
+
+
+class SpillQuotaExceeded(ValueError):
+    """溢出文件超过磁盘配额"""
+
+
+class SpillFile:
+    """已写完的溢出文件"""
+
+    def __init__(self, spill_id: str, path: str, namespace: str, ttl: float):
+        self.spill_id = spill_id
+        self.path = path
+        self.namespace = namespace
+        self.rows = 0
+        self.size = 0
+        # 第 i*_INDEX_INTERVAL 行的起始字节偏移
+        self.checkpoints = array("Q")
+        self.schema: Dict[str, Any] = {}
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.expires = time.monotonic() + ttl
+        self.ttl = ttl
+        self._mmap: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+
+    def _view(self) -> mmap.mmap:
+        """文件的只读内存映射，首次读取时打开"""
+        if self._mmap is None:
+            with open(self.path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def _line_offset(self, view: mmap.mmap, line: int) -> int:
+        """第line行的起始字节偏移，超出行数时返回文件大小"""
+        if line >= self.rows:
+            return self.size
+        checkpoint = line // _INDEX_INTERVAL
+        offset = self.checkpoints[checkpoint]
+        for _ in range(line - checkpoint * _INDEX_INTERVAL):
+            offset = view.find(b"\n", offset) + 1
+        return offset
+
+    def read_lines(self, start: int, count: int) -> bytes:
+        """读取从start行开始的count行"""
+        if self.size == 0:
+            return b""
+        with self._lock:
+            view = self._view()
+            begin = self._line_offset(view, start)
+            end = self._line_offset(view, start + count)
+            return view[begin:end]
+
+    def read_bytes(self, offset: int, length: int) -> bytes:
+        """读取字节范围"""
+        if self.size == 0:
+            return b""
+        with self._lock:
+            return self._view()[offset:offset + length]
+
+    def uri(self) -> str:
+        return f"mongodb-spill://{self.spill_id}"
+
+    def describe(self) -> Dict[str, Any]:
+        """生成可直接序列化的描述"""
+        return {
+            "resource": self.uri(),
+            "spill_id": self.spill_id,
+            "namespace": self.namespace,
+            "rows": self.rows,
+            "bytes": self.size,
+            "schema": self.schema,
+            "expires_in_s": round(max(0.0, self.expires - time.monotonic()), 1),
+        }
+
+    def delete(self) -> None:
+        """关闭映射并删除文件"""
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            logger.warning(f"删除溢出文件 {self.path} 失败: {str(e)}")
+
+
+class SpillWriter:
+    """逐个文档写入溢出文件"""
+
+    def __init__(self, store: "SpillStore", spill: SpillFile):
+        self._store = store
+        self.spill = spill
+        self._file = open(spill.path, "wb")
+        # 聚合结果中的 _id 可能重复（例如$unwind之后），结构统计不按 _id 去重
+        self._schema = SchemaAccumulator(max_tracked_ids=0)
+
+    def write(self, document: Dict[str, Any]) -> None:
+        """追加一个文档"""
+        spill = self.spill
+        line = (json_util.dumps(document, json_options=json_util.RELAXED_JSON_OPTIONS) + "\n").encode()
+        self._store.reserve(self, len(line))
+        if spill.rows % _INDEX_INTERVAL == 0:
+            spill.checkpoints.append(spill.size)
+        if spill.rows < _SCHEMA_SAMPLE:
+            self._schema.add([document])
+        self._file.write(line)
+        spill.rows += 1
+        spill.size += len(line)
+
+    def finish(self) -> SpillFile:
+        """写完文件并登记，之后可以按ID读取"""
+        self._file.close()
+        report = self._schema.report()
+        self.spill.schema = {
+            "sampled_rows": report["sampled_documents"],
+            "fields": {field["path"]: field["types"] for field in report["fields"]},
+        }
+        self._store.commit(self)
+        return self.spill
+
+    def abort(self) -> None:
+        """放弃写入并删除文件"""
+        self._file.close()
+        self._store.release(self)
+        self.spill.delete()
+
+
+class SpillStore:
+    """
+    溢出文件存储
+
+    每个进程使用基础目录下独立的子目录，启动时清理超过保留时间的其他子目录。
+    总大小超过配额时先删除已过期的文件，再按创建顺序删除最早的文件
+    """
+
+    def __init__(self, directory: str, ttl: float = 3600, quota_bytes: int = 1024 ** 3):
+        """
+        初始化溢出文件存储
+
+        Args:
+            directory: 基础目录
+            ttl: 文件保留时间（秒）
+            quota_bytes: 所有文件（包括正在写入的文件）总大小的上限
+        """
+        self.base_directory = directory
+        self.ttl = ttl
+        self.quota_bytes = quota_bytes
+        self._directory: Optional[str] = None
+        self._files: "OrderedDict[str, SpillFile]" = OrderedDict()
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def _ensure_directory(self) -> str:
+        """首次写入时创建本进程的子目录，并清理过期的旧目录（调用方需持有锁）"""
+        if self._directory is None:
+            os.makedirs(self.base_directory, exist_ok=True)
+            cutoff = time.time() - self.ttl
+            for name in os.listdir(self.base_directory):
+                path = os.path.join(self.base_directory, name)
+                if name.startswith("spill-") and os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            self._directory = tempfile.mkdtemp(prefix="spill-", dir=self.base_directory)
+        return self._directory
+
+    def create(self, namespace: str) -> SpillWriter:
+        """
+        新建溢出文件
+
+        Args:
+            namespace: 结果来源的命名空间
+
+        Returns:
+            写入器，写完后调用finish，失败时调用abort
+        """
+        spill_id = uuid.uuid4().hex
+        with self._lock:
+            path = os.path.join(self._ensure_directory(), f"{spill_id}.ndjson")
+            writer = SpillWriter(self, SpillFile(spill_id, path, namespace, self.ttl))
+        return writer
+
+    def reserve(self, writer: SpillWriter, size: int) -> None:
+        """为即将写入的数据占用配额，空间不足时删除旧文件，仍不足时报错"""
+        evicted: List[SpillFile] = []
+        with self._lock:
+            evicted.extend(self._pop_expired())
+            while self._used + size > self.quota_bytes and self._files:
+                oldest = self._files.popitem(last=False)[1]
+                self._used -= oldest.size
+                evicted.append(oldest)
+            if self._used + size > self.quota_bytes:
+                exceeded = True
+            else:
+                self._used += size
+                exceeded = False
+        for spill in evicted:
+            spill.delete()
+        if exceeded:
+            raise SpillQuotaExceeded(
+                f"溢出文件超过磁盘配额 {self.quota_bytes} 字节（已写入 {writer.spill.size} 字节）"
+            )
+
+    def commit(self, writer: SpillWriter) -> None:
+        """登记写完的文件"""
+        with self._lock:
+            writer.spill.expires = time.monotonic() + self.ttl
+            self._files[writer.spill.spill_id] = writer.spill
+
+    def release(self, writer: SpillWriter) -> None:
+        """释放放弃写入的文件占用的配额"""
+        with self._lock:
+            self._used -= writer.spill.size
+
+    def get(self, spill_id: str) -> Optional[SpillFile]:
+        """按ID获取溢出文件，不存在或已过期时返回None"""
+        with self._lock:
+            expired = self._pop_expired()
+            spill = self._files.get(spill_id)
+        for old in expired:
+            old.delete()
+        return spill
+
+    def delete(self, spill_id: str) -> bool:
+        """删除溢出文件"""
+        with self._lock:
+            spill = self._files.pop(spill_id, None)
+            if spill is not None:
+                self._used -= spill.size
+        if spill is None:
+            return False
+        spill.delete()
+        return True
+
+    def close_all(self) -> None:
+        """删除本进程的所有溢出文件"""
+        with self._lock:
+            files = list(self._files.values())
+            self._files.clear()
+            self._used = 0
+            directory, self._directory = self._directory, None
+        for spill in files:
+            spill.delete()
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _pop_expired(self) -> List[SpillFile]:
+        """移除已过期的文件（调用方需持有锁）"""
+        now = time.monotonic()
+        expired_ids = [
+            spill_id for spill_id, spill in self._files.items() if spill.expires < now
+        ]
+        expired = [self._files.pop(spill_id) for spill_id in expired_ids]
+        self._used -= sum(spill.size for spill in expired)
+        return expired
@@ -0,0 +1,664 @@
+"""
+查询模板
+
+命名的查询（过滤器/投影/排序，或聚合管道）在注册时解析并校验一次，参数位置用
+{"$param": "名称"} 占位。运行时只需检查参数类型并填入占位位置，
+同时按模板统计延迟和执行计划的变化
+"""
+
+import datetime
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from bson import ObjectId, json_util
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# 占位符使用的键
+PARAM_KEY = "$param"
+
+# 最多保留的延迟样本数量
+_LATENCY_SAMPLES = 256
+
+# 使用自身专用索引、不需要检查普通索引的首个管道阶段
+_SEARCH_STAGES = ("$geoNear", "$search", "$searchMeta", "$vectorSearch")
+
+# 本进程缓存的模板超过这么久（秒）后，下次使用前检查元数据集合中的版本
+_RECHECK_SECONDS = 5.0
+
+
+def _to_int(value: Any) -> int:
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError("需要整数")
+    return value
+
+
+def _to_number(value: Any) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError("需要数字")
+    return value
+
+
+def _to_string(value: Any) -> str:
+    if not isinstance(value, str):
+        raise ValueError("需要字符串")
+    return value
+
+
+def _to_bool(value: Any) -> bool:
+    if not isinstance(value, bool):
+        raise ValueError("需要布尔值")
+    return value
+
+
+def _to_date(value: Any) -> datetime.datetime:
+    """接受datetime、ISO 8601字符串、毫秒时间戳或 {"$date": ...}"""
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, dict):
+        value = json_util.object_hook(dict(value))
+        if isinstance(value, datetime.datetime):
+            return value
+        raise ValueError("需要日期")
+    if isinstance(value, str):
+        parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+        return parsed
+    if isinstance(value, int) and not isinstance(value, bool):
+        return datetime.datetime.fromtimestamp(value / 1000, datetime.timezone.utc)
+    raise ValueError("需要日期")
+
+
+def _to_object_id(value: Any) -> ObjectId:
+    """接受ObjectId、24位十六进制字符串或 {"$oid": ...}"""
+    if isinstance(value, ObjectId):
+        return value
+    if isinstance(value, dict):
+        value = json_util.object_hook(dict(value))
+        if isinstance(value, ObjectId):
+            return value
+        raise ValueError("需要ObjectId")
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    raise ValueError("需要ObjectId")
+
+
+def _to_any(value: Any) -> Any:
+    return value
+
+
+PARAMETER_TYPES: Dict[str, Callable[[Any], Any]] = {
+    "string": _to_string,
+    "int": _to_int,
+    "number": _to_number,
+    "bool": _to_bool,
+    "date": _to_date,
+    "objectId": _to_object_id,
+    "any": _to_any,
+}
+
+
+class TemplateParameter:
+    """
+    模板参数
+
+    类型名称后加 [] 表示该类型的数组，例如 "objectId[]"
+    """
+
+    def __init__(self, name: str, spec: Any):
+        """
+        初始化参数定义
+
+        Args:
+            name: 参数名称
+            spec: 类型名称，或 {"type": 类型名称, "default": 默认值}，有默认值的参数可以省略
+        """
+        if isinstance(spec, str):
+            spec = {"type": spec}
+        if not isinstance(spec, dict) or not isinstance(spec.get("type"), str):
+            raise ValueError(f"参数 {name} 的定义无效: {spec}")
+        self.name = name
+        self.type = spec["type"]
+        self.is_array = self.type.endswith("[]")
+        base = self.type[:-2] if self.is_array else self.type
+        if base not in PARAMETER_TYPES:
+            raise ValueError(
+                f"参数 {name} 的类型 {self.type} 不受支持，可用类型: {', '.join(PARAMETER_TYPES)}"
+            )
+        self._convert = PARAMETER_TYPES[base]
+        self.required = "default" not in spec
+        self.default = self.convert(spec["default"]) if not self.required else None
+
+    def convert(self, value: Any) -> Any:
+        """检查并转换参数值"""
+        if value is None:
+            return None
+        try:
+            if self.is_array:
+                if not isinstance(value, list):
+                    raise ValueError("需要数组")
+                return [self._convert(item) for item in value]
+            return self._convert(value)
+        except ValueError as e:
+            raise ValueError(f"参数 {self.name} 的值 {value!r} 无效: {str(e)}") from None
+
+    def describe(self) -> Dict[str, Any]:
+        """生成可直接序列化的参数描述"""
+        description: Dict[str, Any] = {"type": self.type, "required": self.required}
+        if not self.required:
+            description["default"] = json_util.dumps(self.default)
+        return description
+
+
+def _compile(value: Any, parameters: Dict[str, TemplateParameter],
+             used: set) -> Optional[Callable[[Dict[str, Any]], Any]]:
+    """
+    把模板中的一个值编译为填充函数
+
+    不含占位符的子树返回None，运行时原样共享，只重建包含占位符的路径
+
+    Args:
+        value: 模板中的值
+        parameters: 参数定义
+        used: 收集用到的参数名称
+
+    Returns:
+        参数字典到填充后值的函数，不含占位符时为None
+    """
+    if isinstance(value, dict):
+        if PARAM_KEY in value:
+            name = value[PARAM_KEY]
+            if len(value) != 1 or not isinstance(name, str):
+                raise ValueError(f"占位符格式无效: {value}")
+            if name not in parameters:
+                raise ValueError(f"占位符 {name} 没有对应的参数定义")
+            used.add(name)
+            return lambda params: params[name]
+        binders = {key: _compile(item, parameters, used) for key, item in value.items()}
+        if all(binder is None for binder in binders.values()):
+            return None
+        return lambda params: {
+            key: item if binders[key] is None else binders[key](params)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        binders = [_compile(item, parameters, used) for item in value]
+        if all(binder is None for binder in binders):
+            return None
+        return lambda params: [
+            item if binder is None else binder(params)
+            for item, binder in zip(value, binders)
+        ]
+    return None
+
+
+def _filter_fields(filter_dict: Any) -> List[str]:
+    """过滤器中参与比较的字段，包括$and/$or/$nor中的子过滤器"""
+    fields: List[str] = []
+    if not isinstance(filter_dict, dict):
+        return fields
+    for key, value in filter_dict.items():
+        if key in ("$and", "$or", "$nor") and isinstance(value, list):
+            for item in value:
+                fields.extend(_filter_fields(item))
+        elif not key.startswith("$"):
+            fields.append(key)
+    return fields
+
+
+def plan_signature(explain: Dict[str, Any]) -> Optional[str]:
+    """
+    从explain结果中提取获胜计划的特征
+
+    Args:
+        explain: queryPlanner级别的explain结果（find或aggregate）
+
+    Returns:
+        形如 "FETCH>IXSCAN(status_1_created_at_-1)" 的字符串，找不到计划时为None
+    """
+    def find_winning(node: Any) -> Optional[Dict[str, Any]]:
+        if isinstance(node, dict):
+            if isinstance(node.get("winningPlan"), dict):
+                return node["winningPlan"]
+            children = node.values()
+        elif isinstance(node, list):
+            children = node
+        else:
+            return None
+        for child in children:
+            found = find_winning(child)
+            if found is not None:
+                return found
+        return None
+
+    winning = find_winning(explain)
+    if winning is None:
+        return None
+    # 基于槽的执行引擎把经典计划放在queryPlan中
+    winning = winning.get("queryPlan", winning)
+
+    parts: List[str] = []
+
+    def walk(node: Dict[str, Any]) -> None:
+        stage = node.get("stage")
+        if isinstance(stage, str):
+            index_name = node.get("indexName")
+            parts.append(f"{stage}({index_name})" if index_name else stage)
+        if isinstance(node.get("inputStage"), dict):
+            walk(node["inputStage"])
+        for child in node.get("inputStages") or []:
+            if isinstance(child, dict):
+                walk(child)
+
+    walk(winning)
+    return ">".join(parts) or None
+
+
+class QueryTemplate:
+    """
+    已解析的查询模板
+
+    find模板由filter/projection/sort/limit组成，聚合模板由pipeline组成，
+    占位符只能出现在值的位置
+    """
+
+    def __init__(self, name: str, database: str, collection: str,
+                 parameters: Dict[str, Any] = None,
+                 filter_dict: Dict[str, Any] = None,
+                 projection: Dict[str, Any] = None,
+                 sort: List[Any] = None,
+                 limit: int = None,
+                 pipeline: List[Dict[str, Any]] = None,
+                 allow_collection_scan: bool = False):
+        """
+        解析并校验模板
+
+        Args:
+            name: 模板名称
+            database: 数据库名称
+            collection: 集合名称
+            parameters: 参数名称到类型定义的映射
+            filter_dict: 过滤器
+            projection: 投影
+            sort: 排序规则，[[字段, 方向], ...]
+            limit: 默认返回数量
+            pipeline: 聚合管道，与filter/projection/sort互斥
+            allow_collection_scan: 没有可用索引时是否仍允许注册
+        """
+        if pipeline is not None and (filter_dict or projection or sort):
+            raise ValueError("聚合模板不能同时指定filter、projection或sort")
+        if pipeline is not None and (
+            not isinstance(pipeline, list) or not all(isinstance(s, dict) for s in pipeline)
+        ):
+            raise ValueError("pipeline必须是阶段对象的列表")
+
+        self.name = name
+        self.database = database
+        self.collection = collection
+        self.parameter_specs = parameters or {}
+        self.parameters = {
+            key: TemplateParameter(key, spec) for key, spec in (parameters or {}).items()
+        }
+        self.filter = filter_dict or {}
+        self.projection = projection
+        self.sort = [tuple(item) for item in sort] if sort else None
+        self.limit = limit
+        self.pipeline = pipeline
+        self.allow_collection_scan = allow_collection_scan
+
+        used: set = set()
+        if pipeline is not None:
+            self._bind_pipeline = _compile(pipeline, self.parameters, used)
+        else:
+            self._bind_filter = _compile(self.filter, self.parameters, used)
+            if projection and _compile(projection, self.parameters, used) is not None:
+                raise ValueError("projection中不能使用占位符")
+        unused = set(self.parameters) - used
+        if unused:
+            raise ValueError(f"参数 {', '.join(sorted(unused))} 没有在模板中使用")
+
+        self.stats = TemplateStats()
+        self.index_check: Dict[str, Any] = {}
+        # 定义内容的摘要，相同定义在各进程中版本一致
+        self.version = hashlib.sha1(json_util.dumps([
+            database, collection, self.parameter_specs, self.filter, projection, sort,
+            limit, pipeline, allow_collection_scan
+        ], sort_keys=True).encode("utf-8")).hexdigest()
+
+    @property
+    def namespace(self) -> str:
+        return f"{self.database}.{self.collection}"
+
+    @property
+    def kind(self) -> str:
+        return "aggregate" if self.pipeline is not None else "find"
+
+    def bind(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        检查参数并填充模板
+
+        Args:
+            params: 参数值
+
+        Returns:
+            find模板返回 {"filter": ...}，聚合模板返回 {"pipeline": ...}
+        """
+        params = params or {}
+        unknown = set(params) - set(self.parameters)
+        if unknown:
+            raise ValueError(f"模板 {self.name} 没有参数 {', '.join(sorted(unknown))}")
+        values: Dict[str, Any] = {}
+        for name, parameter in self.parameters.items():
+            if name in params:
+                values[name] = parameter.convert(params[name])
+            elif parameter.required:
+                raise ValueError(f"缺少参数 {name}")
+            else:
+                values[name] = parameter.default
+        if self.pipeline is not None:
+            bound = self.pipeline if self._bind_pipeline is None else self._bind_pipeline(values)
+            return {"pipeline": bound}
+        bound = self.filter if self._bind_filter is None else self._bind_filter(values)
+        return {"filter": bound}
+
+    def explain_command(self, bound: Dict[str, Any]) -> Dict[str, Any]:
+        """生成用于explain的命令"""
+        if self.pipeline is not None:
+            return {"aggregate": self.collection, "pipeline": bound["pipeline"], "cursor": {}}
+        command: Dict[str, Any] = {"find": self.collection, "filter": bound["filter"]}
+        if self.projection:
+            command["projection"] = self.projection
+        if self.sort:
+            command["sort"] = dict(self.sort)
+        if self.limit:
+            command["limit"] = self.limit
+        return command
+
+    def check_indexes(self, indexes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        检查模板能否使用集合上已有的索引
+
+        索引的首个字段出现在过滤器中，或过滤器为空时与首个排序字段相同，即认为可用
+
+        Args:
+            indexes: list_indexes返回的索引定义
+
+        Returns:
+            包含fields、usable_indexes和indexed的字典
+        """
+        filter_dict: Any = self.filter
+        sort = self.sort
+        first_stage = None
+        if self.pipeline is not None:
+            filter_dict, sort = {}, None
+            stages = list(self.pipeline)
+            first_stage = next(iter(stages[0]), None) if stages else None
+            if stages and "$match" in stages[0]:
+                filter_dict = stages.pop(0)["$match"]
+            if stages and "$sort" in stages[0]:
+                sort = list(stages[0]["$sort"].items())
+
+        fields = _filter_fields(filter_dict)
+        usable: List[str] = []
+        for index in indexes:
+            keys = list(index["key"].items())
+            if not keys:
+                continue
+            leading, direction = keys[0]
+            if isinstance(filter_dict, dict) and "$text" in filter_dict:
+                if any(value == "text" for _, value in keys):
+                    usable.append(index["name"])
+            elif leading in fields or (not fields and sort and leading == sort[0][0]):
+                if direction not in ("text", "2d", "2dsphere"):
+                    usable.append(index["name"])
+
+        return {
+            "fields": fields,
+            "sort": [field for field, _ in sort] if sort else [],
+            "usable_indexes": usable,
+            "indexed": bool(usable) or first_stage in _SEARCH_STAGES,
+        }
+
+    def to_document(self) -> Dict[str, Any]:
+        """转换为元数据集合中的文档，带$的部分以Extended JSON字符串保存"""
+        return {
+            "_id": self.name,
+            "database": self.database,
+            "collection": self.collection,
+            "parameters": json_util.dumps(self.parameter_specs),
+            "filter": json_util.dumps(self.filter),
+            "projection": json_util.dumps(self.projection),
+            "sort": json_util.dumps(self.sort),
+            "limit": self.limit,
+            "pipeline": json_util.dumps(self.pipeline),
+            "allow_collection_scan": self.allow_collection_scan,
+            "index_check": self.index_check,
+            "version": self.version,
+        }
+
+    @classmethod
+    def from_document(cls, document: Dict[str, Any]) -> "QueryTemplate":
+        """从元数据集合中的文档恢复"""
+        template = cls(
+            document["_id"], document["database"], document["collection"],
+            json_util.loads(document["parameters"]),
+            filter_dict=json_util.loads(document["filter"]),
+            projection=json_util.loads(document["projection"]),
+            sort=json_util.loads(document["sort"]),
+            limit=document.get("limit"),
+            pipeline=json_util.loads(document["pipeline"]),
+            allow_collection_scan=document.get("allow_collection_scan", False)
+        )
+        template.index_check = document.get("index_check", {})
+        return template
+
+    def describe(self) -> Dict[str, Any]:
+        """生成可直接序列化的模板描述"""
+        description: Dict[str, Any] = {
+            "name": self.name,
+            "namespace": self.namespace,
+            "kind": self.kind,
+            "parameters": {name: p.describe() for name, p in self.parameters.items()},
+            "index_check": self.index_check,
+            "stats": self.stats.describe(),
+        }
+        if self.pipeline is not None:
+            description["pipeline"] = json_util.dumps(self.pipeline)
+        else:
+            description["filter"] = json_util.dumps(self.filter)
+            description["projection"] = self.projection
+            description["sort"] = [list(item) for item in self.sort] if self.sort else None
+            description["limit"] = self.limit
+        return description
+
+
+class TemplateStats:
+    """单个模板的运行次数、延迟分布和执行计划变化"""
+
+    def __init__(self):
+        self.runs = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self.plans: Counter = Counter()
+        self.last_plan: Optional[str] = None
+        self.plan_changes = 0
+        self._lock = threading.Lock()
+
+    def record_run(self, elapsed_ms: float, success: bool) -> None:
+        """记录一次运行"""
+        with self._lock:
+            self.runs += 1
+            if not success:
+                self.errors += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            self.samples.append(elapsed_ms)
+
+    def record_plan(self, signature: Optional[str]) -> bool:
+        """
+        记录一次explain得到的计划
+
+        Returns:
+            计划是否与上一次不同
+        """
+        if signature is None:
+            return False
+        with self._lock:
+            changed = self.last_plan is not None and signature != self.last_plan
+            if changed:
+                self.plan_changes += 1
+            self.plans[signature] += 1
+            self.last_plan = signature
+            return changed
+
+    def should_explain(self, every: int) -> bool:
+        """首次运行和之后每隔every次运行时检查执行计划，every为0时不检查"""
+        return every > 0 and self.runs % every == 0
+
+    def describe(self) -> Dict[str, Any]:
+        """生成可直接序列化的统计"""
+        with self._lock:
+            samples = sorted(self.samples)
+            runs = self.runs
+
+            def percentile(q: float) -> Optional[float]:
+                if not samples:
+                    return None
+                return round(samples[min(len(samples) - 1, int(q * len(samples)))], 2)
+
+            return {
+                "runs": runs,
+                "errors": self.errors,
+                "avg_ms": round(self.total_ms / runs, 2) if runs else None,
+                "p50_ms": percentile(0.5),
+                "p95_ms": percentile(0.95),
+                "max_ms": round(self.max_ms, 2),
+                "last_plan": self.last_plan,
+                "plans": dict(self.plans),
+                "plan_changes": self.plan_changes,
+            }
+
+
+class TemplateRegistry:
+    """
+    查询模板注册表
+
+    模板定义保存在元数据集合中，多个进程（多进程工作模式的各工作进程、多个stdio进程）共用；
+    本进程缓存已解析的模板和运行统计，超过 _RECHECK_SECONDS 后按版本号检查是否被替换或删除。
+    元数据集合不可写（例如只读账号）时模板只在本进程中可用
+    """
+
+    def __init__(self, collection_factory: Optional[Callable[[], Collection]] = None):
+        """
+        初始化注册表
+
+        Args:
+            collection_factory: 返回元数据集合的函数，为空时模板只保存在本进程内存中
+        """
+        self._collection_factory = collection_factory
+        # 名称 -> (模板, 上次与元数据集合核对的时间)，只在本进程中的模板时间为None
+        self._templates: Dict[str, Tuple[QueryTemplate, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _cache(self, template: QueryTemplate, shared: bool = True) -> QueryTemplate:
+        """缓存模板，版本相同的已缓存模板保留原对象以延续运行统计"""
+        with self._lock:
+            cached = self._templates.get(template.name)
+            if cached is not None and cached[0].version == template.version:
+                template = cached[0]
+            self._templates[template.name] = (template, time.monotonic() if shared else None)
+            return template
+
+    def _load(self, name: str) -> Optional[QueryTemplate]:
+        """从元数据集合读取模板，读取失败时沿用本进程缓存"""
+        with self._lock:
+            cached = self._templates.get(name)
+        try:
+            document = self._collection_factory().find_one({"_id": name})
+        except PyMongoError as e:
+            logger.warning(f"读取查询模板 {name} 失败，使用本进程缓存: {str(e)}")
+            return cached[0] if cached else None
+        if document is None:
+            with self._lock:
+                self._templates.pop(name, None)
+            return None
+        if cached is not None and cached[0].version == document.get("version"):
+            return self._cache(cached[0])
+        try:
+            return self._cache(QueryTemplate.from_document(document))
+        except (KeyError, ValueError) as e:
+            logger.warning(f"元数据集合中的查询模板 {name} 无效: {str(e)}")
+            return None
+
+    def get(self, name: str) -> Optional[QueryTemplate]:
+        """按名称获取模板"""
+        with self._lock:
+            cached = self._templates.get(name)
+        if cached is not None:
+            template, checked = cached
+            if checked is None or time.monotonic() - checked < _RECHECK_SECONDS:
+                return template
+        if self._collection_factory is None:
+            return None
+        return self._load(name)
+
+    def list(self) -> List[QueryTemplate]:
+        """列出所有模板"""
+        if self._collection_factory is not None:
+            try:
+                names = [
+                    document["_id"]
+                    for document in self._collection_factory().find({}, {"_id": 1})
+                ]
+            except PyMongoError as e:
+                logger.warning(f"读取查询模板失败，使用本进程缓存: {str(e)}")
+            else:
+                templates = [self._load(name) for name in names]
+                with self._lock:
+                    templates.extend(
+                        template for name, (template, checked) in self._templates.items()
+                        if checked is None and name not in names
+                    )
+                return [template for template in templates if template is not None]
+        with self._lock:
+            return [template for template, _ in self._templates.values()]
+
+    def add(self, template: QueryTemplate, replace: bool = False) -> None:
+        """登记模板，同名模板已存在且不替换时报错"""
+        if not replace and self.get(template.name) is not None:
+            raise ValueError(f"查询模板 {template.name} 已存在")
+        shared = self._collection_factory is not None
+        if shared:
+            try:
+                if replace:
+                    self._collection_factory().replace_one(
+                        {"_id": template.name}, template.to_document(), upsert=True
+                    )
+                else:
+                    self._collection_factory().insert_one(template.to_document())
+            except DuplicateKeyError:
+                raise ValueError(f"查询模板 {template.name} 已存在") from None
+            except PyMongoError as e:
+                logger.warning(f"保存查询模板 {template.name} 失败，只在本进程中可用: {str(e)}")
+                shared = False
+        self._cache(template, shared)
+
+    def remove(self, name: str) -> bool:
+        """删除模板"""
+        deleted = False
+        if self._collection_factory is not None:
+            try:
+                deleted = self._collection_factory().delete_one({"_id": name}).deleted_count > 0
+            except PyMongoError as e:
+                logger.warning(f"从元数据集合删除查询模板 {name} 失败: {str(e)}")
+        with self._lock:
+            return self._templates.pop(name, None) is not None or deleted
@@ -0,0 +1,341 @@
+"""
+本地向量检索引擎
+
+在Atlas $vectorSearch不可用时使用：把集合中某个嵌入字段加载为连续的float32矩阵，
+以内存映射文件的形式保存在磁盘上，按_id高水位增量追加，并用分块矩阵运算计算top-k。
+多个进程（多进程工作模式）共用同一目录时，通过 .lock 文件串行化刷新
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from bson import json_util
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# 每次矩阵运算处理的行数
+_CHUNK_ROWS = 65536
+
+# 从集合加载向量时每批追加的行数
+_APPEND_BATCH = 10000
+
+
+class VectorIndex:
+    """
+    单个 命名空间/字段 的向量索引
+
+    磁盘上保存三个文件：.f32（向量矩阵）、.norms（向量范数）、.ids（每行一个Extended JSON格式的_id），
+    以及记录维度、行数和代号的 .meta。.meta 通过临时文件原子替换，只有它记录的行数是有效的，
+    文件中超出的部分是未完成的追加，下次追加前截断
+    """
+
+    def __init__(self, path_prefix: str):
+        """
+        初始化向量索引，存在磁盘文件时直接映射
+
+        Args:
+            path_prefix: 索引文件路径前缀
+        """
+        self.path_prefix = path_prefix
+        self.lock = threading.Lock()
+        self.refreshed_at = 0.0
+        self._clear()
+        self._load()
+
+    def _clear(self) -> None:
+        """清空内存中的状态"""
+        self.dim: Optional[int] = None
+        self.generation: Optional[str] = None
+        self.ids_bytes = 0
+        self.ids: List[Any] = []
+        self.positions: Dict[str, int] = {}
+        self.matrix: Optional[np.ndarray] = None
+        self.norms: Optional[np.ndarray] = None
+
+    @property
+    def count(self) -> int:
+        """索引中的向量数量"""
+        return len(self.ids)
+
+    @property
+    def last_id(self) -> Any:
+        """已加载的最大_id（高水位）"""
+        return self.ids[-1] if self.ids else None
+
+    def _path(self, suffix: str) -> str:
+        return f"{self.path_prefix}{suffix}"
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        """读取 .meta，不存在时返回None"""
+        try:
+            with open(self._path(".meta"), "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return None
+
+    def _load(self) -> None:
+        """从磁盘文件恢复索引"""
+        meta = self._read_meta()
+        if meta is None:
+            return
+        with open(self._path(".ids"), "rb") as fh:
+            data = fh.read(meta["ids_bytes"]) if "ids_bytes" in meta else fh.read()
+        lines = data.decode("utf-8").splitlines(keepends=True)[:meta["count"]]
+        self.dim = meta["dim"]
+        self.generation = meta.get("generation")
+        self.ids = [json_util.loads(line)["_id"] for line in lines]
+        self.ids_bytes = sum(len(line.encode("utf-8")) for line in lines)
+        self.positions = {json_util.dumps(value): row for row, value in enumerate(self.ids)}
+        self._map(len(self.ids))
+
+    @contextlib.contextmanager
+    def file_lock(self) -> Iterator[None]:
+        """跨进程互斥锁，持有期间其他进程不能修改该索引的文件"""
+        os.makedirs(os.path.dirname(self.path_prefix) or ".", exist_ok=True)
+        with open(self._path(".lock"), "a+b") as fh:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+                else:
+                    fh.seek(0)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def sync(self) -> None:
+        """
+        与磁盘上的 .meta 对齐
+
+        其他进程追加或重建过索引时重新加载，需在 file_lock 内调用
+        """
+        meta = self._read_meta()
+        if meta is None:
+            if self.ids or self.dim is not None:
+                self._clear()
+        elif meta.get("generation") != self.generation or meta["count"] != self.count:
+            self._clear()
+            self._load()
+
+    def _map(self, count: int) -> None:
+        """内存映射矩阵和范数文件"""
+        if not count:
+            self.matrix = self.norms = None
+            return
+        self.matrix = np.memmap(self._path(".f32"), dtype=np.float32, mode="r",
+                                shape=(count, self.dim))
+        self.norms = np.memmap(self._path(".norms"), dtype=np.float32, mode="r",
+                               shape=(count,))
+
+    def reset(self) -> None:
+        """删除磁盘文件并清空索引，需在 file_lock 内调用"""
+        self._clear()
+        for suffix in (".f32", ".norms", ".ids", ".meta"):
+            try:
+                os.remove(self._path(suffix))
+            except FileNotFoundError:
+                pass
+
+    def append(self, ids: List[Any], vectors: np.ndarray) -> None:
+        """
+        追加一批向量，需在 file_lock 内、sync 之后调用
+
+        Args:
+            ids: 文档_id列表
+            vectors: 形状为 (len(ids), dim) 的float32矩阵
+        """
+        if not ids:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.generation is None:
+            self.generation = uuid.uuid4().hex
+        lines = "".join(json_util.dumps({"_id": value}) + "\n" for value in ids).encode("utf-8")
+        self._append_file(".f32", self.count * self.dim * 4, vectors.tobytes())
+        self._append_file(".norms", self.count * 4,
+                          np.linalg.norm(vectors, axis=1).astype(np.float32).tobytes())
+        self._append_file(".ids", self.ids_bytes, lines)
+        for value in ids:
+            self.positions[json_util.dumps(value)] = len(self.ids)
+            self.ids.append(value)
+        self.ids_bytes += len(lines)
+        partial = self._path(".meta.part")
+        with open(partial, "w", encoding="utf-8") as fh:
+            json.dump({"dim": self.dim, "count": len(self.ids), "ids_bytes": self.ids_bytes,
+                       "generation": self.generation}, fh)
+        os.replace(partial, self._path(".meta"))
+        self._map(len(self.ids))
+
+    def _append_file(self, suffix: str, valid_bytes: int, data: bytes) -> None:
+        """截断未完成的追加后在有效内容末尾写入数据"""
+        with open(self._path(suffix), "ab") as fh:
+            fh.truncate(valid_bytes)
+            fh.write(data)
+
+    def rows_for(self, ids: Iterable[Any]) -> np.ndarray:
+        """
+        将_id转换为矩阵行号
+
+        Args:
+            ids: 文档_id
+
+        Returns:
+            已索引文档对应的行号数组
+        """
+        rows = [self.positions.get(json_util.dumps(value)) for value in ids]
+        return np.array([row for row in rows if row is not None], dtype=np.int64)
+
+    def search(self, query: np.ndarray, k: int, metric: str = "cosine",
+               rows: Optional[np.ndarray] = None) -> List[Tuple[Any, float]]:
+        """
+        计算top-k相似向量
+
+        Args:
+            query: 查询向量
+            k: 返回数量
+            metric: cosine 或 dot
+            rows: 预过滤后允许的行号，None表示全部
+
+        Returns:
+            按得分从高到低排列的 (_id, 得分) 列表
+        """
+        if self.matrix is None or k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        if query.shape != (self.dim,):
+            raise ValueError(f"查询向量维度 {query.shape[0]} 与索引维度 {self.dim} 不一致")
+        if metric == "cosine":
+            query = query / (np.linalg.norm(query) or 1.0)
+
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        candidates = np.arange(self.count) if rows is None else rows
+        for start in range(0, len(candidates), _CHUNK_ROWS):
+            chunk = candidates[start:start + _CHUNK_ROWS]
+            if rows is None:
+                block = self.matrix[chunk[0]:chunk[-1] + 1]
+                norms = self.norms[chunk[0]:chunk[-1] + 1]
+            else:
+                block = self.matrix[chunk]
+                norms = self.norms[chunk]
+            scores = block @ query
+            if metric == "cosine":
+                scores = scores / np.where(norms > 0, norms, 1.0)
+            if len(scores) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                chunk, scores = chunk[top], scores[top]
+            best_rows = np.concatenate([best_rows, chunk])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_scores) > k:
+                top = np.argpartition(-best_scores, k - 1)[:k]
+                best_rows, best_scores = best_rows[top], best_scores[top]
+
+        order = np.argsort(-best_scores, kind="stable")
+        return [(self.ids[int(best_rows[i])], float(best_scores[i])) for i in order]
+
+
+class LocalVectorEngine:
+    """
+    本地向量检索引擎
+
+    管理各 命名空间/字段 的向量索引，查询前按刷新间隔增量加载新文档
+    """
+
+    def __init__(self, cache_dir: str, refresh_interval: float = 60.0):
+        """
+        初始化引擎
+
+        Args:
+            cache_dir: 索引文件目录
+            refresh_interval: 两次增量刷新的最短间隔（秒）
+        """
+        self.cache_dir = cache_dir
+        self.refresh_interval = refresh_interval
+        self._indexes: Dict[Tuple[str, str], VectorIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, field: str) -> VectorIndex:
+        """获取 命名空间/字段 对应的索引，不存在时创建"""
+        key = (namespace, field)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                digest = hashlib.sha1(f"{namespace}\0{field}".encode("utf-8")).hexdigest()
+                index = VectorIndex(os.path.join(self.cache_dir, digest))
+                self._indexes[key] = index
+            return index
+
+    def refresh(self, collection: Any, field: str, force: bool = False,
+                rebuild: bool = False, comment: Optional[str] = None) -> VectorIndex:
+        """
+        增量加载集合中_id大于高水位的文档
+
+        Args:
+            collection: pymongo集合对象
+            field: 嵌入字段
+            force: 是否忽略刷新间隔立即刷新
+            rebuild: 是否丢弃已有索引重新加载（用于捕获更新和删除）
+            comment: 附加到查询上的操作ID
+
+        Returns:
+            刷新后的索引
+        """
+        index = self.get(collection.full_name, field)
+        with index.lock, index.file_lock():
+            index.sync()
+            if rebuild:
+                index.reset()
+            elif not force and index.count and \
+                    time.monotonic() - index.refreshed_at < self.refresh_interval:
+                return index
+
+            query: Dict[str, Any] = {field: {"$exists": True}}
+            if index.last_id is not None:
+                query["_id"] = {"$gt": index.last_id}
+            cursor = collection.find(
+                query, {field: 1}, sort=[("_id", 1)],
+                batch_size=_APPEND_BATCH, comment=comment
+            )
+            added = 0
+            with cursor:
+                ids: List[Any] = []
+                vectors: List[np.ndarray] = []
+                for document in cursor:
+                    vector = np.asarray(document.get(field), dtype=np.float32)
+                    if vector.ndim != 1 or not len(vector):
+                        continue
+                    if index.dim is None:
+                        index.dim = len(vector)
+                    if len(vector) != index.dim:
+                        continue
+                    ids.append(document["_id"])
+                    vectors.append(vector)
+                    if len(ids) >= _APPEND_BATCH:
+                        index.append(ids, np.vstack(vectors))
+                        added += len(ids)
+                        ids, vectors = [], []
+                if ids:
+                    index.append(ids, np.vstack(vectors))
+                    added += len(ids)
+            index.refreshed_at = time.monotonic()
+            if added:
+                logger.info(f"向量索引 {collection.full_name}.{field} 追加 {added} 行，共 {index.count} 行")
+            return index
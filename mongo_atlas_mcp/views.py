@@ -0,0 +1,310 @@
+"""
+物化视图
+
+把命名的聚合管道通过$merge写入目标集合，按计划或按需刷新。
+配置了高水位字段（时间戳或_id）时，增量刷新只处理上次刷新之后的新文档
+"""
+
+import datetime
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from bson import json_util
+from pymongo.collection import Collection
+
+# 跨文档计算的阶段：增量刷新时只看到新文档，输出的是增量而不是累计值
+AGGREGATING_STAGES = {
+    "$group", "$count", "$bucket", "$bucketAuto", "$sortByCount", "$facet", "$setWindowFields"
+}
+
+# 同一源文档的结果重复合并时不改变目标集合的whenMatched
+_IDEMPOTENT_WHEN_MATCHED = {"replace", "merge", "keepExisting"}
+
+
+def aggregates_documents(pipeline: List[Dict[str, Any]]) -> bool:
+    """管道是否包含把多个文档合并计算的阶段"""
+    return any(key in AGGREGATING_STAGES for stage in pipeline for key in stage)
+
+
+class MaterializedView:
+    """
+    物化视图定义及其刷新状态
+
+    管道和whenMatched以Extended JSON字符串保存，避免以$开头的键写入元数据集合
+    """
+
+    def __init__(self, name: str, database: str, source: str,
+                 pipeline: List[Dict[str, Any]], target: str,
+                 watermark_field: Optional[str] = None,
+                 merge_on: Any = "_id",
+                 when_matched: Any = "replace",
+                 refresh_interval: Optional[float] = None,
+                 high_water_mark: Any = None,
+                 last_refresh: Optional[datetime.datetime] = None,
+                 last_duration_ms: Optional[float] = None):
+        """
+        初始化物化视图
+
+        Args:
+            name: 视图名称
+            database: 数据库名称
+            source: 源集合
+            pipeline: 聚合管道（不含$merge/$out）
+            target: 目标集合
+            watermark_field: 高水位字段，为空时每次都全量刷新
+            merge_on: $merge的on字段
+            when_matched: $merge的whenMatched，可以是字符串或更新管道
+            refresh_interval: 自动刷新间隔（秒），为空时仅按需刷新
+            high_water_mark: 上次刷新处理到的高水位
+            last_refresh: 上次刷新完成时间
+            last_duration_ms: 上次刷新耗时（毫秒）
+        """
+        self.name = name
+        self.database = database
+        self.source = source
+        self.pipeline = pipeline
+        self.target = target
+        self.watermark_field = watermark_field
+        self.merge_on = merge_on
+        self.when_matched = when_matched
+        self.refresh_interval = refresh_interval
+        self.high_water_mark = high_water_mark
+        self.last_refresh = last_refresh
+        self.last_duration_ms = last_duration_ms
+        self.lock = threading.Lock()
+        self._next_due = time.monotonic() + (refresh_interval or 0)
+
+    @property
+    def namespace(self) -> str:
+        """源集合的命名空间"""
+        return f"{self.database}.{self.source}"
+
+    @property
+    def incremental(self) -> bool:
+        """
+        是否可以增量刷新
+
+        包含分组等阶段的管道只有在whenMatched是合并新旧值的更新管道时才能增量刷新，
+        否则新文档的分组结果会替换目标集合中的累计值，此时每次都全量刷新
+        """
+        if not self.watermark_field:
+            return False
+        return not aggregates_documents(self.pipeline) or isinstance(self.when_matched, list)
+
+    @property
+    def inclusive_lower_bound(self) -> bool:
+        """
+        增量刷新是否包含等于上次高水位的文档
+
+        上次刷新之后写入、高水位字段恰好等于上次高水位的文档用$gt会被跳过。
+        逐文档的管道重复合并同一文档的结果不改变目标集合，因此使用$gte；
+        累计型的whenMatched管道重复合并会重复计算，只能使用$gt
+        """
+        return not aggregates_documents(self.pipeline) and \
+            self.when_matched in _IDEMPOTENT_WHEN_MATCHED
+
+    def is_due(self, now: float) -> bool:
+        """是否到了自动刷新时间（正在刷新的视图不算）"""
+        return bool(self.refresh_interval) and now >= self._next_due and not self.lock.locked()
+
+    def mark_refreshed(self, high_water_mark: Any, duration_ms: float) -> None:
+        """记录一次成功刷新"""
+        self.high_water_mark = high_water_mark
+        self.last_refresh = datetime.datetime.now(datetime.timezone.utc)
+        self.last_duration_ms = duration_ms
+        self.schedule_next()
+
+    def schedule_next(self) -> None:
+        """从现在起计算下一次自动刷新时间"""
+        self._next_due = time.monotonic() + (self.refresh_interval or 0)
+
+    def load_state(self, other: "MaterializedView") -> None:
+        """用元数据集合中较新的定义和刷新状态覆盖本对象，保留刷新锁和自动刷新时间"""
+        for attribute in ("database", "source", "pipeline", "target", "watermark_field",
+                          "merge_on", "when_matched", "refresh_interval", "high_water_mark",
+                          "last_refresh", "last_duration_ms"):
+            setattr(self, attribute, getattr(other, attribute))
+
+    def build_pipeline(self, upper: Any, full: bool) -> List[Dict[str, Any]]:
+        """
+        生成刷新用的完整管道
+
+        Args:
+            upper: 本次刷新的高水位上界，只处理不超过它的文档，避免刷新期间写入的文档被跳过
+            full: 是否全量刷新（使用$out整体替换目标集合）
+
+        Returns:
+            聚合管道
+        """
+        stages: List[Dict[str, Any]] = []
+        if self.watermark_field and upper is not None:
+            bounds: Dict[str, Any] = {"$lte": upper}
+            if not full and self.high_water_mark is not None:
+                bounds["$gte" if self.inclusive_lower_bound else "$gt"] = self.high_water_mark
+            stages.append({"$match": {self.watermark_field: bounds}})
+        stages.extend(self.pipeline)
+        if full:
+            stages.append({"$out": self.target})
+        else:
+            stages.append({"$merge": {
+                "into": self.target,
+                "on": self.merge_on,
+                "whenMatched": self.when_matched,
+                "whenNotMatched": "insert",
+            }})
+        return stages
+
+    def to_document(self) -> Dict[str, Any]:
+        """转换为元数据集合中的文档"""
+        return {
+            "_id": self.name,
+            "database": self.database,
+            "source": self.source,
+            "pipeline": json_util.dumps(self.pipeline),
+            "target": self.target,
+            "watermark_field": self.watermark_field,
+            "merge_on": self.merge_on,
+            "when_matched": json_util.dumps(self.when_matched),
+            "refresh_interval": self.refresh_interval,
+            "high_water_mark": self.high_water_mark,
+            "last_refresh": self.last_refresh,
+            "last_duration_ms": self.last_duration_ms,
+        }
+
+    @classmethod
+    def from_document(cls, document: Dict[str, Any]) -> "MaterializedView":
+        """从元数据集合中的文档恢复"""
+        return cls(
+            name=document["_id"],
+            database=document["database"],
+            source=document["source"],
+            pipeline=json_util.loads(document["pipeline"]),
+            target=document["target"],
+            watermark_field=document.get("watermark_field"),
+            merge_on=document.get("merge_on", "_id"),
+            when_matched=json_util.loads(document.get("when_matched", '"replace"')),
+            refresh_interval=document.get("refresh_interval"),
+            high_water_mark=document.get("high_water_mark"),
+            last_refresh=document.get("last_refresh"),
+            last_duration_ms=document.get("last_duration_ms"),
+        )
+
+    def describe(self) -> Dict[str, Any]:
+        """生成可直接序列化的视图描述"""
+        return {
+            "name": self.name,
+            "database": self.database,
+            "source": self.source,
+            "target": self.target,
+            "pipeline": json_util.loads(json_util.dumps(self.pipeline)),
+            "watermark_field": self.watermark_field,
+            "merge_on": self.merge_on,
+            "when_matched": json_util.loads(json_util.dumps(self.when_matched)),
+            "incremental": self.incremental,
+            "refresh_interval": self.refresh_interval,
+            "high_water_mark": None if self.high_water_mark is None else str(self.high_water_mark),
+            "last_refresh": self.last_refresh.isoformat() if self.last_refresh else None,
+            "last_duration_ms": self.last_duration_ms,
+            "refreshing": self.lock.locked(),
+        }
+
+
+class ViewRegistry:
+    """
+    物化视图注册表
+
+    视图定义和刷新状态以元数据集合为准：多个进程（多进程工作模式的各工作进程、多个stdio进程）
+    共用同一个集合，每次读取都重新加载，内存中只保留视图对象以复用各视图的刷新锁。
+    高水位通过比较并交换推进，同一段数据只会被一个进程合并
+    """
+
+    def __init__(self, collection_factory: Callable[[], Collection]):
+        """
+        初始化注册表
+
+        Args:
+            collection_factory: 返回元数据集合的函数，延迟到首次访问时调用
+        """
+        self._collection_factory = collection_factory
+        self._views: Dict[str, MaterializedView] = {}
+        self._lock = threading.Lock()
+
+    def _merge(self, document: Dict[str, Any]) -> MaterializedView:
+        """把元数据文档合并进内存中的视图对象"""
+        loaded = MaterializedView.from_document(document)
+        with self._lock:
+            view = self._views.get(loaded.name)
+            if view is None:
+                self._views[loaded.name] = view = loaded
+            else:
+                view.load_state(loaded)
+            return view
+
+    def get(self, name: str) -> Optional[MaterializedView]:
+        """按名称获取视图，同时加载其他进程写入的最新状态"""
+        document = self._collection_factory().find_one({"_id": name})
+        if document is None:
+            with self._lock:
+                self._views.pop(name, None)
+            return None
+        return self._merge(document)
+
+    def list(self) -> List[MaterializedView]:
+        """列出所有视图"""
+        documents = list(self._collection_factory().find())
+        names = {document["_id"] for document in documents}
+        with self._lock:
+            for name in set(self._views) - names:
+                del self._views[name]
+        return [self._merge(document) for document in documents]
+
+    def save(self, view: MaterializedView) -> None:
+        """保存视图定义和刷新状态"""
+        self._collection_factory().replace_one({"_id": view.name}, view.to_document(), upsert=True)
+        with self._lock:
+            self._views[view.name] = view
+
+    def remove(self, name: str) -> Optional[MaterializedView]:
+        """删除视图定义"""
+        self._collection_factory().delete_one({"_id": name})
+        with self._lock:
+            return self._views.pop(name, None)
+
+    def claim(self, view: MaterializedView, upper: Any) -> bool:
+        """
+        在刷新之前把高水位从当前值推进到upper
+
+        Args:
+            view: 视图，其high_water_mark为本进程看到的上次高水位
+            upper: 本次刷新的高水位上界
+
+        Returns:
+            是否推进成功；失败表示其他进程已经刷新过这一段
+        """
+        document = self._collection_factory().find_one_and_update(
+            {"_id": view.name, "high_water_mark": view.high_water_mark},
+            {"$set": {"high_water_mark": upper}},
+            projection={"_id": 1}
+        )
+        return document is not None
+
+    def release(self, view: MaterializedView, upper: Any) -> None:
+        """刷新失败时把claim推进的高水位退回到视图当前的高水位"""
+        self._collection_factory().update_one(
+            {"_id": view.name, "high_water_mark": upper},
+            {"$set": {"high_water_mark": view.high_water_mark}}
+        )
+
+    def record_refresh(self, view: MaterializedView) -> None:
+        """保存刷新完成时间和耗时，高水位已由claim写入"""
+        self._collection_factory().update_one(
+            {"_id": view.name},
+            {"$set": {"last_refresh": view.last_refresh, "last_duration_ms": view.last_duration_ms}}
+        )
+
+    def due(self) -> List[MaterializedView]:
+        """返回到了自动刷新时间的视图"""
+        views = self.list()
+        now = time.monotonic()
+        return [view for view in views if view.is_due(now)]
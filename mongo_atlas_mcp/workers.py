@@ -0,0 +1,577 @@
+"""
+MongoDB Atlas MCP 多进程工作模式
+
+HTTP/SSE传输下，大结果的BSON解码和JSON编码受GIL限制只能用满一个核心。
+多进程模式启动N个工作进程，每个进程有自己的MongoAtlasManager和连接池，
+在本机端口上运行完整的MCP服务器；主进程只负责接受连接并逐个请求转发。
+
+会话由工作进程创建，主进程从initialize响应的Mcp-Session-Id头（SSE为endpoint事件中的
+session_id）记下会话所在的进程，之后该会话的请求都转发到这个进程，游标、变更流、
+溢出文件等保存在进程内的状态因此仍然可用。路由按请求决定，一个keep-alive连接上的
+多个会话各自转发到自己的进程。创建会话的请求轮流分配给各进程；不属于任何会话的请求
+按X-MCP-Session-Id请求头或客户端地址选择进程，与服务器识别无会话请求的方式一致。
+客户端地址通过X-Forwarded-For请求头传给工作进程
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import socket
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 读取请求头的上限
+_MAX_HEADER_BYTES = 64 * 1024
+
+# 转发时每次读取的字节数
+_CHUNK_SIZE = 256 * 1024
+
+# 工作进程退出后重新启动前的等待时间（秒）
+_RESTART_DELAY = 1.0
+
+# 预先读取的请求体上限：用于判断是否为initialize请求，以及连接失败时重发
+_MAX_PEEK_BYTES = 64 * 1024
+
+# 记录的会话路由数量上限，超出时淘汰最久未使用的会话
+_MAX_SESSIONS = 100000
+
+# 到工作进程的连接空闲超过该时间（秒）后不再复用，避免使用已被工作进程关闭的连接
+_UPSTREAM_IDLE = 2.0
+
+# SSE消息端点和endpoint事件中的会话ID
+_SSE_SESSION = re.compile(rb"[?&]session_id=([^&\s\"]+)")
+
+
+class _Upstream:
+    """到一个工作进程的连接"""
+
+    __slots__ = ("reader", "writer", "last_used")
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+
+    @property
+    def reusable(self) -> bool:
+        return (not self.writer.is_closing() and not self.reader.at_eof()
+                and time.monotonic() - self.last_used < _UPSTREAM_IDLE)
+
+
+def _free_port(host: str) -> int:
+    """获取一个本机空闲端口"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def _exit_with_parent(parent_pid: int) -> None:
+    """主进程退出（包括被强制结束）后结束工作进程"""
+    while os.getppid() == parent_pid:
+        time.sleep(_RESTART_DELAY)
+    os._exit(0)
+
+
+def _worker_main(index: int, transport: str, port: int, path: Optional[str],
+                 parent_pid: int) -> None:
+    """工作进程入口：在本机端口上运行一个完整的MCP服务器"""
+    os.environ["MCP_WORKER_INDEX"] = str(index)
+    threading.Thread(target=_exit_with_parent, args=(parent_pid,), daemon=True).start()
+    from .server import MongoAtlasMCPServer
+
+    server = MongoAtlasMCPServer()
+    asyncio.run(server.run(transport, "127.0.0.1", port, path))
+
+
+def parse_head(head: bytes) -> Tuple[List[bytes], Dict[bytes, bytes]]:
+    """
+    拆分请求或响应的首行和头部
+
+    Args:
+        head: 首行和头部，以空行结尾
+
+    Returns:
+        (首行按空格拆分的部分, 小写头名称到值的映射)
+    """
+    lines = head.split(b"\r\n")
+    headers: Dict[bytes, bytes] = {}
+    for line in lines[1:]:
+        name, separator, value = line.partition(b":")
+        if separator:
+            headers[name.strip().lower()] = value.strip()
+    return lines[0].split(b" ", 2), headers
+
+
+def request_session(target: bytes, headers: Dict[bytes, bytes]) -> Optional[bytes]:
+    """请求所属的传输层会话：Mcp-Session-Id请求头，或SSE消息端点的session_id查询参数"""
+    session = headers.get(b"mcp-session-id")
+    if session:
+        return session
+    match = _SSE_SESSION.search(target)
+    return match.group(1) if match else None
+
+
+def session_key(headers: Dict[bytes, bytes], peer: Optional[Tuple]) -> bytes:
+    """
+    不属于任何会话的请求选择工作进程的键
+
+    Args:
+        headers: 请求头
+        peer: 客户端地址
+
+    Returns:
+        X-MCP-Session-Id请求头的值，没有时为客户端IP
+    """
+    claimed = headers.get(b"x-mcp-session-id")
+    if claimed:
+        return claimed
+    return str(peer[0]).encode() if peer else b""
+
+
+def forwarded_head(head: bytes, peer: Optional[Tuple]) -> bytes:
+    """
+    把请求头中的X-Forwarded-For换成主进程看到的客户端地址
+
+    客户端自己发送的X-Forwarded-For被丢弃，工作进程只信任主进程写入的值
+
+    Args:
+        head: 请求首行和头部，以空行结尾
+        peer: 客户端地址
+
+    Returns:
+        转发给工作进程的请求首行和头部
+    """
+    lines = [
+        line for line in head[:-4].split(b"\r\n")
+        if line.partition(b":")[0].strip().lower() != b"x-forwarded-for"
+    ]
+    if peer:
+        lines.append(b"X-Forwarded-For: " + str(peer[0]).encode())
+    return b"\r\n".join(lines) + b"\r\n\r\n"
+
+
+def starts_session(body: Optional[bytes]) -> bool:
+    """请求体是否包含initialize请求（创建新会话，可以交给任意工作进程）"""
+    if not body or b"initialize" not in body:
+        return False
+    try:
+        message = json.loads(body)
+    except ValueError:
+        return False
+    messages = message if isinstance(message, list) else [message]
+    return any(isinstance(item, dict) and item.get("method") == "initialize" for item in messages)
+
+
+def _keep_alive(version: bytes, headers: Dict[bytes, bytes]) -> bool:
+    """按HTTP版本和Connection头判断连接能否继续使用"""
+    connection = headers.get(b"connection", b"").lower()
+    if version.strip().upper() == b"HTTP/1.0":
+        return b"keep-alive" in connection
+    return b"close" not in connection
+
+
+def _body_length(headers: Dict[bytes, bytes]) -> Optional[int]:
+    """Content-Length声明的长度，chunked编码或没有声明时为None"""
+    if b"chunked" in headers.get(b"transfer-encoding", b"").lower():
+        return None
+    if b"content-length" not in headers:
+        return None
+    length = int(headers[b"content-length"])
+    if length < 0:
+        raise ValueError("Content-Length不能为负数")
+    return length
+
+
+async def _copy_exact(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                      length: int, observe=None) -> None:
+    """转发length个字节"""
+    while length:
+        data = await reader.read(min(length, _CHUNK_SIZE))
+        if not data:
+            raise asyncio.IncompleteReadError(b"", length)
+        length -= len(data)
+        if observe is not None:
+            observe(data)
+        writer.write(data)
+        await writer.drain()
+
+
+async def _copy_body(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                     headers: Dict[bytes, bytes], until_eof: bool, observe=None) -> None:
+    """
+    按消息的长度信息转发消息体
+
+    Args:
+        reader: 读取端
+        writer: 写入端
+        headers: 消息头
+        until_eof: 没有长度信息时是否一直读到连接关闭（响应），否则视为没有消息体（请求）
+        observe: 查看转发数据的函数
+    """
+    if b"chunked" in headers.get(b"transfer-encoding", b"").lower():
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            writer.write(line)
+            size = int(line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                # 结尾的trailer以空行结束
+                while line != b"\r\n":
+                    line = await reader.readuntil(b"\r\n")
+                    writer.write(line)
+                break
+            await _copy_exact(reader, writer, size + 2, observe)
+    else:
+        length = _body_length(headers)
+        if length is not None:
+            await _copy_exact(reader, writer, length, observe)
+        elif until_eof:
+            while True:
+                data = await reader.read(_CHUNK_SIZE)
+                if not data:
+                    break
+                if observe is not None:
+                    observe(data)
+                writer.write(data)
+                await writer.drain()
+    await writer.drain()
+
+
+class SessionRoutes:
+    """
+    会话ID到工作进程的映射
+
+    会话在工作进程中创建后登记，会话结束（DELETE）或工作进程重启时移除，
+    超过上限时淘汰最久未使用的会话
+    """
+
+    def __init__(self, max_sessions: int = _MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._routes: "OrderedDict[bytes, int]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+    def get(self, session: bytes) -> Optional[int]:
+        """会话所在的工作进程序号，未知时返回None"""
+        worker = self._routes.get(session)
+        if worker is not None:
+            self._routes.move_to_end(session)
+        return worker
+
+    def learn(self, session: bytes, worker: int) -> None:
+        """登记会话所在的工作进程"""
+        self._routes[session] = worker
+        self._routes.move_to_end(session)
+        while len(self._routes) > self.max_sessions:
+            self._routes.popitem(last=False)
+
+    def forget(self, session: bytes) -> None:
+        """移除已结束的会话"""
+        self._routes.pop(session, None)
+
+    def forget_worker(self, worker: int) -> None:
+        """移除某个工作进程上的全部会话（进程重启后会话已不存在）"""
+        for session in [key for key, value in self._routes.items() if value == worker]:
+            del self._routes[session]
+
+
+class WorkerPool:
+    """
+    工作进程池与会话路由
+
+    工作进程意外退出时自动重新启动，端口不变；该进程上的会话随进程一起失效，
+    客户端需要重新初始化（进程内的游标等状态会丢失）
+    """
+
+    def __init__(self, workers: int, transport: str = "http", path: str = None):
+        """
+        初始化工作进程池
+
+        Args:
+            workers: 工作进程数量
+            transport: 工作进程使用的传输方式，http或sse
+            path: HTTP端点路径
+        """
+        if workers < 1:
+            raise ValueError("工作进程数量必须大于0")
+        if transport not in ("http", "sse"):
+            raise ValueError("多进程模式只支持http和sse传输")
+        self.transport = transport
+        self.path = path
+        self.ports = [_free_port("127.0.0.1") for _ in range(workers)]
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._closing = False
+        self.routes = SessionRoutes()
+        self._next_worker = 0
+
+    def _start(self, index: int) -> None:
+        """启动第index个工作进程"""
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, self.transport, self.ports[index], self.path, os.getpid()),
+            name=f"mongo-atlas-mcp-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+        logger.info(f"工作进程 {index} 已启动（pid={process.pid}，端口 {self.ports[index]}）")
+
+    async def _supervise(self) -> None:
+        """重新启动意外退出的工作进程"""
+        while not self._closing:
+            await asyncio.sleep(_RESTART_DELAY)
+            for index, process in enumerate(self._processes):
+                if process is not None and not process.is_alive() and not self._closing:
+                    logger.warning(f"工作进程 {index} 已退出（exitcode={process.exitcode}），重新启动")
+                    self.routes.forget_worker(index)
+                    self._start(index)
+
+    def route(self, method: bytes, target: bytes, headers: Dict[bytes, bytes],
+              body: Optional[bytes], peer: Optional[Tuple]) -> int:
+        """
+        选择处理请求的工作进程
+
+        Args:
+            method: 请求方法
+            target: 请求路径（含查询参数）
+            headers: 请求头
+            body: 预先读取的请求体，没有读取时为None
+            peer: 客户端地址
+
+        Returns:
+            工作进程序号
+        """
+        session = request_session(target, headers)
+        if session is not None:
+            worker = self.routes.get(session)
+            if worker is not None:
+                return worker
+            # 未登记的会话（例如主进程重启过）按会话ID固定选择，工作进程会答复会话不存在
+            return zlib.crc32(session) % len(self.ports)
+        if (self.transport == "sse" and method == b"GET") or starts_session(body):
+            # 新会话还没有任何状态，轮流分配给各进程
+            worker = self._next_worker
+            self._next_worker = (worker + 1) % len(self.ports)
+            return worker
+        return zlib.crc32(session_key(headers, peer)) % len(self.ports)
+
+    async def _upstream(self, upstreams: Dict[int, _Upstream],
+                        worker: int) -> Tuple[_Upstream, bool]:
+        """
+        获取到工作进程的连接，同一客户端连接上复用
+
+        Returns:
+            (连接, 是否为复用的已有连接)
+        """
+        upstream = upstreams.get(worker)
+        if upstream is not None and upstream.reusable:
+            return upstream, True
+        if upstream is not None:
+            upstream.writer.close()
+        reader, writer = await asyncio.open_connection(
+            "127.0.0.1", self.ports[worker], limit=_MAX_HEADER_BYTES
+        )
+        upstream = upstreams[worker] = _Upstream(reader, writer)
+        return upstream, False
+
+    async def _pipe(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """把一个方向的字节流原样转发，直到对端关闭（协议升级后使用）"""
+        try:
+            while True:
+                data = await reader.read(_CHUNK_SIZE)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            try:
+                writer.write_eof()
+            except (OSError, RuntimeError):
+                writer.close()
+
+    async def _forward(self, client_reader: asyncio.StreamReader,
+                       client_writer: asyncio.StreamWriter, peer: Optional[Tuple],
+                       upstreams: Dict[int, _Upstream]) -> bool:
+        """
+        转发连接上的一个请求及其响应
+
+        Returns:
+            客户端连接能否继续用于下一个请求
+        """
+        try:
+            head = await client_reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError:
+            client_writer.write(b"HTTP/1.1 431 Request Header Fields Too Large\r\nConnection: close\r\n\r\n")
+            return False
+        except asyncio.IncompleteReadError:
+            return False
+        try:
+            request_line, headers = parse_head(head)
+            method, target, version = request_line
+            length = _body_length(headers)
+        except ValueError:
+            client_writer.write(b"HTTP/1.1 400 Bad Request\r\nConnection: close\r\n\r\n")
+            return False
+
+        expect_continue = headers.get(b"expect", b"").lower() == b"100-continue"
+        body = None
+        if length is not None and length <= _MAX_PEEK_BYTES and not expect_continue:
+            body = await client_reader.readexactly(length)
+        worker = self.route(method, target, headers, body, peer)
+        upstream_head = forwarded_head(head, peer)
+        # 请求体已经预读、等待100-continue后才发送或没有请求体时，可以在新连接上重发
+        replayable = body is not None or expect_continue or (
+            length is None and b"chunked" not in headers.get(b"transfer-encoding", b"").lower()
+        )
+        for attempt in range(2):
+            try:
+                upstream, reused = await self._upstream(upstreams, worker)
+            except OSError:
+                client_writer.write(b"HTTP/1.1 503 Service Unavailable\r\nConnection: close\r\n\r\n")
+                return False
+            try:
+                upstream.writer.write(upstream_head)
+                if body is not None:
+                    upstream.writer.write(body)
+                elif not expect_continue:
+                    await _copy_body(client_reader, upstream.writer, headers, until_eof=False)
+                await upstream.writer.drain()
+                response_head = await upstream.reader.readuntil(b"\r\n\r\n")
+                break
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # 还没有向客户端发送任何响应：复用的连接可能已被工作进程关闭，在新连接上重发一次
+                upstreams.pop(worker).writer.close()
+                if attempt == 0 and reused and replayable:
+                    continue
+                client_writer.write(b"HTTP/1.1 502 Bad Gateway\r\nConnection: close\r\n\r\n")
+                return False
+
+        while True:
+            status_line, response_headers = parse_head(response_head)
+            status = int(status_line[1])
+            client_writer.write(response_head)
+            if status == 101:
+                # 协议升级后不再是HTTP请求，原样双向转发
+                upstreams.pop(worker)
+                await asyncio.gather(
+                    self._pipe(client_reader, upstream.writer),
+                    self._pipe(upstream.reader, client_writer)
+                )
+                return False
+            if status >= 200:
+                break
+            if status == 100 and expect_continue:
+                await client_writer.drain()
+                await _copy_body(client_reader, upstream.writer, headers, until_eof=False)
+                await upstream.writer.drain()
+                expect_continue = False
+            response_head = await upstream.reader.readuntil(b"\r\n\r\n")
+
+        session = response_headers.get(b"mcp-session-id")
+        if session:
+            self.routes.learn(session, worker)
+        if method == b"DELETE" and 200 <= status < 300:
+            ended = request_session(target, headers)
+            if ended is not None:
+                self.routes.forget(ended)
+
+        observe = None
+        learned: List[bytes] = []
+        if (self.transport == "sse" and method == b"GET"
+                and b"text/event-stream" in response_headers.get(b"content-type", b"")):
+
+            def observe(data: bytes) -> None:
+                # SSE会话ID在连接建立后的第一个endpoint事件中
+                if not learned:
+                    match = _SSE_SESSION.search(data)
+                    if match:
+                        self.routes.learn(match.group(1), worker)
+                        learned.append(match.group(1))
+
+        framed = (b"chunked" in response_headers.get(b"transfer-encoding", b"").lower()
+                  or b"content-length" in response_headers)
+        if method == b"HEAD" or status in (204, 304):
+            await client_writer.drain()
+            framed = True
+        else:
+            try:
+                await _copy_body(upstream.reader, client_writer, response_headers, until_eof=True,
+                                 observe=observe)
+            finally:
+                # SSE会话随事件流结束
+                for ended in learned:
+                    self.routes.forget(ended)
+        upstream.last_used = time.monotonic()
+        if not framed or not _keep_alive(status_line[0], response_headers):
+            upstreams.pop(worker).writer.close()
+        return (framed and not expect_continue and _keep_alive(version, headers)
+                and _keep_alive(status_line[0], response_headers))
+
+    async def _handle(self, client_reader: asyncio.StreamReader,
+                      client_writer: asyncio.StreamWriter) -> None:
+        """接受一个客户端连接，逐个请求按会话转发到工作进程"""
+        peer = client_writer.get_extra_info("peername")
+        upstreams: Dict[int, _Upstream] = {}
+        try:
+            while await self._forward(client_reader, client_writer, peer, upstreams):
+                pass
+            await client_writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ValueError, IndexError):
+            # 任一端中途断开或发送了无法解析的消息，关闭连接
+            pass
+        finally:
+            for upstream in upstreams.values():
+                upstream.writer.close()
+            client_writer.close()
+
+    async def serve(self, host: str, port: int) -> None:
+        """
+        启动工作进程并在host:port上接受连接，直到收到SIGINT/SIGTERM或被取消
+
+        Args:
+            host: 监听地址
+            port: 监听端口
+        """
+        for index in range(len(self.ports)):
+            self._start(index)
+        supervisor = asyncio.create_task(self._supervise())
+        server = await asyncio.start_server(self._handle, host, port, limit=_MAX_HEADER_BYTES)
+        logger.info(f"多进程模式：{len(self.ports)} 个工作进程，监听 {host}:{port}")
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stop.set)
+            except (NotImplementedError, RuntimeError):
+                # Windows不支持事件循环信号处理，依赖KeyboardInterrupt
+                pass
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            self._closing = True
+            supervisor.cancel()
+            self.close()
+
+    def close(self) -> None:
+        """停止所有工作进程"""
+        self._closing = True
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            if process is not None:
+                process.join(timeout=10)
@@ -5,6 +5,7 @@ MongoDB Atlas MCP 服务器启动脚本
 用于启动MCP服务器
 """
 
+import argparse
 import asyncio
 import os
 import sys
@@ -14,16 +15,30 @@ from dotenv import load_dotenv
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from mongo_atlas_mcp.server import MongoAtlasMCPServer
+from mongo_atlas_mcp.workers import WorkerPool
 
 
 def main():
     """
     主启动函数
     
-    启动MongoDB Atlas MCP服务器
+    启动MongoDB Atlas MCP服务器。默认使用stdio传输；--transport http 或 sse 时
+    以一个长期运行的进程同时服务多个客户端会话，--workers 大于1时由多个工作进程分担
     """
+    parser = argparse.ArgumentParser(description="MongoDB Atlas MCP 服务器")
+    parser.add_argument("--transport", choices=["stdio", "http", "sse"],
+                        help="传输方式，默认MCP_TRANSPORT或stdio")
+    parser.add_argument("--host", help="HTTP监听地址，默认MCP_HOST或127.0.0.1")
+    parser.add_argument("--port", type=int, help="HTTP监听端口，默认MCP_PORT或8000")
+    parser.add_argument("--path", help="HTTP端点路径，默认/mcp（sse为/sse）")
+    parser.add_argument("--workers", type=int,
+                        help="工作进程数量（仅http/sse），默认MCP_WORKERS或1")
+    args = parser.parse_args()
+    
     # 加载环境变量
     load_dotenv()
+    transport = args.transport or os.getenv('MCP_TRANSPORT', 'stdio')
+    workers = args.workers or int(os.getenv('MCP_WORKERS', '1'))
     
     # 检查环境变量
     if not os.getenv('MONGODB_URI'):
@@ -33,13 +48,24 @@ def main():
         return
     
     try:
+        if workers > 1:
+            # 主进程只转发连接，每个工作进程有自己的数据库连接
+            pool = WorkerPool(workers, transport, args.path)
+            print(f"MongoDB Atlas MCP 服务器启动中（{workers} 个工作进程）...")
+            print("按 Ctrl+C 停止服务器")
+            asyncio.run(pool.serve(
+                args.host or os.getenv('MCP_HOST', '127.0.0.1'),
+                args.port or int(os.getenv('MCP_PORT', '8000'))
+            ))
+            return
+        
         # 创建并启动服务器
         server = MongoAtlasMCPServer()
         print("MongoDB Atlas MCP 服务器启动中...")
         print("按 Ctrl+C 停止服务器")
         
         # 运行服务器
-        asyncio.run(server.run())
+        asyncio.run(server.run(transport, args.host, args.port, args.path))
         
     except KeyboardInterrupt:
         print("\n服务器已停止")
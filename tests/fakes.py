@@ -0,0 +1,76 @@
+"""
+测试用的内存集合，只实现元数据集合用到的方法和 等值/$in 过滤
+"""
+
+import copy
+from types import SimpleNamespace
+
+from pymongo.errors import DuplicateKeyError
+
+
+def _matches(document, filter_dict):
+    for key, condition in filter_dict.items():
+        value = document.get(key)
+        if isinstance(condition, dict) and "$in" in condition:
+            if value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeCollection:
+    """按_id保存文档的集合"""
+
+    def __init__(self):
+        self.documents = {}
+
+    def _first(self, filter_dict):
+        return next((d for d in self.documents.values() if _matches(d, filter_dict)), None)
+
+    def find(self, filter_dict=None, projection=None, sort=None, limit=0):
+        found = [copy.deepcopy(d) for d in self.documents.values() if _matches(d, filter_dict or {})]
+        for key, direction in reversed(sort or []):
+            found.sort(key=lambda d: d.get(key), reverse=direction < 0)
+        return found[:limit] if limit else found
+
+    def find_one(self, filter_dict, projection=None):
+        document = self._first(filter_dict)
+        return copy.deepcopy(document)
+
+    def insert_one(self, document):
+        if document["_id"] in self.documents:
+            raise DuplicateKeyError("duplicate key")
+        self.documents[document["_id"]] = copy.deepcopy(document)
+
+    def find_one_and_replace(self, filter_dict, replacement, upsert=False):
+        before = self._first(filter_dict)
+        if before is None:
+            if upsert:
+                self.insert_one(replacement)
+            return None
+        self.documents[before["_id"]] = copy.deepcopy(replacement)
+        return before
+
+    def replace_one(self, filter_dict, replacement, upsert=False):
+        self.find_one_and_replace(filter_dict, replacement, upsert)
+
+    def find_one_and_update(self, filter_dict, update, projection=None):
+        document = self._first(filter_dict)
+        if document is None:
+            return None
+        before = copy.deepcopy(document)
+        document.update(copy.deepcopy(update.get("$set", {})))
+        for key in update.get("$unset", {}):
+            document.pop(key, None)
+        return before
+
+    def update_one(self, filter_dict, update):
+        before = self.find_one_and_update(filter_dict, update)
+        return SimpleNamespace(matched_count=int(before is not None))
+
+    def delete_one(self, filter_dict):
+        document = self._first(filter_dict)
+        if document is not None:
+            del self.documents[document["_id"]]
+        return SimpleNamespace(deleted_count=int(document is not None))
@@ -0,0 +1,89 @@
+"""
+测试准入控制
+"""
+
+import asyncio
+
+import pytest
+
+from mongo_atlas_mcp.admission import AdmissionController, Overloaded, is_expensive, namespace_of
+
+
+def test_is_expensive_classification():
+    assert is_expensive("aggregate", {})
+    assert not is_expensive("find_documents", {"limit": 10})
+    assert is_expensive("find_documents", {})
+    assert is_expensive("delete_document", {"multi": True})
+    assert not is_expensive("delete_document", {"multi": True, "chunked": True})
+    assert is_expensive("create_indexes", {"wait": True})
+    assert not is_expensive("create_indexes", {})
+
+
+def test_namespace_of():
+    assert namespace_of({"database": "db", "collection": "c"}) == "db.c"
+    assert namespace_of({"database": "db"}) == "db"
+    assert namespace_of({}) is None
+
+
+def test_namespace_limit_serializes_calls():
+    async def run():
+        controller = AdmissionController(max_per_namespace=1, queue_timeout=1)
+        active = []
+        peak = []
+
+        async def call():
+            async with controller.admit("db.c", expensive=False):
+                active.append(1)
+                peak.append(len(active))
+                await asyncio.sleep(0.01)
+                active.pop()
+
+        await asyncio.gather(*(call() for _ in range(3)))
+        return max(peak)
+
+    assert asyncio.run(run()) == 1
+
+
+def test_queue_full_rejects_immediately():
+    async def run():
+        controller = AdmissionController(max_expensive=1, max_queue=0)
+        async with controller.admit(None, expensive=True):
+            with pytest.raises(Overloaded):
+                async with controller.admit(None, expensive=True):
+                    pass
+
+    asyncio.run(run())
+
+
+def test_queue_timeout_rejects_and_releases():
+    async def run():
+        controller = AdmissionController(max_per_namespace=1, queue_timeout=0.01)
+        async with controller.admit("db.c", expensive=False):
+            with pytest.raises(Overloaded):
+                async with controller.admit("db.c", expensive=False):
+                    pass
+        # 超时的调用不能占用名额
+        async with controller.admit("db.c", expensive=False):
+            pass
+        return controller
+
+    controller = asyncio.run(run())
+    assert controller._lanes["cheap"]._value == 32
+    assert controller._global._value == 32
+
+
+def test_idle_namespaces_are_dropped():
+    async def run():
+        controller = AdmissionController(max_per_namespace=1, queue_timeout=1)
+
+        async def call(namespace):
+            async with controller.admit(namespace, expensive=False):
+                assert namespace in controller._namespaces
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(call(f"db.c{i % 5}") for i in range(20)))
+        return controller
+
+    controller = asyncio.run(run())
+    assert controller._namespaces == {}
+    assert controller._namespace_users == {}
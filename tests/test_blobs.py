@@ -0,0 +1,102 @@
+"""
+测试GridFS文件传输的范围读取与本地文件处理
+"""
+
+import hashlib
+import os
+
+import pytest
+
+from mongo_atlas_mcp.blobs import (
+    BlobError, RangeReader, chunk_span, read_file_blocks, resolve_local_path, write_atomically
+)
+
+
+class FakeChunks:
+    """按 files_id 和 n 范围返回块的chunks集合"""
+
+    def __init__(self, data, chunk_size, missing=()):
+        self.chunks = [
+            {"files_id": 1, "n": n, "data": data[start:start + chunk_size]}
+            for n, start in enumerate(range(0, len(data), chunk_size))
+            if n not in missing
+        ]
+        self.queries = 0
+
+    def find(self, filter_dict, projection=None, sort=None):
+        self.queries += 1
+        bounds = filter_dict["n"]
+        return iter([
+            {"n": chunk["n"], "data": chunk["data"]} for chunk in self.chunks
+            if chunk["files_id"] == filter_dict["files_id"]
+            and bounds["$gte"] <= chunk["n"] < bounds["$lt"]
+        ])
+
+
+DATA = bytes(range(256)) * 4
+FILE = {"_id": 1, "chunkSize": 10, "length": len(DATA)}
+
+
+def test_chunk_span():
+    assert chunk_span(FILE, 0, 10) == (0, 1, 0)
+    assert chunk_span(FILE, 5, 10) == (0, 2, 5)
+    assert chunk_span(FILE, 25, 0) == (2, 2, 5)
+
+
+@pytest.mark.parametrize("offset,length", [(0, len(DATA)), (7, 123), (1000, 24), (30, 0)])
+def test_range_reader_returns_exact_bytes(offset, length):
+    reader = RangeReader(FakeChunks(DATA, 10), parallelism=3, batch_chunks=2)
+    out = []
+    assert reader.read(FILE, offset, length, out.append) == length
+    assert b"".join(out) == DATA[offset:offset + length]
+
+
+def test_range_reader_queries_through_executor():
+    calls = []
+
+    def execute(fn):
+        calls.append(1)
+        return fn()
+
+    chunks = FakeChunks(DATA, 10)
+    RangeReader(chunks, batch_chunks=4, execute=execute).read(FILE, 0, 80, lambda block: None)
+    assert len(calls) == chunks.queries == 2
+
+
+def test_range_reader_reports_missing_chunk():
+    reader = RangeReader(FakeChunks(DATA, 10, missing={3}), batch_chunks=2)
+    with pytest.raises(BlobError, match="缺少块 3"):
+        reader.read(FILE, 0, 100, lambda block: None)
+
+
+def test_resolve_local_path_stays_inside_base(tmp_path):
+    assert resolve_local_path(str(tmp_path), "a/b.bin") == str(tmp_path / "a" / "b.bin")
+    with pytest.raises(BlobError):
+        resolve_local_path(str(tmp_path), "../outside.bin")
+    with pytest.raises(BlobError):
+        resolve_local_path(str(tmp_path), "/etc/passwd")
+
+
+def test_read_file_blocks_updates_digest(tmp_path):
+    path = tmp_path / "f.bin"
+    path.write_bytes(DATA)
+    digest = hashlib.sha256()
+    blocks = list(read_file_blocks(str(path), 100, digest))
+    assert b"".join(blocks) == DATA and len(blocks) == 11
+    assert digest.hexdigest() == hashlib.sha256(DATA).hexdigest()
+
+
+def test_write_atomically(tmp_path):
+    target = str(tmp_path / "out" / "f.bin")
+    assert write_atomically(target, False, lambda f: f.write(b"abc")) == 3
+    with pytest.raises(BlobError, match="已存在"):
+        write_atomically(target, False, lambda f: f.write(b"x"))
+
+    def failing(f):
+        f.write(b"partial")
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        write_atomically(target, True, failing)
+    assert open(target, "rb").read() == b"abc"
+    assert not os.path.exists(target + ".part")
@@ -0,0 +1,68 @@
+"""
+测试分批任务的批大小调整和多个进程共用任务元数据
+"""
+
+import datetime
+
+from mongo_atlas_mcp.bulkjobs import (
+    CANCELLED, INTERRUPTED, RUNNING, BatchSizer, BulkJob, JobStore
+)
+from tests.fakes import FakeCollection
+
+
+def test_batch_sizer_is_additive_increase_multiplicative_decrease():
+    sizer = BatchSizer(1000, 10, 2000, target_ms=500)
+    assert sizer.update(100) == 1250
+    assert sizer.update(300) == 1250
+    assert sizer.update(800) == 625
+    assert sizer.update(100, lagging=True) == 312
+    for _ in range(20):
+        sizer.update(10)
+    assert sizer.size == 2000
+
+
+def running_job(store):
+    job = BulkJob("delete", "db", "c", {"status": "old"})
+    store.save(job)
+    return job
+
+
+def test_other_process_sees_running_job_until_it_goes_stale():
+    collection = FakeCollection()
+    runner, other = JobStore(lambda: collection), JobStore(lambda: collection)
+    job = running_job(runner)
+    assert other.get(job.job_id).status == RUNNING
+
+    collection.documents[job.job_id]["updated_at"] -= datetime.timedelta(seconds=600)
+    assert other.get(job.job_id).status == INTERRUPTED
+    assert [listed.status for listed in other.list()] == [INTERRUPTED]
+
+
+def test_cancel_from_other_process_is_seen_on_next_save():
+    collection = FakeCollection()
+    runner, other = JobStore(lambda: collection), JobStore(lambda: collection)
+    job = running_job(runner)
+    other.request_cancel(other.get(job.job_id))
+    assert not job.cancel_requested.is_set()
+    runner.save(job)
+    assert job.cancel_requested.is_set()
+    job.finish(CANCELLED)
+    runner.save(job)
+    assert other.get(job.job_id).status == CANCELLED
+
+
+def test_only_one_process_can_resume_a_job():
+    collection = FakeCollection()
+    runner = JobStore(lambda: collection)
+    first, second = JobStore(lambda: collection), JobStore(lambda: collection)
+    job = running_job(runner)
+    collection.documents[job.job_id]["updated_at"] -= datetime.timedelta(seconds=600)
+    seen_by_first, seen_by_second = first.get(job.job_id), second.get(job.job_id)
+    assert seen_by_first.status == seen_by_second.status == INTERRUPTED
+
+    assert first.claim(seen_by_first)
+    assert not second.claim(seen_by_second)
+    # 原进程仍在运行时，下次保存进度发现任务已被恢复，停止执行且不覆盖进度
+    runner.save(job)
+    assert job.cancel_requested.is_set()
+    assert collection.documents[job.job_id]["owner"] == first.owner
@@ -0,0 +1,48 @@
+"""
+测试结果缓存
+"""
+
+import time
+
+from mongo_atlas_mcp.cache import MISSING, TTLCache, cache_key
+
+
+def test_cache_key_serializes_documents():
+    assert cache_key("db.c", {"a": 1}, [1, 2], 5) == ("db.c", '{"a": 1}', "[1, 2]", 5)
+    assert cache_key("db.c", {"a": 1}) == cache_key("db.c", {"a": 1})
+    assert cache_key("db.c", {"a": 1}) != cache_key("db.c", {"a": 2})
+
+
+def test_get_returns_missing_after_ttl():
+    cache = TTLCache(ttl=0.01)
+    cache.set("k", None)
+    assert cache.get("k") is None
+    time.sleep(0.02)
+    assert cache.get("k") is MISSING
+
+
+def test_per_entry_ttl_overrides_default():
+    cache = TTLCache(ttl=0.01)
+    cache.set("k", 1, ttl=60)
+    time.sleep(0.02)
+    assert cache.get("k") == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_invalidate_namespace_only_drops_matching_keys():
+    cache = TTLCache()
+    cache.set(cache_key("db.a", "count"), 1)
+    cache.set(cache_key("db.a", "distinct", "x"), 2)
+    cache.set(cache_key("db.ab", "count"), 3)
+    assert cache.invalidate_namespace("db.a") == 2
+    assert cache.get(cache_key("db.ab", "count")) == 3
@@ -0,0 +1,91 @@
+"""
+测试游标注册表与分页读取
+"""
+
+import time
+
+from mongo_atlas_mcp.cursors import CursorEntry, CursorRegistry
+
+
+class FakeCursor:
+    """按顺序返回文档的游标"""
+
+    def __init__(self, documents):
+        self._documents = iter(documents)
+        self.alive = True
+        self.closed = False
+
+    def __next__(self):
+        try:
+            return next(self._documents)
+        except StopIteration:
+            self.alive = False
+            raise
+
+    def close(self):
+        self.closed = True
+        self.alive = False
+
+
+def make_entry(count, padding=0):
+    documents = [{"_id": i, "pad": "x" * padding} for i in range(count)]
+    return CursorEntry(FakeCursor(documents), "test.items")
+
+
+def test_read_page_respects_page_size():
+    entry = make_entry(5)
+    assert [d["_id"] for d in entry.read_page(2, 1 << 20)] == [0, 1]
+    assert [d["_id"] for d in entry.read_page(2, 1 << 20)] == [2, 3]
+    assert [d["_id"] for d in entry.read_page(2, 1 << 20)] == [4]
+    assert entry.exhausted
+
+
+def test_read_page_keeps_overflow_document_for_next_page():
+    entry = make_entry(3, padding=1000)
+    first = entry.read_page(10, 1500)
+    assert [d["_id"] for d in first] == [0]
+    assert entry.pending["_id"] == 1
+    assert [d["_id"] for d in entry.read_page(10, 1500)] == [1]
+    assert not entry.exhausted
+
+
+def test_read_page_returns_at_least_one_document():
+    entry = make_entry(2, padding=5000)
+    assert len(entry.read_page(10, 10)) == 1
+
+
+def test_registry_evicts_least_recently_used():
+    registry = CursorRegistry(ttl_seconds=600, max_cursors=2)
+    entries = [make_entry(1) for _ in range(3)]
+    ids = [registry.register(entry) for entry in entries[:2]]
+    registry.get(ids[0])
+    registry.register(entries[2])
+    assert registry.get(ids[1]) is None
+    assert entries[1].cursor.closed
+    assert registry.get(ids[0]) is entries[0]
+
+
+def test_registry_expires_idle_cursors():
+    registry = CursorRegistry(ttl_seconds=0.01, max_cursors=10)
+    entry = make_entry(1)
+    cursor_id = registry.register(entry)
+    time.sleep(0.02)
+    assert registry.get(cursor_id) is None
+    assert entry.cursor.closed
+
+
+def test_pop_owned_by_removes_only_matching_operation():
+    registry = CursorRegistry()
+    owned, other = make_entry(1), make_entry(1)
+    owned.owner = "op-1"
+    registry.register(owned)
+    other_id = registry.register(other)
+    assert registry.pop_owned_by("op-1") == [owned]
+    assert registry.get(other_id) is other
+
+
+def test_close_reports_unknown_cursor():
+    registry = CursorRegistry()
+    cursor_id = registry.register(make_entry(1))
+    assert registry.close(cursor_id)
+    assert not registry.close(cursor_id)
@@ -0,0 +1,96 @@
+"""
+测试Extended JSON参数解析
+"""
+
+import datetime
+
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from bson.regex import Regex
+
+from mongo_atlas_mcp.ejson import ExtendedJsonDecoder, coerce_object_ids, decode_value
+
+HEX = "507f1f77bcf86cd799439011"
+
+
+def test_decode_value_converts_type_wrappers():
+    decoded = decode_value({
+        "_id": {"$oid": HEX},
+        "at": {"$date": "2026-01-01T00:00:00Z"},
+        "price": {"$numberDecimal": "1.10"},
+        "name": {"$regularExpression": {"pattern": "^a", "options": "i"}},
+    })
+    assert decoded["_id"] == ObjectId(HEX)
+    assert decoded["at"] == datetime.datetime(2026, 1, 1)
+    assert decoded["price"] == Decimal128("1.10")
+    assert decoded["name"] == Regex("^a", "i")
+
+
+def test_decode_value_returns_unchanged_objects():
+    value = {"status": "paid", "tags": ["a", {"k": 1}]}
+    assert decode_value(value) is value
+
+
+def test_decode_value_does_not_mutate_input():
+    value = {"$set": {"at": {"$date": "2026-01-01T00:00:00Z"}}}
+    decode_value(value)
+    assert value == {"$set": {"at": {"$date": "2026-01-01T00:00:00Z"}}}
+
+
+def test_regex_operator_and_dbref_are_left_as_query():
+    regex = {"name": {"$regex": "^a", "$options": "i"}}
+    assert decode_value(regex) is regex
+    ref = {"$set": {"ref": {"$ref": "coll", "$id": 1}}}
+    assert decode_value(ref) == {"$set": {"ref": {"$ref": "coll", "$id": 1}}}
+
+
+def test_coerce_object_ids():
+    coerced = coerce_object_ids({
+        "_id": {"$in": [HEX, "not-hex"]},
+        "owner._id": HEX,
+        "name": HEX,
+        "$or": [{"_id": HEX}],
+    })
+    assert coerced["_id"] == {"$in": [ObjectId(HEX), "not-hex"]}
+    assert coerced["owner._id"] == ObjectId(HEX)
+    assert coerced["name"] == HEX
+    assert coerced["$or"] == [{"_id": ObjectId(HEX)}]
+
+
+def test_coerce_object_ids_descends_into_not_and_elem_match():
+    coerced = coerce_object_ids({
+        "_id": {"$not": {"$eq": HEX}},
+        "items": {"$elemMatch": {"_id": HEX, "qty": {"$gt": 1}}},
+    })
+    assert coerced["_id"] == {"$not": {"$eq": ObjectId(HEX)}}
+    assert coerced["items"] == {"$elemMatch": {"_id": ObjectId(HEX), "qty": {"$gt": 1}}}
+
+
+def test_decoder_coerces_ids_in_sub_pipelines():
+    decoder = ExtendedJsonDecoder(coerce_ids=True)
+    pipeline = [
+        {"$match": {"_id": HEX}},
+        {"$lookup": {"from": "c", "as": "x", "pipeline": [{"$match": {"_id": HEX}}]}},
+        {"$facet": {"a": [{"$match": {"_id": HEX}}]}},
+    ]
+    decoded = decoder.decode_pipeline(pipeline)
+    assert decoded[0]["$match"]["_id"] == ObjectId(HEX)
+    assert decoded[1]["$lookup"]["pipeline"][0]["$match"]["_id"] == ObjectId(HEX)
+    assert decoded[2]["$facet"]["a"][0]["$match"]["_id"] == ObjectId(HEX)
+    assert pipeline[1]["$lookup"]["pipeline"][0]["$match"]["_id"] == HEX
+
+
+def test_decoder_caches_and_skips_plain_arguments():
+    decoder = ExtendedJsonDecoder()
+    arguments = {"filter": {"status": "paid"}, "limit": 10}
+    assert decoder.decode_arguments(arguments) is arguments
+
+    raw = {"_id": {"$oid": HEX}}
+    first = decoder.decode_filter(raw)
+    assert decoder.decode_filter({"_id": {"$oid": HEX}}) is first
+    assert first == {"_id": ObjectId(HEX)}
+
+
+def test_ids_are_not_coerced_by_default():
+    decoder = ExtendedJsonDecoder()
+    assert decoder.decode_filter({"_id": HEX}) == {"_id": HEX}
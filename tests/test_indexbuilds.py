@@ -0,0 +1,52 @@
+"""
+测试索引构建进度整理
+"""
+
+from mongo_atlas_mcp.indexbuilds import IndexBuildRegistry, summarize_operation
+
+
+def op(seconds, done, total, msg="Index Build: inserting keys from external sorter into index"):
+    return {
+        "opid": 7, "ns": "db.c", "msg": msg,
+        "microsecs_running": seconds * 1_000_000,
+        "progress": {"done": done, "total": total},
+        "command": {"createIndexes": "c", "indexes": [{"name": "a_1"}]},
+    }
+
+
+def test_single_observation_uses_operation_average():
+    summary = summarize_operation(op(100, 50, 100))
+    assert summary["percent"] == 50.0
+    assert summary["eta_s"] == 100.0
+    assert summary["eta_basis"] == "operation"
+    assert summary["indexes"] == ["a_1"]
+
+
+def test_eta_uses_rate_within_current_phase():
+    registry = IndexBuildRegistry()
+    # 扫描阶段用了90秒，第二阶段开始后速度快得多
+    first = registry.summarize([op(100, 100, 1000)])[0]
+    assert first["eta_basis"] == "operation"
+    second = registry.summarize([op(110, 600, 1000)])[0]
+    assert second["eta_basis"] == "phase"
+    assert second["eta_s"] == 8.0
+
+
+def test_phase_change_resets_rate():
+    registry = IndexBuildRegistry()
+    registry.summarize([op(10, 500, 1000, msg="Index Build: scanning collection")])
+    summary = registry.summarize([op(20, 100, 1000)])[0]
+    assert summary["eta_basis"] == "operation"
+
+
+def test_progress_numbers_in_message_do_not_change_phase():
+    registry = IndexBuildRegistry()
+    registry.summarize([op(10, 100, 1000, msg="Index Build: scanning collection 100/1000 10%")])
+    summary = registry.summarize([op(20, 300, 1000, msg="Index Build: scanning collection 300/1000 30%")])[0]
+    assert summary["eta_basis"] == "phase"
+    assert summary["eta_s"] == 35.0
+
+
+def test_finished_or_unknown_progress_has_no_eta():
+    assert summarize_operation(op(10, 1000, 1000))["eta_s"] is None
+    assert summarize_operation({"opid": 1, "secs_running": 3})["eta_s"] is None
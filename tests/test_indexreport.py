@@ -0,0 +1,90 @@
+"""
+测试索引使用分析
+"""
+
+import datetime
+
+from mongo_atlas_mcp.indexreport import (
+    analyze_collection, find_redundant, merge_collection_stats, merge_index_stats, rank_candidates
+)
+
+NOW = datetime.datetime(2026, 1, 10, tzinfo=datetime.timezone.utc)
+
+
+def index(name, *keys, **options):
+    return {"name": name, "key": dict(keys), **options}
+
+
+def test_prefix_index_is_redundant():
+    indexes = [
+        index("_id_", ("_id", 1)),
+        index("a_1", ("a", 1)),
+        index("a_1_b_1", ("a", 1), ("b", 1)),
+        index("a_-1", ("a", -1)),
+    ]
+    assert find_redundant(indexes) == {"a_1": "a_1_b_1"}
+
+
+def test_identical_keys_keep_smaller_name():
+    indexes = [index("b", ("x", 1)), index("a", ("x", 1))]
+    assert find_redundant(indexes) == {"b": "a"}
+
+
+def test_indexes_with_behavior_options_are_not_candidates():
+    indexes = [
+        index("a_u", ("a", 1), unique=True),
+        index("a_ttl", ("a", 1), expireAfterSeconds=60),
+        index("t_text", ("t", "text")),
+        index("a_1_b_1", ("a", 1), ("b", 1)),
+    ]
+    assert find_redundant(indexes) == {}
+
+
+def test_partial_and_sparse_indexes_do_not_cover():
+    indexes = [
+        index("a_1", ("a", 1)),
+        index("a_b_partial", ("a", 1), ("b", 1), partialFilterExpression={"b": {"$exists": True}}),
+        index("a_b_sparse", ("a", 1), ("b", 1), sparse=True),
+    ]
+    assert find_redundant(indexes) == {}
+
+
+def test_merge_stats_across_shards():
+    early = datetime.datetime(2026, 1, 1)
+    late = datetime.datetime(2026, 1, 5)
+    usage = merge_index_stats([
+        {"name": "a_1", "accesses": {"ops": 2, "since": early}},
+        {"name": "a_1", "accesses": {"ops": 3, "since": late}},
+    ])
+    assert usage == {"a_1": {"ops": 5, "since": late}}
+
+    storage = merge_collection_stats([
+        {"storageStats": {"count": 1, "indexSizes": {"a_1": 10}},
+         "latencyStats": {"writes": {"ops": 4}}},
+        {"storageStats": {"count": 2, "indexSizes": {"a_1": 5}}},
+    ])
+    assert storage["count"] == 3
+    assert storage["index_sizes"] == {"a_1": 15}
+    assert storage["write_ops"] == 4
+
+
+def test_unused_requires_minimum_observation_window():
+    indexes = [index("_id_", ("_id", 1)), index("a_1", ("a", 1)), index("b_1", ("b", 1))]
+    stats = [
+        {"name": "_id_", "accesses": {"ops": 0, "since": datetime.datetime(2026, 1, 1)}},
+        {"name": "a_1", "accesses": {"ops": 0, "since": datetime.datetime(2026, 1, 1)}},
+        {"name": "b_1", "accesses": {"ops": 0, "since": datetime.datetime(2026, 1, 9, 12)}},
+    ]
+    report = analyze_collection("db.c", indexes, stats, [], datetime.timedelta(days=7), now=NOW)
+    assert [item["name"] for item in report["drop_candidates"]] == ["a_1"]
+    assert report["drop_candidates"][0]["reasons"] == ["unused"]
+
+
+def test_rank_candidates_orders_by_write_savings():
+    candidates = [
+        {"name": "small", "write_ops_saved": 10, "reasons": ["unused"], "size_bytes": 1},
+        {"name": "busy", "write_ops_saved": 100, "reasons": ["unused"], "size_bytes": None},
+        {"name": "both", "write_ops_saved": 10, "reasons": ["unused", "prefix_of:x"],
+         "size_bytes": 1},
+    ]
+    assert [item["name"] for item in rank_candidates(candidates)] == ["busy", "both", "small"]
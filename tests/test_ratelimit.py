@@ -0,0 +1,58 @@
+"""
+测试令牌桶限流
+"""
+
+from mongo_atlas_mcp.ratelimit import RateLimiter, TokenBucket
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(rate=2, burst=2)
+    bucket.updated = 0.0
+    assert bucket.try_acquire(0.0) == 0
+    assert bucket.try_acquire(0.0) == 0
+    assert bucket.try_acquire(0.0) == 0.5
+    assert bucket.try_acquire(0.5) == 0
+
+
+def test_burst_limits_consecutive_calls():
+    limiter = RateLimiter(rate=1, burst=3)
+    results = [limiter.check("find_documents", "db.c", "s1") for _ in range(4)]
+    assert results[:3] == [0, 0, 0]
+    assert results[3] > 0
+
+
+def test_buckets_are_separate_per_session_and_namespace():
+    limiter = RateLimiter(rate=1, burst=1)
+    assert limiter.check("find_documents", "db.c", "s1") == 0
+    assert limiter.check("find_documents", "db.c", "s1") > 0
+    assert limiter.check("find_documents", "db.c", "s2") == 0
+    assert limiter.check("find_documents", "db.d", "s1") == 0
+
+
+def test_tool_rate_without_burst_does_not_inherit_global_burst():
+    limiter = RateLimiter(rate=50, burst=100, tool_limits={"delete_document": {"rate": 1}})
+    assert limiter._limits_for("delete_document") == (1.0, 1.0)
+    assert limiter.check("delete_document", "db.c", "s1") == 0
+    assert limiter.check("delete_document", "db.c", "s1") > 0
+
+
+def test_tool_overrides():
+    limiter = RateLimiter(rate=50, burst=100, tool_limits={
+        "aggregate": {"rate": 10, "burst": 20},
+        "watch": {"burst": 5},
+        "ping": {"rate": 0},
+    })
+    assert limiter._limits_for("aggregate") == (10.0, 20.0)
+    assert limiter._limits_for("watch") == (50.0, 5.0)
+    assert limiter._limits_for("find_documents") == (50.0, 100.0)
+    assert all(limiter.check("ping", None, "s1") == 0 for _ in range(1000))
+
+
+def test_full_buckets_are_pruned():
+    limiter = RateLimiter(rate=1000, burst=1, max_buckets=2)
+    limiter.check("t", None, "s1")
+    limiter.check("t", None, "s2")
+    for bucket in limiter._buckets.values():
+        bucket.tokens = bucket.burst
+    limiter.check("t", None, "s3")
+    assert list(limiter._buckets) == [("t", None, "s3")]
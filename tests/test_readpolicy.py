@@ -0,0 +1,67 @@
+"""
+测试读取策略
+"""
+
+import pytest
+
+from mongo_atlas_mcp.readpolicy import TRIMMED_KEY, ReadPolicies, ReadPolicy
+
+
+def test_policies_match_most_specific_namespace():
+    policies = ReadPolicies({
+        "shop.orders": {"max_depth": 2},
+        "shop.*": {"max_array_length": 5},
+        "*": {"projection": {"payload": 0}},
+    })
+    assert policies.get("shop", "orders").max_depth == 2
+    assert policies.get("shop", "items").max_array_length == 5
+    assert policies.get("other", "c").projection == {"payload": 0}
+    assert ReadPolicies().get("shop", "orders") is None
+
+
+def test_invalid_configuration_is_rejected():
+    with pytest.raises(ValueError, match="未知配置"):
+        ReadPolicy.from_config({"max_bytes": 1})
+    with pytest.raises(ValueError, match="不能为负数"):
+        ReadPolicy(max_array_length=-1)
+    with pytest.raises(ValueError, match="max_depth"):
+        ReadPolicy(max_depth=100)
+
+
+def test_projection_only_policy_does_not_trim():
+    policy = ReadPolicy(projection={"payload": 0})
+    assert not policy.trims
+    assert policy._stage is None
+
+
+def test_build_pipeline_mirrors_find_and_trims_last():
+    policy = ReadPolicy(projection={"payload": 0}, max_string_length=10)
+    pipeline = policy.build_pipeline({"status": "paid"}, sort=[("created_at", -1)],
+                                     skip=5, limit=10)
+    assert pipeline[:5] == [
+        {"$match": {"status": "paid"}},
+        {"$sort": {"created_at": -1}},
+        {"$skip": 5},
+        {"$limit": 10},
+        {"$project": {"payload": 0}},
+    ]
+    trim = pipeline[5]["$replaceWith"]
+    assert set(trim) == {"doc", "trimmed"}
+    assert policy.build_pipeline(None) == [{"$match": {}}, {"$project": {"payload": 0}}, pipeline[5]]
+
+
+def test_depth_limit_replaces_deep_documents_with_literal():
+    policy = ReadPolicy(max_depth=1)
+    assert repr(policy._stage).count("'$literal': {}") >= 1
+    unlimited = ReadPolicy(max_string_length=10)
+    assert "'$literal': {}" not in repr(unlimited._stage)
+
+
+def test_unwrap_records_trimmed_paths():
+    results = [
+        {"doc": {"_id": 1, "tags": ["a"]}, "trimmed": ["tags", "body"]},
+        {"doc": {"_id": 2}, "trimmed": []},
+    ]
+    documents = list(ReadPolicy.unwrap(results))
+    assert documents[0][TRIMMED_KEY] == ["body", "tags"]
+    assert TRIMMED_KEY not in documents[1]
@@ -0,0 +1,110 @@
+"""
+测试重试策略与熔断器
+"""
+
+import time
+
+import pytest
+from pymongo.errors import (
+    AutoReconnect, ExecutionTimeout, NotPrimaryError, OperationFailure, ServerSelectionTimeoutError
+)
+
+from mongo_atlas_mcp.resilience import (
+    MULTI_WRITE, READ, WRITE, CircuitBreaker, CircuitOpenError, ResilientExecutor, RetryPolicy
+)
+
+
+def executor_with(max_attempts, failure_threshold=5):
+    return ResilientExecutor(
+        CircuitBreaker("c", failure_threshold=failure_threshold),
+        RetryPolicy(max_attempts=max_attempts, base_delay=0)
+    )
+
+
+def failing(errors, result="ok"):
+    """依次抛出errors中的错误，之后返回result"""
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return fn, calls
+
+
+def test_retryable_errors_by_kind():
+    assert RetryPolicy.is_retryable(AutoReconnect("x"), READ)
+    assert not RetryPolicy.is_retryable(AutoReconnect("x"), WRITE)
+    assert RetryPolicy.is_retryable(NotPrimaryError("x"), WRITE)
+    assert RetryPolicy.is_retryable(ServerSelectionTimeoutError("x"), WRITE)
+    assert not RetryPolicy.is_retryable(ServerSelectionTimeoutError("x"), MULTI_WRITE)
+    assert not RetryPolicy.is_retryable(ExecutionTimeout("x"), READ)
+    assert not RetryPolicy.is_retryable(OperationFailure("x"), READ)
+    assert not RetryPolicy.is_retryable(CircuitOpenError("x"), READ)
+
+
+def test_delay_is_bounded():
+    policy = RetryPolicy(base_delay=0.1, max_delay=0.5)
+    assert all(0 <= policy.delay(attempt) <= 0.5 for attempt in range(10) for _ in range(20))
+
+
+def test_read_is_retried_until_success():
+    executor = executor_with(3, failure_threshold=10)
+    fn, calls = failing([AutoReconnect("a"), AutoReconnect("b")])
+    assert executor.execute("op", fn, READ) == "ok"
+    assert len(calls) == 3
+
+
+def test_retries_stop_after_max_attempts():
+    executor = executor_with(2, failure_threshold=10)
+    fn, calls = failing([AutoReconnect("a")] * 5)
+    with pytest.raises(AutoReconnect):
+        executor.execute("op", fn, READ)
+    assert len(calls) == 2
+
+
+def test_multi_write_is_not_retried():
+    executor = executor_with(3)
+    fn, calls = failing([AutoReconnect("a")])
+    with pytest.raises(AutoReconnect):
+        executor.execute("op", fn, MULTI_WRITE)
+    assert len(calls) == 1
+
+
+def test_breaker_opens_and_recovers_through_probe():
+    breaker = CircuitBreaker("c", failure_threshold=2, window=10, reset_timeout=0.05)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # 半开状态只放行一个探测请求
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = CircuitBreaker("c", failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_server_errors_do_not_count_as_failures():
+    breaker = CircuitBreaker("c", failure_threshold=1)
+    executor = ResilientExecutor(breaker, RetryPolicy(max_attempts=1))
+    fn, _ = failing([OperationFailure("bad query")])
+    with pytest.raises(OperationFailure):
+        executor.execute("op", fn, READ)
+    assert breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,81 @@
+"""
+测试集合结构推断
+"""
+
+from bson import Int64, ObjectId
+
+from mongo_atlas_mcp.schema import SchemaAccumulator, bson_type_name
+
+
+def fields(report):
+    return {field["path"]: field for field in report["fields"]}
+
+
+def test_bson_type_names():
+    assert bson_type_name(True) == "bool"
+    assert bson_type_name(1) == "int"
+    assert bson_type_name(2 ** 40) == "long"
+    assert bson_type_name(Int64(1)) == "long"
+    assert bson_type_name(ObjectId()) == "objectId"
+    assert bson_type_name(None) == "null"
+
+
+def test_presence_counts_documents_not_array_elements():
+    accumulator = SchemaAccumulator()
+    accumulator.add([
+        {"_id": 1, "items": [{"sku": "a"}, {"sku": "b"}, {"sku": None}]},
+        {"_id": 2, "items": []},
+    ])
+    stats = fields(accumulator.report())["items.sku"]
+    assert stats["count"] == 3
+    assert stats["presence"] == 0.5
+    assert stats["null_rate"] == 0.5
+    assert stats["types"] == {"string": 2, "null": 1}
+
+
+def test_presence_and_null_rate_for_top_level_fields():
+    accumulator = SchemaAccumulator()
+    accumulator.add([{"_id": i, "name": None if i == 0 else "x"} for i in range(4)] + [{"_id": 9}])
+    stats = fields(accumulator.report())["name"]
+    assert stats["presence"] == 0.8
+    assert stats["null_rate"] == 0.2
+
+
+def test_documents_seen_again_are_not_double_counted():
+    accumulator = SchemaAccumulator()
+    assert accumulator.add([{"_id": 1, "a": 1}, {"_id": 2, "a": 2}]) == 2
+    assert accumulator.add([{"_id": 2, "a": 2}, {"_id": 3}]) == 1
+    report = accumulator.report()
+    assert report["sampled_documents"] == 3
+    assert report["duplicates_skipped"] == 1
+    assert fields(report)["a"]["count"] == 2
+
+
+def test_unhashable_ids_are_deduplicated():
+    accumulator = SchemaAccumulator()
+    accumulator.add([{"_id": {"k": 1}}, {"_id": {"k": 1}}])
+    assert accumulator.report()["sampled_documents"] == 1
+
+
+def test_deduplication_can_be_disabled():
+    accumulator = SchemaAccumulator(max_tracked_ids=0)
+    accumulator.add([{"_id": 1}, {"_id": 1}])
+    assert accumulator.report()["sampled_documents"] == 2
+
+
+def test_array_statistics():
+    accumulator = SchemaAccumulator()
+    accumulator.add([{"tags": ["a", "b"]}, {"tags": [1]}, {"tags": []}])
+    array = fields(accumulator.report())["tags"]["array"]
+    assert array == {
+        "min_length": 0, "max_length": 2, "avg_length": 1.0,
+        "item_types": {"string": 2, "int": 1},
+    }
+
+
+def test_field_limit_sets_truncated():
+    accumulator = SchemaAccumulator(max_fields=2)
+    accumulator.add([{"a": 1, "b": 2, "c": 3}])
+    report = accumulator.report()
+    assert report["truncated"]
+    assert [field["path"] for field in report["fields"]] == ["a", "b"]
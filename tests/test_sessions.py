@@ -0,0 +1,97 @@
+"""
+测试会话识别与每会话限制
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from mongo_atlas_mcp import server as server_module
+from mongo_atlas_mcp.server import MongoAtlasMCPServer
+from mongo_atlas_mcp.sessions import SessionBusy, SessionRegistry
+
+LEGACY = "2025-06-18"
+MODERN = "2026-07-28"
+
+
+class FakeRequest:
+    def __init__(self, headers, host="10.0.0.1"):
+        self.headers = headers
+        self.client = SimpleNamespace(host=host)
+
+
+def session_id_for(monkeypatch, headers, protocol_version=LEGACY, transport="http",
+                   stateless_http=False, host="10.0.0.1", behind_proxy=False):
+    request = FakeRequest(headers, host) if headers is not None else None
+    context = SimpleNamespace(
+        session_id="connection-id",
+        request_context=SimpleNamespace(request=request, protocol_version=protocol_version),
+    )
+    monkeypatch.setattr(server_module, "get_context", lambda: context)
+    owner = SimpleNamespace(transport=transport, stateless_http=stateless_http,
+                            behind_proxy=behind_proxy)
+    return MongoAtlasMCPServer._session_id(owner)
+
+
+def test_transport_session_wins_over_client_header(monkeypatch):
+    headers = {"mcp-session-id": "issued", "x-mcp-session-id": "claimed"}
+    assert session_id_for(monkeypatch, headers) == "issued"
+
+
+def test_client_header_is_used_only_without_a_session(monkeypatch):
+    headers = {"mcp-session-id": "forged", "x-mcp-session-id": "claimed"}
+    # 不建立会话的协议版本和无状态模式下，传输层不校验Mcp-Session-Id
+    assert session_id_for(monkeypatch, headers, protocol_version=MODERN) == "header:claimed"
+    assert session_id_for(monkeypatch, headers, stateless_http=True) == "header:claimed"
+    assert session_id_for(monkeypatch, {}, protocol_version=MODERN) == "client:10.0.0.1"
+
+
+def test_forwarded_address_is_trusted_only_from_the_local_proxy(monkeypatch):
+    headers = {"x-forwarded-for": "203.0.113.7"}
+    assert session_id_for(monkeypatch, headers, protocol_version=MODERN, host="127.0.0.1",
+                          behind_proxy=True) == "client:203.0.113.7"
+    # 不在多进程模式下，或请求不是来自本机的主进程时，客户端自带的头不可信
+    assert session_id_for(monkeypatch, headers, protocol_version=MODERN, host="127.0.0.1",
+                          behind_proxy=False) == "client:127.0.0.1"
+    assert session_id_for(monkeypatch, headers, protocol_version=MODERN, host="10.0.0.9",
+                          behind_proxy=True) == "client:10.0.0.9"
+
+
+def test_sse_and_stdio_use_connection_session(monkeypatch):
+    headers = {"x-mcp-session-id": "claimed"}
+    assert session_id_for(monkeypatch, headers, transport="sse") == "connection-id"
+    assert session_id_for(monkeypatch, None, transport="stdio") == "connection-id"
+
+
+def test_outside_request_uses_context_variable(monkeypatch):
+    def no_context():
+        raise RuntimeError("no context")
+
+    monkeypatch.setattr(server_module, "get_context", no_context)
+    owner = SimpleNamespace(transport="http", stateless_http=False)
+    token = server_module.current_session_id.set("outer")
+    try:
+        assert MongoAtlasMCPServer._session_id(owner) == "outer"
+    finally:
+        server_module.current_session_id.reset(token)
+
+
+def test_per_session_concurrency_limit():
+    registry = SessionRegistry(max_concurrent_per_session=1)
+    with registry.track("s1", "find_documents"):
+        with pytest.raises(SessionBusy):
+            with registry.track("s1", "find_documents"):
+                pass
+        with registry.track("s2", "find_documents"):
+            pass
+    stats = {item["session_id"]: item for item in registry.snapshot()}
+    assert stats["s1"]["calls"] == 1 and stats["s1"]["in_flight"] == 0
+    assert stats["s2"]["calls"] == 1
+
+
+def test_exceptions_count_as_errors():
+    registry = SessionRegistry()
+    with pytest.raises(ValueError):
+        with registry.track("s1", "t"):
+            raise ValueError("boom")
+    assert registry.snapshot()[0]["errors"] == 1
@@ -0,0 +1,99 @@
+"""
+测试近似统计草图的误差范围
+"""
+
+import subprocess
+import sys
+
+import numpy as np
+
+from mongo_atlas_mcp.sketches import (
+    FieldSketch, HyperLogLog, Reservoir, TDigest, extract_field, hash_values, numeric_array
+)
+
+
+def hll_of(values, precision=14):
+    hll = HyperLogLog(precision)
+    for start in range(0, len(values), 10000):
+        hll.add_hashes(hash_values(values[start:start + 10000]))
+    return hll
+
+
+def test_hll_small_cardinality_is_nearly_exact():
+    # hash与进程无关，估计值固定为99.3
+    assert round(hll_of(list(range(100)) * 3).estimate()) == 99
+
+
+def test_hash_values_are_stable_across_processes():
+    script = "from mongo_atlas_mcp.sketches import hash_values; print(hash_values(['a', 1, {'b': 2}]).tolist())"
+    outputs = {
+        subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, check=True,
+            env={"PYTHONHASHSEED": seed}
+        ).stdout
+        for seed in ("1", "2")
+    }
+    assert outputs == {str(hash_values(["a", 1, {"b": 2}]).tolist()) + "\n"}
+
+
+def test_hll_large_cardinality_within_error_bound():
+    true_count = 200000
+    hll = hll_of([f"user-{i}" for i in range(true_count)])
+    error = abs(hll.estimate() - true_count) / true_count
+    # 4倍标准误差，失败概率可以忽略
+    assert error < 4 * hll.relative_error
+
+
+def test_hll_distinguishes_types():
+    assert round(hll_of([1, "1", 1.5, None, {"a": 1}, [1]]).estimate()) == 6
+
+
+def test_tdigest_quantiles_within_rank_error():
+    rng = np.random.default_rng(7)
+    values = rng.normal(100, 15, 100000)
+    digest = TDigest(compression=200)
+    for batch in np.array_split(values, 50):
+        digest.add(batch)
+    ordered = np.sort(values)
+    assert digest.count == len(values)
+    for q in (0.01, 0.5, 0.9, 0.99):
+        estimate = digest.quantile(q)
+        rank = np.searchsorted(ordered, estimate["value"]) / len(values)
+        assert abs(rank - q) <= max(0.01, 2 * estimate["rank_error"])
+    assert digest.min == values.min() and digest.max == values.max()
+
+
+def test_tdigest_centroid_count_is_bounded():
+    digest = TDigest(compression=100)
+    for _ in range(20):
+        digest.add(np.random.default_rng().random(5000))
+    assert len(digest.means) <= 100
+
+
+def test_reservoir_keeps_capacity_and_is_roughly_uniform():
+    hits = np.zeros(10)
+    for seed in range(300):
+        reservoir = Reservoir(capacity=5, seed=seed)
+        for start in range(0, 100, 7):
+            reservoir.add(list(range(start, min(start + 7, 100))))
+        assert len(reservoir.items) == 5 and reservoir.seen == 100
+        for item in reservoir.items:
+            hits[item // 10] += 1
+    # 每个十分位期望150次
+    assert hits.min() > 90 and hits.max() < 210
+
+
+def test_extract_field_and_numeric_array():
+    documents = [{"a": {"b": 1}}, {"a": {"b": True}}, {"a": 2}, {"c": 1}, {"a": {"b": 2.5}}]
+    values = extract_field(documents, "a.b")
+    assert values == [1, True, 2.5]
+    assert numeric_array(values).tolist() == [1.0, 2.5]
+
+
+def test_field_sketch_numeric_moments():
+    sketch = FieldSketch()
+    sketch.add([1, 2, 3, "x", None])
+    assert sketch.values == 5
+    assert sketch.numeric_count == 3
+    assert sketch.numeric_sum == 6
+    assert sketch.numeric_sumsq == 14
@@ -0,0 +1,145 @@
+"""
+测试溢出文件的按行/按字节读取、磁盘配额和过期清理
+"""
+
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from mongo_atlas_mcp import spill as spill_module
+from mongo_atlas_mcp.spill import SpillQuotaExceeded, SpillStore
+
+
+def write_spill(store, count, namespace="db.c"):
+    writer = store.create(namespace)
+    for i in range(count):
+        writer.write({"_id": i, "name": f"doc-{i}"})
+    return writer.finish()
+
+
+def ids_of(data):
+    return [json.loads(line)["_id"] for line in data.decode().splitlines()]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(spill_module, "time", SimpleNamespace(monotonic=fake, time=time.time))
+    return fake
+
+
+def test_read_lines_across_checkpoints(tmp_path):
+    store = SpillStore(str(tmp_path))
+    spill = write_spill(store, 2500)
+    assert spill.rows == 2500 and len(spill.checkpoints) == 3
+    assert ids_of(spill.read_lines(0, 3)) == [0, 1, 2]
+    assert ids_of(spill.read_lines(1020, 10)) == list(range(1020, 1030))
+    assert ids_of(spill.read_lines(2047, 2)) == [2047, 2048]
+    assert ids_of(spill.read_lines(2498, 10)) == [2498, 2499]
+    assert spill.read_lines(2500, 10) == b""
+    with open(spill.path, "rb") as f:
+        assert spill.read_lines(0, 2500) == f.read()
+
+
+def test_read_bytes_matches_file_contents(tmp_path):
+    store = SpillStore(str(tmp_path))
+    spill = write_spill(store, 1500)
+    with open(spill.path, "rb") as f:
+        contents = f.read()
+    assert spill.size == len(contents)
+    boundary = spill.checkpoints[1]
+    assert spill.read_bytes(boundary - 5, 10) == contents[boundary - 5:boundary + 5]
+    assert spill.read_bytes(spill.size - 4, 100) == contents[-4:]
+    assert spill.read_bytes(spill.size, 10) == b""
+
+
+def test_empty_spill_reads_nothing(tmp_path):
+    spill = write_spill(SpillStore(str(tmp_path)), 0)
+    assert spill.rows == 0
+    assert spill.read_lines(0, 10) == b"" and spill.read_bytes(0, 10) == b""
+
+
+def test_quota_evicts_oldest_files_first(tmp_path):
+    store = SpillStore(str(tmp_path), quota_bytes=5000)
+    first = write_spill(store, 100)
+    second = write_spill(store, 100)
+    assert first.size + second.size > 5000 > second.size
+    assert store.get(first.spill_id) is None and not os.path.exists(first.path)
+    assert store.get(second.spill_id) is second
+
+
+def test_quota_exceeded_by_single_result_raises(tmp_path):
+    store = SpillStore(str(tmp_path), quota_bytes=1000)
+    writer = store.create("db.c")
+    with pytest.raises(SpillQuotaExceeded):
+        for i in range(100):
+            writer.write({"_id": i, "name": f"doc-{i}"})
+    writer.abort()
+    assert not os.path.exists(writer.spill.path)
+    # 放弃写入后配额已释放
+    assert write_spill(store, 5).rows == 5
+
+
+def test_expired_files_are_removed(tmp_path, clock):
+    store = SpillStore(str(tmp_path), ttl=60)
+    spill = write_spill(store, 10)
+    clock.now += 30
+    assert store.get(spill.spill_id) is spill
+    assert spill.describe()["expires_in_s"] == 30
+    clock.now += 31
+    assert store.get(spill.spill_id) is None
+    assert not os.path.exists(spill.path)
+
+
+def test_expired_files_free_quota_before_eviction(tmp_path, clock):
+    store = SpillStore(str(tmp_path), ttl=60, quota_bytes=3500)
+    expired = write_spill(store, 50)
+    clock.now += 30
+    kept = write_spill(store, 50)
+    clock.now += 31
+    write_spill(store, 50)
+    assert not os.path.exists(expired.path)
+    assert store.get(kept.spill_id) is kept
+
+
+def test_delete_and_close_all(tmp_path):
+    store = SpillStore(str(tmp_path))
+    first, second = write_spill(store, 5), write_spill(store, 5)
+    assert store.delete(first.spill_id) and not store.delete(first.spill_id)
+    assert not os.path.exists(first.path)
+    directory = os.path.dirname(second.path)
+    store.close_all()
+    assert not os.path.exists(directory)
+
+
+def test_old_process_directories_are_cleaned_up(tmp_path):
+    stale = tmp_path / "spill-old"
+    stale.mkdir()
+    (stale / "x.ndjson").write_bytes(b"{}\n")
+    old = time.time() - 7200
+    os.utime(stale, (old, old))
+    other = tmp_path / "unrelated"
+    other.mkdir()
+    os.utime(other, (old, old))
+
+    store = SpillStore(str(tmp_path), ttl=3600)
+    spill = write_spill(store, 1)
+    assert not stale.exists() and other.exists()
+    assert os.path.dirname(spill.path) != str(tmp_path)
+
+
+def test_schema_summary_is_recorded(tmp_path):
+    spill = write_spill(SpillStore(str(tmp_path)), 3)
+    assert spill.schema["sampled_rows"] == 3
+    assert set(spill.schema["fields"]) >= {"_id", "name"}
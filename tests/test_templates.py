@@ -0,0 +1,157 @@
+"""
+测试查询模板
+"""
+
+import datetime
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+from mongo_atlas_mcp import templates as templates_module
+from mongo_atlas_mcp.templates import QueryTemplate, TemplateRegistry, TemplateStats, plan_signature
+from tests.fakes import FakeCollection
+
+HEX = "507f1f77bcf86cd799439011"
+
+
+def find_template(**kwargs):
+    options = {
+        "parameters": {"status": "string", "owner": "objectId",
+                       "since": {"type": "date", "default": 0}},
+        "filter_dict": {"status": {"$param": "status"}, "owner_id": {"$param": "owner"},
+                        "created_at": {"$gte": {"$param": "since"}}, "deleted": False},
+    }
+    options.update(kwargs)
+    return QueryTemplate("orders", "db", "orders", **options)
+
+
+def test_bind_fills_placeholders_and_converts_types():
+    template = find_template()
+    bound = template.bind({"status": "paid", "owner": HEX})
+    assert bound == {"filter": {
+        "status": "paid",
+        "owner_id": ObjectId(HEX),
+        "created_at": {"$gte": datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)},
+        "deleted": False,
+    }}
+
+
+def test_bind_rejects_bad_parameters():
+    template = find_template()
+    with pytest.raises(ValueError, match="缺少参数 owner"):
+        template.bind({"status": "paid"})
+    with pytest.raises(ValueError, match="没有参数 other"):
+        template.bind({"status": "paid", "owner": HEX, "other": 1})
+    with pytest.raises(ValueError, match="参数 status"):
+        template.bind({"status": 1, "owner": HEX})
+
+
+def test_bind_does_not_mutate_extended_json_arguments():
+    template = find_template()
+    owner = {"$oid": HEX}
+    assert template.bind({"status": "paid", "owner": owner})["filter"]["owner_id"] == ObjectId(HEX)
+    assert owner == {"$oid": HEX}
+
+
+def test_aggregate_template_shares_static_stages():
+    match = {"$match": {"status": {"$param": "status"}}}
+    group = {"$group": {"_id": "$owner", "n": {"$sum": 1}}}
+    template = QueryTemplate("totals", "db", "orders", parameters={"status": "string[]"},
+                             pipeline=[match, group])
+    bound = template.bind({"status": ["paid"]})["pipeline"]
+    assert bound[0] == {"$match": {"status": ["paid"]}}
+    assert bound[1] is group
+
+
+def test_template_definition_errors():
+    with pytest.raises(ValueError, match="没有对应的参数定义"):
+        QueryTemplate("t", "db", "c", filter_dict={"a": {"$param": "x"}})
+    with pytest.raises(ValueError, match="没有在模板中使用"):
+        QueryTemplate("t", "db", "c", parameters={"x": "int"}, filter_dict={"a": 1})
+    with pytest.raises(ValueError, match="不受支持"):
+        QueryTemplate("t", "db", "c", parameters={"x": "float"}, filter_dict={"a": {"$param": "x"}})
+
+
+def test_check_indexes():
+    indexes = [
+        {"name": "_id_", "key": {"_id": 1}},
+        {"name": "status_1", "key": {"status": 1}},
+        {"name": "created_at_-1", "key": {"created_at": -1}},
+    ]
+    assert find_template().check_indexes(indexes)["usable_indexes"] == [
+        "status_1", "created_at_-1"
+    ]
+
+    scan = QueryTemplate("t", "db", "c", parameters={"x": "int"},
+                         filter_dict={"$or": [{"qty": {"$param": "x"}}]})
+    assert scan.check_indexes(indexes) == {
+        "fields": ["qty"], "sort": [], "usable_indexes": [], "indexed": False
+    }
+
+    sorted_only = QueryTemplate("t", "db", "c", sort=[["created_at", -1]])
+    assert sorted_only.check_indexes(indexes)["usable_indexes"] == ["created_at_-1"]
+
+    search = QueryTemplate("t", "db", "c", pipeline=[{"$vectorSearch": {}}])
+    assert search.check_indexes(indexes)["indexed"]
+
+
+def test_plan_signature():
+    explain = {"queryPlanner": {"winningPlan": {
+        "stage": "FETCH",
+        "inputStage": {"stage": "IXSCAN", "indexName": "status_1"},
+    }}}
+    assert plan_signature(explain) == "FETCH>IXSCAN(status_1)"
+
+    sbe = {"stages": [{"$cursor": {"queryPlanner": {"winningPlan": {
+        "queryPlan": {"stage": "COLLSCAN"}, "slotBasedPlan": {}
+    }}}}]}
+    assert plan_signature(sbe) == "COLLSCAN"
+    assert plan_signature({}) is None
+
+
+def test_stats_count_plan_changes():
+    stats = TemplateStats()
+    assert not stats.record_plan("COLLSCAN")
+    assert stats.record_plan("IXSCAN(a_1)")
+    assert not stats.record_plan(None)
+    assert stats.describe()["plan_changes"] == 1
+
+
+def test_registries_sharing_a_collection_see_each_others_templates(monkeypatch):
+    monkeypatch.setattr(templates_module, "_RECHECK_SECONDS", 0)
+    collection = FakeCollection()
+    first, second = TemplateRegistry(lambda: collection), TemplateRegistry(lambda: collection)
+    first.add(find_template())
+    shared = second.get("orders")
+    assert shared.bind({"status": "paid", "owner": HEX}) == first.get("orders").bind(
+        {"status": "paid", "owner": HEX}
+    )
+    with pytest.raises(ValueError):
+        second.add(find_template())
+
+    # 定义不变时保留原对象和运行统计，被替换或删除后重新加载
+    shared.stats.record_run(5.0, True)
+    assert second.get("orders") is shared
+    first.add(find_template(limit=10), replace=True)
+    assert second.get("orders").limit == 10
+    assert first.remove("orders")
+    assert second.get("orders") is None and second.list() == []
+
+
+def test_template_file_definitions_have_the_same_version_everywhere():
+    assert find_template().version == find_template().version != find_template(limit=1).version
+    restored = QueryTemplate.from_document(find_template(sort=[["created_at", -1]]).to_document())
+    assert restored.version == find_template(sort=[["created_at", -1]]).version
+
+
+def test_unwritable_collection_keeps_template_in_this_process():
+    class ReadOnly(FakeCollection):
+        def insert_one(self, document):
+            raise OperationFailure("not authorized")
+
+    registry = TemplateRegistry(lambda: ReadOnly())
+    template = find_template()
+    registry.add(template)
+    assert registry.get("orders") is template
+    assert registry.list() == [template]
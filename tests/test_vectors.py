@@ -0,0 +1,76 @@
+"""
+测试本地向量索引的检索与多进程共用目录时的追加
+"""
+
+import json
+import os
+
+import numpy as np
+
+from mongo_atlas_mcp.vectors import VectorIndex
+
+
+def append_rows(index, start, stop, dim=4):
+    with index.file_lock():
+        index.sync()
+        if index.dim is None:
+            index.dim = dim
+        ids = list(range(start, stop))
+        index.append(ids, np.array([[i] + [1.0] * (dim - 1) for i in ids], dtype=np.float32))
+
+
+def test_search_returns_top_k_by_cosine_and_dot(tmp_path):
+    index = VectorIndex(str(tmp_path / "index"))
+    with index.file_lock():
+        index.dim = 2
+        index.append(["a", "b", "c"], np.array([[1, 0], [0, 1], [1, 1]]))
+    assert [hit[0] for hit in index.search(np.array([1, 0.1]), 2)] == ["a", "c"]
+    assert [hit[0] for hit in index.search(np.array([1, 1]), 1, metric="dot")] == ["c"]
+    assert [hit[0] for hit in index.search(np.array([1, 0]), 3, rows=np.array([1]))] == ["b"]
+
+
+def test_indexes_sharing_files_see_each_others_appends(tmp_path):
+    prefix = str(tmp_path / "index")
+    first, second = VectorIndex(prefix), VectorIndex(prefix)
+    append_rows(first, 0, 3)
+    append_rows(second, 3, 5)
+    append_rows(first, 5, 6)
+
+    with second.file_lock():
+        second.sync()
+    assert first.ids == second.ids == list(range(6))
+    assert first.matrix[:, 0].tolist() == list(range(6))
+    assert VectorIndex(prefix).ids == list(range(6))
+    with open(f"{prefix}.meta", encoding="utf-8") as fh:
+        assert json.load(fh)["count"] == 6
+
+
+def test_unfinished_append_is_truncated(tmp_path):
+    prefix = str(tmp_path / "index")
+    index = VectorIndex(prefix)
+    append_rows(index, 0, 2)
+    # 模拟进程在写完 .f32 和 .ids 之后、替换 .meta 之前退出
+    with open(f"{prefix}.f32", "ab") as fh:
+        fh.write(np.ones(4, dtype=np.float32).tobytes())
+    with open(f"{prefix}.ids", "a", encoding="utf-8") as fh:
+        fh.write('{"_id": 99}\n')
+
+    reopened = VectorIndex(prefix)
+    assert reopened.ids == [0, 1]
+    append_rows(reopened, 2, 3)
+    assert VectorIndex(prefix).ids == [0, 1, 2]
+    assert os.path.getsize(f"{prefix}.f32") == 3 * 4 * 4
+
+
+def test_rebuild_in_another_index_is_picked_up(tmp_path):
+    prefix = str(tmp_path / "index")
+    first, second = VectorIndex(prefix), VectorIndex(prefix)
+    append_rows(first, 0, 2)
+    with second.file_lock():
+        second.sync()
+        second.reset()
+    append_rows(second, 10, 12)
+
+    with first.file_lock():
+        first.sync()
+    assert first.ids == [10, 11]
@@ -0,0 +1,91 @@
+"""
+测试物化视图的刷新管道
+"""
+
+from mongo_atlas_mcp.views import MaterializedView, ViewRegistry
+from tests.fakes import FakeCollection
+
+GROUP = [{"$group": {"_id": "$status", "total": {"$sum": "$amount"}}}]
+COMBINE = [{"$set": {"total": {"$add": ["$total", "$$new.total"]}}}]
+
+
+def make_view(pipeline, when_matched="replace", watermark_field="created_at", high_water_mark=5):
+    return MaterializedView(
+        "v", "db", "orders", pipeline, "orders_view",
+        watermark_field=watermark_field, when_matched=when_matched,
+        high_water_mark=high_water_mark
+    )
+
+
+def test_row_pipeline_refreshes_incrementally_from_inclusive_mark():
+    view = make_view([{"$project": {"amount": 1}}])
+    assert view.incremental
+    stages = view.build_pipeline(upper=9, full=False)
+    assert stages[0] == {"$match": {"created_at": {"$lte": 9, "$gte": 5}}}
+    assert stages[-1]["$merge"]["whenMatched"] == "replace"
+
+
+def test_grouping_pipeline_without_combining_merge_is_not_incremental():
+    assert not make_view(GROUP).incremental
+    assert not make_view(GROUP, when_matched="merge").incremental
+
+
+def test_grouping_pipeline_with_combining_merge_uses_exclusive_mark():
+    view = make_view(GROUP, when_matched=COMBINE)
+    assert view.incremental
+    assert not view.inclusive_lower_bound
+    stages = view.build_pipeline(upper=9, full=False)
+    assert stages[0] == {"$match": {"created_at": {"$lte": 9, "$gt": 5}}}
+    assert stages[-1]["$merge"]["whenMatched"] == COMBINE
+
+
+def test_full_refresh_uses_out():
+    stages = make_view(GROUP).build_pipeline(upper=9, full=True)
+    assert stages[0] == {"$match": {"created_at": {"$lte": 9}}}
+    assert stages[-1] == {"$out": "orders_view"}
+
+
+def test_view_without_watermark_is_never_incremental():
+    view = make_view([{"$project": {"a": 1}}], watermark_field=None)
+    assert not view.incremental
+    assert view.build_pipeline(upper=None, full=True) == [{"$project": {"a": 1}}, {"$out": "orders_view"}]
+
+
+def test_document_round_trip():
+    view = make_view(GROUP, when_matched=COMBINE)
+    restored = MaterializedView.from_document(view.to_document())
+    assert restored.pipeline == GROUP
+    assert restored.when_matched == COMBINE
+    assert restored.high_water_mark == 5
+    assert restored.incremental
+
+
+def test_registries_sharing_a_collection_see_each_others_views():
+    collection = FakeCollection()
+    first, second = ViewRegistry(lambda: collection), ViewRegistry(lambda: collection)
+    first.save(make_view(GROUP, when_matched=COMBINE))
+    assert [view.name for view in second.list()] == ["v"]
+    first.remove("v")
+    assert second.get("v") is None and second.list() == []
+
+
+def test_claim_advances_mark_only_once():
+    collection = FakeCollection()
+    first, second = ViewRegistry(lambda: collection), ViewRegistry(lambda: collection)
+    first.save(make_view(GROUP, when_matched=COMBINE))
+    stale = second.get("v")
+    view = first.get("v")
+    assert first.claim(view, 9)
+    # 另一个进程仍以旧高水位5为条件，不会重复合并5到9之间的文档
+    assert not second.claim(stale, 9)
+    assert second.get("v") is stale and stale.high_water_mark == 9
+
+
+def test_release_restores_mark_after_failed_refresh():
+    collection = FakeCollection()
+    registry = ViewRegistry(lambda: collection)
+    registry.save(make_view(GROUP, when_matched=COMBINE))
+    view = registry.get("v")
+    assert registry.claim(view, 9)
+    registry.release(view, 9)
+    assert registry.get("v").high_water_mark == 5
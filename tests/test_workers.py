@@ -0,0 +1,207 @@
+"""
+测试多进程模式的请求解析与会话路由
+"""
+
+import asyncio
+import json
+
+from mongo_atlas_mcp import workers as workers_module
+from mongo_atlas_mcp.workers import (
+    SessionRoutes, WorkerPool, forwarded_head, parse_head, request_session, session_key,
+    starts_session
+)
+
+INITIALIZE = json.dumps({"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {}}).encode()
+CALL = json.dumps({"jsonrpc": "2.0", "id": 2, "method": "tools/call", "params": {}}).encode()
+
+
+def test_parse_head_and_session_keys():
+    request_line, headers = parse_head(
+        b"POST /mcp HTTP/1.1\r\nHost: x\r\nMcp-Session-Id: abc\r\nX-MCP-Session-Id: mine\r\n\r\n"
+    )
+    assert request_line == [b"POST", b"/mcp", b"HTTP/1.1"]
+    assert request_session(b"/mcp", headers) == b"abc"
+    assert session_key(headers, ("10.0.0.1", 5000)) == b"mine"
+    assert session_key({}, ("10.0.0.1", 5000)) == b"10.0.0.1"
+    assert request_session(b"/messages/?session_id=f00d&x=1", {}) == b"f00d"
+    assert request_session(b"/mcp", {}) is None
+
+
+def test_forwarded_head_replaces_client_supplied_address():
+    head = b"POST /mcp HTTP/1.1\r\nHost: x\r\nx-forwarded-for: 1.2.3.4\r\n\r\n"
+    forwarded = forwarded_head(head, ("10.0.0.1", 5000))
+    assert forwarded == b"POST /mcp HTTP/1.1\r\nHost: x\r\nX-Forwarded-For: 10.0.0.1\r\n\r\n"
+    assert parse_head(forwarded)[1][b"x-forwarded-for"] == b"10.0.0.1"
+
+
+def test_starts_session():
+    assert starts_session(INITIALIZE)
+    assert starts_session(b"[" + INITIALIZE + b"]")
+    assert not starts_session(CALL)
+    assert not starts_session(b"initialize")
+    assert not starts_session(None)
+
+
+def test_session_routes_evict_and_forget():
+    routes = SessionRoutes(max_sessions=2)
+    routes.learn(b"a", 0)
+    routes.learn(b"b", 1)
+    routes.get(b"a")
+    routes.learn(b"c", 1)
+    assert routes.get(b"b") is None
+    routes.forget_worker(1)
+    assert len(routes) == 1 and routes.get(b"a") == 0
+
+
+def test_new_sessions_are_spread_across_workers():
+    pool = WorkerPool(3)
+    picks = [pool.route(b"POST", b"/mcp", {}, INITIALIZE, ("10.0.0.1", 1)) for _ in range(6)]
+    assert picks == [0, 1, 2, 0, 1, 2]
+    # 不属于会话的请求固定到同一个进程
+    plain = {pool.route(b"POST", b"/mcp", {}, CALL, ("10.0.0.1", port)) for port in range(10)}
+    assert len(plain) == 1
+
+
+async def fake_worker(index, sessions, close_after=None):
+    """
+    按请求答复自己序号的HTTP服务器，initialize请求签发新会话，chunked路径分块答复。
+    close_after为0时不答复直接断开，为1时答复一次后断开（模拟关闭空闲连接）
+    """
+    async def handle(reader, writer):
+        if close_after == 0:
+            writer.close()
+            return
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, headers = parse_head(head)
+                body = await reader.readexactly(int(headers.get(b"content-length", b"0")))
+                extra = b""
+                if starts_session(body):
+                    session = f"w{index}-{len(sessions)}".encode()
+                    sessions.append(session)
+                    extra = b"Mcp-Session-Id: " + session + b"\r\n"
+                payload = json.dumps({
+                    "worker": index, "session": headers.get(b"mcp-session-id", b"").decode(),
+                    "forwarded": headers.get(b"x-forwarded-for", b"").decode(),
+                }).encode()
+                if request_line[1] == b"/chunked":
+                    half = len(payload) // 2
+                    writer.write(
+                        b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n" + extra + b"\r\n"
+                        + b"%x\r\n%s\r\n%x\r\n%s\r\n0\r\n\r\n" % (
+                            half, payload[:half], len(payload) - half, payload[half:]
+                        )
+                    )
+                else:
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n" % len(payload)
+                                 + extra + b"\r\n" + payload)
+                await writer.drain()
+                if close_after == 1:
+                    writer.close()
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    _, headers = parse_head(head)
+    if b"content-length" in headers:
+        body = await reader.readexactly(int(headers[b"content-length"]))
+    else:
+        body = b""
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).strip(), 16)
+            chunk = await reader.readexactly(size + 2)
+            if not size:
+                break
+            body += chunk[:-2]
+    return headers, json.loads(body)
+
+
+def test_keep_alive_connection_routes_each_request_by_session():
+    async def run():
+        sessions = []
+        workers = [await fake_worker(index, sessions) for index in range(2)]
+        pool = WorkerPool(2)
+        pool.ports = [server.sockets[0].getsockname()[1] for server in workers]
+        proxy = await asyncio.start_server(pool._handle, "127.0.0.1", 0)
+        reader, writer = await asyncio.open_connection(
+            "127.0.0.1", proxy.sockets[0].getsockname()[1]
+        )
+
+        async def post(body, session=None, path=b"/mcp"):
+            writer.write(b"POST " + path + b" HTTP/1.1\r\nHost: x\r\n"
+                         + (b"Mcp-Session-Id: " + session + b"\r\n" if session else b"")
+                         + b"Content-Length: %d\r\n\r\n" % len(body) + body)
+            return await read_response(reader)
+
+        first_headers, first = await post(INITIALIZE)
+        second_headers, second = await post(INITIALIZE, path=b"/chunked")
+        results = []
+        for _ in range(2):
+            for headers in (first_headers, second_headers):
+                session = headers[b"mcp-session-id"]
+                results.append((session, (await post(CALL, session, b"/chunked"))[1]))
+        writer.close()
+        proxy.close()
+        for server in workers:
+            server.close()
+        return first, second, results
+
+    first, second, results = asyncio.run(run())
+    assert {first["worker"], second["worker"]} == {0, 1}
+    for session, answer in results:
+        assert answer["session"] == session.decode()
+        assert session.decode().startswith(f"w{answer['worker']}-")
+
+
+async def proxy_for(workers):
+    pool = WorkerPool(len(workers))
+    pool.ports = [server.sockets[0].getsockname()[1] for server in workers]
+    proxy = await asyncio.start_server(pool._handle, "127.0.0.1", 0)
+    reader, writer = await asyncio.open_connection("127.0.0.1", proxy.sockets[0].getsockname()[1])
+    return proxy, reader, writer
+
+
+def post_call(writer):
+    writer.write(b"POST /mcp HTTP/1.1\r\nHost: x\r\nX-Forwarded-For: 6.6.6.6\r\n"
+                 + b"Content-Length: %d\r\n\r\n" % len(CALL) + CALL)
+
+
+def test_request_is_retried_when_pooled_upstream_was_closed(monkeypatch):
+    # 总是复用连接，使第二个请求写到已被工作进程关闭的连接上
+    monkeypatch.setattr(workers_module._Upstream, "reusable", property(lambda self: True))
+
+    async def run():
+        worker = await fake_worker(0, [], close_after=1)
+        proxy, reader, writer = await proxy_for([worker])
+        answers = []
+        for _ in range(2):
+            post_call(writer)
+            answers.append((await read_response(reader))[1])
+        writer.close()
+        proxy.close()
+        worker.close()
+        return answers
+
+    answers = asyncio.run(run())
+    assert [answer["worker"] for answer in answers] == [0, 0]
+    assert all(answer["forwarded"] == "127.0.0.1" for answer in answers)
+
+
+def test_upstream_failure_returns_bad_gateway():
+    async def run():
+        worker = await fake_worker(0, [], close_after=0)
+        proxy, reader, writer = await proxy_for([worker])
+        post_call(writer)
+        head = await reader.readuntil(b"\r\n\r\n")
+        writer.close()
+        proxy.close()
+        worker.close()
+        return head
+
+    assert asyncio.run(run()).startswith(b"HTTP/1.1 502 ")